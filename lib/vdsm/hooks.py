@@ -29,12 +29,17 @@ import libvirt
 import logging
 import os
 import os.path
+import subprocess
 import sys
 import tempfile
+import threading
 
 from vdsm.common import exception
+from vdsm.common.compat import CPopen
+from vdsm.common.time import monotonic_time
+from . import cmdutils
 from . import commands
-from .constants import P_VDSM_HOOKS, P_VDSM, P_VDSM_RUN
+from .constants import P_VDSM_HOOKS, P_VDSM, P_VDSM_RUN, P_VDSM_EXEC
 
 _LAUNCH_FLAGS_FILE = 'launchflags'
 _LAUNCH_FLAGS_PATH = os.path.join(
@@ -43,6 +48,13 @@ _LAUNCH_FLAGS_PATH = os.path.join(
     _LAUNCH_FLAGS_FILE,
 )
 
+_HOOKRUNNER = os.path.join(P_VDSM_EXEC, 'hookrunner')
+
+# Python hooks including this line in their header are run by the hookrunner
+# helper, if enabled.
+_IN_PROCESS_MARK = '# vdsm-hook: in-process'
+_HEADER_SIZE = 4096
+
 
 # dir path is relative to '/' for test purposes
 # otherwise path is relative to P_VDSM_HOOKS
@@ -67,13 +79,19 @@ def _runHooksDir(data, dir, vmconf={}, raiseError=True, params={},
     if not scripts:
         return data
 
+    if hookType == _DOMXML_HOOK:
+        payload = data or ''
+    elif hookType == _JSON_HOOK:
+        payload = json.dumps(data)
+
+    runner = _hook_runner()
+
     data_fd, data_filename = tempfile.mkstemp()
     try:
-        if hookType == _DOMXML_HOOK:
-            os.write(data_fd, data or '')
-        elif hookType == _JSON_HOOK:
-            os.write(data_fd, json.dumps(data))
+        os.write(data_fd, payload)
         os.close(data_fd)
+        # The file is updated only when needed by the next hook.
+        file_payload = payload
 
         scriptenv = os.environ.copy()
 
@@ -103,8 +121,26 @@ def _runHooksDir(data, dir, vmconf={}, raiseError=True, params={},
 
         errorSeen = False
         for s in scripts:
-            rc, out, err = commands.execCmd([s], raw=True,
-                                            env=scriptenv)
+            start = monotonic_time()
+            result = None
+            if runner is not None and _is_in_process_hook(s):
+                try:
+                    result = runner.run(s, scriptenv, payload)
+                except Exception:
+                    logging.exception('Cannot run hook %s in hookrunner, '
+                                      'running hook in a new process', s)
+            if result is None:
+                if file_payload != payload:
+                    with open(data_filename, 'w') as f:
+                        f.write(payload)
+                rc, out, err = commands.execCmd([s], raw=True,
+                                                env=scriptenv)
+                with open(data_filename) as f:
+                    payload = file_payload = f.read()
+            else:
+                rc, payload, err = result
+            logging.debug('Hook %s returned %s in %.2f seconds', s, rc,
+                          monotonic_time() - start)
             logging.info(err)
             if rc != 0:
                 errorSeen = True
@@ -116,15 +152,143 @@ def _runHooksDir(data, dir, vmconf={}, raiseError=True, params={},
 
         if errorSeen and raiseError:
             raise exception.HookError(err)
-
-        with open(data_filename) as f:
-            final_data = f.read()
     finally:
         os.unlink(data_filename)
     if hookType == _DOMXML_HOOK:
-        return final_data
+        return payload
     elif hookType == _JSON_HOOK:
-        return json.loads(final_data)
+        return json.loads(payload)
+
+
+def _is_in_process_hook(script):
+    try:
+        with open(script) as f:
+            header = f.read(_HEADER_SIZE)
+    except IOError:
+        return False
+    lines = header.splitlines()
+    return (bool(lines) and lines[0].startswith('#!') and
+            'python' in lines[0] and _IN_PROCESS_MARK in lines)
+
+
+class HookRunnerError(Exception):
+    """ The hookrunner helper failed """
+
+
+class HookRunner(object):
+    """
+    Pool of up to workers long lived hookrunner helper processes, running
+    Python hooks without starting a new interpreter for every hook.
+
+    Helpers are started when needed, and a helper that failed is terminated
+    and replaced by a new helper on the next run.
+    """
+
+    def __init__(self, workers, helper=_HOOKRUNNER):
+        self._max_workers = workers
+        self._helper = helper
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._workers = 0
+
+    def run(self, script, env, payload):
+        """
+        Run script in a helper with env and payload.
+
+        Returns the script exit code, the payload written by the script, and
+        the script standard error.
+        """
+        worker = self._acquire()
+        try:
+            return worker.run(script, env, payload)
+        except Exception:
+            worker.close()
+            worker = None
+            raise
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+            self._workers -= len(idle)
+        for worker in idle:
+            worker.close()
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._workers >= self._max_workers:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+        try:
+            return _HookWorker(self._helper)
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            if worker is None:
+                self._workers -= 1
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+
+
+class _HookWorker(object):
+
+    def __init__(self, helper):
+        env = os.environ.copy()
+        ppath = env.get('PYTHONPATH', '')
+        env['PYTHONPATH'] = ':'.join(ppath.split(':') + [P_VDSM])
+        cmd = cmdutils.wrap_command([helper])
+        logging.info('Starting hookrunner helper')
+        self._proc = CPopen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=None, env=env)
+
+    def run(self, script, env, payload):
+        request = json.dumps({'script': script, 'env': env,
+                              'payload': payload})
+        self._proc.stdin.write(request + '\n')
+        self._proc.stdin.flush()
+        line = self._proc.stdout.readline()
+        if not line:
+            raise HookRunnerError('hookrunner helper terminated')
+        reply = json.loads(line)
+        return (reply['rc'], reply['payload'].encode('utf-8'),
+                reply['err'].encode('utf-8'))
+
+    def close(self):
+        logging.info('Terminating hookrunner helper')
+        self._proc.stdin.close()
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+
+
+_runner = None
+_runner_configured = False
+_runner_lock = threading.Lock()
+
+
+def _hook_runner():
+    """
+    Return the shared HookRunner, or None if running hooks in the hookrunner
+    helper is disabled.
+    """
+    global _runner, _runner_configured
+    with _runner_lock:
+        if not _runner_configured:
+            # Imported here to keep hooks importing hooking fast.
+            from vdsm.config import config
+            workers = config.getint('vars', 'hook_runner_workers')
+            if workers > 0:
+                _runner = HookRunner(workers)
+            _runner_configured = True
+        return _runner
 
 
 def before_device_create(devicexml, vmconf={}, customProperties={}):
@@ -170,15 +170,21 @@ def get(target=None, killOnFailure=True):
                     setattr(conn, name,
                             wrapMethod(utils.weakmethod(method)))
             if target is not None:
-                for ev in (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
-                           libvirt.VIR_DOMAIN_EVENT_ID_REBOOT,
-                           libvirt.VIR_DOMAIN_EVENT_ID_RTC_CHANGE,
-                           libvirt.VIR_DOMAIN_EVENT_ID_IO_ERROR_REASON,
-                           libvirt.VIR_DOMAIN_EVENT_ID_GRAPHICS,
-                           libvirt.VIR_DOMAIN_EVENT_ID_BLOCK_JOB,
-                           libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG,
-                           libvirt.VIR_DOMAIN_EVENT_ID_JOB_COMPLETED,
-                           libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED):
+                events = [libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                          libvirt.VIR_DOMAIN_EVENT_ID_REBOOT,
+                          libvirt.VIR_DOMAIN_EVENT_ID_RTC_CHANGE,
+                          libvirt.VIR_DOMAIN_EVENT_ID_IO_ERROR_REASON,
+                          libvirt.VIR_DOMAIN_EVENT_ID_GRAPHICS,
+                          libvirt.VIR_DOMAIN_EVENT_ID_BLOCK_JOB,
+                          libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG,
+                          libvirt.VIR_DOMAIN_EVENT_ID_JOB_COMPLETED,
+                          libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED]
+                # Available since libvirt 3.2.
+                block_threshold = getattr(
+                    libvirt, 'VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD', None)
+                if block_threshold is not None:
+                    events.append(block_threshold)
+                for ev in events:
                     conn.domainEventRegisterAny(None,
                                                 ev,
                                                 target.dispatchLibvirtEvents,
@@ -29,6 +29,7 @@ import pwd
 import re
 import selinux
 import shutil
+import threading
 
 import six
 
@@ -39,6 +40,7 @@ from vdsm import dsaversion
 from vdsm import hooks
 from vdsm.common import fileutils
 from vdsm.common.conv import tobool
+from vdsm.common.time import monotonic_time
 
 from vdsm.network import cmd
 from vdsm.network import ifacetracking
@@ -68,6 +70,8 @@ NET_CONF_PREF = NET_CONF_DIR + 'ifcfg-'
 
 CONFFILE_HEADER_SIGNATURE = '# Generated by VDSM version'
 
+_BRINGUP_WORKERS = config.getint('vars', 'ifcfg_bringup_workers')
+
 
 def is_available():
     return True
@@ -764,31 +768,142 @@ class ConfigWriter(object):
                            ''.join(config_lines_without_comments_and_bridge))
 
 
-def stop_devices(device_ifcfgs):
-    for dev in reversed(_sort_device_ifcfgs(device_ifcfgs)):
-        ifdown(dev)
-        if os.path.exists('/sys/class/net/%s/bridge' % dev):
-            # ifdown is not enough to remove nicless bridges
-            cmd.exec_sync([constants.EXT_BRCTL, 'delbr', dev])
+def stop_devices(device_ifcfgs, workers=_BRINGUP_WORKERS):
+    """
+    Bring down the devices of device_ifcfgs, each device after the devices
+    using it, running up to workers ifdown commands concurrently.
+
+    Returns a dict of device name to ifdown time in seconds.
+    """
+    devices, dependencies = _sort_device_ifcfgs(device_ifcfgs)
+    users = {dev: set() for dev in devices}
+    for dev, deps in six.iteritems(dependencies):
+        for dep in deps:
+            users[dep].add(dev)
+    timings = _run_ordered(_stop_device, list(reversed(devices)), users,
+                           workers)
+    logging.debug('Stopped devices: %s', _format_timings(timings))
+    return timings
+
+
+def _stop_device(dev):
+    ifdown(dev)
+    if os.path.exists('/sys/class/net/%s/bridge' % dev):
+        # ifdown is not enough to remove nicless bridges
+        cmd.exec_sync([constants.EXT_BRCTL, 'delbr', dev])
+    if _is_bond_name(dev):
+        if _is_running_bond(dev):
+            with open(BONDING_MASTERS, 'w') as f:
+                f.write("-%s\n" % dev)
+
+
+def start_devices(device_ifcfgs, workers=_BRINGUP_WORKERS):
+    """
+    Bring up the devices of device_ifcfgs, each device after the devices it
+    uses, running up to workers ifup commands concurrently.
+
+    Returns a dict of device name to ifup time in seconds.
+    """
+    devices, dependencies = _sort_device_ifcfgs(device_ifcfgs)
+    timings = _run_ordered(_start_device, devices, dependencies, workers)
+    logging.debug('Started devices: %s', _format_timings(timings))
+    return timings
+
+
+def _start_device(dev):
+    try:
+        # this is an ugly way to check if this is a bond but picking into
+        # the ifcfg files is even worse.
         if _is_bond_name(dev):
-            if _is_running_bond(dev):
-                with open(BONDING_MASTERS, 'w') as f:
-                    f.write("-%s\n" % dev)
+            if not _is_running_bond(dev):
+                with open(BONDING_MASTERS, 'w') as masters:
+                    masters.write('+%s\n' % dev)
+        _exec_ifup_by_name(dev)
+    except ConfigNetworkError:
+        logging.error('Failed to ifup device %s during rollback.', dev,
+                      exc_info=True)
 
 
-def start_devices(device_ifcfgs):
-    for dev in _sort_device_ifcfgs(device_ifcfgs):
-        try:
-            # this is an ugly way to check if this is a bond but picking into
-            # the ifcfg files is even worse.
-            if _is_bond_name(dev):
-                if not _is_running_bond(dev):
-                    with open(BONDING_MASTERS, 'w') as masters:
-                        masters.write('+%s\n' % dev)
-            _exec_ifup_by_name(dev)
-        except ConfigNetworkError:
-            logging.error('Failed to ifup device %s during rollback.', dev,
-                          exc_info=True)
+def _run_ordered(func, devices, dependencies, workers):
+    """
+    Call func with every device in devices, using up to workers threads.
+    func is called with a device after it returned for all the device
+    dependencies. Ready devices are taken in the order of devices, so with
+    one worker devices are handled in the same order.
+
+    If func fails, no more devices are handled, and the first error is raised
+    after running calls return.
+
+    Returns a dict of device name to func time in seconds.
+    """
+    pending = list(devices)
+    waiting = {dev: set(dependencies.get(dev, ())) & set(devices)
+               for dev in devices}
+    timings = {}
+    errors = []
+    cond = threading.Condition(threading.Lock())
+    # Number of devices handled now, guarded by cond.
+    running = [0]
+
+    def next_device():
+        with cond:
+            while pending:
+                for dev in pending:
+                    if not waiting[dev]:
+                        break
+                else:
+                    if running[0]:
+                        cond.wait()
+                        continue
+                    # Dependency loop; handle devices in the original order.
+                    dev = pending[0]
+                pending.remove(dev)
+                running[0] += 1
+                return dev
+            return None
+
+    def device_done(dev, elapsed):
+        with cond:
+            running[0] -= 1
+            timings[dev] = elapsed
+            for deps in six.itervalues(waiting):
+                deps.discard(dev)
+            cond.notify_all()
+
+    def worker():
+        while True:
+            dev = next_device()
+            if dev is None:
+                return
+            start = monotonic_time()
+            try:
+                func(dev)
+            except Exception as e:
+                with cond:
+                    errors.append(e)
+                    del pending[:]
+            finally:
+                device_done(dev, monotonic_time() - start)
+
+    if workers <= 1:
+        worker()
+    else:
+        threads = [concurrent.thread(worker, name='ifcfg/%d' % i)
+                   for i in range(min(workers, len(devices)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    return timings
+
+
+def _format_timings(timings):
+    return ', '.join('%s=%.2f' % (dev, elapsed)
+                     for dev, elapsed in sorted(six.iteritems(timings)))
 
 
 def _is_bond_name(dev):
@@ -802,10 +917,16 @@ def _is_running_bond(bond):
 
 
 def _sort_device_ifcfgs(device_ifcfgs):
+    """
+    Return the devices of device_ifcfgs in bring up order, and a dict of
+    device name to the names of the devices it uses: a vlan uses its
+    underlying device, and a bridge uses its ports.
+    """
     devices = {'Bridge': [],
                'Vlan': [],
                'Slave': [],
                'Other': []}
+    bridges = {}
     for conf_file in device_ifcfgs:
         if not conf_file.startswith(NET_CONF_PREF):
             continue
@@ -820,8 +941,21 @@ def _sort_device_ifcfgs(device_ifcfgs):
         dev = conf_file[len(NET_CONF_PREF):]
 
         devices[_dev_type(content)].append(dev)
+        bridge = re.search('^BRIDGE=(.+)$', content, re.MULTILINE)
+        if bridge:
+            bridges[dev] = bridge.group(1).strip('\'"')
 
-    return devices['Other'] + devices['Vlan'] + devices['Bridge']
+    sorted_devices = devices['Other'] + devices['Vlan'] + devices['Bridge']
+    dependencies = {dev: set() for dev in sorted_devices}
+    for vlan in devices['Vlan']:
+        base = vlan.rsplit('.', 1)[0]
+        if base in dependencies:
+            dependencies[vlan].add(base)
+    for port, bridge in six.iteritems(bridges):
+        if port in dependencies and bridge in dependencies:
+            dependencies[bridge].add(port)
+
+    return sorted_devices, dependencies
 
 
 def _dev_type(content):
@@ -842,7 +976,11 @@ def ifup(iface):
 
 def ifdown(iface):
     "Bring down an interface"
-    rc, _, _ = cmd.exec_sync([constants.EXT_IFDOWN, iface])
+    try:
+        rc, _, _ = cmd.exec_sync([constants.EXT_IFDOWN, iface])
+    finally:
+        # ifdown may stop dhclient.
+        dhclient.invalidate_index()
     return rc
 
 
@@ -852,10 +990,14 @@ def _exec_ifup_by_name(iface_name, cgroup=dhclient.DHCLIENT_CGROUP):
     """
     cmds = [constants.EXT_IFUP, iface_name]
 
-    if cgroup:
-        rc, out, err = cmd.exec_systemd_new_unit(cmds, slice_name=cgroup)
-    else:
-        rc, out, err = cmd.exec_sync(cmds)
+    try:
+        if cgroup:
+            rc, out, err = cmd.exec_systemd_new_unit(cmds, slice_name=cgroup)
+        else:
+            rc, out, err = cmd.exec_sync(cmds)
+    finally:
+        # ifup may start dhclient.
+        dhclient.invalidate_index()
 
     if rc != 0:
         # In /etc/sysconfig/network-scripts/ifup* the last line usually
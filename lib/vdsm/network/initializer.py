@@ -20,11 +20,13 @@ from __future__ import absolute_import
 
 from vdsm import supervdsm
 from vdsm.network import dhclient_monitor
+from vdsm.network.netinfo import cache as netinfo_cache
 from vdsm.network.nm import networkmanager
 
 
 def init_privileged_network_components():
     networkmanager.init()
+    netinfo_cache.start_devices_cache()
 
 
 def init_unprivileged_network_components(cif):
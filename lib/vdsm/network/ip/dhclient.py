@@ -25,8 +25,10 @@ import logging
 import os
 import signal
 import subprocess
+import threading
 
 from vdsm import concurrent
+from vdsm.config import config
 from vdsm.network import cmd
 from vdsm.network import errors as ne
 from vdsm.network.link import iface as linkiface
@@ -34,6 +36,7 @@ from vdsm.common.cache import memoized
 from vdsm.common.cmdutils import CommandPath
 from vdsm.common.fileutils import rm_file
 from vdsm.common.proc import pgrep
+from vdsm.common.time import monotonic_time
 
 from . import address
 
@@ -45,6 +48,8 @@ LEASE_FILE = os.path.join(LEASE_DIR, 'dhclient{0}--{1}.lease')
 DHCP4 = 'dhcpv4'
 DHCP6 = 'dhcpv6'
 
+_INDEX_TTL = config.getint('vars', 'dhclient_index_ttl')
+
 
 class DhcpClient(object):
     PID_FILE = '/var/run/dhclient%s-%s.pid'
@@ -76,7 +81,10 @@ class DhcpClient(object):
         if self.duid_source_file and supports_duid_file():
             cmds += ['-df', self.duid_source_file]
         cmds += [self.iface]
-        return cmd.exec_systemd_new_unit(cmds, slice_name=self._cgroup)
+        try:
+            return cmd.exec_systemd_new_unit(cmds, slice_name=self._cgroup)
+        finally:
+            _index.invalidate()
 
     def start(self, blocking):
         if blocking:
@@ -97,6 +105,7 @@ class DhcpClient(object):
         else:
             logging.info('Stopping dhclient-%s on %s', self.family, self.iface)
             _kill_and_rm_pid(pid, self.pidFile)
+            _index.invalidate()
             if linkiface.exists(self.iface):
                 address.flush(self.iface)
 
@@ -104,44 +113,127 @@ class DhcpClient(object):
 def kill(device_name, family=4):
     if not linkiface.exists(device_name):
         return
-    for pid, pid_file in _pid_lookup(device_name, family):
+    clients = _index.lookup(device_name, family)
+    for pid, pid_file in clients:
         logging.info('Stopping dhclient-%s on %s', family, device_name)
         _kill_and_rm_pid(pid, pid_file)
+    if clients:
+        _index.invalidate()
 
 
 def is_active(device_name, family):
-    for pid, _ in _pid_lookup(device_name, family):
-        return True
-    return False
+    return bool(_index.lookup(device_name, family))
 
 
 def dhcp_info(devices):
     info = {devname: {DHCP4: False, DHCP6: False} for devname in devices}
 
-    for pid in pgrep('dhclient'):
-        args = _read_cmdline(pid)
-        if not args:
-            continue
-
-        dev = args[-1]
+    for dev, family in _index.clients():
         if dev not in info:
             continue
 
-        dhcp_version_key = DHCP6 if '-6' in args[:-1] else DHCP4
+        dhcp_version_key = DHCP6 if family == 6 else DHCP4
         info[dev][dhcp_version_key] = True
 
     return info
 
 
-def _pid_lookup(device_name, family):
+def invalidate_index():
+    """
+    Drop the index of running dhclient processes. Must be called after
+    starting or stopping dhclient outside of this module.
+    """
+    _index.invalidate()
+
+
+def index_stats():
+    return _index.stats()
+
+
+class ClientIndex(object):
+    """
+    Index of the running dhclient processes by device and family, shared by
+    all lookups until vdsm starts or stops a dhclient, or the index is older
+    than ttl seconds. A dhclient started or stopped by someone else is seen
+    after ttl seconds.
+    """
+
+    def __init__(self, ttl=_INDEX_TTL, clock=monotonic_time):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (device, family) -> list of (pid, pid_file).
+        self._clients = None
+        self._expires = 0
+        self._generation = 0
+        self._scanned = None
+        self._lookups = 0
+        self._scans = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._clients = None
+            self._generation += 1
+
+    def lookup(self, device_name, family):
+        """
+        Return a list of (pid, pid_file) of the dhclient processes running
+        for device_name and family.
+        """
+        return list(self._get().get((device_name, family), ()))
+
+    def clients(self):
+        """
+        Return a list of (device, family) with a running dhclient process.
+        """
+        return list(self._get())
+
+    def stats(self):
+        """
+        Return the number of lookups and scans, and the age of the index in
+        seconds, or None if there is no index.
+        """
+        with self._lock:
+            if self._clients is None or self._scanned is None:
+                age = None
+            else:
+                age = self._clock() - self._scanned
+            return {'lookups': self._lookups, 'scans': self._scans,
+                    'age': age}
+
+    def _get(self):
+        with self._lock:
+            self._lookups += 1
+            if self._clock() >= self._expires:
+                self._clients = None
+            if self._clients is not None:
+                return self._clients
+            generation = self._generation
+            self._scans += 1
+
+        now = self._clock()
+        clients = _scan_clients()
+
+        with self._lock:
+            # Do not keep an index scanned while vdsm started or stopped a
+            # dhclient.
+            if generation == self._generation:
+                self._clients = clients
+                self._scanned = now
+                self._expires = now + self._ttl
+
+        return clients
+
+
+def _scan_clients():
+    clients = {}
     for pid in pgrep('dhclient'):
         args = _read_cmdline(pid)
         if not args:
             continue
 
-        if args[-1] != device_name:  # dhclient of another device
-            continue
-        tokens = iter(args)
+        device_name = args[-1]
+        tokens = iter(args[:-1])
         pid_file = '/var/run/dhclient.pid'  # Default client pid location
         running_family = 4
         for token in tokens:
@@ -152,10 +244,9 @@ def _pid_lookup(device_name, family):
             elif token == '-6':
                 running_family = 6
 
-        if running_family != family:
-            continue
-
-        yield pid, pid_file
+        clients.setdefault((device_name, running_family), []).append(
+            (pid, pid_file))
+    return clients
 
 
 def _read_cmdline(pid):
@@ -209,3 +300,6 @@ def _kill_and_rm_pid(pid, pid_file):
             raise
     if pid_file is not None:
         rm_file(pid_file)
+
+
+_index = ClientIndex()
@@ -280,12 +280,16 @@ def _bondExists(bondName):
     return os.path.exists('/sys/class/net/%s/bonding' % bondName)
 
 
-def getLinks():
-    """Return an iterator of Link objects, each per a link in the system."""
+def getLinks(stats=False):
+    """Return an iterator of Link objects, each per a link in the system.
+
+    If stats is True, links reported by netlink also have a stats attribute
+    with their statistics counters.
+    """
     dpdk_links = (dpdk.link_info(dev_name, dev_info['pci_addr'])
                   for dev_name, dev_info
                   in six.viewitems(dpdk.get_dpdk_devices()))
-    for data in itertools.chain(link.iter_links(), dpdk_links):
+    for data in itertools.chain(link.iter_links(stats=stats), dpdk_links):
         try:
             yield Link.fromDict(data)
         except IOError:  # If a link goes missing we just don't report it
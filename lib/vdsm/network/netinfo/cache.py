@@ -19,18 +19,26 @@
 #
 
 from __future__ import absolute_import
+import copy
 import logging
 import os
 import errno
+import threading
 import six
 
+from vdsm import concurrent
+from vdsm.common.time import monotonic_time
+from vdsm.config import config
 from vdsm.network import netinfo
 from vdsm.network.ip.address import ipv6_supported
 from vdsm.network.ip import dhclient
+from vdsm.network.ipwrapper import getLink
 from vdsm.network.ipwrapper import getLinks
+from vdsm.network.ipwrapper import Link
 from vdsm.network.link import dpdk
 from vdsm.network.netconfpersistence import RunningConfig
 from vdsm.network.netlink import link as nl_link
+from vdsm.network.netlink import monitor
 
 from .addresses import getIpAddrs, getIpInfo, is_ipv6_local_auto
 from . import bonding
@@ -48,6 +56,10 @@ from .qos import report_network_qos
 # TODO: Get switch type from the system.
 LEGACY_SWITCH = {'switch': 'legacy'}
 
+_DEVICES_CACHE = config.getboolean('vars', 'net_devices_cache')
+_DEVICES_CACHE_CHECK = config.getboolean('vars', 'net_devices_cache_check')
+_DEVICES_CACHE_MAX_AGE = config.getint('vars', 'net_devices_cache_max_age')
+
 
 class NetworkIsMissing(Exception):
     pass
@@ -95,28 +107,14 @@ def _networks_report(vdsmnets, routes, ipaddrs, devices_info):
 
 
 def _devices_report(ipaddrs, routes):
-    devs_report = {'bondings': {}, 'bridges': {}, 'nics': {}, 'vlans': {}}
+    if _devices_cache is not None:
+        devs_report = _devices_cache.report(ipaddrs, routes)
+    else:
+        devs_report = _read_devices_report(ipaddrs, routes)
 
     devinfo_by_devname = {}
-    for dev in (link for link in getLinks() if not link.isHidden()):
-        if dev.isBRIDGE():
-            devinfo = devs_report['bridges'][dev.name] = bridges.info(dev)
-        elif dev.isNICLike():
-            if dev.isDPDK():
-                devinfo = devs_report['nics'][dev.name] = dpdk.info(dev)
-            else:
-                devinfo = devs_report['nics'][dev.name] = nics.info(dev)
-            devinfo.update(bonding.get_bond_slave_agg_info(dev.name))
-        elif dev.isBOND():
-            devinfo = devs_report['bondings'][dev.name] = bonding.info(dev)
-            devinfo.update(bonding.get_bond_agg_info(dev.name))
-            devinfo.update(LEGACY_SWITCH)
-        elif dev.isVLAN():
-            devinfo = devs_report['vlans'][dev.name] = vlans.info(dev)
-        else:
-            continue
-        devinfo.update(_devinfo(dev, routes, ipaddrs))
-        devinfo_by_devname[dev.name] = devinfo
+    for devs in six.itervalues(devs_report):
+        devinfo_by_devname.update(devs)
 
     dhcp_info = dhclient.dhcp_info(frozenset(devinfo_by_devname))
     for devname, devinfo in devinfo_by_devname.items():
@@ -127,6 +125,274 @@ def _devices_report(ipaddrs, routes):
     return devs_report
 
 
+def _read_devices_report(ipaddrs, routes):
+    devs_report = _empty_devices_report()
+    for dev in (link for link in getLinks() if not link.isHidden()):
+        entry = _device_info(dev)
+        if entry is None:
+            continue
+        devtype, devinfo = entry
+        devs_report[devtype][dev.name] = _device_report(
+            dev, devtype, devinfo, routes, ipaddrs)
+    return devs_report
+
+
+def _empty_devices_report():
+    return {'bondings': {}, 'bridges': {}, 'nics': {}, 'vlans': {}}
+
+
+def _device_info(dev):
+    """
+    Return the report type and the info of dev which is not modified unless
+    the link is modified, or None if dev is not reported.
+    """
+    if dev.isBRIDGE():
+        return 'bridges', bridges.info(dev)
+    elif dev.isNICLike():
+        if dev.isDPDK():
+            return 'nics', dpdk.info(dev)
+        return 'nics', nics.info(dev)
+    elif dev.isBOND():
+        devinfo = bonding.info(dev)
+        devinfo.update(LEGACY_SWITCH)
+        return 'bondings', devinfo
+    elif dev.isVLAN():
+        return 'vlans', vlans.info(dev)
+    return None
+
+
+def _device_report(dev, devtype, devinfo, routes, ipaddrs):
+    if devtype == 'nics':
+        devinfo.update(bonding.get_bond_slave_agg_info(dev.name))
+    elif devtype == 'bondings':
+        devinfo.update(bonding.get_bond_agg_info(dev.name))
+    devinfo.update(_devinfo(dev, routes, ipaddrs))
+    return devinfo
+
+
+class DevicesCache(object):
+    """
+    Keep the info of the host network devices in memory, so reports do not
+    read every device from netlink and sysfs.
+
+    The cache is updated by a netlink link events monitor: every event marks
+    the link, its master and its previous master as dirty, and only dirty
+    devices are read again by the next report. Addresses, routes and other
+    info changing without a link event are read on every report.
+
+    All devices are read again when the cache is older than max_age seconds,
+    in case a change was not notified by a link event. If check is True,
+    every cached report is compared with a full report, and differences are
+    logged.
+    """
+
+    def __init__(self, check=_DEVICES_CACHE_CHECK,
+                 max_age=_DEVICES_CACHE_MAX_AGE, clock=monotonic_time):
+        self._check = check
+        self._max_age = max_age
+        self._clock = clock
+        # Serializes reports, so concurrent callers do not read the same
+        # dirty devices.
+        self._report_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Device name -> (Link, report type, info). The report type and info
+        # are None if the device is not reported. None if all devices must be
+        # read.
+        self._devices = None
+        self._dirty = set()
+        self._expires = 0
+        self._generation = 0
+        self._monitor = None
+        self._thread = None
+        self._monitoring = False
+
+    def start(self):
+        self._monitor = monitor.Monitor(groups=('link',))
+        self._monitor.start()
+        # Events received before reading the devices are harmless, they only
+        # mark devices as dirty.
+        self._monitoring = True
+        self._thread = concurrent.thread(self._process_events,
+                                         name="netinfo/cache")
+        self._thread.start()
+
+    def stop(self):
+        if not self._monitor.is_stopped():
+            self._monitor.stop()
+        self._thread.join()
+        self._monitor.wait()
+
+    def invalidate(self, event):
+        """
+        Mark the devices affected by a netlink link event as dirty.
+        """
+        name = event.get('name')
+        if name is None:
+            return
+        with self._lock:
+            # Devices are marked even if all devices must be read, since the
+            # event may be for a device already read by a running report.
+            self._dirty.add(name)
+            if 'master' in event:
+                self._dirty.add(event['master'])
+            if self._devices is None:
+                return
+            entry = self._devices.get(name)
+            if entry is not None and entry[0].master:
+                self._dirty.add(entry[0].master)
+            if event.get('type') in ('macvlan', 'macvtap'):
+                # Virtual functions used by a macvtap device are hidden.
+                self._dirty.update(
+                    devname for devname, (dev, _, _)
+                    in six.iteritems(self._devices) if dev.isVF())
+
+    def invalidate_all(self):
+        with self._lock:
+            self._devices = None
+            self._generation += 1
+
+    def report(self, ipaddrs, routes):
+        """
+        Return a devices report, like _read_devices_report.
+        """
+        if not self._monitoring:
+            return _read_devices_report(ipaddrs, routes)
+
+        with self._report_lock:
+            devices = self._update()
+            devs_report = _empty_devices_report()
+            for name, (dev, devtype, devinfo) in six.iteritems(devices):
+                if devtype is None:
+                    continue
+                # Callers modify the returned info.
+                devs_report[devtype][name] = _device_report(
+                    dev, devtype, copy.deepcopy(devinfo), routes, ipaddrs)
+
+        # DPDK devices are not netlink devices, so they are not cached.
+        for dev in _dpdk_links():
+            if not dev.isHidden():
+                devtype, devinfo = _device_info(dev)
+                devs_report[devtype][dev.name] = _device_report(
+                    dev, devtype, devinfo, routes, ipaddrs)
+
+        if self._check:
+            devs_report = self._check_report(devs_report, ipaddrs, routes)
+
+        return devs_report
+
+    def _update(self):
+        with self._lock:
+            if self._clock() >= self._expires:
+                self._devices = None
+            devices = self._devices
+            generation = self._generation
+            dirty = self._dirty
+            self._dirty = set()
+
+        start = self._clock()
+        if devices is None:
+            devices = {}
+            for dev in _netlink_links():
+                devices[dev.name] = self._read_entry(dev)
+            logging.debug('Read %d network devices in %.2f seconds',
+                          len(devices), self._clock() - start)
+            expires = start + self._max_age
+        else:
+            # Do not modify the devices used by a concurrent invalidate().
+            devices = dict(devices)
+            try:
+                for name in dirty:
+                    self._update_device(devices, name)
+            except Exception:
+                # The dirty devices were not read, read all devices in the
+                # next report.
+                self.invalidate_all()
+                raise
+            expires = None
+
+        with self._lock:
+            # Do not keep devices read while the cache was invalidated.
+            if generation == self._generation:
+                self._devices = devices
+                if expires is not None:
+                    self._expires = expires
+
+        return devices
+
+    def _update_device(self, devices, name):
+        try:
+            dev = getLink(name)
+        except IOError as e:
+            if e.errno != errno.ENODEV:
+                raise
+            devices.pop(name, None)
+        else:
+            devices[name] = self._read_entry(dev)
+
+    def _read_entry(self, dev):
+        if not dev.isHidden():
+            entry = _device_info(dev)
+            if entry is not None:
+                devtype, devinfo = entry
+                return dev, devtype, devinfo
+        return dev, None, None
+
+    def _check_report(self, devs_report, ipaddrs, routes):
+        expected = _read_devices_report(ipaddrs, routes)
+        if devs_report == expected:
+            return devs_report
+
+        changed = set()
+        for devtype in expected:
+            names = set(devs_report[devtype]) | set(expected[devtype])
+            changed.update(
+                name for name in names
+                if devs_report[devtype].get(name) !=
+                expected[devtype].get(name))
+        logging.warning('Cached network devices report is inconsistent, '
+                        'devices: %s', sorted(changed))
+        self.invalidate_all()
+        return expected
+
+    def _process_events(self):
+        try:
+            for event in self._monitor:
+                self.invalidate(event)
+        finally:
+            self._monitoring = False
+            self.invalidate_all()
+
+
+def _netlink_links():
+    for data in nl_link.iter_links():
+        try:
+            yield Link.fromDict(data)
+        except IOError:  # If a link goes missing we just don't report it
+            continue
+
+
+def _dpdk_links():
+    for dev_name, dev_info in six.viewitems(dpdk.get_dpdk_devices()):
+        yield Link.fromDict(dpdk.link_info(dev_name, dev_info['pci_addr']))
+
+
+_devices_cache = None
+
+
+def start_devices_cache():
+    """
+    Start keeping the devices report in memory, if enabled.
+    """
+    global _devices_cache
+    if not _DEVICES_CACHE:
+        return
+    cache = DevicesCache()
+    cache.start()
+    _devices_cache = cache
+    logging.info('Network devices cache started (check=%s)',
+                 _DEVICES_CACHE_CHECK)
+
+
 def _permanent_hwaddr_info(devs_report):
     paddr = bonding.permanent_address()
     nics_info = devs_report.get('nics', {})
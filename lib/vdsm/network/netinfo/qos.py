@@ -32,6 +32,8 @@ def report_network_qos(nets_info, devs_info):
     qdiscs = defaultdict(list)
     for qdisc in tc.qdiscs(dev=None):  # None -> all dev qdiscs
         qdiscs[qdisc['dev']].append(qdisc)
+    # Networks on vlans of the same device share the device classes.
+    hfsc_classes = {}
     for net, attrs in nets_info.iteritems():
         iface = attrs['iface']
         if iface in devs_info['bridges']:
@@ -56,8 +58,11 @@ def report_network_qos(nets_info, devs_info):
                         DEFAULT_CLASSID)
 
         # Now that iface is either a bond or a nic, let's get the QoS info
-        classes = [cls for cls in tc.classes(iface, classid=class_id) if
-                   cls['kind'] == 'hfsc']
+        if iface not in hfsc_classes:
+            hfsc_classes[iface] = [cls for cls in tc.classes(iface) if
+                                   cls['kind'] == 'hfsc']
+        classes = [cls for cls in hfsc_classes[iface] if
+                   cls['handle'] == class_id]
         if classes:
             cls, = classes
             attrs['hostQos'] = {'out': cls['hfsc']}
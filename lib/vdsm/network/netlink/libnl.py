@@ -34,6 +34,7 @@ from __future__ import absolute_import
 
 from ctypes import CDLL, CFUNCTYPE, sizeof, get_errno, byref
 from ctypes import c_char, c_char_p, c_int, c_void_p, c_size_t, py_object
+from ctypes import c_uint64
 
 from vdsm.common.cache import memoized
 
@@ -157,6 +158,18 @@ class NlCbKind(object):
     NL_CB_CUSTOM = 3  # Customized handler specified by user
 
 
+# include/netlink/route/link.h
+class RtnlLinkStat(object):
+    RX_PACKETS = 0
+    TX_PACKETS = 1
+    RX_BYTES = 2
+    TX_BYTES = 3
+    RX_ERRORS = 4
+    TX_ERRORS = 5
+    RX_DROPPED = 6
+    TX_DROPPED = 7
+
+
 class RtnlObjectType(object):
     BASE = 'route'
     ADDR = BASE + '/addr'  # libnl/lib/route/addr.c
@@ -710,6 +723,19 @@ def rtnl_link_get_mtu(link):
     return mtu
 
 
+def rtnl_link_get_stat(link, stat_id):
+    """Return statistical counter of link object.
+
+    @arg link            Link object
+    @arg stat_id         Identifier of statistical counter, see RtnlLinkStat
+
+    @return Value of counter or 0 if not specified.
+    """
+    _rtnl_link_get_stat = _libnl_route(
+        'rtnl_link_get_stat', c_uint64, c_void_p, c_int)
+    return _rtnl_link_get_stat(link, stat_id)
+
+
 def rtnl_link_get_name(link):
     """Return name of link object.
 
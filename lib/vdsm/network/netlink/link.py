@@ -38,14 +38,21 @@ def get_link(name):
         return link_info
 
 
-def iter_links():
+def iter_links(stats=False):
     """Generator that yields an information dictionary for each link of the
-    system."""
+    system.
+
+    If stats is True, the dictionary also contains the link statistics
+    counters under the 'stats' key, taken from the same netlink dump.
+    """
     with _pool.socket() as sock:
         with _nl_link_cache(sock) as cache:
             link = libnl.nl_cache_get_first(cache)
             while link:
-                yield _link_info(link, cache=cache)
+                info = _link_info(link, cache=cache)
+                if stats:
+                    info['stats'] = _link_stats(link)
+                yield info
                 link = libnl.nl_cache_get_next(link)
 
 
@@ -104,6 +111,23 @@ def _link_info(link, cache=None):
     return info
 
 
+# Counters named after /sys/class/net/<link>/statistics files.
+_LINK_STATS = (
+    ('rx_bytes', libnl.RtnlLinkStat.RX_BYTES),
+    ('tx_bytes', libnl.RtnlLinkStat.TX_BYTES),
+    ('rx_dropped', libnl.RtnlLinkStat.RX_DROPPED),
+    ('tx_dropped', libnl.RtnlLinkStat.TX_DROPPED),
+    ('rx_errors', libnl.RtnlLinkStat.RX_ERRORS),
+    ('tx_errors', libnl.RtnlLinkStat.TX_ERRORS),
+)
+
+
+def _link_stats(link):
+    """Returns a dictionary with the statistics counters of the link."""
+    return {name: libnl.rtnl_link_get_stat(link, stat_id)
+            for name, stat_id in _LINK_STATS}
+
+
 def _link_index_to_name(link_index, cache=None):
     """Returns the textual name of the link with index equal to link_index."""
     if cache is None:
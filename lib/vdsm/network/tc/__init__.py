@@ -23,9 +23,11 @@ from collections import namedtuple
 from functools import partial
 import errno
 
+from vdsm.config import config
 from vdsm.network import ipwrapper
 
 from . import filter as tc_filter
+from . import _netlink
 from . import _parser
 from . import cls
 from . import qdisc
@@ -33,6 +35,8 @@ from ._wrapper import TrafficControlException
 
 QDISC_INGRESS = 'ffff:'
 
+_NETLINK = config.getboolean('vars', 'tc_netlink')
+
 
 def _addTarget(network, parent, target):
     fs = list(filters(network, parent))
@@ -181,6 +185,28 @@ def _iterate(module, dev, out=None, **kwargs):
         yield module.parse(tokens)
 
 
+def qdiscs(dev, out=None):
+    """
+    Generates information dictionaries of the qdiscs of dev, or of all devices
+    if dev is None.
+    """
+    if out is None and _NETLINK:
+        return _netlink.qdiscs(dev)
+    return _iterate(qdisc, dev, out=out)
+
+
+def classes(dev, out=None, parent=None, classid=None):
+    """
+    Generates information dictionaries of the classes of dev.
+    """
+    if out is None and _NETLINK:
+        return _netlink.classes(dev, parent=parent, classid=classid)
+    kwargs = {}
+    if parent is not None:
+        kwargs['parent'] = parent
+    if classid is not None:
+        kwargs['classid'] = classid
+    return _iterate(cls, dev, out=out, **kwargs)
+
+
 _filters = partial(_iterate, tc_filter)  # kwargs: parent and pref
-qdiscs = partial(_iterate, qdisc)  # kwargs: dev
-classes = partial(_iterate, cls)  # kwargs: parent and classid
@@ -0,0 +1,353 @@
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Read qdiscs and classes with rtnetlink dump requests (RTM_GETQDISC and
+RTM_GETTCLASS) instead of running tc and parsing its output.
+
+The reported dictionaries are the same as the ones returned by qdisc.parse and
+cls.parse. Kind specific attributes are reported for the hfsc, fq_codel, sfq
+and pfifo_fast kinds.
+"""
+from __future__ import absolute_import
+from contextlib import closing
+import errno
+import os
+import socket
+import struct
+
+from vdsm.network.netlink import link as nl_link
+
+from . import cls
+from ._wrapper import TrafficControlException
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWQDISC = 36
+RTM_GETQDISC = 38
+RTM_NEWTCLASS = 40
+RTM_GETTCLASS = 42
+
+TCA_KIND = 1
+TCA_OPTIONS = 2
+
+TC_H_ROOT = 0xFFFFFFFF
+TC_H_UNSPEC = 0
+
+TCA_FQ_CODEL_TARGET = 1
+TCA_FQ_CODEL_LIMIT = 2
+TCA_FQ_CODEL_INTERVAL = 3
+TCA_FQ_CODEL_ECN = 4
+TCA_FQ_CODEL_FLOWS = 5
+TCA_FQ_CODEL_QUANTUM = 6
+
+TCA_HFSC_RSC = 1
+TCA_HFSC_FSC = 2
+TCA_HFSC_USC = 3
+
+_TC_PRIO_MAX = 15
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_NLMSGERR = struct.Struct('=i')
+_TCMSG = struct.Struct('=BxxxiIII')
+_RTATTR = struct.Struct('=HH')
+_U32 = struct.Struct('=I')
+_HFSC_QOPT = struct.Struct('=H')
+_SERVICE_CURVE = struct.Struct('=III')
+_PRIO_QOPT = struct.Struct('=i16B')
+_SFQ_QOPT = struct.Struct('=IiIII')
+
+_RECV_SIZE = 65536
+
+
+def qdiscs(dev=None):
+    """
+    Generates the qdiscs of dev, or of all devices if dev is None, like
+    tc.qdiscs.
+    """
+    ifindex = 0 if dev is None else _ifindex(dev, ['qdisc', 'show'])
+    with closing(_socket()) as sock:
+        data = _dump(sock, RTM_GETQDISC, 0)
+    if dev is None:
+        return parse_qdiscs(data, names=_link_names())
+    return parse_qdiscs(data, ifindex=ifindex)
+
+
+def classes(dev, parent=None, classid=None):
+    """
+    Generates the classes of dev, like tc.classes.
+    """
+    ifindex = _ifindex(dev, ['class', 'show'])
+    with closing(_socket()) as sock:
+        data = _dump(sock, RTM_GETTCLASS, ifindex)
+    parent = None if parent is None else _parse_handle(parent)
+    classid = None if classid is None else _parse_handle(classid)
+    for msg_type, msg in _messages(data):
+        if msg_type != RTM_NEWTCLASS:
+            continue
+        _, _, handle, msg_parent, _ = _TCMSG.unpack_from(msg)
+        if parent is not None and msg_parent != parent:
+            continue
+        if classid is not None and handle != classid:
+            continue
+        yield _parse_class(msg)
+
+
+def parse_qdiscs(data, names=None, ifindex=0):
+    """
+    Generates the qdiscs in data, the messages of a RTM_GETQDISC dump, of the
+    ifindex link, or of all links if ifindex is 0. If names, a dict of link
+    indexes to names, is given, the qdiscs also report their device, like
+    "tc qdisc show".
+    """
+    for msg_type, msg in _messages(data):
+        if msg_type != RTM_NEWQDISC:
+            continue
+        qdisc = _parse_qdisc(msg, names, ifindex)
+        if qdisc is not None:
+            yield qdisc
+
+
+def parse_classes(data):
+    """
+    Generates the classes in data, the messages of a RTM_GETTCLASS dump.
+    """
+    for msg_type, msg in _messages(data):
+        if msg_type == RTM_NEWTCLASS:
+            yield _parse_class(msg)
+
+
+def _parse_qdisc(msg, names, ifindex):
+    _, msg_ifindex, handle, parent, info = _TCMSG.unpack_from(msg)
+    if ifindex and msg_ifindex != ifindex:
+        return None
+    attrs = _attrs(msg, _TCMSG.size)
+    kind = _parse_str(attrs.get(TCA_KIND, b''))
+    if kind == 'noqueue':
+        return None  # Like tc._iterate, do not report noqueue qdiscs.
+
+    data = {'kind': kind, 'handle': '%x:' % (handle >> 16)}
+    if names is not None:
+        data['dev'] = names.get(msg_ifindex, str(msg_ifindex))
+    if parent == TC_H_ROOT:
+        data['root'] = True
+    elif parent != TC_H_UNSPEC:
+        data['parent'] = _format_handle(parent)
+    if info != 1:
+        data['refcnt'] = info
+
+    spec_parser = _qdisc_spec.get(kind)
+    if spec_parser is not None and TCA_OPTIONS in attrs:
+        data[kind] = spec_parser(attrs[TCA_OPTIONS])
+    return data
+
+
+def _parse_class(msg):
+    _, _, handle, parent, info = _TCMSG.unpack_from(msg)
+    attrs = _attrs(msg, _TCMSG.size)
+    kind = _parse_str(attrs.get(TCA_KIND, b''))
+    data = {'kind': kind, 'handle': _format_handle(handle)}
+    if parent == TC_H_ROOT:
+        data['root'] = True
+    elif parent != TC_H_UNSPEC:
+        data['parent'] = _format_handle(parent)
+    if info:
+        data['leaf'] = '%x:' % (info >> 16)
+
+    if kind == 'hfsc' and TCA_OPTIONS in attrs:
+        curves = _parse_hfsc_class(attrs[TCA_OPTIONS])
+        if curves:
+            data[kind] = curves
+    return cls.report(data)
+
+
+def _parse_hfsc_qdisc(options):
+    defcls, = _HFSC_QOPT.unpack_from(options)
+    return {'default': defcls}
+
+
+def _parse_hfsc_class(options):
+    attrs = _attrs(options)
+    curves = {}
+    for attr_type, name in ((TCA_HFSC_RSC, 'rt'), (TCA_HFSC_FSC, 'ls'),
+                            (TCA_HFSC_USC, 'ul')):
+        if attr_type in attrs:
+            m1, d, m2 = _SERVICE_CURVE.unpack_from(attrs[attr_type])
+            # The kernel uses bytes per second, tc reports bits per second.
+            curves[name] = {'m1': m1 * 8, 'd': d, 'm2': m2 * 8}
+    if ('rt' in curves and 'ls' in curves and
+            curves['rt'] == curves['ls']):
+        # Like tc, report equal real time and link sharing curves as 'sc'.
+        curves['sc'] = curves.pop('rt')
+        del curves['ls']
+    return curves
+
+
+def _parse_fq_codel(options):
+    attrs = _attrs(options)
+    data = {}
+    for attr_type, name in ((TCA_FQ_CODEL_LIMIT, 'limit'),
+                            (TCA_FQ_CODEL_FLOWS, 'flows'),
+                            (TCA_FQ_CODEL_QUANTUM, 'quantum'),
+                            (TCA_FQ_CODEL_TARGET, 'target'),
+                            (TCA_FQ_CODEL_INTERVAL, 'interval')):
+        if attr_type in attrs:
+            data[name], = _U32.unpack_from(attrs[attr_type])
+    if TCA_FQ_CODEL_ECN in attrs and _U32.unpack_from(
+            attrs[TCA_FQ_CODEL_ECN])[0]:
+        data['ecn'] = True
+    return data
+
+
+def _parse_sfq(options):
+    quantum, perturb, limit, _, _ = _SFQ_QOPT.unpack_from(options)
+    data = {'limit': limit, 'quantum': quantum}
+    if perturb:
+        data['perturb'] = perturb
+    return data
+
+
+def _parse_pfifo_fast(options):
+    values = _PRIO_QOPT.unpack_from(options)
+    return {'bands': values[0], 'priomap': list(values[1:_TC_PRIO_MAX + 1])}
+
+
+_qdisc_spec = {
+    'fq_codel': _parse_fq_codel,
+    'hfsc': _parse_hfsc_qdisc,
+    'pfifo_fast': _parse_pfifo_fast,
+    'sfq': _parse_sfq,
+}
+
+
+def _format_handle(handle):
+    """Format a handle like tc print_tc_classid."""
+    major = handle >> 16
+    minor = handle & 0xFFFF
+    if handle == TC_H_ROOT:
+        return 'root'
+    elif handle == TC_H_UNSPEC:
+        return 'none'
+    elif major == 0:
+        return ':%x' % minor
+    elif minor == 0:
+        return '%x:' % major
+    return '%x:%x' % (major, minor)
+
+
+def _parse_handle(handle):
+    """Parse a handle like tc get_tc_classid."""
+    if handle == 'root':
+        return TC_H_ROOT
+    elif handle == 'none':
+        return TC_H_UNSPEC
+    major, _, minor = handle.partition(':')
+    return (int(major or '0', 16) << 16) | int(minor or '0', 16)
+
+
+def _parse_str(value):
+    value = value.split(b'\0', 1)[0]
+    return value if isinstance(value, str) else value.decode('ascii')
+
+
+def _messages(data):
+    """
+    Generates the type and the payload of the netlink messages in data.
+    """
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        yield msg_type, data[offset + _NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+def _attrs(data, offset=0):
+    """
+    Return a dict of the payloads of the route attributes in data, starting
+    at offset.
+    """
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _socket():
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def _dump(sock, request_type, ifindex, seq=1):
+    """
+    Send a dump request and return the received messages, up to the
+    NLMSG_DONE message.
+    """
+    tcmsg = _TCMSG.pack(socket.AF_UNSPEC, ifindex, 0, 0, 0)
+    request = _NLMSGHDR.pack(_NLMSGHDR.size + len(tcmsg), request_type,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + tcmsg
+    sock.sendto(request, (0, 0))
+
+    chunks = []
+    while True:
+        chunk = sock.recv(_RECV_SIZE)
+        for msg_type, msg in _messages(chunk):
+            if msg_type == NLMSG_DONE:
+                chunks.append(chunk)
+                return b''.join(chunks)
+            elif msg_type == NLMSG_ERROR:
+                error, = _NLMSGERR.unpack_from(msg)
+                if error:
+                    raise TrafficControlException(
+                        -error, os.strerror(-error),
+                        ['netlink', 'dump', request_type])
+        chunks.append(chunk)
+
+
+def _ifindex(dev, command):
+    try:
+        return nl_link.get_link(dev)['index']
+    except IOError as e:
+        if e.errno != errno.ENODEV:
+            raise
+        raise TrafficControlException(
+            errno.ENODEV, 'Cannot find device "%s"' % dev,
+            command + ['dev', dev])
+
+
+def _link_names():
+    return {link['index']: link['name'] for link in nl_link.iter_links()}
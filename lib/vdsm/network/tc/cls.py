@@ -85,6 +85,13 @@ def parse(tokens):
                     token = next(tokens)
                 except StopIteration:
                     break
+    return report(data)
+
+
+def report(data):
+    """Takes a dictionary of parsed class attributes and returns the
+    dictionary reported to the api."""
+    kind = data['kind']
     if kind == 'hfsc' and 'sc' in data.get(kind, {}):
         #  sc is a shorthand for when rt an ls are equal. For reporting to the
         #  api we separate it into the two components
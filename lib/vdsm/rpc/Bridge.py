@@ -15,6 +15,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
 from __future__ import absolute_import
+from collections import namedtuple
 from functools import partial
 
 import logging
@@ -59,6 +60,37 @@ class InvalidCall(Exception):
                 (self.function, self.arguments, self.error))
 
 
+class _Method(namedtuple('_Method', 'rep, class_name, method_name, '
+                                    'arg_names, method_args, call, ret')):
+    """
+    Compiled description of an API method.
+
+    rep          vdsmapi.MethodRep of the method
+    class_name   schema class name (e.g. "Host")
+    method_name  method name (e.g. "getStats")
+    arg_names    tuple of all argument names, in schema order
+    method_args  tuple of (name, has_default, default) for the arguments
+                 passed to the API method, excluding the API class ctor
+                 arguments
+    call         override function from command_info, or None
+    ret          result member name or function from command_info, or None
+    """
+
+    __slots__ = ()
+
+    def bind(self, argobj):
+        """
+        Return the positional arguments for calling the API method.
+        """
+        args = []
+        for name, has_default, default in self.method_args:
+            if name in argobj:
+                args.append(argobj[name])
+            elif has_default:
+                args.append(default)
+        return tuple(args)
+
+
 class DynamicBridge(object):
     def __init__(self):
         paths = [vdsmapi.find_schema()]
@@ -73,6 +105,7 @@ class DynamicBridge(object):
 
         self._threadLocal = threading.local()
         self.log = logging.getLogger('DynamicBridge')
+        self._methods = self._compile_methods()
 
     def register_server_address(self, server_address):
         self._threadLocal.server = server_address
@@ -108,11 +141,53 @@ class DynamicBridge(object):
 
     def dispatch(self, method):
         try:
-            className, methodName = method.split('.', 1)
-            self._schema.get_method(vdsmapi.MethodRep(className, methodName))
-        except (vdsmapi.MethodNotFound, ValueError):
+            return partial(self._dynamicMethod, self._methods[method])
+        except KeyError:
             raise yajsonrpc.JsonRpcMethodNotFoundError(method)
-        return partial(self._dynamicMethod, className, methodName)
+
+    def _compile_methods(self):
+        """
+        Build a method descriptor for every method in the schema, so
+        dispatching a call does not need to look up the schema and the API
+        classes again.
+        """
+        methods = {}
+        for method in self._schema.get_methods:
+            className, methodName = method.split('.', 1)
+            rep = vdsmapi.MethodRep(className, methodName)
+            api_class = self._get_api_class(className)
+            ctorArgs = getattr(api_class, 'ctorArgs', ())
+
+            method_args = []
+            for arg in self._schema.get_args(rep):
+                name = arg.get('name')
+                if name in ctorArgs:
+                    continue
+                if 'defaultvalue' in arg:
+                    default = arg['defaultvalue']
+                    default = vdsmapi.DEFAULT_VALUES.get(default, default)
+                    method_args.append((name, True, default))
+                else:
+                    method_args.append((name, False, None))
+
+            cmd = '%s_%s' % (className, methodName)
+            info = command_info.get(cmd, {})
+            methods[method] = _Method(
+                rep=rep,
+                class_name=className,
+                method_name=methodName,
+                arg_names=tuple(self._schema.get_arg_names(rep)),
+                method_args=tuple(method_args),
+                call=info.get('call'),
+                ret=info.get('ret'))
+        return methods
+
+    def _get_api_class(self, className):
+        className = self._convert_class_name(className)
+        if _glusterEnabled and className.startswith('Gluster'):
+            return getattr(gapi, className, None)
+        else:
+            return getattr(API, className, None)
 
     def _convert_class_name(self, name):
         """
@@ -126,7 +201,7 @@ class DynamicBridge(object):
         except KeyError:
             return name
 
-    def _get_method_args(self, rep, argObj):
+    def _get_api_instance(self, className, argObj):
         """
         An internal API call currently looks like:
 
@@ -136,34 +211,12 @@ class DynamicBridge(object):
         Eventually we can remove this instancing but for now that's the way it
         works.  Each API.py object defines its ctor_args so that we can query
         them from here.  For any given method, the method_args are obtained by
-        chopping off the ctor_args from the beginning of argObj.
+        chopping off the ctor_args from the beginning of argObj, see
+        _compile_methods().
         """
-        allArgs = self._schema.get_arg_names(rep)
-
-        class_name = self._convert_class_name(rep.object_name)
-        if _glusterEnabled and class_name.startswith('Gluster'):
-            ctorArgs = getattr(gapi, class_name).ctorArgs
-        else:
-            ctorArgs = getattr(API, class_name).ctorArgs
-
-        defaultArgs = self._schema.get_default_arg_names(rep)
-        defaultValues = self._schema.get_default_arg_values(rep)
-
-        # Determine the method arguments by subtraction
-        methodArgs = []
-        for arg in allArgs:
-            if arg not in ctorArgs:
-                methodArgs.append(arg)
-
-        return self._get_args(argObj, methodArgs, defaultArgs, defaultValues)
-
-    def _get_api_instance(self, className, argObj):
-        className = self._convert_class_name(className)
-
-        if _glusterEnabled and className.startswith('Gluster'):
-            apiObj = getattr(gapi, className)
-        else:
-            apiObj = getattr(API, className)
+        apiObj = self._get_api_class(className)
+        if apiObj is None:
+            raise AttributeError("API has no class %r" % className)
 
         ctorArgs = self._get_args(argObj, apiObj.ctorArgs, [], [])
         return apiObj(*ctorArgs)
@@ -176,18 +229,18 @@ class DynamicBridge(object):
 
         return kwargs
 
-    def _dynamicMethod(self, className, methodName, *args, **kwargs):
-        rep = vdsmapi.MethodRep(className, methodName)
-        argobj = self._name_args(args, kwargs, self._schema.get_arg_names(rep))
+    def _dynamicMethod(self, method, *args, **kwargs):
+        className = method.class_name
+        methodName = method.method_name
+        argobj = self._name_args(args, kwargs, method.arg_names)
 
-        self._schema.verify_args(rep, argobj)
+        self._schema.verify_args(method.rep, argobj)
         api = self._get_api_instance(className, argobj)
 
-        methodArgs = self._get_method_args(rep, argobj)
+        methodArgs = method.bind(argobj)
 
         # Call the override function (if given).  Otherwise, just call directly
-        cmd = '%s_%s' % (className, methodName)
-        fn = command_info.get(cmd, {}).get('call')
+        fn = method.call
         if fn:
             result = fn(api, argobj)
         else:
@@ -211,9 +264,9 @@ class DynamicBridge(object):
             msg = result['status']['message']
             raise yajsonrpc.JsonRpcError(code, msg)
 
-        retfield = command_info.get(cmd, {}).get('ret')
+        retfield = method.ret
         if isinstance(retfield, types.FunctionType):
-            if cmd == 'Host_getCapabilities':
+            if retfield is Host_getCapabilities_Ret:
                 ret = retfield(self._threadLocal.server, result)
             else:
                 ret = retfield(result)
@@ -223,8 +276,7 @@ class DynamicBridge(object):
         else:
             ret = self._get_result(result, retfield)
 
-        self._schema.verify_retval(vdsmapi.MethodRep(className, methodName),
-                                   ret)
+        self._schema.verify_retval(method.rep, ret)
         return ret
 
 
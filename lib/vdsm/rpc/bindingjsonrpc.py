@@ -18,11 +18,14 @@ from __future__ import absolute_import
 import functools
 import logging
 
+import six
+
 from yajsonrpc import JsonRpcServer
 from yajsonrpc.stompreactor import StompReactor
 
 from vdsm import concurrent
 from vdsm import executor
+from vdsm import metrics
 from vdsm.config import config
 
 
@@ -31,6 +34,7 @@ _TIMEOUT = config.getint('rpc', 'worker_timeout')
 _THREADS = config.getint('rpc', 'worker_threads')
 _TASK_PER_WORKER = config.getint('rpc', 'tasks_per_worker')
 _TASKS = _THREADS * _TASK_PER_WORKER
+_DISPATCH_WORKERS = config.getint('rpc', 'dispatch_workers')
 
 
 class BindingJsonRpc(object):
@@ -45,7 +49,9 @@ class BindingJsonRpc(object):
         self._server = JsonRpcServer(
             bridge, timeout, cif,
             functools.partial(self._executor.dispatch,
-                              timeout=_TIMEOUT, discard=False))
+                              timeout=_TIMEOUT, discard=False),
+            workers=_DISPATCH_WORKERS,
+            stats_callback=_send_dispatch_stats)
         self._reactor = StompReactor(subs)
         self.startReactor()
 
@@ -66,9 +72,10 @@ class BindingJsonRpc(object):
     def start(self):
         self._executor.start()
 
-        t = concurrent.thread(self._server.serve_requests,
-                              name='JsonRpcServer')
-        t.start()
+        for i in range(self._server.workers):
+            t = concurrent.thread(self._server.serve_requests,
+                                  name='JsonRpcServer/%d' % i)
+            t.start()
 
     def startReactor(self):
         reactorName = self._reactor.__class__.__name__
@@ -80,3 +87,13 @@ class BindingJsonRpc(object):
         self._server.stop()
         self._reactor.stop()
         self._executor.stop()
+
+
+def _send_dispatch_stats(queue_depth, stats):
+    prefix = "hosts.vdsm.jsonrpc"
+    report = {prefix + ".queue_depth": queue_depth}
+    for method, method_stats in six.iteritems(stats):
+        method_prefix = prefix + "." + method.replace(".", "_")
+        for name, value in six.iteritems(method_stats):
+            report[method_prefix + "." + name] = value
+    metrics.send(report)
@@ -539,6 +539,56 @@ class BufferedReader(asyncore.file_dispatcher):
         return False
 
 
+class LineReader(asyncore.file_dispatcher):
+    """
+    Read lines from file, notifying every line read, and notify when file was
+    closed.
+    """
+
+    def __init__(self, fd, receive, closed, bufsize=4096, map=None):
+        asyncore.file_dispatcher.__init__(self, fd, map=map)
+        filecontrol.set_close_on_exec(self._fileno)
+        self._receive = receive
+        self._closed = closed
+        self._bufsize = bufsize
+        self._data = bytearray()
+
+    def handle_read(self):
+        chunk = self.socket.read(self._bufsize)
+        if not chunk:
+            self.handle_close()
+            return
+        self._data += chunk
+        while self._receive is not None:
+            end = self._data.find(b"\n")
+            if end == -1:
+                break
+            line = bytes(self._data[:end])
+            del self._data[:end + 1]
+            self._receive(line)
+
+    def handle_close(self):
+        closed = self._closed
+        self.close()
+        if closed is not None:
+            closed()
+
+    def handle_error(self):
+        log.exception("Unhandled error in %s", self)
+        self.handle_close()
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self._receive = None
+        self._closed = None
+        asyncore.file_dispatcher.close(self)
+
+    def writable(self):
+        return False
+
+
 class Reaper(object):
     """
     Wait for process and notify when it has terminated.
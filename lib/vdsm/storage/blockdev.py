@@ -24,11 +24,26 @@ blockdev - data operations on block devices.
 
 from __future__ import absolute_import
 
+import collections
+import errno
+import fcntl
+import io
 import logging
+import mmap
+import os
+import stat
+import struct
+import threading
+
+import six
 
 from vdsm import cmdutils
+from vdsm import concurrent
 from vdsm import constants
 from vdsm import utils
+from vdsm.common import exception
+from vdsm.common.osutils import uninterruptible
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 
 from vdsm.storage import blkdiscard
@@ -44,6 +59,30 @@ log = logging.getLogger("storage.blockdev")
 # storage backends and transport to determine the best value.
 OPTIMAL_BLOCK_SIZE = constants.MEGAB
 
+# Ioctl from linux/fs.h.
+BLKZEROOUT = 0x127f
+
+# Zero methods used when zeroing in-process. Discard is never used, since
+# discard_zeroes_data is not reliable.
+ZERO_ZEROOUT = "zeroout"
+ZERO_WRITE = "write"
+
+# Devices are split into ranges of this size, zeroed concurrently. Using the
+# LVM extent size, so volumes are typically split into whole ranges.
+ZERO_RANGE_SIZE = 128 * constants.MEGAB
+
+# When the device does not support zeroing, ranges are zeroed by writing a
+# buffer of this size.
+ZERO_BUFFER_SIZE = 8 * constants.MEGAB
+
+_ZERO_IN_PROCESS = config.getboolean("irs", "zero_in_process")
+_ZERO_WORKERS = config.getint("irs", "zero_workers")
+_PROGRESS_INTERVAL = config.getint("irs", "progress_interval")
+
+# Limits the number of ranges zeroed concurrently on this host, when zeroing
+# multiple devices at the same time.
+_zero_slots = threading.BoundedSemaphore(_ZERO_WORKERS)
+
 
 def zero(device_path, size=None, task=None):
     """
@@ -72,6 +111,19 @@ def zero(device_path, size=None, task=None):
     log.info("Zeroing device %s (size=%d)", device_path, size)
     with utils.stopwatch("Zero device %s" % device_path,
                          level=logging.INFO, log=log):
+        if _ZERO_IN_PROCESS:
+            try:
+                zeroer = Zeroer(device_path, size)
+                if task:
+                    with task.abort_callback(zeroer.abort):
+                        zeroer.run()
+                else:
+                    zeroer.run()
+            except EnvironmentError as e:
+                raise se.VolumesZeroingError("Zeroing device %s failed: %s"
+                                             % (device_path, e))
+            return
+
         try:
             # Write optimal size blocks. Images are always aligned to
             # optimal size blocks, so we typically have only one call.
@@ -108,6 +160,193 @@ def _zero(path, offset, block_size, count, task=None):
         op.run()
 
 
+class Zeroer(object):
+    """
+    Zero a device in-process.
+
+    The device is split into ranges, zeroed by a pool of worker threads.
+    Ranges are zeroed using BLKZEROOUT if the device supports offloading
+    zeroing (e.g. WRITE SAME), or direct I/O writes of a zeroed buffer
+    otherwise.
+
+    The number of ranges zeroed concurrently on this host is limited by the
+    zero_workers option, so zeroing many devices at the same time does not
+    overload the storage.
+    """
+
+    def __init__(self, path, size, workers=_ZERO_WORKERS,
+                 range_size=ZERO_RANGE_SIZE, buffer_size=ZERO_BUFFER_SIZE,
+                 method=None, progress_interval=_PROGRESS_INTERVAL,
+                 clock=monotonic_time):
+        self._path = path
+        self._size = size
+        self._workers = workers
+        self._buffer_size = buffer_size
+        self._method = method or zero_method(path)
+        self._progress_interval = progress_interval
+        self._clock = clock
+        self._ranges = collections.deque()
+        for offset in six.moves.range(0, size, range_size):
+            self._ranges.append((offset, min(range_size, size - offset)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._aborted = False
+        self._error = None
+        self._done = 0
+        self._start = None
+        self._next_report = None
+
+    @property
+    def method(self):
+        return self._method
+
+    def abort(self):
+        """
+        Stop zeroing. Workers stop after zeroing the current chunk, and run()
+        raises `vdsm.common.exception.ActionStopped`.
+        """
+        self._aborted = True
+        self._stop.set()
+
+    def run(self):
+        workers = min(self._workers, len(self._ranges))
+        log.debug("Zeroing device %s using %s (workers=%d, ranges=%d)",
+                  self._path, self._method, workers, len(self._ranges))
+        self._start = self._clock()
+        self._next_report = self._start + self._progress_interval
+
+        threads = []
+        for i in range(workers):
+            t = concurrent.thread(self._worker, name="zero/%d" % i, log=log)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        if self._aborted:
+            raise exception.ActionStopped()
+        if self._error:
+            raise self._error
+        if self._done != self._size:
+            raise se.VolumesZeroingError(
+                "Zeroing device %s incomplete: %d/%d bytes zeroed"
+                % (self._path, self._done, self._size))
+
+        elapsed = self._clock() - self._start
+        log.info("Zeroed device %s using %s (%s)",
+                 self._path, self._method, self._throughput(elapsed))
+
+    def _worker(self):
+        try:
+            fd = os.open(self._path, os.O_WRONLY | os.O_DIRECT)
+            with io.FileIO(fd, "w", closefd=True) as f:
+                # Zeroed buffer aligned to page size, allowing direct I/O,
+                # reused for all writes. Pages are allocated only if the
+                # buffer is used.
+                buf = mmap.mmap(-1, self._buffer_size, mmap.MAP_SHARED)
+                with utils.closing(buf, log=log.name):
+                    while not self._stop.is_set():
+                        rng = self._next_range()
+                        if rng is None:
+                            break
+                        with _zero_slots:
+                            self._zero_range(f, buf, *rng)
+        except Exception as e:
+            log.exception("Zeroing device %s failed", self._path)
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+
+    def _next_range(self):
+        try:
+            return self._ranges.popleft()
+        except IndexError:
+            return None
+
+    def _zero_range(self, f, buf, offset, length):
+        if self._method != ZERO_WRITE:
+            try:
+                self._ioctl(f, offset, length)
+                self._update(length)
+                return
+            except EnvironmentError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY,
+                                   errno.EINVAL):
+                    raise
+                with self._lock:
+                    if self._method != ZERO_WRITE:
+                        log.warning("Device %s does not support %s (%s), "
+                                    "falling back to writes",
+                                    self._path, self._method, e)
+                        self._method = ZERO_WRITE
+        self._write(f, buf, offset, length)
+
+    def _ioctl(self, f, offset, length):
+        fcntl.ioctl(f.fileno(), BLKZEROOUT, struct.pack("QQ", offset, length))
+
+    def _write(self, f, buf, offset, length):
+        f.seek(offset)
+        end = offset + length
+        while offset < end and not self._stop.is_set():
+            n = min(len(buf), end - offset)
+            pos = 0
+            while pos < n:
+                if six.PY2:
+                    wbuf = buffer(buf, pos, n - pos)
+                else:
+                    wbuf = memoryview(buf)[pos:n]
+                pos += uninterruptible(f.write, wbuf)
+            offset += n
+            self._update(n)
+
+    def _update(self, n):
+        with self._lock:
+            self._done += n
+            now = self._clock()
+            if now < self._next_report:
+                return
+            self._next_report = now + self._progress_interval
+            done = self._done
+        log.info("Zeroing device %s: %d%% done (%s)",
+                 self._path, done * 100 // self._size,
+                 self._throughput(now - self._start))
+
+    def _throughput(self, elapsed):
+        mib = self._done / float(constants.MEGAB)
+        rate = mib / elapsed if elapsed > 0 else 0
+        return "%.2f MiB in %.2f seconds, %.2f MiB/s" % (mib, elapsed, rate)
+
+
+def zero_method(path):
+    """
+    Return the best method for zeroing path, based on the device queue
+    limits.
+
+    Returns:
+        ZERO_ZEROOUT if the device supports offloading zeroing, or ZERO_WRITE
+        otherwise.
+    """
+    st = os.stat(path)
+    if not stat.S_ISBLK(st.st_mode):
+        return ZERO_WRITE
+    queue = "/sys/dev/block/%d:%d/queue" % (os.major(st.st_rdev),
+                                            os.minor(st.st_rdev))
+    if (_queue_limit(queue, "write_zeroes_max_bytes") or
+            _queue_limit(queue, "write_same_max_bytes")):
+        return ZERO_ZEROOUT
+    return ZERO_WRITE
+
+
+def _queue_limit(queue, name):
+    try:
+        with open(os.path.join(queue, name)) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        # Not supported by this kernel.
+        return 0
+
+
 def discard(device_path):
     """
     Discard a block device.
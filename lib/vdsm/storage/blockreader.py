@@ -0,0 +1,244 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+blockreader - read and write block storage metadata in long lived helper
+processes.
+
+Direct I/O to a device that stopped responding (e.g. a multipath device
+without paths and queue_if_no_path) blocks the calling thread in D state.
+Doing this I/O in helper processes keeps vdsm threads responsive: a read or
+write that does not complete in time fails, and the helper is replaced by a
+new one.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import json
+import logging
+import os
+import select
+import subprocess
+import threading
+
+from vdsm import cmdutils
+from vdsm.common.compat import CPopen
+from vdsm.common.osutils import uninterruptible
+from vdsm.common.time import monotonic_time
+from vdsm.constants import P_VDSM_EXEC
+from vdsm.storage import directio
+
+_BLOCKREADER = os.path.join(P_VDSM_EXEC, 'blockreader')
+
+_READ_SIZE = 64 * 1024
+
+log = logging.getLogger("storage.blockreader")
+
+
+class Error(Exception):
+    """ The blockreader helper failed """
+
+
+class Timeout(Error):
+    """ The blockreader helper did not reply in time """
+
+
+class BlockReader(object):
+    """
+    Pool of up to workers long lived blockreader helper processes.
+
+    Helpers are started when needed. A helper that failed or did not reply in
+    timeout seconds is terminated, and replaced by a new helper on the next
+    request.
+    """
+
+    def __init__(self, workers, timeout, helper=_BLOCKREADER):
+        self._max_workers = workers
+        self._timeout = timeout
+        self._helper = helper
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._workers = 0
+        self._latency = {
+            "read": directio.LatencyHistogram(),
+            "write": directio.LatencyHistogram(),
+        }
+
+    def read(self, path, ranges):
+        """
+        Read ranges of path using direct I/O in a helper.
+
+        ranges is a list of (offset, size) tuples aligned to
+        `vdsm.storage.directio.ALIGNMENT`. Returns a list of strings with the
+        data of each range, like `vdsm.storage.directio.readblocks`.
+
+        Raises OSError if reading failed, ValueError if a range is not
+        aligned, or Error if the helper failed or did not reply in time.
+        """
+        return self._run("read", path, ranges)
+
+    def write(self, path, offset, data):
+        """
+        Write data to path at offset using direct I/O in a helper, like
+        `vdsm.storage.directio.writeblock`.
+
+        Raises OSError if writing failed or was incomplete, ValueError if
+        offset or the length of data is not aligned, or Error if the helper
+        failed or did not reply in time. After a timeout, the write may or may
+        not have completed.
+        """
+        self._run("write", path, offset, data)
+
+    def latency(self):
+        """
+        Return the latency histograms of reads and writes, measured around
+        the round trip to the helper, including failed requests.
+        """
+        return {op: histogram.info()
+                for op, histogram in self._latency.items()}
+
+    def close(self):
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+            self._workers -= len(idle)
+        for worker in idle:
+            worker.close()
+
+    def _run(self, op, *args):
+        worker = self._acquire()
+        start = monotonic_time()
+        try:
+            return getattr(worker, op)(*args, timeout=self._timeout)
+        except Error:
+            worker.close()
+            worker = None
+            raise
+        finally:
+            self._latency[op].add(monotonic_time() - start)
+            self._release(worker)
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._workers >= self._max_workers:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+        try:
+            return _ReaderWorker(self._helper)
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            if worker is None:
+                self._workers -= 1
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+
+
+class _ReaderWorker(object):
+
+    def __init__(self, helper):
+        cmd = cmdutils.wrap_command([helper])
+        log.info("Starting blockreader helper")
+        self._proc = CPopen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=None)
+        self._poller = select.poll()
+        self._poller.register(self._proc.stdout.fileno(), select.POLLIN)
+        self._buf = b""
+
+    def read(self, path, ranges, timeout):
+        deadline = monotonic_time() + timeout
+        self._send({"op": "read", "path": path, "ranges": ranges})
+        reply = self._reply(deadline, path)
+        data = self._readexactly(sum(reply["sizes"]), deadline, path)
+        blocks = []
+        pos = 0
+        for size in reply["sizes"]:
+            blocks.append(data[pos:pos + size])
+            pos += size
+        return blocks
+
+    def write(self, path, offset, data, timeout):
+        deadline = monotonic_time() + timeout
+        # Metadata writes are much smaller than the pipe buffer, so sending
+        # does not block even if the helper is hung.
+        self._send({"op": "write", "path": path, "offset": offset,
+                    "size": len(data)}, data)
+        self._reply(deadline, path)
+
+    def close(self):
+        log.info("Terminating blockreader helper")
+        self._proc.stdin.close()
+        if self._proc.poll() is None:
+            self._proc.kill()
+        # A helper blocked in D state exits only when its read completes, so
+        # it is not waited for here; subprocess reaps it later.
+        self._proc.poll()
+
+    def _send(self, request, data=b""):
+        try:
+            self._proc.stdin.write(json.dumps(request) + "\n")
+            self._proc.stdin.write(data)
+            self._proc.stdin.flush()
+        except EnvironmentError as e:
+            raise Error("Cannot send request to blockreader helper: %s" % e)
+
+    def _reply(self, deadline, path):
+        reply = json.loads(self._readline(deadline, path))
+        if "errno" in reply:
+            if reply["errno"] is None:
+                raise ValueError(reply["error"])
+            raise OSError(reply["errno"], reply["error"])
+        return reply
+
+    def _readline(self, deadline, path):
+        while b"\n" not in self._buf:
+            self._fill(deadline, path)
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line
+
+    def _readexactly(self, size, deadline, path):
+        while len(self._buf) < size:
+            self._fill(deadline, path)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def _fill(self, deadline, path):
+        timeout = deadline - monotonic_time()
+        try:
+            ready = timeout > 0 and self._poller.poll(timeout * 1000)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            # Poll again with the remaining time.
+            return
+        if not ready:
+            raise Timeout("Timeout accessing %s in blockreader helper" %
+                          path)
+        chunk = uninterruptible(os.read, self._proc.stdout.fileno(),
+                                _READ_SIZE)
+        if not chunk:
+            raise Error("blockreader helper terminated")
+        self._buf += chunk
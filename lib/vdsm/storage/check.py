@@ -27,12 +27,18 @@ CheckService     entry point for starting and stopping path checkers.
 DirectioChecker  checker using dd process for file or block based
                  volumes.
 
+HelperChecker    checker reading file or block based volumes in a long lived
+                 helper process shared by all checkers.
+
 CheckResult      result object provided to user callback on each check.
 """
 
 from __future__ import absolute_import
 
+import itertools
+import json
 import logging
+import os
 import re
 import subprocess
 import threading
@@ -41,12 +47,17 @@ from vdsm import cmdutils
 from vdsm import concurrent
 from vdsm import constants
 from vdsm.common.compat import CPopen
+from vdsm.config import config
 from vdsm.storage import asyncevent
 from vdsm.storage import asyncutils
 from vdsm.storage import exception
 
 EXEC_ERROR = 127
 
+_DIOCHECK = "/usr/libexec/vdsm/diocheck"
+
+_USE_HELPER = config.getboolean("irs", "check_helper")
+
 _log = logging.getLogger("storage.check")
 
 
@@ -78,12 +89,13 @@ class CheckService(object):
 
     """
 
-    def __init__(self):
+    def __init__(self, use_helper=_USE_HELPER):
         self._lock = threading.Lock()
         self._loop = asyncevent.EventLoop()
         self._thread = concurrent.thread(self._loop.run_forever,
                                          name="check/loop")
         self._checkers = {}
+        self._helper = CheckHelper(self._loop) if use_helper else None
 
     def start(self):
         """
@@ -107,15 +119,20 @@ class CheckService(object):
             for checker in self._checkers.values():
                 self._loop.call_soon_threadsafe(checker.stop)
             self._checkers.clear()
+            if self._helper:
+                self._loop.call_soon_threadsafe(self._helper.close)
             self._loop.call_soon_threadsafe(self._loop.stop)
             self._thread.join()
             self._loop.close()
 
-    def start_checking(self, path, complete, interval=10.0):
+    def start_checking(self, path, complete, interval=10.0, timeout=None):
         """
         Start checking path every interval secconds. On check, invoke the
         complete callback with a CheckResult instance.
 
+        When using the check helper and timeout is set, a check which did not
+        complete within timeout seconds is reported as failed.
+
         Note that the complete callback is invoked in the check thread, and
         must not block, as it will block all other checkers.
         """
@@ -123,8 +140,13 @@ class CheckService(object):
         with self._lock:
             if path in self._checkers:
                 raise RuntimeError("Already checking path %r" % path)
-            checker = DirectioChecker(self._loop, path, complete,
-                                      interval=interval)
+            if self._helper:
+                checker = HelperChecker(self._loop, self._helper, path,
+                                        complete, interval=interval,
+                                        timeout=timeout)
+            else:
+                checker = DirectioChecker(self._loop, path, complete,
+                                          interval=interval)
             self._checkers[path] = checker
         self._loop.call_soon_threadsafe(checker.start)
 
@@ -249,7 +271,7 @@ class DirectioChecker(object):
         _log.debug("Checker %r stopping", self._path)
         self._state = STOPPING
         self._looper.stop()
-        if self._proc is None:
+        if not self._in_progress():
             self._stop_completed()
 
     def wait(self, timeout=None):
@@ -263,6 +285,9 @@ class DirectioChecker(object):
     def is_running(self):
         return self._state is not IDLE
 
+    def _in_progress(self):
+        return self._proc is not None
+
     def _stop_completed(self):
         self._state = IDLE
         _log.debug("Checker %r stopped", self._path)
@@ -274,7 +299,7 @@ class DirectioChecker(object):
         the checker is stopped.
         """
         assert self._state is RUNNING
-        if self._proc:
+        if self._in_progress():
             _log.warning("Checker %r is blocked for %.2f seconds",
                          self._path, self._loop.time() - self._check_time)
             return
@@ -328,11 +353,13 @@ class DirectioChecker(object):
                    self._path, rc, elapsed)
         self._reaper = None
         self._proc = None
+        self._report(CheckResult(self._path, rc, self._err, self._check_time,
+                                 elapsed))
+
+    def _report(self, result):
         if self._state is STOPPING:
             self._stop_completed()
             return
-        result = CheckResult(self._path, rc, self._err, self._check_time,
-                             elapsed)
         self._complete(result)
 
     def __repr__(self):
@@ -344,6 +371,174 @@ class DirectioChecker(object):
         return "<%s at 0x%x>" % (" ".join(info), id(self))
 
 
+class HelperChecker(DirectioChecker):
+    """
+    Check path availability using direct I/O in a CheckHelper process.
+
+    HelperChecker behaves like DirectioChecker, but instead of starting a dd
+    process for each check, it sends a read request to a helper process
+    shared by all checkers, and the complete callback is invoked with a
+    HelperResult instance.
+
+    If timeout is set and a check did not complete within timeout seconds,
+    the complete callback is invoked with a failed result. The check is
+    still in progress, so the next checks are delayed until the helper
+    completes the read.
+    """
+
+    def __init__(self, loop, helper, path, complete, interval=10.0,
+                 timeout=None):
+        super(HelperChecker, self).__init__(loop, path, complete,
+                                            interval=interval)
+        self._helper = helper
+        self._timeout = timeout
+        self._request = None
+        self._timer = None
+        self._timed_out = False
+
+    def _in_progress(self):
+        return self._request is not None
+
+    def _start_process(self):
+        """
+        Send a read request to the helper. When the read was completed,
+        _read_completed will be called.
+        """
+        self._timed_out = False
+        self._request = self._helper.read(self._path, self._read_completed)
+        if self._timeout is not None:
+            self._timer = self._loop.call_later(self._timeout,
+                                                self._check_timed_out)
+
+    def _check_timed_out(self):
+        assert self._state is not IDLE
+        self._timer = None
+        self._timed_out = True
+        elapsed = self._loop.time() - self._check_time
+        _log.warning("Checker %r timed out after %.2f seconds",
+                     self._path, elapsed)
+        if self._state is RUNNING:
+            self._complete(HelperResult(
+                self._path, None, "Timeout reading path", self._check_time,
+                elapsed))
+
+    def _read_completed(self, delay, error):
+        """
+        Called when the helper has completed reading path.
+        """
+        assert self._state is not IDLE
+        now = self._loop.time()
+        elapsed = now - self._check_time
+        _log.debug("FINISH check %r (error=%s, elapsed=%.02f)",
+                   self._path, error, elapsed)
+        self._request = None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._timed_out:
+            # Already reported.
+            if self._state is STOPPING:
+                self._stop_completed()
+            return
+        self._report(HelperResult(self._path, delay, error, self._check_time,
+                                  elapsed))
+
+    def _check_completed(self, rc):
+        """
+        Called when sending the read request failed.
+        """
+        self._read_completed(None, self._err)
+
+
+class CheckHelper(object):
+    """
+    Long lived helper process reading paths using direct I/O for all
+    checkers.
+
+    The helper is started when reading the first path, and started again if
+    it has terminated. CheckHelper is not thread safe; it must be used only
+    in the event loop thread.
+    """
+
+    log = logging.getLogger("storage.checkhelper")
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._proc = None
+        self._reader = None
+        self._pending = {}
+        self._ids = itertools.count()
+
+    def read(self, path, complete):
+        """
+        Read path in the helper process, and invoke complete(delay, error)
+        when the read was completed. On success error is None, on failure
+        delay is None.
+
+        Returns the request id.
+        """
+        if self._proc is None:
+            self._start()
+        req_id = next(self._ids)
+        line = json.dumps({"id": req_id, "path": path}) + "\n"
+        self._pending[req_id] = complete
+        try:
+            os.write(self._proc.stdin.fileno(), line.encode("utf-8"))
+        except EnvironmentError:
+            del self._pending[req_id]
+            self._terminate()
+            raise
+        return req_id
+
+    def close(self):
+        """
+        Terminate the helper, failing pending requests.
+        """
+        if self._proc is not None:
+            self._terminate()
+
+    def _start(self):
+        cmd = cmdutils.wrap_command([_DIOCHECK])
+        self.log.info("Starting check helper")
+        self._proc = CPopen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=None)
+        self._reader = self._loop.create_dispatcher(
+            asyncevent.LineReader, self._proc.stdout, self._received,
+            self._closed)
+
+    def _received(self, line):
+        try:
+            reply = json.loads(line)
+            req_id = reply["id"]
+        except (ValueError, KeyError, TypeError):
+            self.log.error("Invalid reply from check helper: %r", line)
+            return
+        complete = self._pending.pop(req_id, None)
+        if complete is None:
+            return
+        complete(reply.get("delay"), reply.get("error"))
+
+    def _closed(self):
+        self.log.warning("Check helper terminated")
+        self._reader = None
+        self._terminate()
+
+    def _terminate(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        proc = self._proc
+        self._proc = None
+        proc.stdin.close()
+        if proc.poll() is None:
+            proc.kill()
+            asyncevent.Reaper(self._loop, proc, lambda rc: None)
+        pending = self._pending
+        self._pending = {}
+        for complete in pending.values():
+            complete(None, "Check helper terminated")
+
+
 class CheckResult(object):
 
     _PATTERN = re.compile(br".*, ([\de\-.]+) s,[^,]+")
@@ -377,3 +572,23 @@ class CheckResult(object):
         return "<%s path=%s rc=%d err=%r time=%.2f elapsed=%.2f at 0x%x>" % (
             self.__class__.__name__, self.path, self.rc, self.err, self.time,
             self.elapsed, id(self))
+
+
+class HelperResult(object):
+
+    def __init__(self, path, delay, error, time, elapsed):
+        self.path = path
+        self.read_delay = delay
+        self.error = error
+        self.time = time
+        self.elapsed = elapsed
+
+    def delay(self):
+        if self.error is not None:
+            raise exception.MiscFileReadException(self.path, self.error)
+        return self.read_delay
+
+    def __repr__(self):
+        return "<%s path=%s delay=%s error=%r time=%.2f elapsed=%.2f at " \
+            "0x%x>" % (self.__class__.__name__, self.path, self.read_delay,
+                       self.error, self.time, self.elapsed, id(self))
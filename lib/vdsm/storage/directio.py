@@ -20,18 +20,40 @@
 from __future__ import absolute_import
 
 import ctypes
+import errno
 import io
 import logging
+import mmap
 import os
+import threading
 
 from contextlib import closing
 from contextlib import contextmanager
 
+from vdsm import utils
+from vdsm.common.osutils import uninterruptible
+from vdsm.common.time import monotonic_time
+
 log = logging.getLogger('storage.directio')
 
 libc = ctypes.CDLL("libc.so.6", use_errno=True)
 CharPointer = ctypes.POINTER(ctypes.c_char)
 
+libc.pread64.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                         ctypes.c_int64]
+libc.pread64.restype = ctypes.c_ssize_t
+libc.pwrite64.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                          ctypes.c_int64]
+libc.pwrite64.restype = ctypes.c_ssize_t
+
+# Direct I/O offsets and sizes must be aligned to this size.
+ALIGNMENT = 512
+
+# Upper bounds in seconds of the latency histogram buckets. The last bucket
+# counts slower operations.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1,
+                   2, 5)
+
 _PC_REC_XFER_ALIGN = 17
 _PC_REC_MIN_XFER_SIZE = 16
 
@@ -176,3 +198,177 @@ class DirectFile(object):
 
         if not self.closed:
             self.close()
+
+
+class LatencyHistogram(object):
+    """
+    Count operations by latency.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._lock = threading.Lock()
+        self._bounds = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, latency):
+        with self._lock:
+            for i, bound in enumerate(self._bounds):
+                if latency <= bound:
+                    break
+            else:
+                i = len(self._bounds)
+            self._counts[i] += 1
+            self._total += latency
+            self._max = max(self._max, latency)
+
+    def info(self):
+        """
+        Return the number of operations, their total and maximum latency,
+        and a list of (bound, count) buckets. The bound of the last bucket
+        is None.
+        """
+        with self._lock:
+            return {
+                "count": sum(self._counts),
+                "total": self._total,
+                "max": self._max,
+                "buckets": list(zip(self._bounds + (None,), self._counts)),
+            }
+
+
+_latency = {
+    "read": LatencyHistogram(),
+    "write": LatencyHistogram(),
+}
+
+
+def latency():
+    """
+    Return the latency histograms of readblocks and writeblock calls.
+    """
+    return {op: histogram.info() for op, histogram in _latency.items()}
+
+
+def readblocks(path, ranges):
+    """
+    Read ranges of path using direct I/O, opening path once.
+
+    ranges is a list of (offset, size) tuples aligned to ALIGNMENT. Ranges
+    are read in offset order into one aligned buffer, so adjacent ranges are
+    read with a single system call.
+
+    Returns a list of strings with the data of each range. A string is
+    shorter than the range size if the range is after the end of path.
+    """
+    for offset, size in ranges:
+        _validate_range(offset, size)
+
+    start = monotonic_time()
+
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    runs = []
+    end = None
+    for i in order:
+        offset, size = ranges[i]
+        if offset != end:
+            runs.append([])
+        runs[-1].append(i)
+        end = offset + size
+
+    results = [None] * len(ranges)
+    total = sum(size for offset, size in ranges)
+
+    with _aligned_buffer(total) as (buf, address):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        try:
+            bufpos = 0
+            for run in runs:
+                offset = ranges[run[0]][0]
+                length = sum(ranges[i][1] for i in run)
+                nread = _transfer(libc.pread64, fd, address + bufpos, length,
+                                  offset)
+                pos = bufpos
+                for i in run:
+                    size = ranges[i][1]
+                    available = max(0, bufpos + nread - pos)
+                    results[i] = buf[pos:pos + min(size, available)]
+                    pos += size
+                bufpos += length
+        finally:
+            os.close(fd)
+
+    _latency["read"].add(monotonic_time() - start)
+    return results
+
+
+def writeblock(path, offset, data):
+    """
+    Write data to path at offset using direct I/O. offset and the length of
+    data must be aligned to ALIGNMENT.
+
+    Raises OSError if data could not be written completely.
+    """
+    _validate_range(offset, len(data))
+
+    start = monotonic_time()
+
+    with _aligned_buffer(len(data)) as (buf, address):
+        buf.write(data)
+        fd = os.open(path, os.O_WRONLY | os.O_DIRECT)
+        try:
+            nwritten = _transfer(libc.pwrite64, fd, address, len(data),
+                                 offset)
+        finally:
+            os.close(fd)
+
+    if nwritten < len(data):
+        raise OSError(errno.EIO, "Short write to %s: wrote %d of %d bytes "
+                      "at offset %d" % (path, nwritten, len(data), offset))
+
+    _latency["write"].add(monotonic_time() - start)
+
+
+def _validate_range(offset, size):
+    if offset % ALIGNMENT or size % ALIGNMENT:
+        raise ValueError("Unaligned range offset=%d size=%d" %
+                         (offset, size))
+
+
+@contextmanager
+def _aligned_buffer(size):
+    """
+    Yield a page aligned mmap buffer of size bytes and its address.
+    """
+    buf = mmap.mmap(-1, max(size, mmap.PAGESIZE), mmap.MAP_SHARED)
+    with utils.closing(buf, log=log.name):
+        pointer = ctypes.c_char.from_buffer(buf)
+        try:
+            yield buf, ctypes.addressof(pointer)
+        finally:
+            # Release the buffer export before closing the mmap.
+            del pointer
+
+
+def _transfer(func, fd, address, size, offset):
+    """
+    Call func (pread64 or pwrite64) until size bytes were transferred or
+    func returned 0, and return the number of bytes transferred.
+    """
+    done = 0
+    while done < size:
+        n = uninterruptible(_call, func, fd, address + done, size - done,
+                            offset + done)
+        if n == 0:
+            break
+        done += n
+    return done
+
+
+def _call(func, fd, address, size, offset):
+    n = func(fd, address, size, offset)
+    if n < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return n
@@ -40,8 +40,11 @@ from itertools import chain
 from subprocess import list2cmdline
 
 from vdsm import constants
+from vdsm import supervdsm
+from vdsm.common.time import monotonic_time
 from vdsm.storage import devicemapper
 from vdsm.storage import exception as se
+from vdsm.storage import lvmshell
 from vdsm.storage import misc
 from vdsm.storage import multipath
 from vdsm.storage.constants import VG_EXTENT_SIZE_MB
@@ -53,7 +56,7 @@ log = logging.getLogger("storage.LVM")
 PV_FIELDS = ("uuid,name,size,vg_name,vg_uuid,pe_start,pe_count,"
              "pe_alloc_count,mda_count,dev_size,mda_used_count")
 VG_FIELDS = ("uuid,name,attr,size,free,extent_size,extent_count,free_count,"
-             "tags,vg_mda_size,vg_mda_free,lv_count,pv_count,pv_name")
+             "tags,vg_mda_size,vg_mda_free,lv_count,pv_count,vg_seqno,pv_name")
 LV_FIELDS = "uuid,name,vg_name,attr,size,seg_start_pe,devices,tags"
 
 VG_ATTR_BITS = ("permission", "resizeable", "exported",
@@ -129,6 +132,8 @@ VDSM_LVM_CONF = os.path.join(VDSM_LVM_SYSTEM_DIR, "lvm.conf")
 
 USER_DEV_LIST = filter(None, config.get("irs", "lvm_dev_whitelist").split(","))
 
+LVM_COMMAND_SERVER = config.getboolean("irs", "lvm_command_server")
+
 
 def _buildFilter(devices):
     strippeds = set(d.strip() for d in devices)
@@ -233,6 +238,12 @@ def makeLV(*args):
 class LVMCache(object):
     """
     Keep all the LVM information.
+
+    LVs are indexed by VG, so reloading or invalidating the LVs of one VG
+    does not touch the LVs of other VGs. When the LVs of a VG are invalidated
+    because another host may have modified them, they are reloaded only if
+    the VG metadata sequence number (vg_seqno) changed since they were
+    loaded.
     """
 
     def _getCachedExtraCfg(self):
@@ -280,11 +291,22 @@ class LVMCache(object):
         self._stalelv = True
         self._pvs = {}
         self._vgs = {}
+        # {vgName: {lvName: LV or Stub}}
         self._lvs = {}
+        # {vgName: set of lvNames with a Stub}
+        self._lvstubs = {}
+        # VGs with all their LVs loaded.
+        self._lvsloaded = set()
+        # {vgName: vg_seqno} when all the VG LVs were loaded.
+        self._lvseqno = {}
+        # VGs with all their LVs invalidated, to be checked using vg_seqno.
+        self._lvsunverified = set()
+        self._stats = dict.fromkeys(("lvs_commands", "lvs_time",
+                                     "lv_hits", "lv_misses"), 0)
 
     def cmd(self, cmd, devices=tuple()):
         finalCmd = self._addExtraCfg(cmd, devices)
-        rc, out, err = misc.execCmd(finalCmd, sudo=True)
+        rc, out, err = self._run(finalCmd)
         if rc != 0:
             # Filter might be stale
             self.invalidateFilter()
@@ -294,10 +316,54 @@ class LVMCache(object):
             # the devlist is sorted there is no fear
             # of two identical filters looking differently
             if newCmd != finalCmd:
-                return misc.execCmd(newCmd, sudo=True)
+                return self._run(newCmd)
 
         return rc, out, err
 
+    def _run(self, cmd):
+        """
+        Run report commands in supervdsm persistent lvm shell if enabled,
+        falling back to running lvm if the shell fails.
+        """
+        if LVM_COMMAND_SERVER and cmd[1] in lvmshell.REPORT_COMMANDS:
+            log.debug("Running in lvm shell: %s", cmd[1])
+            try:
+                return supervdsm.getProxy().lvmReport(cmd[1:])
+            except Exception:
+                log.exception("Error running %s in lvm shell", cmd[1])
+        return misc.execCmd(cmd, sudo=True)
+
+    def _lvscmd(self, cmd, devices=tuple()):
+        start = monotonic_time()
+        try:
+            return self.cmd(cmd, devices)
+        finally:
+            elapsed = monotonic_time() - start
+            with self._lock:
+                self._stats["lvs_commands"] += 1
+                self._stats["lvs_time"] += elapsed
+
+    def _countlv(self, hit):
+        with self._lock:
+            self._stats["lv_hits" if hit else "lv_misses"] += 1
+
+    def stats(self):
+        """
+        Return a dict of LV cache counters:
+
+        lvs_commands    number of lvs commands run
+        lvs_time        total time spent running lvs commands, in seconds
+        lv_hits         LV lookups served from the cache
+        lv_misses       LV lookups requiring a reload
+        lv_hit_rate     lv_hits / (lv_hits + lv_misses), or None
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["lv_hits"] + stats["lv_misses"]
+        stats["lv_hit_rate"] = (float(stats["lv_hits"]) / lookups
+                                if lookups else None)
+        return stats
+
     def __str__(self):
         return ("PVS:\n%s\n\nVGS:\n%s\n\nLVS:\n%s" %
                 (pp.pformat(self._pvs),
@@ -414,6 +480,15 @@ class LVMCache(object):
 
         return updatedVGs
 
+    def _vgseqno(self, vgName):
+        """
+        Return the cached vg_seqno of vgName, or None if not cached.
+        """
+        vg = self._vgs.get(vgName)
+        if vg is None or isinstance(vg, Stub):
+            return None
+        return vg.vg_seqno
+
     def _reloadlvs(self, vgName, lvNames=None):
         lvNames = _normalizeargs(lvNames)
         cmd = list(LVS_CMD)
@@ -421,18 +496,22 @@ class LVMCache(object):
             cmd.extend(["%s/%s" % (vgName, lvName) for lvName in lvNames])
         else:
             cmd.append(vgName)
+            # Taken before running lvs; if the VG is modified meanwhile, the
+            # LVs will be reloaded on the next check.
+            seqno = self._vgseqno(vgName)
 
-        rc, out, err = self.cmd(cmd, self._getVGDevs((vgName,)))
+        rc, out, err = self._lvscmd(cmd, self._getVGDevs((vgName,)))
 
         with self._lock:
+            vglvs = self._lvs.setdefault(vgName, {})
+            stubs = self._lvstubs.setdefault(vgName, set())
             if rc != 0:
                 log.warning("lvm lvs failed: %s %s %s", str(rc), str(out),
                             str(err))
-                lvNames = lvNames if lvNames else self._lvs.keys()
-                for l in lvNames:
-                    if isinstance(self._lvs.get(l), Stub):
-                        self._lvs[l] = Unreadable(self._lvs[l].name, True)
-                return dict(self._lvs)
+                for lvName in lvNames if lvNames else list(stubs):
+                    if isinstance(vglvs.get(lvName), Stub):
+                        vglvs[lvName] = Unreadable(lvName, True)
+                return dict(vglvs)
 
             updatedLVs = {}
             for line in out:
@@ -440,50 +519,61 @@ class LVMCache(object):
                 lv = makeLV(*fields)
                 # For LV we are only interested in its first extent
                 if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs[(lv.vg_name, lv.name)] = lv
+                    updatedLVs[lv.name] = lv
+            vglvs.update(updatedLVs)
+            stubs.difference_update(updatedLVs)
 
             # Determine if there are stale LVs
             if lvNames:
-                staleLVs = (lvName for lvName in lvNames
-                            if (vgName, lvName) not in updatedLVs.iterkeys())
+                staleLVs = set(lvNames).difference(updatedLVs)
             else:
                 # All the LVs in the VG
-                staleLVs = (lvName for v, lvName in self._lvs.keys()
-                            if (v == vgName) and
-                            ((vgName, lvName) not in updatedLVs.iterkeys()))
+                staleLVs = set(vglvs).difference(updatedLVs)
+                self._lvsloaded.add(vgName)
+                self._lvsunverified.discard(vgName)
+                self._lvseqno[vgName] = seqno
 
             for lvName in staleLVs:
                 log.warning("Removing stale lv: %s/%s", vgName, lvName)
-                self._lvs.pop((vgName, lvName), None)
+                vglvs.pop(lvName, None)
+                stubs.discard(lvName)
 
             log.debug("lvs reloaded")
 
         return updatedLVs
 
     def _reloadAllLvs(self):
-        """
-        Used only during bootstrap.
-        """
         cmd = list(LVS_CMD)
-        rc, out, err = self.cmd(cmd)
-        if rc == 0:
-            updatedLVs = set()
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
-                # For LV we are only interested in its first extent
-                if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs.add((lv.vg_name, lv.name))
-
-            # Remove stales
-            for vgName, lvName in self._lvs.keys():
-                if (vgName, lvName) not in updatedLVs:
-                    self._lvs.pop((vgName, lvName), None)
-                    log.error("Removing stale lv: %s/%s", vgName, lvName)
-            self._stalelv = False
-        return dict(self._lvs)
+        with self._lock:
+            seqnos = {vgName: self._vgseqno(vgName) for vgName in self._vgs}
+        rc, out, err = self._lvscmd(cmd)
+        with self._lock:
+            if rc == 0:
+                updatedLVs = {}
+                for line in out:
+                    fields = [field.strip()
+                              for field in line.split(SEPARATOR)]
+                    lv = makeLV(*fields)
+                    # For LV we are only interested in its first extent
+                    if lv.seg_start_pe == "0":
+                        updatedLVs.setdefault(lv.vg_name, {})[lv.name] = lv
+
+                # Remove stales
+                for vgName, vglvs in self._lvs.iteritems():
+                    staleLVs = set(vglvs).difference(
+                        updatedLVs.get(vgName, ()))
+                    for lvName in staleLVs:
+                        log.error("Removing stale lv: %s/%s", vgName, lvName)
+
+                self._lvs = updatedLVs
+                self._lvstubs = {vgName: set() for vgName in updatedLVs}
+                self._lvsloaded = set(updatedLVs)
+                self._lvsunverified.clear()
+                self._lvseqno = {vgName: seqnos.get(vgName)
+                                 for vgName in updatedLVs}
+                self._stalelv = False
+            return [lv for vglvs in self._lvs.itervalues()
+                    for lv in vglvs.itervalues()]
 
     def _invalidatepvs(self, pvNames):
         pvNames = _normalizeargs(pvNames)
@@ -513,19 +603,73 @@ class LVMCache(object):
             # Invalidate LVs in a specific VG
             if lvNames:
                 # Invalidate a specific LVs
+                vglvs = self._lvs.setdefault(vgName, {})
+                stubs = self._lvstubs.setdefault(vgName, set())
                 for lvName in lvNames:
-                    self._lvs[(vgName, lvName)] = Stub(lvName, True)
+                    vglvs[lvName] = Stub(lvName, True)
+                stubs.update(lvNames)
             else:
                 # Invalidate all the LVs in a given VG
-                for lv in self._lvs.values():
-                    if not isinstance(lv, Stub):
-                        if lv.vg_name == vgName:
-                            self._lvs[(vgName, lv.name)] = Stub(lv.name, True)
+                vglvs = self._lvs.get(vgName, {})
+                for lvName in vglvs:
+                    vglvs[lvName] = Stub(lvName, True)
+                self._lvstubs.setdefault(vgName, set()).update(vglvs)
+
+    def _invalidatelvsmetadata(self, vgName):
+        """
+        Invalidate all the LVs of vgName, which may have been modified by
+        another host. Unlike _invalidatelvs, the LVs are reloaded only if the
+        VG vg_seqno changed since they were loaded, so this must not be used
+        when the LVs state (e.g. active) may have changed. The VG must be
+        invalidated as well.
+        """
+        with self._lock:
+            if vgName in self._lvs:
+                self._lvsunverified.add(vgName)
+
+    def _removelvs(self, vgName, lvNames):
+        lvNames = _normalizeargs(lvNames)
+        with self._lock:
+            vglvs = self._lvs.get(vgName, {})
+            stubs = self._lvstubs.get(vgName, set())
+            for lvName in lvNames:
+                vglvs.pop(lvName, None)
+                stubs.discard(lvName)
 
     def _invalidateAllLvs(self):
         with self._lock:
             self._stalelv = True
             self._lvs.clear()
+            self._lvstubs.clear()
+            self._lvsloaded.clear()
+            self._lvseqno.clear()
+            self._lvsunverified.clear()
+
+    def _verifylvs(self, vgName):
+        """
+        Return True if the cached LVs of vgName may be used, False if they
+        must be reloaded.
+
+        If the LVs of vgName were invalidated by _invalidatelvsmetadata,
+        compare the VG vg_seqno with the vg_seqno seen when the LVs were
+        loaded.
+        """
+        with self._lock:
+            if vgName not in self._lvsunverified:
+                return True
+            seqno = self._lvseqno.get(vgName)
+
+        if seqno is None:
+            return False
+
+        vg = self.getVg(vgName)
+        if vg is None or isinstance(vg, Stub) or vg.vg_seqno != seqno:
+            log.debug("vg %s changed, lvs must be reloaded", vgName)
+            return False
+
+        with self._lock:
+            self._lvsunverified.discard(vgName)
+        return True
 
     def flush(self):
         self._invalidateAllPvs()
@@ -605,52 +749,49 @@ class LVMCache(object):
         return vgs.values()
 
     def getLv(self, vgName, lvName=None):
-        # Checking self._stalelv here is suboptimal, because
-        # unnecessary reloads
-        # are done.
-
         # Return vgName/lvName info
-        # If both 'vgName' and 'lvName' are None then return everything
         # If only 'lvName' is None then return all the LVs in the given VG
-        # If only 'vgName' is None it is weird, so return nothing
-        # (we can consider returning all the LVs with a given name)
+        if not self._verifylvs(vgName):
+            self._reloadlvs(vgName)
+
         if lvName:
             # vgName, lvName
-            lv = self._lvs.get((vgName, lvName))
+            lv = self._lvs.get(vgName, {}).get(lvName)
             if not lv or isinstance(lv, Stub):
+                self._countlv(hit=False)
                 # while we here reload all the LVs in the VG
                 lvs = self._reloadlvs(vgName)
-                lv = lvs.get((vgName, lvName))
+                lv = lvs.get(lvName)
                 if not lv:
                     log.warning("lv: %s not found in lvs vg: %s response",
                                 lvName, vgName)
+            else:
+                self._countlv(hit=True)
             res = lv
         else:
             # vgName, None
             # If there any stale LVs reload the whole VG, since it would
-            # cost us around same efforts anyhow and these stale LVs can
-            # be in the vg.
-            # Will be better when the pvs dict will be part of the vg.
-            # Fix me: should not be more stubs
-            if self._stalelv or any(isinstance(lv, Stub)
-                                    for lv in self._lvs.values()):
+            # cost us around same efforts anyhow.
+            if vgName not in self._lvsloaded or self._lvstubs.get(vgName):
+                self._countlv(hit=False)
                 lvs = self._reloadlvs(vgName)
             else:
-                lvs = dict(self._lvs)
-            # lvs = self._reloadlvs()
-            lvs = [lv for lv in lvs.values()
-                   if not isinstance(lv, Stub) and (lv.vg_name == vgName)]
-            res = lvs
+                self._countlv(hit=True)
+                lvs = self._lvs.get(vgName, {})
+            res = [lv for lv in lvs.values() if not isinstance(lv, Stub)]
         return res
 
     def getAllLvs(self):
         # None, None
-        if self._stalelv or any(isinstance(lv, Stub)
-                                for lv in self._lvs.values()):
-            lvs = self._reloadAllLvs()
-        else:
-            lvs = dict(self._lvs)
-        return lvs.values()
+        if self._stalelv:
+            return self._reloadAllLvs()
+
+        lvs = []
+        for vgName in list(self._lvs):
+            if not self._verifylvs(vgName) or self._lvstubs.get(vgName):
+                self._reloadlvs(vgName)
+            lvs.extend(self._lvs.get(vgName, {}).values())
+        return lvs
 
 _lvminfo = LVMCache()
 
@@ -1079,7 +1220,7 @@ def deactivateVG(vgName):
 def invalidateVG(vgName, invalidateLVs=True, invalidatePVs=False):
     _lvminfo._invalidatevgs(vgName)
     if invalidateLVs:
-        _lvminfo._invalidatelvs(vgName)
+        _lvminfo._invalidatelvsmetadata(vgName)
     if invalidatePVs:
         vgPvs = listPVNames(vgName)
         _lvminfo._invalidatepvs(pvNames=vgPvs)
@@ -1200,7 +1341,7 @@ def removeLVs(vgName, lvNames):
     if rc == 0:
         for lvName in lvNames:
             # Remove the LV from the cache
-            _lvminfo._lvs.pop((vgName, lvName), None)
+            _lvminfo._removelvs(vgName, lvName)
             # If lvremove succeeded it affected VG as well
             _lvminfo._invalidatevgs(vgName)
     else:
@@ -1314,7 +1455,7 @@ def renameLV(vg, oldlv, newlv):
     if rc != 0:
         raise se.LogicalVolumeRenameError("%s %s %s" % (vg, oldlv, newlv))
 
-    _lvminfo._lvs.pop((vg, oldlv), None)
+    _lvminfo._removelvs(vg, oldlv)
     _lvminfo._reloadlvs(vg, newlv)
 
 
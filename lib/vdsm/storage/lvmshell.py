@@ -0,0 +1,250 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Persistent lvm shell for running lvm report commands.
+
+Running "sudo lvm lvs ..." for every query starts sudo and lvm again, and lvm
+must initialize again. LVMShell keeps an interactive lvm shell running, and
+sends it report commands (pvs, vgs and lvs) one after another.
+
+Reports are requested in JSON format, together with the command log report
+providing the command status. The JSON report is converted back to the
+format produced by "--noheadings --separator SEP", so callers can parse the
+output as if lvm was executed directly.
+
+The shell must run as root; vdsm uses the instance running in supervdsm.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import select
+import subprocess
+import threading
+
+import six
+
+from vdsm import constants
+from vdsm.common import time
+from vdsm.common.compat import CPopen
+from vdsm.common.osutils import uninterruptible_poll
+
+REPORT_COMMANDS = frozenset(["pvs", "vgs", "lvs"])
+
+PROMPT = "lvm> "
+
+# Report the command status in the JSON output.
+_LOG_CONFIG = ("log {report_command_log=1 command_log_selection='all'} "
+               "report {output_format='json'}")
+
+# log_ret_code of a successful command (ECMD_PROCESSED).
+_ECMD_PROCESSED = 1
+
+# Exit code reported when the command status is missing (ECMD_FAILED).
+_ECMD_FAILED = 5
+
+_BUFSIZE = 64 * 1024
+
+log = logging.getLogger("storage.lvmshell")
+
+
+class Error(Exception):
+    """
+    Raised when the lvm shell fails. The shell is restarted on the next
+    command.
+    """
+
+
+class LVMShell(object):
+
+    def __init__(self, lvm=constants.EXT_LVM, timeout=60):
+        self._lvm = lvm
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._proc = None
+
+    def run(self, args):
+        """
+        Run the lvm report command args, e.g. ["lvs", "--noheadings", ...],
+        and return rc, out and err like commands.execCmd, with out and err
+        as lists of lines.
+        """
+        if args[0] not in REPORT_COMMANDS:
+            raise ValueError("Not a report command: %s" % args[0])
+        line = _shell_line(args)
+        with self._lock:
+            if self._proc is None:
+                self._start()
+            try:
+                self._proc.stdin.write(line + "\n")
+                self._proc.stdin.flush()
+                out, err = self._read_until_prompt()
+                return _parse_report(out, err, _separator(args))
+            except Exception:
+                # The state of the shell is unknown now.
+                self._stop()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _start(self):
+        log.debug("Starting lvm shell %s", self._lvm)
+        self._proc = CPopen([self._lvm],
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            close_fds=True)
+        try:
+            self._read_until_prompt()
+        except Exception:
+            self._stop()
+            raise
+
+    def _stop(self):
+        if self._proc is None:
+            return
+        log.debug("Stopping lvm shell (pid=%s)", self._proc.pid)
+        proc, self._proc = self._proc, None
+        try:
+            proc.kill()
+        except OSError:
+            pass  # Already terminated
+        proc.wait()
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    def _read_until_prompt(self):
+        """
+        Read the shell output until the next prompt, returning out and err.
+        """
+        stdout = self._proc.stdout.fileno()
+        stderr = self._proc.stderr.fileno()
+        out = bytearray()
+        err = bytearray()
+        buffers = {stdout: out, stderr: err}
+
+        poller = select.poll()
+        poller.register(stdout, select.POLLIN)
+        poller.register(stderr, select.POLLIN)
+
+        deadline = time.monotonic_time() + self._timeout
+        while not out.endswith(PROMPT):
+            remaining = deadline - time.monotonic_time()
+            if remaining <= 0:
+                raise Error("Timeout waiting for lvm shell prompt")
+            for fd, _ in uninterruptible_poll(poller.poll, remaining * 1000):
+                data = os.read(fd, _BUFSIZE)
+                if not data:
+                    raise Error("lvm shell terminated: out=%r err=%r"
+                                % (str(out), str(err)))
+                buffers[fd] += data
+
+        # Errors are written before the prompt, so they are available now.
+        poller.unregister(stdout)
+        while poller.poll(0):
+            data = os.read(stderr, _BUFSIZE)
+            if not data:
+                break
+            err += data
+
+        return str(out[:-len(PROMPT)]), str(err)
+
+
+def _shell_line(args):
+    """
+    Return lvm shell command line for args.
+
+    The shell splits the line on whitespace, and supports only quoting whole
+    arguments, without escaping. Since lvm configuration accepts both single
+    and double quoted strings, the configuration is converted to use only
+    single quotes.
+    """
+    args = list(args)
+    try:
+        i = args.index("--config")
+    except ValueError:
+        args.extend(("--config", _LOG_CONFIG))
+    else:
+        args[i + 1] = args[i + 1].replace('"', "'") + " " + _LOG_CONFIG
+    args.extend(("--reportformat", "json"))
+
+    words = []
+    for arg in args:
+        if '"' in arg:
+            raise ValueError("Cannot quote argument: %r" % arg)
+        if not arg or any(c.isspace() or c == "'" for c in arg):
+            arg = '"%s"' % arg
+        words.append(arg)
+    return " ".join(words)
+
+
+def _separator(args):
+    try:
+        return args[args.index("--separator") + 1]
+    except (ValueError, IndexError):
+        return " "
+
+
+def _parse_report(out, err, separator):
+    """
+    Convert JSON report to rc, out, err as returned by commands.execCmd.
+    """
+    # Skip anything before the JSON document, e.g. input echoed by the shell.
+    lines = out.splitlines()
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("{"):
+            break
+    else:
+        raise Error("No report in lvm shell output: out=%r err=%r"
+                    % (out, err))
+
+    try:
+        doc = json.loads("\n".join(lines[i:]), object_pairs_hook=OrderedDict)
+    except ValueError as e:
+        raise Error("Invalid lvm shell report: %s: out=%r" % (e, out))
+
+    rc = _ECMD_FAILED
+    for entry in doc.get("log", ()):
+        if (entry.get("log_type") == "status" and
+                entry.get("log_object_type") == "cmd"):
+            ret_code = int(entry["log_ret_code"])
+            rc = 0 if ret_code == _ECMD_PROCESSED else ret_code
+
+    # Rows keep the order of the fields requested in the command.
+    report_lines = []
+    for report in doc.get("report", ()):
+        for rows in report.values():
+            for row in rows:
+                report_lines.append(
+                    separator.join(_native(v) for v in row.values()))
+
+    return rc, report_lines, err.splitlines()
+
+
+def _native(value):
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode("utf-8")
+    return value
@@ -19,6 +19,8 @@
 #
 
 from __future__ import absolute_import
+import io
+import mmap
 import os
 import errno
 import time
@@ -28,6 +30,8 @@ import logging
 
 import uuid
 
+from contextlib import contextmanager
+
 from six.moves import queue
 
 from vdsm.config import config
@@ -38,6 +42,7 @@ from vdsm.storage.threadPool import ThreadPool
 
 from vdsm import concurrent
 from vdsm import constants
+from vdsm.common.osutils import uninterruptible
 
 __author__ = "ayalb"
 __date__ = "$Mar 9, 2009 5:25:07 PM$"
@@ -64,6 +69,11 @@ _zeroCheck = misc.checksum(EMPTYMAILBOX, CHECKSUM_BYTES)
 # Assumes CHECKSUM_BYTES equals 4!!!
 pZeroChecksum = struct.pack('<l', _zeroCheck)
 
+MAILBOX_DIRECT_IO = config.getboolean('irs', 'mailbox_direct_io')
+MAILBOX_MONITOR_INTERVAL = config.getfloat('irs', 'mailbox_monitor_interval')
+MAILBOX_MIN_POLL_INTERVAL = config.getfloat('irs',
+                                            'mailbox_min_poll_interval')
+
 
 def dec2hex(n):
     return "%x" % n
@@ -84,6 +94,167 @@ def _mboxExecCmd(*args, **kwargs):
     return misc.execCmd(*args, **kwargs)
 
 
+def mailboxFile(path, directIO):
+    """
+    Return a mailbox file object for accessing path using direct I/O in vdsm
+    process if directIO is True, or by running dd otherwise.
+    """
+    if directIO:
+        return DirectMailboxFile(path)
+    return DDMailboxFile(path)
+
+
+def _check_open(f):
+    if f._closed:
+        raise IOError(errno.EBADF, "Mailbox %s is closed" % f.name)
+
+
+class DDMailboxFile(object):
+    """
+    Read and write mailbox volume by running dd.
+
+    Offsets must be aligned to the size of the data read or written. Once
+    closed, read and write fail with EBADF.
+    """
+
+    def __init__(self, path):
+        self._path = str(path)
+        self._closed = False
+
+    @property
+    def name(self):
+        return self._path
+
+    def read(self, offset, size):
+        _check_open(self)
+        cmd = [constants.EXT_DD,
+               'if=' + self._path,
+               'iflag=direct,fullblock',
+               'bs=' + str(size),
+               'count=1',
+               'skip=' + str(offset // size)]
+        (rc, out, err) = _mboxExecCmd(cmd, raw=True)
+        if rc:
+            raise IOError(errno.EIO, "Could not read mailbox %s: rc=%s "
+                          "err=%r" % (self._path, rc, err))
+        return out
+
+    def write(self, offset, data):
+        _check_open(self)
+        cmd = [constants.EXT_DD,
+               'of=' + self._path,
+               'iflag=fullblock',
+               'oflag=direct',
+               'conv=notrunc',
+               'bs=' + str(len(data)),
+               'count=1',
+               'seek=' + str(offset // len(data))]
+        (rc, out, err) = _mboxExecCmd(cmd, data=data)
+        if rc:
+            raise IOError(errno.EIO, "Could not write mailbox %s: rc=%s "
+                          "err=%r" % (self._path, rc, err))
+
+    def close(self):
+        self._closed = True
+
+
+class DirectMailboxFile(object):
+    """
+    Read and write mailbox volume using direct I/O in vdsm process.
+
+    The file is opened on the first access and kept open, and I/O is done
+    using page aligned buffers, allocated once for every size. After an I/O
+    error, the file is opened again on the next access. Once closed, read and
+    write fail with EBADF instead of opening the file again.
+
+    Not thread safe; callers must serialize access.
+    """
+
+    def __init__(self, path):
+        self._path = str(path)
+        self._file = None
+        self._closed = False
+        # Maps size to mmap buffer of this size.
+        self._buffers = {}
+
+    @property
+    def name(self):
+        return self._path
+
+    def read(self, offset, size):
+        _check_open(self)
+        buf = self._buffer(size)
+        with self._io():
+            self._file.seek(offset)
+            nread = uninterruptible(self._file.readinto, buf)
+        if nread != size:
+            raise IOError(errno.EIO, "Short read from mailbox %s: %d/%d "
+                          "bytes" % (self._path, nread, size))
+        return buf[:]
+
+    def write(self, offset, data):
+        _check_open(self)
+        buf = self._buffer(len(data))
+        buf[:] = data
+        with self._io():
+            self._file.seek(offset)
+            nwritten = uninterruptible(self._file.write, buf)
+        if nwritten != len(data):
+            raise IOError(errno.EIO, "Short write to mailbox %s: %d/%d "
+                          "bytes" % (self._path, nwritten, len(data)))
+
+    def close(self):
+        self._closed = True
+        if self._file:
+            self._file.close()
+            self._file = None
+        for buf in self._buffers.values():
+            buf.close()
+        self._buffers.clear()
+
+    def _buffer(self, size):
+        try:
+            return self._buffers[size]
+        except KeyError:
+            buf = mmap.mmap(-1, size, mmap.MAP_SHARED)
+            self._buffers[size] = buf
+            return buf
+
+    @contextmanager
+    def _io(self):
+        if self._file is None:
+            fd = os.open(self._path, os.O_RDWR | os.O_DIRECT)
+            self._file = io.FileIO(fd, "r+", closefd=True)
+        try:
+            yield
+        except EnvironmentError:
+            self._file.close()
+            self._file = None
+            raise
+
+
+class PollInterval(object):
+    """
+    Mailbox polling interval, tightened while requests are in flight.
+
+    After reset(), next() returns minInterval, doubled on each call up to
+    maxInterval. Without a reset, next() returns maxInterval.
+    """
+
+    def __init__(self, minInterval, maxInterval):
+        self._min = min(minInterval, maxInterval)
+        self._max = maxInterval
+        self._current = maxInterval
+
+    def reset(self):
+        self._current = self._min
+
+    def next(self):
+        interval = self._current
+        self._current = min(self._current * 2, self._max)
+        return interval
+
+
 class SPM_Extend_Message:
 
     log = logging.getLogger('storage.SPM.Messages.Extend')
@@ -180,7 +351,10 @@ class HSM_Mailbox:
 
     log = logging.getLogger('storage.Mailbox.HSM')
 
-    def __init__(self, hostID, poolID, inbox, outbox, monitorInterval=2):
+    def __init__(self, hostID, poolID, inbox, outbox,
+                 monitorInterval=MAILBOX_MONITOR_INTERVAL,
+                 directIO=MAILBOX_DIRECT_IO,
+                 minInterval=MAILBOX_MIN_POLL_INTERVAL):
         self._hostID = str(hostID)
         self._poolID = str(poolID)
         self._monitorInterval = monitorInterval
@@ -198,7 +372,9 @@ class HSM_Mailbox:
             raise RuntimeError("HSM_Mailbox create failed - outbox %s does "
                                "not exist" % repr(self._outbox))
         self._mailman = HSM_MailMonitor(self._inbox, self._outbox, hostID,
-                                        self._queue, monitorInterval)
+                                        self._queue, monitorInterval,
+                                        directIO=directIO,
+                                        minInterval=minInterval)
         self.log.debug('HSM_MailboxMonitor created for pool %s' % self._poolID)
 
     def sendExtendMsg(self, volumeData, newSize, callbackFunction=None):
@@ -229,7 +405,8 @@ class HSM_Mailbox:
 class HSM_MailMonitor(object):
     log = logging.getLogger('storage.MailBox.HsmMailMonitor')
 
-    def __init__(self, inbox, outbox, hostID, queue, monitorInterval):
+    def __init__(self, inbox, outbox, hostID, queue, monitorInterval,
+                 directIO=False, minInterval=None):
         # Save arguments
         tpSize = config.getint('irs', 'thread_pool_size') / 2
         waitTimeout = wait_timeout(monitorInterval)
@@ -240,27 +417,16 @@ class HSM_MailMonitor(object):
         self._queue = queue
         self._activeMessages = {}
         self._monitorInterval = monitorInterval
+        self._pollInterval = PollInterval(
+            minInterval or monitorInterval, monitorInterval)
         self._hostID = int(hostID)
         self._used_slots_array = [0] * MESSAGES_PER_MAILBOX
         self._outgoingMail = EMPTYMAILBOX
         self._incomingMail = EMPTYMAILBOX
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._inCmd = [constants.EXT_DD,
-                       'if=' + str(inbox),
-                       'iflag=direct,fullblock',
-                       'bs=' + str(MAILBOX_SIZE),
-                       'count=1',
-                       'skip=' + str(self._hostID)
-                       ]
-        self._outCmd = [constants.EXT_DD,
-                        'of=' + str(outbox),
-                        'iflag=fullblock',
-                        'oflag=direct',
-                        'conv=notrunc',
-                        'bs=' + str(MAILBOX_SIZE),
-                        'count=1',
-                        'seek=' + str(self._hostID)
-                        ]
+        self._inFile = mailboxFile(inbox, directIO)
+        self._outFile = mailboxFile(outbox, directIO)
+        self._mailboxOffset = self._hostID * MAILBOX_SIZE
         self._init = False
         self._initMailbox()  # Read initial mailbox state
         self._msgCounter = 0
@@ -271,14 +437,15 @@ class HSM_MailMonitor(object):
 
     def _initMailbox(self):
         # Sync initial incoming mail state with storage view
-        (rc, out, err) = _mboxExecCmd(self._inCmd, raw=True)
-        if rc == 0:
-            self._incomingMail = out
-            self._init = True
-        else:
+        try:
+            self._incomingMail = self._inFile.read(self._mailboxOffset,
+                                                   MAILBOX_SIZE)
+        except EnvironmentError as e:
             self.log.warning("HSM_MailboxMonitor - Could not initialize "
                              "mailbox, will not accept requests until init "
-                             "succeeds")
+                             "succeeds: %s", e)
+        else:
+            self._init = True
 
     def immStop(self):
         self._stop = True
@@ -371,11 +538,11 @@ class HSM_MailMonitor(object):
 
     def _checkForMail(self):
         # self.log.debug("HSM_MailMonitor - checking for mail")
-        # self.log.debug("Running command: " + str(self._inCmd))
-        (rc, in_mail, err) = misc.execCmd(self._inCmd, raw=True)
-        if rc:
-            raise RuntimeError("_handleResponses.Could not read mailbox - rc "
-                               "%s" % rc)
+        try:
+            in_mail = self._inFile.read(self._mailboxOffset, MAILBOX_SIZE)
+        except EnvironmentError as e:
+            raise RuntimeError("_handleResponses.Could not read mailbox - "
+                               "%s" % e)
         if (len(in_mail) != MAILBOX_SIZE):
             raise RuntimeError("_handleResponses.Could not read mailbox - len "
                                "%s != %s" % (len(in_mail), MAILBOX_SIZE))
@@ -383,15 +550,18 @@ class HSM_MailMonitor(object):
         return self._handleResponses(in_mail)
 
     def _sendMail(self):
-        self.log.info("HSM_MailMonitor sending mail to SPM - " +
-                      str(self._outCmd))
+        self.log.info("HSM_MailMonitor sending mail to SPM - %s offset %d",
+                      self._outFile.name, self._mailboxOffset)
         chk = misc.checksum(
             self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES],
             CHECKSUM_BYTES)
         pChk = struct.pack('<l', chk)  # Assumes CHECKSUM_BYTES equals 4!!!
         self._outgoingMail = \
             self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES] + pChk
-        _mboxExecCmd(self._outCmd, data=self._outgoingMail)
+        try:
+            self._outFile.write(self._mailboxOffset, self._outgoingMail)
+        except EnvironmentError as e:
+            self.log.warning("HSM_MailMonitor couldn't send mail: %s", e)
 
     def _handleMessage(self, message):
         # TODO: add support for multiple mailboxes
@@ -415,6 +585,7 @@ class HSM_MailMonitor(object):
                                "cannot add new message")
 
         self._msgCounter += 1
+        self._pollInterval.reset()
         self._used_slots_array[freeSlot] = 1
         self._activeMessages[freeSlot] = message
         start = freeSlot * MESSAGE_SIZE
@@ -501,7 +672,7 @@ class HSM_MailMonitor(object):
                         if (failures > 9):
                             time.sleep(60)
                         else:
-                            time.sleep(self._monitorInterval)
+                            time.sleep(self._pollInterval.next())
 
                 except:
                     self.log.error("HSM_MailboxMonitor - Incoming mail"
@@ -512,6 +683,8 @@ class HSM_MailMonitor(object):
                           "thread stopped, clearing outgoing mail")
             self._outgoingMail = EMPTYMAILBOX
             self._sendMail()  # Clear outgoing mailbox
+            self._inFile.close()
+            self._outFile.close()
 
 
 class SPM_MailMonitor:
@@ -524,10 +697,18 @@ class SPM_MailMonitor:
     def unregisterMessageType(self, messageType):
         del self._messageTypes[messageType]
 
-    def __init__(self, poolID, maxHostID, inbox, outbox, monitorInterval=2):
+    def __init__(self, poolID, maxHostID, inbox, outbox,
+                 monitorInterval=MAILBOX_MONITOR_INTERVAL,
+                 directIO=MAILBOX_DIRECT_IO,
+                 minInterval=MAILBOX_MIN_POLL_INTERVAL):
         """
         Note: inbox paramerter here should point to the HSM's outbox
         mailbox file, and vice versa.
+
+        If directIO is True, mailboxes are accessed using direct I/O in vdsm
+        process instead of running dd. After receiving a request, mailboxes
+        are polled every minInterval seconds, backing off to monitorInterval
+        seconds if no more requests are received.
         """
         self._messageTypes = {}
         # Save arguments
@@ -553,31 +734,23 @@ class SPM_MailMonitor:
         self._numHosts = int(maxHostID)
         self._outMailLen = MAILBOX_SIZE * self._numHosts
         self._monitorInterval = monitorInterval
+        self._pollInterval = PollInterval(
+            minInterval or monitorInterval, monitorInterval)
         # TODO: add support for multiple paths (multiple mailboxes)
         self._outgoingMail = self._outMailLen * "\0"
         self._incomingMail = self._outgoingMail
-        self._inCmd = ['dd',
-                       'if=' + str(self._inbox),
-                       'iflag=direct,fullblock',
-                       'count=1'
-                       ]
-        self._outCmd = ['dd',
-                        'of=' + str(self._outbox),
-                        'oflag=direct',
-                        'iflag=fullblock',
-                        'conv=notrunc',
-                        'count=1'
-                        ]
+        self._inFile = mailboxFile(self._inbox, directIO)
+        self._outFile = mailboxFile(self._outbox, directIO)
         self._outLock = threading.Lock()
         self._inLock = threading.Lock()
         # Clear outgoing mail
-        self.log.debug("SPM_MailMonitor - clearing outgoing mail, command is: "
-                       "%s", self._outCmd)
-        cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-        (rc, out, err) = _mboxExecCmd(cmd, data=self._outgoingMail)
-        if rc:
-            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail, "
-                             "dd failed")
+        self.log.debug("SPM_MailMonitor - clearing outgoing mail %s",
+                       self._outFile.name)
+        try:
+            self._outFile.write(0, self._outgoingMail)
+        except EnvironmentError as e:
+            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail: "
+                             "%s", e)
 
         self._thread = concurrent.thread(
             self.run, name="mailbox-spm", log=self.log)
@@ -716,6 +889,9 @@ class SPM_MailMonitor:
                         )
                         if not res:
                             raise Exception()
+                        # More requests are likely while this one is in
+                        # flight.
+                        self._pollInterval.reset()
                     else:
                         self.log.error("SPM_MailMonitor: unknown message type "
                                        "encountered: %s", msgType)
@@ -738,18 +914,18 @@ class SPM_MailMonitor:
         self._inLock.acquire()
         try:
             # self.log.debug("SPM_MailMonitor -_checking for mail")
-            cmd = self._inCmd + ['bs=' + str(self._outMailLen)]
-            # self.log.debug("SPM_MailMonitor - reading incoming mail, "
-            #               "command: " + str(cmd))
-            (rc, in_mail, err) = misc.execCmd(cmd, raw=True)
-            if rc:
+            try:
+                in_mail = self._inFile.read(0, self._outMailLen)
+            except EnvironmentError as e:
                 raise IOError(errno.EIO, "_handleRequests._checkForMail - "
-                              "Could not read mailbox: %s" % self._inbox)
+                              "Could not read mailbox: %s: %s"
+                              % (self._inbox, e))
 
             if (len(in_mail) != (self._outMailLen)):
-                self.log.error('SPM_MailMonitor: _checkForMail - dd succeeded '
-                               'but read %d bytes instead of %d, cannot check '
-                               'mail.  Read mail contains: %s', len(in_mail),
+                self.log.error('SPM_MailMonitor: _checkForMail - read '
+                               'succeeded but read %d bytes instead of %d, '
+                               'cannot check mail.  Read mail contains: %s',
+                               len(in_mail),
                                self._outMailLen, repr(in_mail[:80]))
                 raise RuntimeError("_handleRequests._checkForMail - Could not "
                                    "read mailbox")
@@ -757,12 +933,10 @@ class SPM_MailMonitor:
             if self._handleRequests(in_mail):
                 self._outLock.acquire()
                 try:
-                    cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-                    (rc, out, err) = _mboxExecCmd(cmd,
-                                                  data=self._outgoingMail)
-                    if rc:
-                        self.log.warning("SPM_MailMonitor couldn't write "
-                                         "outgoing mail, dd failed")
+                    self._outFile.write(0, self._outgoingMail)
+                except EnvironmentError as e:
+                    self.log.warning("SPM_MailMonitor couldn't write "
+                                     "outgoing mail: %s", e)
                 finally:
                     self._outLock.release()
         finally:
@@ -780,14 +954,11 @@ class SPM_MailMonitor:
             mailboxOffset = (msgID / SLOTS_PER_MAILBOX) * MAILBOX_SIZE
             mailbox = self._outgoingMail[mailboxOffset:
                                          mailboxOffset + MAILBOX_SIZE]
-            cmd = self._outCmd + ['bs=' + str(MAILBOX_SIZE),
-                                  'seek=' + str(mailboxOffset / MAILBOX_SIZE)]
-            # self.log.debug("Running command: %s, for message id: %s",
-            #               str(cmd), str(msgID))
-            (rc, out, err) = _mboxExecCmd(cmd, data=mailbox)
-            if rc:
+            try:
+                self._outFile.write(mailboxOffset, mailbox)
+            except EnvironmentError as e:
                 self.log.error("SPM_MailMonitor: sendReply - couldn't send "
-                               "reply, dd failed")
+                               "reply: %s", e)
         finally:
             self._outLock.release()
 
@@ -798,10 +969,14 @@ class SPM_MailMonitor:
                     self._checkForMail()
                 except:
                     self.log.error("Error checking for mail", exc_info=True)
-                time.sleep(self._monitorInterval)
+                time.sleep(self._pollInterval.next())
         finally:
             self._stopped = True
             self.tp.joinAll(waitForTasks=False)
+            with self._inLock:
+                self._inFile.close()
+            with self._outLock:
+                self._outFile.close()
             self.log.info("SPM_MailMonitor - Incoming mail monitoring thread "
                           "stopped")
 
@@ -51,7 +51,10 @@ from vdsm import concurrent
 from vdsm import constants
 from vdsm.common import logutils
 from vdsm.common import proc
+from vdsm.config import config
 
+from vdsm.storage import blockreader
+from vdsm.storage import directio
 from vdsm.storage import exception as se
 from vdsm.storage.constants import SECTOR_SIZE
 
@@ -64,6 +67,11 @@ UNLIMITED_THREADS = -1
 
 log = logging.getLogger('storage.Misc')
 
+_READBLOCK_HELPER = config.getboolean("irs", "readblock_helper")
+
+_block_reader = None
+_block_reader_lock = threading.Lock()
+
 
 def namedtuple2dict(nt):
     return dict(map(lambda f: (f, getattr(nt, f)), nt._fields))
@@ -100,6 +108,9 @@ def readblock(name, offset, size):
     if (size % 512) or (offset % 512):
         raise se.MiscBlockReadException(name, offset, size)
 
+    if _READBLOCK_HELPER:
+        return readblocks(name, [(offset, size)])[0]
+
     left = size
     ret = ""
     baseoffset = offset
@@ -122,6 +133,70 @@ def readblock(name, offset, size):
     return ret.splitlines()
 
 
+def readblocks(name, ranges):
+    '''
+    Read (direct IO) the content of device 'name' at ranges, a list of
+    (offset, size) tuples. When irs:readblock_helper is enabled, all ranges
+    are read in one request to a blockreader helper. Returns a list with the
+    lines of each range.
+    '''
+    for offset, size in ranges:
+        if (size % 512) or (offset % 512):
+            raise se.MiscBlockReadException(name, offset, size)
+
+    if not _READBLOCK_HELPER:
+        return [readblock(name, offset, size) for offset, size in ranges]
+
+    try:
+        blocks = _get_block_reader().read(name, ranges)
+    except (EnvironmentError, blockreader.Error) as e:
+        log.error("Error reading %s: %s", name, e)
+        offset, size = ranges[0]
+        raise se.MiscBlockReadException(name, offset, size)
+
+    for (offset, size), data in zip(ranges, blocks):
+        if len(data) != size:
+            raise se.MiscBlockReadIncomplete(name, offset, size)
+
+    return [data.splitlines() for data in blocks]
+
+
+def writeblock(name, offset, data):
+    '''
+    Write (direct IO) data to device 'name' at offset. offset and the length
+    of data must be aligned to 512 bytes.
+    '''
+    if _READBLOCK_HELPER:
+        try:
+            _get_block_reader().write(name, offset, data)
+        except (EnvironmentError, blockreader.Error) as e:
+            log.error("Error writing %s: %s", name, e)
+            raise se.MiscBlockWriteException(name, offset, len(data))
+        return
+
+    with directio.DirectFile(name, "r+") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def readblock_latency():
+    """
+    Return the latency histograms of metadata reads and writes done in
+    blockreader helpers when irs:readblock_helper is enabled.
+    """
+    return _get_block_reader().latency()
+
+
+def _get_block_reader():
+    global _block_reader
+    with _block_reader_lock:
+        if _block_reader is None:
+            _block_reader = blockreader.BlockReader(
+                config.getint("irs", "readblock_workers"),
+                config.getint("irs", "process_pool_timeout"))
+        return _block_reader
+
+
 def validateDDBytes(ddstderr, size):
     log.debug("err: %s, size: %s" % (ddstderr, size))
     try:
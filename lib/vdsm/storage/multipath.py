@@ -23,11 +23,13 @@ multipath module provides helper procedures for configuring multipath
 daemon and maintaining its state
 """
 from __future__ import absolute_import
+import copy
 import os
 import errno
 from glob import glob
 import logging
 import re
+import threading
 from collections import namedtuple
 
 from vdsm import commands
@@ -35,6 +37,7 @@ from vdsm import supervdsm
 from vdsm import udevadm
 from vdsm import utils
 from vdsm.common import cmdutils
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm.storage import devicemapper
 from vdsm.storage import hba
@@ -49,6 +52,15 @@ QUEUE = "queue"
 
 TOXIC_CHARS = '()*+?|^$.\\'
 
+_DEVICE_INVENTORY = config.getboolean('irs', 'multipath_device_inventory')
+
+# Path states may change without rescanning devices, so the inventory must not
+# be used for too long.
+_INVENTORY_MAX_AGE = 60
+
+# Number of scsi_id commands run concurrently when collecting devices.
+_SERIAL_WORKERS = 10
+
 log = logging.getLogger("storage.Multipath")
 
 _SCSI_ID = cmdutils.CommandPath("scsi_id",
@@ -82,6 +94,8 @@ def rescan():
     timeout = config.getint('irs', 'udev_settle_timeout')
     udevadm.settle(timeout)
 
+    _inventory.invalidate()
+
 
 def resize_devices():
     """
@@ -97,6 +111,8 @@ def resize_devices():
         except Exception:
             log.exception("Could not resize device %s", guid)
 
+    _inventory.invalidate()
+
 
 def _resize_if_needed(guid):
     name = devicemapper.getDmId(guid)
@@ -221,14 +237,108 @@ def getHBTL(physdev):
 
 
 def pathListIter(filterGuids=()):
+    if _DEVICE_INVENTORY:
+        return _inventory.devices(filterGuids)
+
+    return _pathListIter(filterGuids,
+                         supervdsm.getProxy().getScsiSerial,
+                         devicemapper.getPathsStatus(),
+                         iscsi.getSessionInfo)
+
+
+def collectDevices():
+    """
+    Return info about all multipath devices, in the format returned by
+    pathListIter, collected in a single pass.
+
+    Must run as root, since getting the device serial and iSCSI session
+    credentials requires root.
+    """
+    devices = [dmId for dmId, guid in getMPDevsIter()]
+    serials = {}
+
+    def getSerial(dmId):
+        return dmId, getScsiSerial(dmId)
+
+    for res in misc.itmap(getSerial, devices, _SERIAL_WORKERS):
+        if isinstance(res, Exception):
+            log.warning("Error getting device serial: %s", res)
+            continue
+        dmId, serial = res
+        serials[dmId] = serial
+
+    return list(_pathListIter((),
+                              lambda dmId: serials.get(dmId, ""),
+                              devicemapper._getPathsStatus(),
+                              iscsi.readSessionInfo))
+
+
+class DeviceInventory(object):
+    """
+    Snapshot of all multipath devices, collected by supervdsm in a single
+    call, and shared by all callers until devices are rescanned or resized,
+    or the snapshot is too old.
+    """
+
+    def __init__(self, collect, max_age=_INVENTORY_MAX_AGE,
+                 clock=monotonic_time):
+        self._collect = collect
+        self._max_age = max_age
+        self._clock = clock
+        # Serializes collecting devices, so concurrent callers share the
+        # same snapshot.
+        self._collect_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._devices = None
+        self._expires = 0
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._devices = None
+            self._generation += 1
+
+    def devices(self, filterGuids=()):
+        """
+        Return a list of devices info, like pathListIter.
+        """
+        with self._collect_lock:
+            with self._lock:
+                if self._clock() >= self._expires:
+                    self._devices = None
+                devices = self._devices
+                generation = self._generation
+
+            if devices is None:
+                start = self._clock()
+                devices = self._collect()
+                log.debug("Collected %d multipath devices in %.2f seconds",
+                          len(devices), self._clock() - start)
+                with self._lock:
+                    # Do not keep a snapshot collected while devices were
+                    # rescanned.
+                    if generation == self._generation:
+                        self._devices = devices
+                        self._expires = start + self._max_age
+
+        # Callers may modify the returned info.
+        return [copy.deepcopy(dev) for dev in devices
+                if not filterGuids or dev["guid"] in filterGuids]
+
+
+def _collectDevices():
+    return supervdsm.getProxy().getMultipathDevices()
+
+
+_inventory = DeviceInventory(_collectDevices)
+
+
+def _pathListIter(filterGuids, getSerial, pathStatuses, getSessionInfo):
     filterLen = len(filterGuids) if filterGuids else -1
     devsFound = 0
 
     knownSessions = {}
 
-    svdsm = supervdsm.getProxy()
-    pathStatuses = devicemapper.getPathsStatus()
-
     for dmId, guid in getMPDevsIter():
         if devsFound == filterLen:
             break
@@ -242,7 +352,7 @@ def pathListIter(filterGuids=()):
             "guid": guid,
             "dm": dmId,
             "capacity": str(getDeviceSize(dmId)),
-            "serial": svdsm.getScsiSerial(dmId),
+            "serial": getSerial(dmId),
             "paths": [],
             "connections": [],
             "devtypes": [],
@@ -317,7 +427,7 @@ def pathListIter(filterGuids=()):
                     # FIXME: This entire part is for BC. It should be moved to
                     # hsm and not preserved for new APIs. New APIs should keep
                     # numeric types and sane field names.
-                    sess = iscsi.getSessionInfo(sessionID)
+                    sess = getSessionInfo(sessionID)
                     sessionInfo = {
                         "connection": sess.target.portal.hostname,
                         "port": str(sess.target.portal.port),
@@ -387,7 +497,8 @@ def getMPDevsIter():
             log.info("Device with unsupported GUID %s discarded", guid)
             continue
 
-        yield dmInfoDir.split("/")[3], guid
+        dmId = os.path.basename(os.path.dirname(dmInfoDir.rstrip("/")))
+        yield dmId, guid
 
 
 def devIsiSCSI(type):
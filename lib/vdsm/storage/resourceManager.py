@@ -19,6 +19,7 @@
 #
 from __future__ import absolute_import
 
+import collections
 import threading
 import logging
 import re
@@ -32,6 +33,7 @@ from six.moves import queue
 from vdsm import concurrent
 from vdsm import utils
 from vdsm.common.logutils import SimpleLogAdapter
+from vdsm.common.time import monotonic_time
 from vdsm.storage import exception as se
 from vdsm.storage import guarded
 from vdsm.storage import rwlock
@@ -178,6 +180,7 @@ class Request(object):
         self._isCanceled = False
         self._doneEvent = threading.Event()
         self._callback = callback
+        self._created = monotonic_time()
         self.reqID = str(uuid4())
         self._log = SimpleLogAdapter(self._log, {"ResName": self.fullName,
                                                  "ReqID": self.reqID})
@@ -234,6 +237,12 @@ class Request(object):
     def wait(self, timeout=None):
         return self._doneEvent.wait(timeout)
 
+    def waitTime(self):
+        """
+        Return the time since the request was registered.
+        """
+        return monotonic_time() - self._created
+
     def granted(self):
         with self._syncRoot:
             return (not self._isCanceled) and self._doneEvent.isSet()
@@ -342,13 +351,18 @@ class _ResourceManager(object):
 
     This class is for internal usage only, clients should use the module
     interface.
+
+    The resources of a namespace are split between shards by name, each
+    protected by its own lock, so requests for different resources do not
+    contend. A new resource is created outside of the shard lock; while it
+    is created, requests for the same resource are queued.
     """
     _log = logging.getLogger("storage.ResourceManager")
     _namespaceValidator = re.compile(r"^[\w\d_-]+$")
     _resourceNameValidator = re.compile(r"^[^\s.]+$")
 
     def __init__(self):
-        self._syncRoot = rwlock.RWLock()
+        self._lock = threading.Lock()
         self._namespaces = {}
 
     def registerNamespace(self, namespace, factory):
@@ -359,7 +373,7 @@ class _ResourceManager(object):
             raise NamespaceRegistered("Namespace '%s' already registered"
                                       % namespace)
 
-        with self._syncRoot.exclusive:
+        with self._lock:
             if namespace in self._namespaces:
                 raise NamespaceRegistered("Namespace '%s' already registered"
                                           % namespace)
@@ -369,7 +383,7 @@ class _ResourceManager(object):
             self._namespaces[namespace] = Namespace(factory)
 
     def unregisterNamespace(self, namespace):
-        with self._syncRoot.exclusive:
+        with self._lock:
             if namespace not in self._namespaces:
                 raise KeyError("Namespace '%s' doesn't exist" % namespace)
 
@@ -377,41 +391,62 @@ class _ResourceManager(object):
 
     def _unregisterNamespaceLocked(self, namespace):
         """
-        Must be called when holding self._syncRoot.exclusive, and namespace
-        exists in self._namespaces.
+        Must be called when holding self._lock, and namespace exists in
+        self._namespaces.
         """
         self._log.debug("Unregistering namespace '%s'", namespace)
         namespaceObj = self._namespaces[namespace]
-        with namespaceObj.lock:
-            if len(namespaceObj.resources) > 0:
+        with namespaceObj.lockAll():
+            if namespaceObj.hasResources():
                 raise ResourceManagerError("Cannot unregister Resource "
                                            "Factory '%s'. It has active "
                                            "resources." % (namespace))
 
+            namespaceObj.registered = False
             del self._namespaces[namespace]
 
+    def _getNamespace(self, namespace):
+        try:
+            return self._namespaces[namespace]
+        except KeyError:
+            raise ValueError("Namespace '%s' is not registered with this "
+                             "manager" % namespace)
+
     def getResourceStatus(self, namespace, name):
         if not self._resourceNameValidator.match(name):
             raise ValueError("Invalid resource name '%s'" % name)
 
-        with self._syncRoot.shared:
-            try:
-                namespaceObj = self._namespaces[namespace]
-            except KeyError:
-                raise ValueError("Namespace '%s' is not registered with this "
-                                 "manager" % namespace)
-            resources = namespaceObj.resources
-            with namespaceObj.lock:
-                if not namespaceObj.factory.resourceExists(name):
-                    raise KeyError("No such resource '%s.%s'" % (namespace,
-                                                                 name))
+        namespaceObj = self._getNamespace(namespace)
+        shard = namespaceObj.shard(name)
+        with shard.lock:
+            if not namespaceObj.factory.resourceExists(name):
+                raise KeyError("No such resource '%s.%s'" % (namespace,
+                                                             name))
+
+            if name not in shard.resources:
+                return LockState.free
 
-                if name not in resources:
-                    return LockState.free
+            return LockState.fromType(shard.resources[name].currentLock)
 
-                return LockState.fromType(resources[name].currentLock)
+    def getLockStats(self):
+        """
+        Return lock requests statistics for every namespace.
+        """
+        with self._lock:
+            namespaces = list(self._namespaces.items())
+        return {namespace: namespaceObj.stats()
+                for namespace, namespaceObj in namespaces}
 
     def _switchLockType(self, resourceInfo, newLockType):
+        if not resourceInfo.created:
+            # Creating the resource failed, try again for this request.
+            resourceInfo.currentLock = newLockType
+            namespace = self._namespaces[resourceInfo.namespace]
+            resourceInfo.realObj = namespace.factory.createResource(
+                resourceInfo.name, resourceInfo.currentLock)
+            resourceInfo.created = True
+            return
+
         switchLock = (resourceInfo.currentLock != newLockType)
         resourceInfo.currentLock = newLockType
 
@@ -494,23 +529,22 @@ class _ResourceManager(object):
         request = Request(namespace, name, lockType, callback)
         self._log.debug("Trying to register resource '%s' for lock type '%s'",
                         fullName, lockType)
-        with nested(utils.RollbackContext(),
-                    self._syncRoot.shared) as (contextCleanup, lock):
-            try:
-                namespaceObj = self._namespaces[namespace]
-            except KeyError:
-                raise ValueError("Namespace '%s' is not registered with this "
-                                 "manager" % namespace)
-
-            resources = namespaceObj.resources
-            with namespaceObj.lock:
+        namespaceObj = self._getNamespace(namespace)
+        shard = namespaceObj.shard(name)
+
+        with utils.RollbackContext() as contextCleanup:
+            with shard.lock:
+                if not namespaceObj.registered:
+                    raise ValueError("Namespace '%s' is not registered with "
+                                     "this manager" % namespace)
                 try:
-                    resource = resources[name]
+                    resource = shard.resources[name]
                 except KeyError:
                     if not namespaceObj.factory.resourceExists(name):
                         raise KeyError("No such resource '%s'" % (fullName))
                 else:
                     if len(resource.queue) == 0 and \
+                            resource.created and \
                             resource.currentLock == SHARED and \
                             request.lockType == SHARED:
                         resource.activeUsers += 1
@@ -519,44 +553,56 @@ class _ResourceManager(object):
                                         "shared lock (%d active users)",
                                         fullName, resource.activeUsers)
                         request.grant()
+                        shard.granted(request, waited=False)
                         contextCleanup.defer(request.emit,
                                              ResourceRef(namespace, name,
                                                          resource.realObj,
                                                          request.reqID))
                         return RequestRef(request)
 
-                    resource.queue.insert(0, request)
+                    resource.queue.append(request)
                     self._log.debug("Resource '%s' is currently locked, "
                                     "Entering queue (%d in queue)",
                                     fullName, len(resource.queue))
                     return RequestRef(request)
 
-                # TODO : Creating the object inside the namespace lock causes
-                #        the entire namespace to lock and might cause
-                #        performance issues. As this is no currently a problem
-                #        I left it as it is to keep the code simple. If there
-                #        is a bottleneck in the resource framework, its
-                #        probably here.
-                try:
-                    obj = namespaceObj.factory.createResource(name, lockType)
-                except:
-                    self._log.warn("Resource factory failed to create resource"
-                                   " '%s'. Canceling request.", fullName,
-                                   exc_info=True)
-                    contextCleanup.defer(request.cancel)
-                    return RequestRef(request)
-
-                resource = resources[name] = ResourceInfo(obj, namespace, name)
+                # Lock the resource for this request while creating it
+                # without holding the shard lock. Other requests for this
+                # resource will wait in the queue.
+                resource = ResourceInfo(None, namespace, name, created=False)
                 resource.currentLock = request.lockType
                 resource.activeUsers += 1
+                shard.resources[name] = resource
+
+            try:
+                obj = namespaceObj.factory.createResource(name, lockType)
+            except:
+                self._log.warn("Resource factory failed to create resource"
+                               " '%s'. Canceling request.", fullName,
+                               exc_info=True)
+                contextCleanup.defer(request.cancel)
+                with shard.lock:
+                    resource.activeUsers -= 1
+                    self._grantNext(shard, resource, contextCleanup)
+                return RequestRef(request)
+
+            with shard.lock:
+                resource.realObj = obj
+                resource.created = True
 
                 self._log.debug("Resource '%s' is free. Now locking as '%s' "
                                 "(1 active user)", fullName, request.lockType)
                 request.grant()
+                shard.granted(request, waited=False)
                 contextCleanup.defer(request.emit,
                                      ResourceRef(namespace, name,
                                                  resource.realObj,
                                                  request.reqID))
+
+                # Shared requests which arrived while creating the resource.
+                if resource.currentLock == SHARED:
+                    self._grantShared(shard, resource, contextCleanup)
+
                 return RequestRef(request)
 
     def releaseResource(self, namespace, name):
@@ -567,18 +613,13 @@ class _ResourceManager(object):
         fullName = "%s.%s" % (namespace, name)
 
         self._log.debug("Trying to release resource '%s'", fullName)
-        with nested(utils.RollbackContext(),
-                    self._syncRoot.shared) as (contextCleanup, lock):
-            try:
-                namespaceObj = self._namespaces[namespace]
-            except KeyError:
-                raise ValueError("Namespace '%s' is not registered with this "
-                                 "manager", namespace)
-            resources = namespaceObj.resources
+        namespaceObj = self._getNamespace(namespace)
+        shard = namespaceObj.shard(name)
 
-            with namespaceObj.lock:
+        with utils.RollbackContext() as contextCleanup:
+            with shard.lock:
                 try:
-                    resource = resources[name]
+                    resource = shard.resources[name]
                 except KeyError:
                     raise ValueError("Resource '%s.%s' is not currently "
                                      "registered" % (namespace, name))
@@ -592,106 +633,175 @@ class _ResourceManager(object):
                     return
                 self._log.debug("Resource '%s' is free, finding out if anyone "
                                 "is waiting for it.", fullName)
-                # Grant a request
-                while True:
-                    # Is there someone waiting for the resource
-                    if len(resource.queue) == 0:
-                        self._freeResource(resources[name])
-                        del resources[name]
-                        self._log.debug("No one is waiting for resource '%s', "
-                                        "Clearing records.", fullName)
-                        return
-
-                    self._log.debug("Resource '%s' has %d requests in queue. "
-                                    "Handling top request.", fullName,
-                                    len(resource.queue))
-                    nextRequest = resource.queue.pop()
-                    # We lock the request to simulate a transaction. We cannot
-                    # grant the request before there is a resource switch. And
-                    # we can't do a resource switch before we can guarantee
-                    # that the request will be granted.
-                    with nextRequest.syncRoot:
-                        if nextRequest.canceled():
-                            self._log.debug("Request '%s' was canceled, "
-                                            "Ignoring it.", nextRequest)
-                            continue
-
-                        try:
-                            self._switchLockType(resource,
-                                                 nextRequest.lockType)
-                        except Exception:
-                            self._log.warn("Resource factory failed to create "
-                                           "resource '%s'. Canceling request.",
-                                           fullName, exc_info=True)
-                            nextRequest.cancel()
-                            continue
-
-                        nextRequest.grant()
-                        contextCleanup.defer(
-                            partial(nextRequest.emit,
-                                    ResourceRef(namespace, name,
-                                                resource.realObj,
-                                                nextRequest.reqID)))
+                self._grantNext(shard, resource, contextCleanup)
 
-                        resource.activeUsers += 1
+    def _grantNext(self, shard, resource, contextCleanup):
+        """
+        Grant the next requests waiting for resource, which has no active
+        users, or remove the resource if no one is waiting for it.
 
-                        self._log.debug("Request '%s' was granted",
-                                        nextRequest)
-                        break
+        Must be called when holding shard.lock.
+        """
+        fullName = resource.fullName
+        # Grant a request
+        while True:
+            # Is there someone waiting for the resource
+            if len(resource.queue) == 0:
+                self._freeResource(resource)
+                del shard.resources[resource.name]
+                self._log.debug("No one is waiting for resource '%s', "
+                                "Clearing records.", fullName)
+                return
 
-                # If the lock is exclusive were done
-                if resource.currentLock == EXCLUSIVE:
-                    return
+            self._log.debug("Resource '%s' has %d requests in queue. "
+                            "Handling top request.", fullName,
+                            len(resource.queue))
+            nextRequest = resource.queue.popleft()
+            # We lock the request to simulate a transaction. We cannot
+            # grant the request before there is a resource switch. And
+            # we can't do a resource switch before we can guarantee
+            # that the request will be granted.
+            with nextRequest.syncRoot:
+                if nextRequest.canceled():
+                    self._log.debug("Request '%s' was canceled, "
+                                    "Ignoring it.", nextRequest)
+                    continue
+
+                try:
+                    self._switchLockType(resource, nextRequest.lockType)
+                except Exception:
+                    self._log.warn("Resource factory failed to create "
+                                   "resource '%s'. Canceling request.",
+                                   fullName, exc_info=True)
+                    nextRequest.cancel()
+                    continue
+
+                nextRequest.grant()
+                shard.granted(nextRequest, waited=True)
+                contextCleanup.defer(
+                    partial(nextRequest.emit,
+                            ResourceRef(resource.namespace, resource.name,
+                                        resource.realObj,
+                                        nextRequest.reqID)))
+
+                resource.activeUsers += 1
+
+                self._log.debug("Request '%s' was granted", nextRequest)
+                break
+
+        # If the lock is exclusive were done
+        if resource.currentLock == EXCLUSIVE:
+            return
+
+        self._grantShared(shard, resource, contextCleanup)
+
+    def _grantShared(self, shard, resource, contextCleanup):
+        """
+        Grant the shared requests at the head of the queue of resource,
+        which is locked in shared mode.
+
+        Must be called when holding shard.lock.
+        """
+        self._log.debug("This is a shared lock. Granting all shared "
+                        "requests")
+        while len(resource.queue) > 0:
 
-                # Keep granting shared locks
-                self._log.debug("This is a shared lock. Granting all shared "
-                                "requests")
-                while len(resource.queue) > 0:
+            nextRequest = resource.queue[0]
+            if nextRequest.canceled():
+                resource.queue.popleft()
+                continue
 
-                    nextRequest = resource.queue[-1]
-                    if nextRequest.canceled():
-                        resource.queue.pop()
-                        continue
+            if nextRequest.lockType == EXCLUSIVE:
+                break
 
-                    if nextRequest.lockType == EXCLUSIVE:
-                        break
+            nextRequest = resource.queue.popleft()
+            try:
+                nextRequest.grant()
+                contextCleanup.defer(
+                    partial(nextRequest.emit,
+                            ResourceRef(resource.namespace, resource.name,
+                                        resource.realObj,
+                                        nextRequest.reqID)))
+            except RequestAlreadyProcessedError:
+                continue
 
-                    nextRequest = resource.queue.pop()
-                    try:
-                        nextRequest.grant()
-                        contextCleanup.defer(
-                            partial(nextRequest.emit,
-                                    ResourceRef(namespace, name,
-                                                resource.realObj,
-                                                nextRequest.reqID)))
-                    except RequestAlreadyProcessedError:
-                        continue
+            shard.granted(nextRequest, waited=True)
+            resource.activeUsers += 1
+            self._log.debug("Request '%s' was granted (%d "
+                            "active users)", nextRequest,
+                            resource.activeUsers)
 
-                    resource.activeUsers += 1
-                    self._log.debug("Request '%s' was granted (%d "
-                                    "active users)", nextRequest,
-                                    resource.activeUsers)
+
+# Number of shards in a namespace. Requests for resources in different shards
+# do not contend for the same lock.
+NAMESPACE_SHARDS = 16
 
 
 class Namespace(object):
     """
     Namespace struct
     """
-    def __init__(self, factory):
-        self.resources = {}
-        self.lock = threading.Lock()  # rwlock.RWLock()
+    def __init__(self, factory, shards=NAMESPACE_SHARDS):
         self.factory = factory
+        self.shards = [Shard() for i in range(shards)]
+        self.registered = True
+
+    def shard(self, name):
+        return self.shards[hash(name) % len(self.shards)]
+
+    def lockAll(self):
+        return nested(*[shard.lock for shard in self.shards])
+
+    def hasResources(self):
+        return any(shard.resources for shard in self.shards)
+
+    def stats(self):
+        total = {"requests": 0, "waited": 0, "wait_time": 0.0,
+                 "max_wait": 0.0}
+        for shard in self.shards:
+            with shard.lock:
+                total["requests"] += shard.requests
+                total["waited"] += shard.waited
+                total["wait_time"] += shard.waitTime
+                total["max_wait"] = max(total["max_wait"], shard.maxWait)
+        return total
+
+
+class Shard(object):
+    """
+    Shard struct, keeping some of the resources of a namespace.
+    """
+    def __init__(self):
+        self.resources = {}
+        self.lock = threading.Lock()
+        # Lock requests statistics
+        self.requests = 0
+        self.waited = 0
+        self.waitTime = 0.0
+        self.maxWait = 0.0
+
+    def granted(self, request, waited):
+        """
+        Account a granted request. Must be called when holding self.lock.
+        """
+        self.requests += 1
+        if waited:
+            wait = request.waitTime()
+            self.waited += 1
+            self.waitTime += wait
+            self.maxWait = max(self.maxWait, wait)
 
 
 class ResourceInfo(object):
     """
     Resource struct
     """
-    def __init__(self, realObj, namespace, name):
-        self.queue = []
+    def __init__(self, realObj, namespace, name, created=True):
+        self.queue = collections.deque()
         self.activeUsers = 0
         self.currentLock = None
         self.realObj = realObj
+        self.created = created
         self.namespace = namespace
         self.name = name
         self.fullName = "%s.%s" % (namespace, name)
@@ -1032,6 +1142,18 @@ def releaseResource(namespace, name):
     _manager.releaseResource(namespace, name)
 
 
+def getLockStats():
+    """
+    Return lock requests statistics for every namespace:
+
+        requests    number of granted requests
+        waited      number of granted requests which waited in the queue
+        wait_time   total time granted requests waited in the queue
+        max_wait    longest time a granted request waited in the queue
+    """
+    return _manager.getLockStats()
+
+
 # Private apis for the tests - clients should never use these!
 
 def _registerResource(namespace, name, lockType, callback):
@@ -457,6 +457,13 @@ class Record(object):
 
 # Record with empty values, mark a free record in the index.
 EMPTY_RECORD = Record("", 0)
+EMPTY_RECORD_BYTES = EMPTY_RECORD.bytes()
+
+# Values in the free records map of the in-memory index.
+FREE = b"\1"
+USED = b"\0"
+FREE_BYTE = ord(FREE)
+USED_BYTE = ord(USED)
 
 
 class LeasesVolume(object):
@@ -594,7 +601,7 @@ class LeasesVolume(object):
         """
         log.debug("Getting all leases for lockspace %r", self.lockspace)
         leases = {}
-        for recnum in range(MAX_RECORDS):
+        for recnum in self._index.used_records():
             # TODO: handle bad records - currently will raise InvalidRecord and
             # fail the request.
             record = self._index.read_record(recnum)
@@ -657,36 +664,43 @@ class VolumeIndex(object):
     """
     Index maintaining volume metadata and the mapping from lease id to lease
     offset.
+
+    The records in the buffer are also indexed in memory, mapping lease id to
+    record number, and keeping a map of free records. The in-memory index
+    is rebuilt when loading the index from storage, and updated when writing
+    a record.
     """
 
     def __init__(self):
         self._buf = mmap.mmap(-1, INDEX_SIZE, mmap.MAP_SHARED)
+        # Maps lease id (bytes) to record number.
+        self._records = {}
+        # Byte per record, FREE if the record is empty. The buffer is zeroed,
+        # so no record is empty until the index is loaded or formatted.
+        self._free = bytearray(USED * MAX_RECORDS)
 
     def find_record(self, lease_id):
         """
         Search for lease_id record. Returns record number if found, -1
         otherwise.
         """
-        prefix = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))
-
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(prefix, RECORD_BASE)
-        if offset == -1:
-            return -1
-
-        return self._record_number(offset)
+        key = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))[:-1].rstrip(b"\0")
+        return self._records.get(key, -1)
 
     def find_free_record(self):
         """
         Find the first free record. Returns record number if found, -1
         otherwise.
         """
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(EMPTY_RECORD.bytes(), RECORD_BASE)
-        if offset == -1:
-            return -1
+        return self._free.find(FREE)
 
-        return self._record_number(offset)
+    def used_records(self):
+        """
+        Iterate over the numbers of records which are not free.
+        """
+        for recnum, free in enumerate(self._free):
+            if free != FREE_BYTE:
+                yield recnum
 
     def read_record(self, recnum):
         """
@@ -706,8 +720,10 @@ class VolumeIndex(object):
         storage.
         """
         offset = self._record_offset(recnum)
+        self._unindex_record(recnum)
         self._buf.seek(offset)
         self._buf.write(record.bytes())
+        self._index_record(recnum)
 
     def read_metadata(self):
         """
@@ -738,6 +754,7 @@ class VolumeIndex(object):
         """
         file.seek(INDEX_BASE)
         file.readinto(self._buf)
+        self._rebuild()
 
     def dump(self, file):
         """
@@ -783,8 +800,40 @@ class VolumeIndex(object):
     def _record_offset(self, recnum):
         return RECORD_BASE + recnum * RECORD_SIZE
 
-    def _record_number(self, offset):
-        return (offset - RECORD_BASE) // RECORD_SIZE
+    def _record_key(self, recnum):
+        offset = self._record_offset(recnum)
+        return self._buf[offset:offset + LOOKUP_STRUCT.size - 1].rstrip(b"\0")
+
+    def _rebuild(self):
+        self._records.clear()
+        data = self._buf[RECORD_BASE:INDEX_SIZE]
+        key_size = LOOKUP_STRUCT.size - 1
+        for recnum in range(MAX_RECORDS):
+            offset = recnum * RECORD_SIZE
+            if data[offset:offset + RECORD_SIZE] == EMPTY_RECORD_BYTES:
+                self._free[recnum] = FREE_BYTE
+                continue
+            self._free[recnum] = USED_BYTE
+            key = data[offset:offset + key_size].rstrip(b"\0")
+            if key and key not in self._records:
+                self._records[key] = recnum
+
+    def _index_record(self, recnum):
+        offset = self._record_offset(recnum)
+        if self._buf[offset:offset + RECORD_SIZE] == EMPTY_RECORD_BYTES:
+            self._free[recnum] = FREE_BYTE
+            return
+        self._free[recnum] = USED_BYTE
+        key = self._record_key(recnum)
+        # Like searching the buffer, the first record wins if the lease id is
+        # duplicated.
+        if key and self._records.get(key, MAX_RECORDS) > recnum:
+            self._records[key] = recnum
+
+    def _unindex_record(self, recnum):
+        key = self._record_key(recnum)
+        if self._records.get(key) == recnum:
+            del self._records[key]
 
 
 class ChangeBlock(object):
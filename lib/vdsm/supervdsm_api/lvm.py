@@ -0,0 +1,37 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+
+from vdsm.storage import lvmshell
+
+from . import expose
+
+_shell = lvmshell.LVMShell()
+
+
+@expose
+def lvmReport(args):
+    """
+    Run a lvm report command in a persistent lvm shell.
+
+    args are the lvm command arguments, without the lvm executable, e.g.
+    ["lvs", "--noheadings", ...]. Returns (rc, out, err).
+    """
+    return _shell.run(args)
@@ -162,6 +162,10 @@ class _SuperVdsm(object):
     def getPathsStatus(self):
         return _getPathsStatus()
 
+    @logDecorator
+    def getMultipathDevices(self):
+        return multipath.collectDevices()
+
     def _runAs(self, user, groups, func, args=(), kwargs={}):
         def child(pipe):
             res = ex = None
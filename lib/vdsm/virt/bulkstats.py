@@ -0,0 +1,291 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Columnar storage of libvirt bulk stats samples.
+
+A bulk stats sample is a dict mapping vm ids to flat dicts of libvirt
+counters, such as "block.2.rd.bytes". Walking these dicts for every
+getStats() call, and finding again the device indexes in every sample, is
+costly when running many VMs.
+
+Sample flattens a bulk stats sample once, when it is collected, into fixed
+layout arrays: one row per VM, and one row per VM disk and VM nic. compute()
+then computes the derived statistics (rates, latencies and percentages) for
+all VMs in a single pass over two samples.
+"""
+
+from __future__ import absolute_import
+
+from array import array
+import sys
+
+import six
+
+
+# Marks a counter missing in the libvirt sample. Bulk stats accumulate what
+# they can get, so any counter may be missing.
+MISSING = -sys.maxsize - 1
+
+VM_FIELDS = (
+    'cpu.time',
+    'cpu.user',
+    'cpu.system',
+)
+
+BLOCK_FIELDS = (
+    'rd.bytes',
+    'wr.bytes',
+    'rd.reqs',
+    'wr.reqs',
+    'fl.reqs',
+    'rd.times',
+    'wr.times',
+    'fl.times',
+)
+
+NET_FIELDS = (
+    'rx.bytes',
+    'tx.bytes',
+    'rx.errs',
+    'rx.drop',
+    'tx.errs',
+    'tx.drop',
+)
+
+_CPU_TIME, _CPU_USER, _CPU_SYSTEM = range(len(VM_FIELDS))
+
+_RD_BYTES, _WR_BYTES, _RD_REQS, _WR_REQS, _FL_REQS, _RD_TIMES, _WR_TIMES, \
+    _FL_TIMES = range(len(BLOCK_FIELDS))
+
+_RX_BYTES, _TX_BYTES, _RX_ERRS, _RX_DROP, _TX_ERRS, _TX_DROP = \
+    range(len(NET_FIELDS))
+
+
+class _Table(object):
+    """
+    Rows of integer counters with fixed layout, stored in a single array.
+    """
+
+    __slots__ = ('fields', 'values', 'index')
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.values = array('l')
+        # Maps row key to row number.
+        self.index = {}
+
+    def add(self, key, stats, prefix):
+        self.index[key] = len(self.index)
+        values = self.values
+        for field in self.fields:
+            value = stats.get(prefix + field, MISSING)
+            # Some counters are reported as floats.
+            values.append(int(value))
+
+    def row(self, key):
+        """
+        Return the offset of the row in values, or None if there is no such
+        row.
+        """
+        try:
+            return self.index[key] * len(self.fields)
+        except KeyError:
+            return None
+
+
+class Sample(object):
+    """
+    A bulk stats sample flattened to fixed layout arrays.
+    """
+
+    def __init__(self, bulk_stats):
+        self.vms = _Table(VM_FIELDS)
+        self.block = _Table(BLOCK_FIELDS)
+        self.net = _Table(NET_FIELDS)
+        # Maps vm id to (list of disk names, list of nic names).
+        self.devices = {}
+
+        for vm_id, stats in six.iteritems(bulk_stats):
+            self.vms.add(vm_id, stats, '')
+            disks = self._add_devices(vm_id, stats, 'block', self.block)
+            nics = self._add_devices(vm_id, stats, 'net', self.net)
+            self.devices[vm_id] = (disks, nics)
+
+    def _add_devices(self, vm_id, stats, group, table):
+        names = []
+        for name, idx in six.iteritems(_reverse_map(stats, group)):
+            table.add((vm_id, name), stats, '%s.%d.' % (group, idx))
+            names.append(name)
+        return names
+
+
+class VmStats(object):
+    """
+    Statistics computed for one VM from two samples, formatted as reported
+    by vmstats.
+
+    cpu    dict with cpuUser, cpuSys, and cpuUsage if available
+    disks  dict mapping disk name to dict of disk statistics
+    nics   dict mapping nic name to dict of nic counters
+    """
+
+    __slots__ = ('cpu', 'disks', 'nics')
+
+    def __init__(self):
+        self.cpu = {'cpuUser': 0.0, 'cpuSys': 0.0}
+        self.disks = {}
+        self.nics = {}
+
+
+def compute(first, last, interval):
+    """
+    Compute the statistics of all VMs found in both first and last samples.
+
+    Returns dict mapping vm id to VmStats. Disk rates and cpu percentages
+    are computed only if interval is positive.
+    """
+    result = {}
+    first_vms = first.vms.values
+    last_vms = last.vms.values
+
+    for vm_id in last.vms.index:
+        first_row = first.vms.row(vm_id)
+        if first_row is None:
+            continue
+        last_row = last.vms.row(vm_id)
+        vm = VmStats()
+
+        if interval > 0:
+            _compute_cpu(vm.cpu, first_vms, first_row, last_vms, last_row,
+                         interval)
+
+        disks, nics = last.devices[vm_id]
+        for name in disks:
+            first_disk_row = first.block.row((vm_id, name))
+            if first_disk_row is not None:
+                vm.disks[name] = _compute_disk(
+                    first.block.values, first_disk_row,
+                    last.block.values, last.block.row((vm_id, name)),
+                    interval)
+        for name in nics:
+            if (vm_id, name) in first.net.index:
+                vm.nics[name] = _compute_nic(
+                    last.net.values, last.net.row((vm_id, name)))
+
+        result[vm_id] = vm
+
+    return result
+
+
+def _compute_cpu(stats, first, first_row, last, last_row, interval):
+    first_user = first[first_row + _CPU_USER]
+    first_system = first[first_row + _CPU_SYSTEM]
+    last_user = last[last_row + _CPU_USER]
+    last_system = last[last_row + _CPU_SYSTEM]
+    if MISSING in (first_user, first_system, last_user, last_system):
+        return
+
+    # TODO: cpuUsage should have the same type as cpuUser and cpuSys.
+    stats['cpuUsage'] = str(last_system + last_user)
+
+    cpu_sys = (last_user - first_user) + (last_system - first_system)
+    stats['cpuSys'] = _usage_percentage(cpu_sys, interval)
+
+    first_time = first[first_row + _CPU_TIME]
+    last_time = last[last_row + _CPU_TIME]
+    if first_time != MISSING and last_time != MISSING:
+        stats['cpuUser'] = _usage_percentage(
+            (last_time - first_time) - cpu_sys, interval)
+
+
+def _compute_disk(first, first_row, last, last_row, interval):
+    stats = {}
+
+    if interval > 0:
+        for name, field in (('readRate', _RD_BYTES),
+                            ('writeRate', _WR_BYTES)):
+            first_value = first[first_row + field]
+            last_value = last[last_row + field]
+            if first_value != MISSING and last_value != MISSING:
+                stats[name] = str((last_value - first_value) / interval)
+
+    for name, reqs, times in (('readLatency', _RD_REQS, _RD_TIMES),
+                              ('writeLatency', _WR_REQS, _WR_TIMES),
+                              ('flushLatency', _FL_REQS, _FL_TIMES)):
+        values = (first[first_row + reqs], last[last_row + reqs],
+                  first[first_row + times], last[last_row + times])
+        if MISSING in values:
+            continue
+        operations = values[1] - values[0]
+        elapsed_time = values[3] - values[2]
+        if operations:
+            stats[name] = str(elapsed_time / operations)
+        else:
+            stats[name] = '0'
+
+    for name, field in (('readOps', _RD_REQS),
+                        ('writeOps', _WR_REQS),
+                        ('readBytes', _RD_BYTES),
+                        ('writtenBytes', _WR_BYTES)):
+        value = last[last_row + field]
+        if value != MISSING:
+            stats[name] = str(value)
+
+    return stats
+
+
+_NIC_COUNTERS = (
+    (('rxErrors', _RX_ERRS),
+     ('rxDropped', _RX_DROP),
+     ('txErrors', _TX_ERRS),
+     ('txDropped', _TX_DROP)),
+    (('rx', _RX_BYTES),
+     ('tx', _TX_BYTES)),
+)
+
+
+def _compute_nic(last, last_row):
+    stats = {}
+    # Like vmstats._nic_traffic, report each group of counters up to the
+    # first missing counter.
+    for group in _NIC_COUNTERS:
+        for name, field in group:
+            value = last[last_row + field]
+            if value == MISSING:
+                break
+            stats[name] = str(value)
+    return stats
+
+
+def _usage_percentage(val, interval):
+    return 100 * val / interval / 1000 ** 3
+
+
+def _reverse_map(stats, group):
+    name_to_idx = {}
+    for idx in six.moves.xrange(stats.get('%s.count' % group, 0)):
+        try:
+            name = stats['%s.%d.name' % (group, idx)]
+        except KeyError:
+            # See vmstats._find_bulk_stats_reverse_map.
+            pass
+        else:
+            name_to_idx[name] = idx
+    return name_to_idx
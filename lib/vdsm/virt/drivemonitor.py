@@ -0,0 +1,143 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Drive watermark monitoring using block threshold events.
+
+Without events, every chunked drive is checked every vm_watermark_interval
+seconds, querying libvirt (and QEMU) for the drive allocation.
+
+With events, a block threshold is set on each chunked drive after checking
+it, and libvirt sends a VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD event when the
+guest writes above the threshold. Only drives without a threshold, or with an
+exceeded threshold, are checked. All chunked drives are still checked every
+vm_watermark_safety_interval seconds, in case an event was missed.
+
+Drives replicating to a chunked replica are always checked, since the
+physical size of the replica is not known to libvirt.
+"""
+
+from __future__ import absolute_import
+
+import libvirt
+
+from vdsm.common.time import monotonic_time
+from vdsm.config import config
+from vdsm.virt import events
+from vdsm.virt.vmdevices.storage import BLOCK_THRESHOLD
+
+_EVENTS = config.getboolean('vars', 'vm_watermark_events')
+_SAFETY_INTERVAL = config.getint('vars', 'vm_watermark_safety_interval')
+
+
+def events_supported():
+    return events.BLOCK_THRESHOLD is not None
+
+
+class DriveMonitor(object):
+    """
+    Track which chunked drives of a vm need a watermark check.
+
+    The state of each drive is kept in drive.threshold_state. Drives are
+    modified by the periodic drive monitor and by the libvirt event thread;
+    the state is set before setting the threshold, so an event received
+    before setBlockThreshold returns is not lost.
+    """
+
+    def __init__(self, vm, log, events=_EVENTS,
+                 safety_interval=_SAFETY_INTERVAL, clock=monotonic_time):
+        self._vm = vm
+        self._log = log
+        self._events = events and events_supported()
+        self._safety_interval = safety_interval
+        self._clock = clock
+        self._next_check = clock() + safety_interval
+
+    @property
+    def events_enabled(self):
+        return self._events
+
+    def needs_check(self, drives):
+        """
+        Return True if any of drives should be checked now. Does not modify
+        the monitor state.
+        """
+        if not drives:
+            return False
+        if not self._events or self._clock() >= self._next_check:
+            return True
+        return any(self._needs_check(drive) for drive in drives)
+
+    def drives_to_check(self, drives):
+        """
+        Return the drives that should be checked now.
+        """
+        if not self._events:
+            return drives
+        now = self._clock()
+        if now >= self._next_check:
+            self._next_check = now + self._safety_interval
+            return drives
+        return [drive for drive in drives if self._needs_check(drive)]
+
+    def set_threshold(self, drive, physical):
+        """
+        Set a block threshold on drive, so we get an event when the guest
+        writes above the drive watermark limit.
+        """
+        if not self._events or not self._can_set_threshold(drive):
+            return
+
+        threshold = physical - drive.watermarkLimit
+        drive.threshold_state = BLOCK_THRESHOLD.SET
+        try:
+            self._vm._dom.setBlockThreshold(drive.name, threshold)
+        except libvirt.libvirtError as e:
+            drive.threshold_state = BLOCK_THRESHOLD.UNSET
+            self._log.error("Unable to set block threshold for drive %s: %s",
+                            drive.name, e)
+            return
+
+        self._log.debug("Set block threshold for drive %s to %d (physical "
+                        "%d)", drive.name, threshold, physical)
+
+    def on_block_threshold(self, drive, path, threshold, excess):
+        """
+        Called when drive exceeded the block threshold. Runs in the libvirt
+        event thread, so it must not block.
+        """
+        self._log.info("Block threshold %d exceeded by %d for drive %s (%s)",
+                       threshold, excess, drive.name, path)
+        drive.threshold_state = BLOCK_THRESHOLD.EXCEEDED
+
+    def _needs_check(self, drive):
+        return (drive.threshold_state != BLOCK_THRESHOLD.SET or
+                not self._can_set_threshold(drive))
+
+    def _can_set_threshold(self, drive):
+        return drive.chunked and not drive.isDiskReplicationInProgress()
+
+
+def drive_name(dev):
+    """
+    Return the drive name from the dev argument of a block threshold event,
+    which may use the "vda[1]" form, specifying an index in the backing
+    chain.
+    """
+    return dev.split("[", 1)[0]
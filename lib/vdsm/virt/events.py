@@ -22,6 +22,9 @@ from __future__ import absolute_import
 
 import libvirt
 
+# Available since libvirt 3.2; None with older versions.
+BLOCK_THRESHOLD = getattr(libvirt, 'VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD', None)
+
 LIBVIRT_EVENTS = {
     libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: 'LIFECYCLE',
     libvirt.VIR_DOMAIN_EVENT_ID_REBOOT: 'REBOOT',
@@ -34,6 +37,9 @@ LIBVIRT_EVENTS = {
     libvirt.VIR_DOMAIN_EVENT_ID_JOB_COMPLETED: 'JOB_COMPLETED'
 }
 
+if BLOCK_THRESHOLD is not None:
+    LIBVIRT_EVENTS[BLOCK_THRESHOLD] = 'BLOCK_THRESHOLD'
+
 
 def event_name(event_id):
     try:
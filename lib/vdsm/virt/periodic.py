@@ -23,8 +23,10 @@ from __future__ import absolute_import
 Code to perform periodic maintenance and bookkeeping of the VMs.
 """
 
+from collections import defaultdict
 import logging
 import threading
+import zlib
 
 import libvirt
 
@@ -32,6 +34,8 @@ from vdsm import containersconnection
 from vdsm import executor
 from vdsm import host
 from vdsm import libvirtconnection
+from vdsm import metrics
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm.virt import migration
 from vdsm.virt import sampling
@@ -45,6 +49,9 @@ _WORKERS = config.getint('sampling', 'periodic_workers')
 _TASK_PER_WORKER = config.getint('sampling', 'periodic_task_per_worker')
 _TASKS = _WORKERS * _TASK_PER_WORKER
 _MAX_WORKERS = config.getint('sampling', 'max_workers')
+_SPREAD_SLOTS = config.getint('sampling', 'periodic_spread_slots')
+_BATCH_SIZE = config.getint('sampling', 'periodic_batch_size')
+_METRICS_ENABLED = config.getboolean('metrics', 'enabled')
 
 
 _operations = []
@@ -70,8 +77,13 @@ def start(cif, scheduler):
     _executor.start()
 
     def per_vm_operation(func, period):
-        disp = VmDispatcher(
-            cif.getVMs, _executor, func, _timeout_from(period))
+        if _SPREAD_SLOTS > 0:
+            disp = SpreadVmDispatcher(
+                cif.getVMs, _executor, func, _timeout_from(period),
+                scheduler, period, _SPREAD_SLOTS, _BATCH_SIZE)
+        else:
+            disp = VmDispatcher(
+                cif.getVMs, _executor, func, _timeout_from(period))
         return Operation(disp, period, scheduler)
 
     _operations = [
@@ -131,6 +143,21 @@ def stop():
     _executor.stop(wait=False)
 
 
+def dispatch_vm_operation(create, vm, period):
+    """
+    Run a per-VM operation now, instead of waiting for its next cycle. Used
+    when an event requires an operation that may block.
+
+    Raises executor.NotRunning if periodic operations were not started, and
+    executor.TooManyTasks if the executor is overloaded.
+    """
+    if _executor is None:
+        raise executor.NotRunning()
+    op = create(vm)
+    if op.required and op.runnable:
+        _executor.dispatch(op, _timeout_from(period))
+
+
 class Operation(object):
     """
     Operation runs a callable with a given period until
@@ -301,10 +328,173 @@ class VmDispatcher(object):
         )
 
 
+class SpreadVmDispatcher(VmDispatcher):
+    """
+    Dispatch an Operation to all VMs, spreading the VMs evenly over the
+    period, instead of dispatching all of them at the start of the period.
+
+    The period is divided into slots, and every VM is assigned a stable slot
+    based on its id, so the VM is handled at the same phase in every period.
+    If the operation supports batching, VMs in the same slot are handled by
+    one executor task, up to batch_size VMs per task.
+
+    The lag between the planned and actual start of the tasks, and the number
+    of skipped VMs are logged and reported as metrics once per period.
+    """
+
+    _log = logging.getLogger("virt.periodic.SpreadVmDispatcher")
+
+    def __init__(self, get_vms, executor, create, timeout, scheduler, period,
+                 slots, batch_size=1, clock=monotonic_time):
+        """
+        scheduler: schedule.Scheduler instance for dispatching the slots
+        period: the period of the operation, in seconds
+        slots: number of slots in the period
+        batch_size: maximum number of VMs per executor task
+        clock: monotonic clock, for testing
+        """
+        super(SpreadVmDispatcher, self).__init__(
+            get_vms, executor, create, timeout)
+        self._scheduler = scheduler
+        self._period = period
+        self._slots = slots
+        self._batch_size = batch_size if create.batchable else 1
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._skipped = []
+        self._lag = 0.0
+
+    def __call__(self):
+        self._report()
+
+        slots = defaultdict(list)
+        for vm_id, vm_obj in self._get_vms().iteritems():
+            slots[self.slot(vm_id)].append(vm_obj)
+
+        now = self._clock()
+        interval = float(self._period) / self._slots
+        for slot, vms in slots.iteritems():
+            delay = slot * interval
+            if delay == 0:
+                self._dispatch_slot(vms, now)
+            else:
+                self._scheduler.schedule(
+                    delay, _Slot(self._dispatch_slot, vms, now + delay))
+
+    def slot(self, vm_id):
+        """
+        Return the slot of vm_id, stable across periods and vdsm restarts.
+        """
+        return zlib.crc32(vm_id.encode("utf-8")) % self._slots
+
+    def _dispatch_slot(self, vms, planned):
+        ops = []
+        for vm_obj in vms:
+            op = None
+            try:
+                op = self._create(vm_obj)
+                if not op.required:
+                    continue
+                # See VmDispatcher.__call__.
+                if not op.runnable:
+                    self._skip(vm_obj.id)
+                    continue
+            except Exception:
+                self._log.exception("while dispatching %s", op)
+            else:
+                ops.append(op)
+
+        for i in range(0, len(ops), self._batch_size):
+            batch = _Batch(ops[i:i + self._batch_size], planned,
+                           self._update_lag, self._clock)
+            try:
+                self._executor.dispatch(batch, self._timeout)
+            except executor.TooManyTasks:
+                for op in batch.ops:
+                    self._skip(op.vm_id)
+            except executor.NotRunning:
+                return
+
+    def _skip(self, vm_id):
+        with self._lock:
+            self._skipped.append(vm_id)
+
+    def _update_lag(self, lag):
+        with self._lock:
+            self._lag = max(self._lag, lag)
+
+    def _report(self):
+        with self._lock:
+            skipped, self._skipped = self._skipped, []
+            lag, self._lag = self._lag, 0.0
+
+        if skipped:
+            self._log.warning('could not run %s on %s',
+                              self._create, skipped)
+        if _METRICS_ENABLED:
+            prefix = 'hosts.vdsm.periodic.' + self._create.__name__
+            metrics.send({prefix + '.lag': lag,
+                          prefix + '.skipped': len(skipped)})
+
+    def __repr__(self):
+        return '<SpreadVmDispatcher operation=%s at 0x%x>' % (
+            self._create, id(self)
+        )
+
+
+class _Slot(object):
+    """
+    Scheduled call dispatching the VMs of one slot.
+    """
+
+    def __init__(self, dispatch, vms, planned):
+        self._dispatch = dispatch
+        self._vms = vms
+        self._planned = planned
+
+    def __call__(self):
+        self._dispatch(self._vms, self._planned)
+
+
+class _Batch(object):
+    """
+    Executor task running an operation on several VMs, one after another.
+    """
+
+    _log = logging.getLogger("virt.periodic.Batch")
+
+    def __init__(self, ops, planned, update_lag, clock):
+        self.ops = ops
+        self._planned = planned
+        self._update_lag = update_lag
+        self._clock = clock
+
+    def __call__(self):
+        self._update_lag(max(0.0, self._clock() - self._planned))
+        for op in self.ops:
+            try:
+                op()
+            except Exception:
+                self._log.exception("%s failed", op)
+
+    def __repr__(self):
+        return '<Batch ops=%s at 0x%x>' % (self.ops, id(self))
+
+
 class _RunnableOnVm(object):
+
+    # Whether several VMs can be handled by one executor task. Operations
+    # that may block should not be batched, so one blocked VM does not delay
+    # other VMs.
+    batchable = False
+
     def __init__(self, vm):
         self._vm = vm
 
+    @property
+    def vm_id(self):
+        return self._vm.id
+
     @property
     def required(self):
         # Disable everything until the migration destination VM
@@ -365,6 +555,9 @@ class UpdateVolumes(_RunnableOnVm):
 
 class BlockjobMonitor(_RunnableOnVm):
 
+    # Checks only VMs with block jobs, ready for commands.
+    batchable = True
+
     @property
     def required(self):
         # For performance reasons, we must avoid as much
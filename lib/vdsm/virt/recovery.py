@@ -35,6 +35,7 @@ from vdsm import constants
 from vdsm import containersconnection
 from vdsm import libvirtconnection
 from vdsm import utils
+from vdsm.virt import recoveryfile
 from vdsm.virt import vmchannels
 from vdsm.virt import vmstatus
 from vdsm.virt import vmxml
@@ -68,6 +69,10 @@ def _get_vdsm_domains():
 class File(object):
     """
     "pickle" for vm state.
+
+    The state is stored using recoveryfile format, appending only the changes
+    on each save. If the state cannot be encoded in this format, it is
+    pickled.
     """
 
     EXTENSION = ".recovery"
@@ -78,6 +83,7 @@ class File(object):
         self._vmid = vmid
         self._name = '%s%s' % (vmid, self.EXTENSION)
         self._path = os.path.join(constants.P_VDSM_RUN, self._name)
+        self._writer = recoveryfile.Writer(self._path)
         self._lock = threading.Lock()
 
     @property
@@ -104,8 +110,7 @@ class File(object):
     def load(self, cif):
         self._log.debug("recovery: trying with VM %s", self._vmid)
         try:
-            with open(self._path) as src:
-                params = pickle.load(src)
+            params = recoveryfile.load(self._path)
             self._set_elapsed_time(params)
             res = cif.createVm(params, vmRecover=True)
         except Exception:
@@ -117,6 +122,15 @@ class File(object):
             return True
 
     def _dump(self, data):
+        try:
+            self._writer.write(data)
+        except (TypeError, ValueError) as e:
+            self._log.warning("Cannot save state in recovery format, using "
+                              "pickle: %s", e)
+            self._pickle(data)
+            self._writer.reset()
+
+    def _pickle(self, data):
         with tempfile.NamedTemporaryFile(
             dir=constants.P_VDSM_RUN,
             delete=False
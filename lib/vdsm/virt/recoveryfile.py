@@ -0,0 +1,214 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Recovery file format.
+
+A recovery file keeps the state of a running VM, a dict of JSON compatible
+values. The file starts with a header line, followed by JSON records, one per
+line:
+
+    vdsm-recovery/1
+    {"set":{"vmId":"...","status":"Up",...},"del":[]}
+    {"set":{"status":"Paused","statusTime":"4296227440"},"del":[]}
+
+Each record sets the changed keys and deletes the removed keys. The first
+record sets the entire state. When writing new state, only the changed keys
+are appended to the file. The file is rewritten with a single record when
+there are too many records.
+
+JSON cannot keep tuples or non-string dict keys, so states containing them
+are rejected, and callers should fall back to pickle. Strings are loaded as
+unicode on Python 2, like the values received from JSON-RPC.
+
+If vdsm is killed while appending a record, the last line may be incomplete;
+this line is ignored when loading the file. If appending a record fails, the
+file is rewritten on the next write, so incomplete records never appear
+before other records.
+
+Files written by older versions, using pickle, are loaded as is.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import json
+import logging
+import os
+import tempfile
+
+import six
+
+from vdsm.common.compat import pickle
+
+VERSION = 1
+
+HEADER = ("vdsm-recovery/%d\n" % VERSION).encode("ascii")
+
+# Rewrite the file after this number of records.
+MAX_RECORDS = 100
+
+_SEPARATORS = (",", ":")
+
+log = logging.getLogger("virt.recovery.file")
+
+
+class Error(Exception):
+    """
+    Raised when a recovery file cannot be parsed.
+    """
+
+
+class Writer(object):
+    """
+    Write VM state to a recovery file, appending only the changes since the
+    last write.
+
+    Not thread safe; callers must serialize calls.
+    """
+
+    def __init__(self, path, max_records=MAX_RECORDS):
+        self._path = path
+        self._max_records = max_records
+        self._state = None
+        self._records = 0
+
+    def write(self, data):
+        """
+        Write data to the recovery file.
+
+        The writer keeps a reference to data, so data must not be modified
+        after calling this.
+
+        Raises TypeError or ValueError if data cannot be encoded in JSON
+        without changing it; the file is not modified in this case.
+        """
+        if self._state is not None and self._records < self._max_records:
+            record = _diff(self._state, data)
+            if record is None:
+                return
+            if self._append(_encode(record)):
+                self._state = data
+                self._records += 1
+                return
+
+        self._rewrite(_encode({"set": data, "del": []}))
+        self._state = data
+        self._records = 1
+
+    def reset(self):
+        """
+        Forget the last state written, so the next write rewrites the entire
+        file. Must be called if the file was written by other means.
+        """
+        self._state = None
+        self._records = 0
+
+    def _append(self, line):
+        try:
+            fd = os.open(self._path, os.O_WRONLY | os.O_APPEND)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        try:
+            written = os.write(fd, line)
+        except EnvironmentError:
+            # The file may end now with an incomplete record, so it must be
+            # rewritten before appending more records.
+            self.reset()
+            raise
+        finally:
+            os.close(fd)
+        # On a short write, the caller rewrites the file.
+        return written == len(line)
+
+    def _rewrite(self, line):
+        dirname = os.path.dirname(self._path)
+        with tempfile.NamedTemporaryFile(dir=dirname, delete=False) as f:
+            f.write(HEADER)
+            f.write(line)
+        os.rename(f.name, self._path)
+
+
+def load(path):
+    """
+    Load the state stored in recovery file at path, written by Writer or by
+    older versions using pickle.
+
+    Raises Error if the file cannot be parsed.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        if header != HEADER:
+            f.seek(0)
+            return pickle.load(f)
+        lines = f.read().splitlines(True)
+
+    state = {}
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError as e:
+            if i == len(lines) - 1 and not line.endswith(b"\n"):
+                log.warning("Ignoring incomplete last record in %s: %r",
+                            path, line)
+                break
+            raise Error("Invalid record %d in %s: %s" % (i, path, e))
+        state.update(record["set"])
+        for key in record["del"]:
+            state.pop(key, None)
+
+    if not state:
+        raise Error("No state in %s" % path)
+
+    return state
+
+
+def _diff(old, new):
+    changed = {}
+    for key, value in new.items():
+        if key not in old or old[key] != value:
+            changed[key] = value
+    removed = [key for key in old if key not in new]
+    if not changed and not removed:
+        return None
+    return {"set": changed, "del": removed}
+
+
+def _encode(record):
+    _check_value(record)
+    line = json.dumps(record, separators=_SEPARATORS) + "\n"
+    return line.encode("utf-8")
+
+
+def _check_value(value):
+    """
+    Raise TypeError if value would be modified by a JSON round trip.
+    """
+    if isinstance(value, dict):
+        for k, v in six.iteritems(value):
+            if not isinstance(k, six.string_types):
+                raise TypeError("Non-string key %r is not supported" % (k,))
+            _check_value(v)
+    elif isinstance(value, list):
+        for v in value:
+            _check_value(v)
+    elif isinstance(value, tuple):
+        raise TypeError("Tuple %r is not supported" % (value,))
@@ -25,6 +25,7 @@ Support for VM and host statistics sampling.
 """
 
 from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
 import errno
 import logging
 import os
@@ -33,6 +34,7 @@ import threading
 import time
 
 from vdsm import hugepages
+from vdsm import metrics
 from vdsm import numa
 from vdsm import utils
 import vdsm.common.time
@@ -41,6 +43,7 @@ from vdsm.constants import P_VDSM_RUN, P_VDSM_CLIENT_LOG
 from vdsm.host import api as hostapi
 from vdsm.network import ipwrapper
 from vdsm.network.netinfo import nics, bonding, vlans
+from vdsm.virt import bulkstats
 from vdsm.virt import vmstats
 from vdsm.virt.utils import ExpiringCache
 
@@ -50,6 +53,9 @@ if not os.path.exists(_THP_STATE_PATH):
     _THP_STATE_PATH = '/sys/kernel/mm/redhat_transparent_hugepage/enabled'
 _METRICS_ENABLED = config.getboolean('metrics', 'enabled')
 
+_IFACE_STATS = ('rx_bytes', 'tx_bytes', 'rx_dropped', 'tx_dropped',
+                'rx_errors', 'tx_errors')
+
 
 class InterfaceSample(object):
     """
@@ -95,27 +101,41 @@ class InterfaceSample(object):
 
     def __init__(self, link):
         ifid = link.name
-        self.rx = self.readIfaceStat(ifid, 'rx_bytes')
-        self.tx = self.readIfaceStat(ifid, 'tx_bytes')
-        self.rxDropped = self.readIfaceStat(ifid, 'rx_dropped')
-        self.txDropped = self.readIfaceStat(ifid, 'tx_dropped')
-        self.rxErrors = self.readIfaceStat(ifid, 'rx_errors')
-        self.txErrors = self.readIfaceStat(ifid, 'tx_errors')
+        # Links reported by netlink carry their counters; others (e.g. dpdk)
+        # must be read from sysfs.
+        stats = getattr(link, 'stats', None)
+        if stats is None:
+            stats = {name: self.readIfaceStat(ifid, name)
+                     for name in _IFACE_STATS}
+        self.rx = stats['rx_bytes']
+        self.tx = stats['tx_bytes']
+        self.rxDropped = stats['rx_dropped']
+        self.txDropped = stats['tx_dropped']
+        self.rxErrors = stats['rx_errors']
+        self.txErrors = stats['tx_errors']
         self.operstate = 'up' if link.oper_up else 'down'
         self.speed = _getLinkSpeed(link)
         self.duplex = _getDuplex(ifid)
 
 
+def _read_proc_stat():
+    with open('/proc/stat') as f:
+        return f.readlines()
+
+
 class TotalCpuSample(object):
     """
     A sample of total CPU consumption.
 
     The sample is taken at initialization time and can't be updated.
+    If proc_stat (the lines of /proc/stat) is not specified, /proc/stat is
+    read.
     """
-    def __init__(self):
-        with open('/proc/stat') as f:
-            self.user, userNice, self.sys, self.idle = \
-                map(int, f.readline().split()[1:5])
+    def __init__(self, proc_stat=None):
+        if proc_stat is None:
+            proc_stat = _read_proc_stat()
+        self.user, userNice, self.sys, self.idle = \
+            map(int, proc_stat[0].split()[1:5])
         self.user += userNice
 
 
@@ -124,23 +144,26 @@ class CpuCoreSample(object):
     A sample of the CPU consumption of each core
 
     The sample is taken at initialization time and can't be updated.
+    If proc_stat (the lines of /proc/stat) is not specified, /proc/stat is
+    read.
     """
     CPU_CORE_STATS_PATTERN = re.compile(r'cpu(\d+)\s+(.*)')
 
-    def __init__(self):
+    def __init__(self, proc_stat=None):
+        if proc_stat is None:
+            proc_stat = _read_proc_stat()
         self.coresSample = {}
-        with open('/proc/stat') as src:
-            for line in src:
-                match = self.CPU_CORE_STATS_PATTERN.match(line)
-                if match:
-                    coreSample = {}
-                    user, userNice, sys, idle = \
-                        map(int, match.group(2).split()[0:4])
-                    coreSample['user'] = user
-                    coreSample['userNice'] = userNice
-                    coreSample['sys'] = sys
-                    coreSample['idle'] = idle
-                    self.coresSample[match.group(1)] = coreSample
+        for line in proc_stat:
+            match = self.CPU_CORE_STATS_PATTERN.match(line)
+            if match:
+                coreSample = {}
+                user, userNice, sys, idle = \
+                    map(int, match.group(2).split()[0:4])
+                coreSample['user'] = user
+                coreSample['userNice'] = userNice
+                coreSample['sys'] = sys
+                coreSample['idle'] = idle
+                self.coresSample[match.group(1)] = coreSample
 
     def getCoreSample(self, coreId):
         strCoreId = str(coreId)
@@ -188,7 +211,8 @@ class TimedSample(object):
 
 def _get_interfaces_and_samples():
     links_and_samples = {}
-    for link in ipwrapper.getLinks():
+    # Get the links and their counters in a single netlink dump.
+    for link in ipwrapper.getLinks(stats=True):
         try:
             links_and_samples[link.name] = InterfaceSample(link)
         except IOError as e:
@@ -205,9 +229,20 @@ class HostSample(TimedSample):
     A sample of host-related statistics.
 
     Contains the state of the host at the time of initialization.
+
+    The time spent collecting each source of the sample, in seconds, is
+    kept in the timings dict.
     """
     MONITORED_PATHS = ['/tmp', '/var/log', '/var/log/core', P_VDSM_RUN]
 
+    @contextmanager
+    def _timed(self, source):
+        start = vdsm.common.time.monotonic_time()
+        try:
+            yield
+        finally:
+            self.timings[source] = vdsm.common.time.monotonic_time() - start
+
     def _getDiskStats(self):
         d = {}
         for p in self.MONITORED_PATHS:
@@ -228,30 +263,39 @@ class HostSample(TimedSample):
         :type pid: int
         """
         super(HostSample, self).__init__()
-        self.interfaces = _get_interfaces_and_samples()
-        self.pidcpu = PidCpuSample(pid)
-        self.ncpus = os.sysconf('SC_NPROCESSORS_ONLN')
-        self.totcpu = TotalCpuSample()
-        meminfo = utils.readMemInfo()
-        freeOrCached = (meminfo['MemFree'] +
-                        meminfo['Cached'] + meminfo['Buffers'])
-        self.memUsed = 100 - int(100.0 * (freeOrCached) / meminfo['MemTotal'])
-        self.anonHugePages = meminfo.get('AnonHugePages', 0) / 1024
+        self.timings = {}
+        with self._timed('interfaces'):
+            self.interfaces = _get_interfaces_and_samples()
+        with self._timed('cpu'):
+            self.pidcpu = PidCpuSample(pid)
+            self.ncpus = os.sysconf('SC_NPROCESSORS_ONLN')
+            proc_stat = _read_proc_stat()
+            self.totcpu = TotalCpuSample(proc_stat)
+            self.cpuCores = CpuCoreSample(proc_stat)
+        with self._timed('memory'):
+            meminfo = utils.readMemInfo()
+            freeOrCached = (meminfo['MemFree'] +
+                            meminfo['Cached'] + meminfo['Buffers'])
+            self.memUsed = 100 - int(100.0 * (freeOrCached) /
+                                     meminfo['MemTotal'])
+            self.anonHugePages = meminfo.get('AnonHugePages', 0) / 1024
         try:
             with open('/proc/loadavg') as loadavg:
                 self.cpuLoad = loadavg.read().split()[1]
         except:
             self.cpuLoad = '0.0'
-        self.diskStats = self._getDiskStats()
+        with self._timed('disks'):
+            self.diskStats = self._getDiskStats()
         try:
             with open(_THP_STATE_PATH) as f:
                 s = f.read()
                 self.thpState = s[s.index('[') + 1:s.index(']')]
         except:
             self.thpState = 'never'
-        self.hugepages = hugepages.state()
-        self.cpuCores = CpuCoreSample()
-        self.numaNodeMem = NumaNodeMemorySample()
+        with self._timed('hugepages'):
+            self.hugepages = hugepages.state()
+        with self._timed('numa'):
+            self.numaNodeMem = NumaNodeMemorySample()
         ENGINE_DEFAULT_POLL_INTERVAL = 15
         try:
             self.recentClient = (
@@ -350,16 +394,25 @@ class StatsCache(object):
     to take the sample timestamp BEFORE to start the possibly-blocking call.
     If we take the timestamp after the call, we have no means to distinguish
     between a well behaving call and an unblocked stuck call.
+
+    If `columnar' is True, every sample is also flattened into fixed layout
+    arrays when added (see bulkstats), and the cpu, network and disk
+    statistics of all VMs are computed in one pass when first requested
+    using get_with_computed() or get_batch_with_computed(), and cached until
+    the next sample is added.
     """
 
     _log = logging.getLogger("virt.sampling.StatsCache")
 
-    def __init__(self, clock=vdsm.common.time.monotonic_time):
+    def __init__(self, clock=vdsm.common.time.monotonic_time, columnar=False):
         self._clock = clock
         self._lock = threading.Lock()
         self._samples = SampleWindow(size=2, timefn=self._clock)
         self._last_sample_time = 0
         self._vm_last_timestamp = defaultdict(int)
+        self._columnar = columnar
+        self._flat_samples = deque(maxlen=2)
+        self._computed = None
 
     def add(self, vmid):
         """
@@ -382,40 +435,86 @@ class StatsCache(object):
         Return the available StatSample for the given VM.
         """
         with self._lock:
-            first_batch, last_batch, interval = self._samples.stats()
-            stats_age = self._clock() - self._vm_last_timestamp[vmid]
+            return self._get(vmid)
+
+    def get_with_computed(self, vmid):
+        """
+        Return the available StatSample for the given VM, and the
+        bulkstats.VmStats computed from the same samples, or None if not
+        available or if the cache is not columnar.
+        """
+        with self._lock:
+            sample = self._get(vmid)
+            computed = self._get_computed()
+            if sample.first_value is None or computed is None:
+                return sample, None
+            return sample, computed.get(vmid)
 
-            if first_batch is None:
-                return StatsSample(None, None, None, stats_age)
+    def _get(self, vmid):
+        first_batch, last_batch, interval = self._samples.stats()
+        stats_age = self._clock() - self._vm_last_timestamp[vmid]
 
-            first_sample = first_batch.get(vmid)
-            last_sample = last_batch.get(vmid)
+        if first_batch is None:
+            return StatsSample(None, None, None, stats_age)
 
-            if first_sample is None or last_sample is None:
-                return StatsSample(None, None, None, stats_age)
+        first_sample = first_batch.get(vmid)
+        last_sample = last_batch.get(vmid)
 
-            return StatsSample(first_sample, last_sample,
-                               interval, stats_age)
+        if first_sample is None or last_sample is None:
+            return StatsSample(None, None, None, stats_age)
+
+        return StatsSample(first_sample, last_sample,
+                           interval, stats_age)
 
     def get_batch(self):
         """
         Return the available StatSample for the all VMs.
         """
         with self._lock:
-            first_batch, last_batch, interval = self._samples.stats()
+            return self._get_batch()
 
-            if first_batch is None:
+    def get_batch_with_computed(self):
+        """
+        Return the available StatSample for the all VMs, and a dict mapping
+        vm id to the bulkstats.VmStats computed from the same samples. The
+        dict is empty if the cache is not columnar.
+        """
+        with self._lock:
+            return self._get_batch(), self._get_computed() or {}
+
+    def _get_batch(self):
+        first_batch, last_batch, interval = self._samples.stats()
+
+        if first_batch is None:
+            return None
+
+        ts = self._clock()
+        return {
+            vm_id: StatsSample(
+                first_batch[vm_id], last_batch[vm_id], interval,
+                ts - self._vm_last_timestamp[vm_id]
+            )
+            for vm_id in last_batch if (vm_id in first_batch and
+                                        vm_id in self._vm_last_timestamp)
+        }
+
+    def _get_computed(self):
+        """
+        Return dict mapping vm id to the bulkstats.VmStats computed from the
+        current samples, or None if not available or if the cache is not
+        columnar. Must be called with the lock held.
+        """
+        if not self._columnar:
+            return None
+
+        if self._computed is None:
+            if len(self._flat_samples) < 2:
                 return None
+            _, _, interval = self._samples.stats()
+            first, last = self._flat_samples
+            self._computed = bulkstats.compute(first, last, interval)
 
-            ts = self._clock()
-            return {
-                vm_id: StatsSample(
-                    first_batch[vm_id], last_batch[vm_id], interval,
-                    ts - self._vm_last_timestamp[vm_id]
-                )
-                for vm_id in last_batch if (vm_id in first_batch and
-                                            vm_id in self._vm_last_timestamp)
-            }
+        return self._computed
 
     def clock(self):
         """
@@ -432,11 +531,19 @@ class StatsCache(object):
         returned by unblocked stuck calls, to avoid overwrite fresh data
         with stale one.
         """
+        # Flatten the sample before taking the lock, to keep readers waiting
+        # only for adding the sample.
+        if self._columnar:
+            flat_sample = bulkstats.Sample(bulk_stats)
+
         with self._lock:
             last_sample_time = self._last_sample_time
             if monotonic_ts >= last_sample_time:
                 self._samples.append(bulk_stats)
                 self._last_sample_time = monotonic_ts
+                if self._columnar:
+                    self._flat_samples.append(flat_sample)
+                    self._computed = None
 
                 self._update_ts(bulk_stats, monotonic_ts)
             else:
@@ -450,7 +557,8 @@ class StatsCache(object):
             self._vm_last_timestamp[vmid] = monotonic_ts
 
 
-stats_cache = StatsCache()
+stats_cache = StatsCache(
+    columnar=config.getboolean('sampling', 'columnar_stats_cache'))
 
 
 # this value can be tricky to tune.
@@ -514,7 +622,7 @@ class VMBulkstatsMonitor(object):
 
     def _send_metrics(self):
         vms = self._get_vms()
-        vm_samples = self._stats_cache.get_batch()
+        vm_samples, computed = self._stats_cache.get_batch_with_computed()
         if vm_samples is None:
             return
         stats = {}
@@ -526,7 +634,8 @@ class VMBulkstatsMonitor(object):
             vm_data = vmstats.produce(vm_obj,
                                       vm_sample.first_value,
                                       vm_sample.last_value,
-                                      vm_sample.interval)
+                                      vm_sample.interval,
+                                      computed.get(vm_id))
             vm_data["vmName"] = vm_obj.name
             stats[vm_id] = vm_data
         vmstats.send_metrics(stats)
@@ -564,10 +673,14 @@ class HostMonitor(object):
     def __call__(self):
         sample = HostSample(self._pid)
         self._samples.append(sample)
+        logging.debug("Host sample collected in %s", sample.timings)
 
         if self._cif and _METRICS_ENABLED:
             stats = hostapi.get_stats(self._cif, self._samples.stats())
             hostapi.send_metrics(stats)
+            metrics.send({'hosts.vdsm.sampling.' + source: elapsed
+                          for source, elapsed in six.iteritems(
+                              sample.timings)})
 
 
 def _getLinkSpeed(dev):
@@ -71,6 +71,16 @@ class DRIVE_SHARED_TYPE:
         return (cls.NONE, cls.EXCLUSIVE, cls.SHARED, cls.TRANSIENT)
 
 
+class BLOCK_THRESHOLD:
+    """
+    Block threshold state of a chunked drive, when using block threshold
+    events. See vdsm.virt.drivemonitor.
+    """
+    UNSET = "unset"
+    SET = "set"
+    EXCEEDED = "exceeded"
+
+
 class VolumeNotFound(errors.Base):
     msg = ("Cannot find volume {self.vol_id} in drive {self.drive_name}'s "
            "volume chain")
@@ -102,7 +112,7 @@ class Drive(core.Base):
                  'volumeChain', 'baseVolumeID', 'serial', 'reqsize', 'cache',
                  '_blockDev', 'extSharedState', 'drv', 'sgio', 'GUID',
                  'diskReplicate', '_diskType', 'hosts', 'protocol', 'auth',
-                 'discard', 'vm_custom')
+                 'discard', 'vm_custom', 'threshold_state')
     VOLWM_CHUNK_SIZE = (config.getint('irs', 'volume_utilization_chunk_mb') *
                         constants.MEGAB)
     VOLWM_FREE_PCT = 100 - config.getint('irs', 'volume_utilization_percent')
@@ -214,6 +224,7 @@ class Drive(core.Base):
         self.discard = kwargs.get('discard', False)
 
         self._blockDev = None  # Lazy initialized
+        self.threshold_state = BLOCK_THRESHOLD.UNSET
 
         self._customize()
         self._setExtSharedState()
@@ -359,6 +370,8 @@ class Drive(core.Base):
             # After live storage migration domain type may have changed
             # invalidating cached blockDev.
             self._blockDev = None
+            # The block threshold was set on the previous volume.
+            self.threshold_state = BLOCK_THRESHOLD.UNSET
         self._path = path
 
     @property
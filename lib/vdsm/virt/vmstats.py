@@ -31,16 +31,23 @@ from vdsm.utils import convertToStr
 from vdsm.virt.utils import isVdsmImage
 
 
-def produce(vm, first_sample, last_sample, interval):
+def produce(vm, first_sample, last_sample, interval, computed=None):
     """
     Translates vm samples into stats.
+
+    If `computed' is given, it must be the bulkstats.VmStats computed from
+    the same samples, and it is used instead of computing the cpu, network
+    and disk statistics again from the samples.
     """
 
     stats = {}
 
-    cpu(stats, first_sample, last_sample, interval)
-    networks(vm, stats, first_sample, last_sample, interval)
-    disks(vm, stats, first_sample, last_sample, interval)
+    if computed is None:
+        cpu(stats, first_sample, last_sample, interval)
+    else:
+        stats.update(computed.cpu)
+    networks(vm, stats, first_sample, last_sample, interval, computed)
+    disks(vm, stats, first_sample, last_sample, interval, computed)
     balloon(vm, stats, last_sample)
     cpu_count(stats, last_sample)
     tune_io(vm, stats)
@@ -290,14 +297,7 @@ def _nic_traffic(vm_obj, name, model, mac,
     Return the `stats' dictionary on success.
     """
 
-    if_speed = 1000 if model in ('e1000', 'virtio') else 100
-
-    if_stats = {
-        'macAddr': mac,
-        'name': name,
-        'speed': str(if_speed),
-        'state': 'unknown',
-    }
+    if_stats = _nic_info(name, model, mac)
 
     with _skip_if_missing_stats(vm_obj):
         if_stats['rxErrors'] = str(end_sample['net.%d.rx.errs' % end_index])
@@ -314,7 +314,26 @@ def _nic_traffic(vm_obj, name, model, mac,
     return if_stats
 
 
-def networks(vm, stats, first_sample, last_sample, interval):
+# The nic counters reported by _nic_traffic, in groups reported up to the
+# first missing counter.
+_NIC_COUNTERS = (
+    ('rxErrors', 'rxDropped', 'txErrors', 'txDropped'),
+    ('rx', 'tx'),
+)
+
+
+def _nic_info(name, model, mac):
+    if_speed = 1000 if model in ('e1000', 'virtio') else 100
+
+    return {
+        'macAddr': mac,
+        'name': name,
+        'speed': str(if_speed),
+        'state': 'unknown',
+    }
+
+
+def networks(vm, stats, first_sample, last_sample, interval, computed=None):
     stats['network'] = {}
 
     if first_sample is None or last_sample is None:
@@ -325,6 +344,26 @@ def networks(vm, stats, first_sample, last_sample, interval):
             interval, vm.id)
         return None
 
+    if computed is not None:
+        for nic in vm.getNicDevices():
+            if nic.name.startswith('hostdev'):
+                continue
+
+            # may happen if nic is a new hot-plugged one
+            if nic.name not in computed.nics:
+                continue
+
+            if_stats = _nic_info(nic.name, nic.nicModel, nic.macAddr)
+            nic_stats = computed.nics[nic.name]
+            for group in _NIC_COUNTERS:
+                with _skip_if_missing_stats(vm):
+                    for name in group:
+                        if_stats[name] = nic_stats[name]
+            if_stats['sampleTime'] = monotonic_time()
+            stats['network'][nic.name] = if_stats
+
+        return stats
+
     first_indexes = _find_bulk_stats_reverse_map(first_sample, 'net')
     last_indexes = _find_bulk_stats_reverse_map(last_sample, 'net')
 
@@ -345,16 +384,19 @@ def networks(vm, stats, first_sample, last_sample, interval):
     return stats
 
 
-def disks(vm, stats, first_sample, last_sample, interval):
+def disks(vm, stats, first_sample, last_sample, interval, computed=None):
     if first_sample is None or last_sample is None:
         return None
 
-    # libvirt does not guarantee that disk will returned in the same
-    # order across calls. It is usually like this, but not always,
-    # for example if hotplug/hotunplug comes into play.
-    # To be safe, we need to find the mapping after each call.
-    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'block')
-    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'block')
+    if computed is not None:
+        first_indexes = last_indexes = computed.disks
+    else:
+        # libvirt does not guarantee that disk will returned in the same
+        # order across calls. It is usually like this, but not always,
+        # for example if hotplug/hotunplug comes into play.
+        # To be safe, we need to find the mapping after each call.
+        first_indexes = _find_bulk_stats_reverse_map(first_sample, 'block')
+        last_indexes = _find_bulk_stats_reverse_map(last_sample, 'block')
     disk_stats = {}
 
     for vm_drive in vm.getDiskDevices():
@@ -380,20 +422,15 @@ def disks(vm, stats, first_sample, last_sample, interval):
                         'invalid interval %i when calculating '
                         'stats for vm %s disk %s',
                         interval, vm.id, vm_drive.name)
+
+                if computed is not None:
+                    drive_stats.update(computed.disks[vm_drive.name])
                 else:
                     drive_stats.update(
-                        _disk_rate(
+                        _disk_stats(
                             first_sample, first_indexes[vm_drive.name],
                             last_sample, last_indexes[vm_drive.name],
                             interval))
-                drive_stats.update(
-                    _disk_latency(
-                        first_sample, first_indexes[vm_drive.name],
-                        last_sample, last_indexes[vm_drive.name]))
-                drive_stats.update(
-                    _disk_iops_bytes(
-                        first_sample, first_indexes[vm_drive.name],
-                        last_sample, last_indexes[vm_drive.name]))
 
         except AttributeError:
             logging.exception("Disk %s stats not available",
@@ -407,6 +444,20 @@ def disks(vm, stats, first_sample, last_sample, interval):
     return stats
 
 
+def _disk_stats(first_sample, first_index, last_sample, last_index,
+                interval):
+    stats = {}
+    if interval > 0:
+        stats.update(
+            _disk_rate(first_sample, first_index, last_sample, last_index,
+                       interval))
+    stats.update(
+        _disk_latency(first_sample, first_index, last_sample, last_index))
+    stats.update(
+        _disk_iops_bytes(first_sample, first_index, last_sample, last_index))
+    return stats
+
+
 def _disk_rate(first_sample, first_index, last_sample, last_index, interval):
     stats = {}
 
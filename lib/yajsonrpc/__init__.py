@@ -14,7 +14,10 @@
 # License along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 from __future__ import absolute_import
+import collections
+import itertools
 import logging
+import six
 from six.moves import queue
 from weakref import ref
 from threading import Lock, Event
@@ -269,11 +272,12 @@ class _JsonRpcClientRequestContext(object):
 
 
 class _JsonRpcServeRequestContext(object):
-    def __init__(self, client, server_address, context):
+    def __init__(self, client, server_address, context, received=None):
         self._requests = []
         self._client = client
         self._server_address = server_address
         self._context = context
+        self._received = received
         self._counter = 0
         self._requests = {}
         self._responses = []
@@ -298,6 +302,13 @@ class _JsonRpcServeRequestContext(object):
     def context(self):
         return self._context
 
+    @property
+    def received(self):
+        """
+        Monotonic time when the message was queued by the server.
+        """
+        return self._received
+
     def sendReply(self):
         if len(self._requests) > 0:
             return
@@ -538,25 +549,104 @@ class JsonRpcTask(object):
         )
 
 
+class _MethodStats(object):
+    """
+    Dispatch statistics of single method, collected since the last report.
+
+    pending     number of requests decoded but not started yet
+    count       number of requests started
+    decode_time total time spent decoding messages containing this method
+    wait_time   total time between receiving a message and starting the
+                request
+    """
+
+    __slots__ = ("pending", "count", "decode_time", "wait_time")
+
+    def __init__(self):
+        self.pending = 0
+        self.count = 0
+        self.decode_time = 0.0
+        self.wait_time = 0.0
+
+    def report(self):
+        count = max(self.count, 1)
+        return {
+            "pending": self.pending,
+            "count": self.count,
+            "decode_time": self.decode_time / count,
+            "wait_time": self.wait_time / count,
+        }
+
+
 class JsonRpcServer(object):
     log = logging.getLogger("jsonrpc.JsonRpcServer")
 
     """
     Creates new JsonrRpcServer by providing a bridge, timeout in seconds
     which defining how often we should log connections stats and thread
-    factory.
+    factory. If stats_callback is set, it is called with the number of
+    messages waiting for decoding and the per method dispatch statistics
+    (see stats()) every timeout seconds.
+
+    Incoming messages are decoded and dispatched by workers threads, each
+    running serve_requests(). Messages of the same client are handled by one
+    worker at a time in the order they were received, so requests of a
+    client are dispatched in order, while a large message from one client
+    does not block decoding messages of other clients.
     """
-    def __init__(self, bridge, timeout, cif, threadFactory=None):
+    def __init__(self, bridge, timeout, cif, threadFactory=None, workers=1,
+                 stats_callback=None):
         self._bridge = bridge
         self._cif = cif
         self._workQueue = queue.Queue()
         self._threadFactory = threadFactory
         self._timeout = timeout
+        self._workers = workers
+        self._stats_callback = stats_callback
         self._next_report = monotonic_time() + self._timeout
-        self._counter = 0
+        # Number of requests processed, and the number processed at the last
+        # report. Counting without the lock keeps the common path lock free.
+        self._counter = itertools.count(1)
+        self._reported = 0
+        self._lock = Lock()
+        # Messages waiting for decoding, per client. A client is in the work
+        # queue only if it has pending messages and no worker is handling
+        # its messages.
+        self._client_queues = {}
+        self._stats = collections.defaultdict(_MethodStats)
+
+    @property
+    def workers(self):
+        return self._workers
 
     def queueRequest(self, req):
-        self._workQueue.put_nowait(req)
+        client = req[0]
+        received = monotonic_time()
+        with self._lock:
+            pending = self._client_queues.get(client)
+            if pending is not None:
+                pending.append((req, received))
+                return
+            self._client_queues[client] = collections.deque(
+                [(req, received)])
+        self._workQueue.put_nowait(client)
+
+    @property
+    def queue_depth(self):
+        """
+        Return the number of messages waiting for decoding.
+        """
+        with self._lock:
+            return sum(len(q) for q in self._client_queues.values())
+
+    def stats(self):
+        """
+        Return per method dispatch statistics collected since the last
+        report.
+        """
+        with self._lock:
+            return {method: stats.report()
+                    for method, stats in six.iteritems(self._stats)}
 
     """
     Aggregates number of requests received by vdsm. Each request from
@@ -564,14 +654,53 @@ class JsonRpcServer(object):
     number of requests.
     """
     def _attempt_log_stats(self):
-        self._counter += 1
-        if monotonic_time() > self._next_report:
-            self.log.info('%s requests processed during %s seconds',
-                          self._counter, self._timeout)
+        processed = next(self._counter)
+        if monotonic_time() <= self._next_report:
+            return
+        with self._lock:
+            # Another worker may have reported while we were waiting.
+            if monotonic_time() <= self._next_report:
+                return
+            counter = processed - self._reported
+            self._reported = processed
+            stats = {method: s.report()
+                     for method, s in six.iteritems(self._stats)}
             self._next_report += self._timeout
-            self._counter = 0
+            # Keep methods with pending requests, so pending does not
+            # become negative when they are started.
+            for method in list(self._stats):
+                s = self._stats[method]
+                if s.pending:
+                    s.count = 0
+                    s.decode_time = s.wait_time = 0.0
+                else:
+                    del self._stats[method]
+
+        self.log.info('%s requests processed during %s seconds',
+                      counter, self._timeout)
+        self.log.debug('Dispatch stats: %s', stats)
+        if self._stats_callback is not None:
+            self._stats_callback(self.queue_depth, stats)
+
+    def _request_queued(self, requests, decode_time):
+        with self._lock:
+            for req in requests:
+                stats = self._stats[req.method]
+                stats.pending += 1
+                stats.decode_time += decode_time
+
+    def _request_dequeued(self, ctx, req):
+        if ctx.received is None:
+            return
+        wait_time = monotonic_time() - ctx.received
+        with self._lock:
+            stats = self._stats[req.method]
+            stats.pending -= 1
+            stats.count += 1
+            stats.wait_time += wait_time
 
     def _serveRequest(self, ctx, req):
+        self._request_dequeued(ctx, req)
         start_time = monotonic_time()
         response = self._handle_request(req, ctx)
         error = getattr(response, "error", None)
@@ -633,15 +762,33 @@ class JsonRpcServer(object):
     @traceback(log=log)
     def serve_requests(self):
         while True:
-            obj = self._workQueue.get()
-            if obj is None:
+            client = self._workQueue.get()
+            if client is None:
                 break
 
-            self._parseMessage(obj)
+            with self._lock:
+                pending = self._client_queues[client]
+                obj, received = pending.popleft()
 
-    def _parseMessage(self, obj):
+            try:
+                self._parseMessage(obj, received)
+            finally:
+                # Handle one message per turn, so a client sending many
+                # messages cannot starve other clients.
+                with self._lock:
+                    if pending:
+                        requeue = True
+                    else:
+                        del self._client_queues[client]
+                        requeue = False
+                if requeue:
+                    self._workQueue.put_nowait(client)
+
+    def _parseMessage(self, obj, received=None):
         client, server_address, context, msg = obj
-        ctx = _JsonRpcServeRequestContext(client, server_address, context)
+        ctx = _JsonRpcServeRequestContext(client, server_address, context,
+                                          received)
+        start_time = monotonic_time()
 
         try:
             rawRequests = json.loads(msg)
@@ -677,6 +824,9 @@ class JsonRpcServer(object):
                                                 JsonRpcInternalError(),
                                                 None))
 
+        if received is not None:
+            self._request_queued(requests, monotonic_time() - start_time)
+
         ctx.setRequests(requests)
 
         # No request was built successfully or is only notifications
@@ -696,6 +846,7 @@ class JsonRpcServer(object):
                 )
             except Exception as e:
                 self.log.exception("could not allocate request thread")
+                self._request_dequeued(ctx, request)
                 ctx.requestDone(
                     JsonRpcResponse(
                         None,
@@ -708,4 +859,5 @@ class JsonRpcServer(object):
 
     def stop(self):
         self.log.info("Stopping JsonRPC Server")
-        self._workQueue.put_nowait(None)
+        for _ in range(self._workers):
+            self._workQueue.put_nowait(None)
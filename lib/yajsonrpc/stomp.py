@@ -309,6 +309,162 @@ class Parser(object):
             return None
 
 
+class BufferParser(object):
+    """
+    STOMP frame parser keeping unparsed data in a growable bytearray.
+
+    Parser accumulates incoming data by concatenating strings and slicing
+    them again for every line and body, which is quadratic in the frame size.
+    This parser appends incoming data to a single bytearray and consumes it
+    by advancing a read offset. Consumed data is dropped only when it makes
+    up most of the buffer, so the cost of compacting is amortized.
+
+    When the frame has a content-length header, the body is not looked at
+    until the whole body was received, and then it is copied exactly once.
+
+    The interface is the same as Parser.
+    """
+
+    # Drop consumed data only when it is larger than this, to avoid moving
+    # data around when parsing many small frames.
+    _COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self._frames = deque()
+        self._buf = bytearray()
+        # Offset of the first unparsed byte in self._buf.
+        self._start = 0
+        # Offset where the next terminator search should start. Data before
+        # this offset was already scanned and does not contain the terminator.
+        self._scan = 0
+        self._frame = None
+        self._content_length = -1
+        self._state_cb = self._parse_command
+
+    @property
+    def pending(self):
+        return len(self._frames)
+
+    def parse(self, data):
+        self._buf += data
+        while self._state_cb():
+            pass
+        self._compact()
+
+    def popFrame(self):
+        try:
+            return self._frames.popleft()
+        except IndexError:
+            return None
+
+    def _compact(self):
+        start = self._start
+        if start > self._COMPACT_THRESHOLD and start * 2 > len(self._buf):
+            del self._buf[:start]
+            self._scan -= start
+            self._start = 0
+
+    def _read_until(self, term):
+        """
+        Consume data up to term, and return it without the terminator.
+        Returns None if term was not received yet.
+        """
+        buf = self._buf
+        end = buf.find(term, self._scan)
+        if end == -1:
+            self._scan = len(buf)
+            return None
+
+        res = bytes(buf[self._start:end])
+        self._start = self._scan = end + 1
+        return res
+
+    def _read_line(self):
+        line = self._read_until(b"\n")
+        if line is not None and line.endswith(b"\r"):
+            line = line[:-1]
+        return line
+
+    def _parse_command(self):
+        cmd = self._read_line()
+        if cmd is None:
+            return False
+
+        # Heart-beat
+        if cmd == b"":
+            return True
+
+        self._frame = Frame(decodeValue(cmd))
+        self._state_cb = self._parse_header
+        return True
+
+    def _parse_header(self):
+        header = self._read_line()
+        if header is None:
+            return False
+
+        headers = self._frame.headers
+        if header == b"":
+            self._content_length = int(headers.get('content-length', -1))
+            if self._content_length >= 0:
+                self._state_cb = self._parse_body_length
+            else:
+                self._state_cb = self._parse_body_terminator
+            return True
+
+        key, value = header.split(b":", 1)
+
+        # See Parser._parse_header for handling of repeated headers.
+        headers.setdefault(decodeValue(key), decodeValue(value))
+        return True
+
+    def _parse_body_length(self):
+        buf = self._buf
+        start = self._start
+        end = start + self._content_length
+        if len(buf) < end + 1:
+            return False
+
+        if buf[end:end + 1] != b"\0":
+            raise RuntimeError("Frame end is missing \\0")
+
+        self._push_frame(memoryview(buf)[start:end].tobytes())
+        self._start = self._scan = end + 1
+        return True
+
+    def _parse_body_terminator(self):
+        body = self._read_until(b"\0")
+        if body is None:
+            return False
+
+        self._push_frame(body)
+        return True
+
+    def _push_frame(self, body):
+        self._frame.body = body
+        self._frames.append(self._frame)
+        self._frame = None
+        self._content_length = -1
+        self._state_cb = self._parse_command
+
+
+_PARSERS = {
+    "string": Parser,
+    "bytearray": BufferParser,
+}
+
+
+def parser_factory(name):
+    """
+    Return the parser class registered as name.
+    """
+    try:
+        return _PARSERS[name]
+    except KeyError:
+        raise ValueError("Unsupported stomp parser %r, expecting one of %s"
+                         % (name, ", ".join(sorted(_PARSERS))))
+
+
 class AsyncDispatcher(object):
     log = logging.getLogger("stomp.AsyncDispatcher")
 
@@ -339,11 +495,11 @@ class AsyncDispatcher(object):
     - AsyncClient - responsible for client side
     """
     def __init__(self, connection, frame_handler, bufferSize=4096,
-                 clock=time.monotonic_time):
+                 clock=time.monotonic_time, parser=Parser):
         self._frame_handler = frame_handler
         self.connection = connection
         self._bufferSize = bufferSize
-        self._parser = Parser()
+        self._parser = parser()
         self._outbuf = None
         self._outgoing_heartbeat_in_milis = 0
         self._clock = clock
@@ -289,8 +289,9 @@ class _StompConnection(object):
         self._messageHandler = None
 
         self._async_client = aclient
+        parser = stomp.parser_factory(config.get('rpc', 'stomp_parser'))
         self._dispatcher = reactor.create_dispatcher(
-            sock, stomp.AsyncDispatcher(self, aclient))
+            sock, stomp.AsyncDispatcher(self, aclient, parser=parser))
         self._client_host = self._dispatcher.addr[0]
         self._client_port = self._dispatcher.addr[1]
 
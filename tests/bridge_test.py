@@ -18,14 +18,18 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+from __future__ import print_function
+
 import imp
+import timeit
 
 from vdsm.common.exception import GeneralException
 from vdsm.rpc.Bridge import DynamicBridge
-from yajsonrpc import JsonRpcError
+from yajsonrpc import JsonRpcError, JsonRpcMethodNotFoundError
 
 from monkeypatch import MonkeyPatch
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import slowtest
 
 apiWhitelist = ('StorageDomain.Classes', 'StorageDomain.Types',
                 'Volume.Formats', 'Volume.Types', 'Volume.Roles',
@@ -186,3 +190,63 @@ class BridgeTests(TestCaseBase):
 
         self.assertEqual(bridge.dispatch('Host.getDeviceList')(**params),
                          [])
+
+    def testMethodNotFound(self):
+        bridge = DynamicBridge()
+        for method in ('Host.noSuchMethod', 'NoSuchClass.ping', 'ping'):
+            self.assertRaises(JsonRpcMethodNotFoundError, bridge.dispatch,
+                              method)
+
+    def testCompiledMethod(self):
+        bridge = DynamicBridge()
+        method = bridge._methods['StorageDomain.detach']
+        self.assertEqual(method.class_name, 'StorageDomain')
+        self.assertEqual(method.method_name, 'detach')
+        # The ctor argument is not passed to the method.
+        self.assertNotIn('storagedomainID',
+                         [name for name, _, _ in method.method_args])
+        self.assertEqual(
+            method.bind({'storagepoolID': 'pool', 'force': True}),
+            ('pool', None, 0, True))
+
+    @slowtest
+    def testDispatchOverhead(self):
+        setup = """
+from vdsm.rpc.Bridge import DynamicBridge
+bridge = DynamicBridge()
+
+def bench(name):
+    method = bridge._methods[name]
+    method.bind({})
+    bridge.dispatch(name)
+"""
+        count = 10000
+        for name in _COMMON_VERBS:
+            elapsed = timeit.timeit("bench(%r)" % name, setup=setup,
+                                    number=count)
+            print("%s: %.3f usec per call" % (name, elapsed / count * 10**6))
+
+
+# Verbs called most often by engine, used for measuring dispatch overhead.
+_COMMON_VERBS = (
+    'Host.getAllVmStats',
+    'Host.getAllVmIoTunePolicies',
+    'Host.getStats',
+    'Host.getCapabilities',
+    'Host.ping',
+    'Host.getVMList',
+    'Host.getVMFullList',
+    'Host.getAllTasksStatuses',
+    'Host.getStorageRepoStats',
+    'Host.getConnectedStoragePools',
+    'Host.getStorageDomains',
+    'Host.getDeviceList',
+    'StoragePool.getSpmStatus',
+    'StoragePool.getInfo',
+    'StorageDomain.getInfo',
+    'StorageDomain.getStats',
+    'Volume.getInfo',
+    'Image.prepare',
+    'Task.getStatus',
+    'VM.getStats',
+)
@@ -20,18 +20,24 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from __future__ import print_function
 
 import contextlib
 import libvirt
 import tempfile
 import os
 import os.path
+import threading
+import time
 from contextlib import contextmanager
+from xml.dom import minidom
 from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase as TestCaseBase
 from testlib import namedTemporaryDir
+from testValidation import slowtest
 
 from vdsm import hooks
+from vdsm.common import exception
 
 
 class TestHooks(TestCaseBase):
@@ -158,3 +164,207 @@ domXMLFile.close()
                     self.assertTrue(os.path.exists(flags_file))
                     hooks.remove_vm_launch_flags_file(vm_id)
                     self.assertFalse(os.path.exists(flags_file))
+
+
+IN_PROCESS_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+import hooking
+domxml = hooking.read_domxml()
+mode = 'runner' if hooking._payload is not None else 'process'
+domxml.documentElement.setAttribute('hook%d', mode)
+hooking.write_domxml(domxml)
+"""
+
+PROCESS_HOOK = """#!/bin/sh
+sed -i 's/<domain/<domain shell%d="process"/' "$_hook_domxml"
+"""
+
+EXIT_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+import hooking
+hooking.exit_hook('hook failed')
+"""
+
+RAISE_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+raise RuntimeError('hook failed')
+"""
+
+JSON_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+import os
+import hooking
+data = hooking.read_json()
+data['value'] = os.environ['customProperty']
+hooking.write_json(data)
+"""
+
+SIBLING_IMPORT_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+import hooking
+import hooklib
+domxml = hooking.read_domxml()
+domxml.documentElement.setAttribute('lib', hooklib.VALUE)
+hooking.write_domxml(domxml)
+"""
+
+BACKGROUND_HOOK = """#!/usr/bin/python2
+# vdsm-hook: in-process
+import subprocess
+subprocess.Popen(['sleep', '10'])
+"""
+
+DOMXML = '<domain type="kvm"/>'
+
+
+class TestHookRunner(TestCaseBase):
+
+    @contextmanager
+    def hooks_dir(self, *scripts):
+        with namedTemporaryDir() as dirName:
+            for n, code in enumerate(scripts):
+                path = os.path.join(dirName, '%02d' % n)
+                with open(path, 'w') as f:
+                    f.write(code)
+                os.chmod(path, 0o775)
+            yield dirName
+
+    @contextmanager
+    def hook_runner(self, workers=2, helper='../helpers/hookrunner'):
+        runner = hooks.HookRunner(workers, helper=helper)
+        try:
+            with MonkeyPatchScope([(hooks, '_runner', runner),
+                                   (hooks, '_runner_configured', True)]):
+                yield runner
+        finally:
+            runner.close()
+
+    def domain_attrs(self, domxml):
+        return dict(minidom.parseString(domxml).documentElement.attributes
+                    .items())
+
+    def test_in_process_hook(self):
+        with self.hooks_dir(IN_PROCESS_HOOK % 0) as dirName:
+            with self.hook_runner():
+                res = hooks._runHooksDir(DOMXML, dirName)
+        self.assertEqual(self.domain_attrs(res),
+                         {'type': 'kvm', 'hook0': 'runner'})
+
+    def test_runner_disabled(self):
+        with self.hooks_dir(IN_PROCESS_HOOK % 0) as dirName:
+            with MonkeyPatchScope([(hooks, '_runner', None),
+                                   (hooks, '_runner_configured', True)]):
+                res = hooks._runHooksDir(DOMXML, dirName)
+        self.assertEqual(self.domain_attrs(res),
+                         {'type': 'kvm', 'hook0': 'process'})
+
+    def test_mixed_hooks(self):
+        with self.hooks_dir(IN_PROCESS_HOOK % 0, PROCESS_HOOK % 1,
+                            IN_PROCESS_HOOK % 2) as dirName:
+            with self.hook_runner():
+                res = hooks._runHooksDir(DOMXML, dirName)
+        self.assertEqual(self.domain_attrs(res),
+                         {'type': 'kvm', 'hook0': 'runner',
+                          'shell1': 'process', 'hook2': 'runner'})
+
+    def test_exit_hook(self):
+        with self.hooks_dir(EXIT_HOOK, IN_PROCESS_HOOK % 1) as dirName:
+            with self.hook_runner():
+                with self.assertRaises(exception.HookError) as e:
+                    hooks._runHooksDir(DOMXML, dirName)
+        self.assertIn('hook failed', str(e.exception))
+
+    def test_exit_hook_no_raise(self):
+        # Return code 2 stops processing the next hooks.
+        with self.hooks_dir(EXIT_HOOK, IN_PROCESS_HOOK % 1) as dirName:
+            with self.hook_runner():
+                res = hooks._runHooksDir(DOMXML, dirName, raiseError=False)
+        self.assertEqual(self.domain_attrs(res), {'type': 'kvm'})
+
+    def test_failing_hook(self):
+        with self.hooks_dir(RAISE_HOOK) as dirName:
+            with self.hook_runner():
+                with self.assertRaises(exception.HookError) as e:
+                    hooks._runHooksDir(DOMXML, dirName)
+        self.assertIn('RuntimeError: hook failed', str(e.exception))
+
+    def test_sibling_import(self):
+        with self.hooks_dir(SIBLING_IMPORT_HOOK) as dirName:
+            with open(os.path.join(dirName, 'hooklib.py'), 'w') as f:
+                f.write('VALUE = "sibling"\n')
+            with self.hook_runner():
+                res = hooks._runHooksDir(DOMXML, dirName)
+        self.assertEqual(self.domain_attrs(res),
+                         {'type': 'kvm', 'lib': 'sibling'})
+
+    def test_background_process(self):
+        # The hook returns without waiting for its child process.
+        with self.hooks_dir(BACKGROUND_HOOK) as dirName:
+            with self.hook_runner():
+                start = time.time()
+                hooks._runHooksDir(DOMXML, dirName)
+                elapsed = time.time() - start
+        self.assertLess(elapsed, 5)
+
+    def test_json_hook(self):
+        with self.hooks_dir(JSON_HOOK) as dirName:
+            with self.hook_runner():
+                res = hooks._runHooksDir({'value': None}, dirName,
+                                         params={'customProperty': 'x'},
+                                         hookType=hooks._JSON_HOOK)
+        self.assertEqual(res, {'value': 'x'})
+
+    def test_helper_failure(self):
+        # Hooks are run in a new process if the helper cannot be used.
+        with self.hooks_dir(IN_PROCESS_HOOK % 0) as dirName:
+            with self.hook_runner(helper='/no/such/executable'):
+                res = hooks._runHooksDir(DOMXML, dirName)
+        self.assertEqual(self.domain_attrs(res),
+                         {'type': 'kvm', 'hook0': 'process'})
+
+    def test_helper_reused(self):
+        with self.hooks_dir(IN_PROCESS_HOOK % 0) as dirName:
+            with self.hook_runner(workers=1) as runner:
+                hooks._runHooksDir(DOMXML, dirName)
+                hooks._runHooksDir(DOMXML, dirName)
+                self.assertEqual(len(runner._idle), 1)
+
+    def test_concurrent_runs(self):
+        results = []
+
+        def run():
+            results.append(hooks._runHooksDir(DOMXML, dirName))
+
+        with self.hooks_dir(IN_PROCESS_HOOK % 0) as dirName:
+            with self.hook_runner(workers=2) as runner:
+                threads = [threading.Thread(target=run) for i in range(6)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                self.assertLessEqual(runner._workers, 2)
+        self.assertEqual(len(results), 6)
+        for res in results:
+            self.assertEqual(self.domain_attrs(res),
+                             {'type': 'kvm', 'hook0': 'runner'})
+
+    @slowtest
+    def test_time_vm_start(self):
+        count = 10
+        scripts = [IN_PROCESS_HOOK % n for n in range(count)]
+        with self.hooks_dir(*scripts) as dirName:
+            start = time.time()
+            with MonkeyPatchScope([(hooks, '_runner', None),
+                                   (hooks, '_runner_configured', True)]):
+                hooks._runHooksDir(DOMXML, dirName)
+            process_time = time.time() - start
+
+            with self.hook_runner(workers=1):
+                # Start the helper before measuring.
+                hooks._runHooksDir(DOMXML, dirName)
+                start = time.time()
+                hooks._runHooksDir(DOMXML, dirName)
+                runner_time = time.time() - start
+
+        print("%d hooks: processes %.3f seconds, hookrunner %.3f seconds"
+              % (count, process_time, runner_time))
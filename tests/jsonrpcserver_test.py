@@ -0,0 +1,160 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+
+import itertools
+import json
+import threading
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testlib import expandPermutations, permutations
+
+from vdsm import concurrent
+from vdsm import utils
+import yajsonrpc
+from yajsonrpc import JsonRpcServer, JsonRpcMethodNotFoundError
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.replies = []
+
+    def send(self, data):
+        self.replies.append(json.loads(data))
+
+
+class FakeCif(object):
+    ready = True
+
+
+class Bridge(object):
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def dispatch(self, method):
+        if method != "echo":
+            raise JsonRpcMethodNotFoundError(method)
+        return self.echo
+
+    def echo(self, text):
+        with self.lock:
+            self.calls.append(text)
+        return text
+
+    def register_server_address(self, server_address):
+        pass
+
+    def unregister_server_address(self):
+        pass
+
+
+def request(method, params, rid):
+    return json.dumps({"jsonrpc": "2.0", "method": method, "params": params,
+                       "id": rid})
+
+
+@expandPermutations
+class JsonRpcServerTests(VdsmTestCase):
+
+    @permutations([[1], [4]])
+    def test_client_order(self, workers):
+        bridge = Bridge()
+        server = JsonRpcServer(bridge, 60, FakeCif(), workers=workers)
+        clients = [FakeClient() for i in range(4)]
+        for i in range(50):
+            for n, client in enumerate(clients):
+                msg = request("echo", ["%d-%d" % (n, i)], i)
+                server.queueRequest((client, "address", None, msg))
+
+        self.serve(server, clients, 50)
+
+        for n, client in enumerate(clients):
+            expected = ["%d-%d" % (n, i) for i in range(50)]
+            self.assertEqual([r["result"] for r in client.replies], expected)
+            calls = [c for c in bridge.calls if c.startswith("%d-" % n)]
+            self.assertEqual(calls, expected)
+
+    def test_stats(self):
+        server = JsonRpcServer(Bridge(), 60, FakeCif())
+        client = FakeClient()
+        batch = "[%s, %s]" % (request("echo", ["a"], 1),
+                              request("echo", ["b"], 2))
+        server.queueRequest((client, "address", None, batch))
+        self.assertEqual(server.queue_depth, 1)
+
+        self.serve(server, [client], 1)
+
+        self.assertEqual(server.queue_depth, 0)
+        stats = server.stats()["echo"]
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["count"], 2)
+        self.assertTrue(stats["decode_time"] >= 0)
+        self.assertTrue(stats["wait_time"] >= 0)
+
+    def test_stats_callback(self):
+        reports = []
+
+        def stats_callback(queue_depth, stats):
+            reports.append((queue_depth, stats))
+
+        # Every call advances the clock by one second.
+        clock = itertools.count()
+        with MonkeyPatchScope([(yajsonrpc, "monotonic_time",
+                                lambda: next(clock))]):
+            server = JsonRpcServer(Bridge(), 0.5, FakeCif(),
+                                   stats_callback=stats_callback)
+            client = FakeClient()
+            for i in range(2):
+                server.queueRequest((client, "address", None,
+                                     request("echo", ["a"], i)))
+            self.serve(server, [client], 2)
+
+        # The second message is waiting while the first request is reported.
+        self.assertEqual([depth for depth, stats in reports], [1, 0])
+        for depth, stats in reports:
+            self.assertEqual(stats["echo"]["count"], 1)
+
+    def test_parse_error(self):
+        server = JsonRpcServer(Bridge(), 60, FakeCif())
+        client = FakeClient()
+        server.queueRequest((client, "address", None, "{invalid"))
+        self.serve(server, [client], 1)
+        self.assertEqual(client.replies[0]["error"]["code"], -32700)
+        self.assertEqual(server.queue_depth, 0)
+
+    def serve(self, server, clients, replies):
+        threads = [concurrent.thread(server.serve_requests)
+                   for i in range(server.workers)]
+        for t in threads:
+            t.start()
+        try:
+            for client in clients:
+                utils.retry(lambda: self.assertEqual(len(client.replies),
+                                                     replies),
+                            expectedException=AssertionError, timeout=5,
+                            sleep=0.05)
+        finally:
+            server.stop()
+            for t in threads:
+                t.join()
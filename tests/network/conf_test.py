@@ -21,12 +21,15 @@
 #
 
 from __future__ import absolute_import
+from __future__ import print_function
 
 import os
 import pwd
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
 
 from six import StringIO
 
@@ -38,6 +41,7 @@ from monkeypatch import MonkeyPatchScope
 from nose.plugins.attrib import attr
 from nose.plugins.skip import SkipTest
 from testlib import VdsmTestCase as TestCaseBase, mock
+from testValidation import slowtest
 
 
 @attr(type='unit')
@@ -122,6 +126,135 @@ class ifcfgConfigWriterTests(TestCaseBase):
             self._assertFilesRestored()
 
 
+@attr(type='unit')
+class ifcfgStartDevicesTests(TestCaseBase):
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._started = []
+        self._lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def _write_ifcfgs(self, ifcfgs):
+        filenames = []
+        for dev, content in ifcfgs:
+            filename = os.path.join(self._tempdir, 'ifcfg-' + dev)
+            with open(filename, 'w') as f:
+                f.write(content)
+            filenames.append(filename)
+        return filenames
+
+    def _ifup(self, dev, cgroup=None, delay=0):
+        time.sleep(delay)
+        with self._lock:
+            self._started.append(dev)
+
+    def _fake_ifcfg(self, ifup):
+        return MonkeyPatchScope([
+            (ifcfg, 'NET_CONF_PREF', os.path.join(self._tempdir, 'ifcfg-')),
+            (ifcfg, '_exec_ifup_by_name', ifup),
+            (ifcfg, '_is_bond_name', lambda dev: False),
+        ])
+
+    def _network_ifcfgs(self, count):
+        ifcfgs = [('eth0', 'DEVICE=eth0\n')]
+        for i in range(count):
+            vlan = 'eth0.%d' % i
+            bridge = 'net%d' % i
+            ifcfgs.append((vlan, 'DEVICE=%s\nVLAN=yes\nBRIDGE=%s\n'
+                           % (vlan, bridge)))
+            ifcfgs.append((bridge, 'DEVICE=%s\nTYPE=Bridge\n' % bridge))
+        return ifcfgs
+
+    def test_sort_device_ifcfgs(self):
+        filenames = self._write_ifcfgs([
+            ('net1', 'DEVICE=net1\nTYPE=Bridge\n'),
+            ('eth0.1', "DEVICE=eth0.1\nVLAN=yes\nBRIDGE='net1'\n"),
+            ('eth0', 'DEVICE=eth0\n'),
+            ('eth1', 'DEVICE=eth1\nSLAVE=yes\nMASTER=bond0\n'),
+        ])
+        with self._fake_ifcfg(self._ifup):
+            devices, dependencies = ifcfg._sort_device_ifcfgs(filenames)
+        self.assertEqual(devices, ['eth0', 'eth0.1', 'net1'])
+        self.assertEqual(dependencies, {'eth0': set(),
+                                        'eth0.1': {'eth0'},
+                                        'net1': {'eth0.1'}})
+
+    def test_serial_order(self):
+        filenames = self._write_ifcfgs(self._network_ifcfgs(3))
+        with self._fake_ifcfg(self._ifup):
+            timings = ifcfg.start_devices(filenames, workers=1)
+        self.assertEqual(self._started, ['eth0', 'eth0.0', 'eth0.1',
+                                         'eth0.2', 'net0', 'net1', 'net2'])
+        self.assertEqual(sorted(timings), sorted(self._started))
+
+    def test_concurrent_order(self):
+        filenames = self._write_ifcfgs(self._network_ifcfgs(10))
+
+        def ifup(dev, cgroup=None):
+            self._ifup(dev, delay=0.01)
+
+        with self._fake_ifcfg(ifup):
+            ifcfg.start_devices(filenames, workers=4)
+        self.assertEqual(len(self._started), 21)
+        self.assertEqual(self._started[0], 'eth0')
+        for i in range(10):
+            self.assertLess(self._started.index('eth0.%d' % i),
+                            self._started.index('net%d' % i))
+
+    def test_stop_order(self):
+        filenames = self._write_ifcfgs(self._network_ifcfgs(10))
+        stopped = []
+
+        def ifdown(dev):
+            time.sleep(0.01)
+            with self._lock:
+                stopped.append(dev)
+
+        with MonkeyPatchScope([
+            (ifcfg, 'NET_CONF_PREF', os.path.join(self._tempdir, 'ifcfg-')),
+            (ifcfg, 'ifdown', ifdown),
+            (ifcfg, '_is_bond_name', lambda dev: False),
+        ]):
+            ifcfg.stop_devices(filenames, workers=4)
+        self.assertEqual(len(stopped), 21)
+        self.assertEqual(stopped[-1], 'eth0')
+        for i in range(10):
+            self.assertLess(stopped.index('net%d' % i),
+                            stopped.index('eth0.%d' % i))
+
+    def test_error(self):
+        filenames = self._write_ifcfgs(self._network_ifcfgs(10))
+
+        def ifup(dev, cgroup=None):
+            if dev == 'eth0':
+                raise RuntimeError('ifup failed')
+            self._ifup(dev)
+
+        with self._fake_ifcfg(ifup):
+            self.assertRaises(RuntimeError, ifcfg.start_devices, filenames,
+                              workers=4)
+        # Devices using the failed device are not started.
+        self.assertEqual(self._started, [])
+
+    @slowtest
+    def test_time_start_devices(self):
+        filenames = self._write_ifcfgs(self._network_ifcfgs(50))
+
+        def ifup(dev, cgroup=None):
+            self._ifup(dev, delay=0.01)
+
+        for workers in (1, 8):
+            with self._fake_ifcfg(ifup):
+                start = time.time()
+                ifcfg.start_devices(filenames, workers=workers)
+                elapsed = time.time() - start
+            print("workers=%d: %d devices in %.3f seconds"
+                  % (workers, len(filenames), elapsed))
+
+
 IFCFG_ETH_CONF = """DEVICE="testdevice"
 ONBOOT=yes
 NETBOOT=yes
@@ -0,0 +1,197 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+from contextlib import contextmanager
+import time
+
+from nose.plugins.attrib import attr
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testValidation import slowtest
+
+from vdsm.network.ip import dhclient
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProcesses(object):
+    """
+    Emulate the process table, counting the scans.
+    """
+
+    def __init__(self, processes=()):
+        self.processes = dict(processes)
+        self.scans = 0
+
+    def pgrep(self, name):
+        self.scans += 1
+        return list(self.processes)
+
+    def read_cmdline(self, pid):
+        # Like reading /proc/<pid>/cmdline.
+        with open('/proc/self/cmdline') as f:
+            f.read()
+        return self.processes.get(pid)
+
+
+def dhclient_args(device_name, family=4, pid_file=None):
+    args = ['/sbin/dhclient', '-%d' % family, '-1']
+    if pid_file is not None:
+        args += ['-pf', pid_file]
+    return args + [device_name]
+
+
+@attr(type='unit')
+class ClientIndexTests(VdsmTestCase):
+
+    def test_lookup(self):
+        procs = FakeProcesses({
+            100: dhclient_args('eth0', pid_file='/run/dhclient4-eth0.pid'),
+            101: dhclient_args('eth0', family=6),
+            102: dhclient_args('eth1'),
+        })
+        with fake_index(procs) as index:
+            self.assertEqual(index.lookup('eth0', 4),
+                             [(100, '/run/dhclient4-eth0.pid')])
+            self.assertEqual(index.lookup('eth0', 6),
+                             [(101, '/var/run/dhclient.pid')])
+            self.assertEqual(index.lookup('eth2', 4), [])
+
+    def test_exited_process(self):
+        procs = FakeProcesses({100: None, 101: dhclient_args('eth0')})
+        with fake_index(procs) as index:
+            self.assertEqual(sorted(index.clients()), [('eth0', 4)])
+
+    def test_shared(self):
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+        with fake_index(procs, ttl=60) as index:
+            index.lookup('eth0', 4)
+            index.lookup('eth1', 4)
+            index.clients()
+            self.assertEqual(procs.scans, 1)
+
+    def test_no_ttl(self):
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+        with fake_index(procs, ttl=0) as index:
+            index.lookup('eth0', 4)
+            index.lookup('eth0', 4)
+            self.assertEqual(procs.scans, 2)
+
+    def test_ttl(self):
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+        clock = FakeClock()
+        with fake_index(procs, ttl=60, clock=clock) as index:
+            index.lookup('eth0', 4)
+            procs.processes[101] = dhclient_args('eth1')
+            clock.now += 59
+            self.assertEqual(index.lookup('eth1', 4), [])
+            clock.now += 1
+            self.assertEqual(index.lookup('eth1', 4),
+                             [(101, '/var/run/dhclient.pid')])
+            self.assertEqual(procs.scans, 2)
+
+    def test_invalidate(self):
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+        with fake_index(procs, ttl=60) as index:
+            index.lookup('eth0', 4)
+            del procs.processes[100]
+            index.invalidate()
+            self.assertEqual(index.lookup('eth0', 4), [])
+            self.assertEqual(procs.scans, 2)
+
+    def test_invalidate_while_scanning(self):
+        index = None
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+
+        def pgrep(name):
+            # dhclient started while scanning.
+            index.invalidate()
+            return list(procs.processes)
+
+        with fake_index(procs, ttl=60) as index:
+            with MonkeyPatchScope([(dhclient, 'pgrep', pgrep)]):
+                index.lookup('eth0', 4)
+            self.assertIsNone(index._clients)
+
+    def test_stats(self):
+        procs = FakeProcesses({100: dhclient_args('eth0')})
+        clock = FakeClock()
+        with fake_index(procs, ttl=60, clock=clock) as index:
+            self.assertEqual(index.stats(),
+                             {'lookups': 0, 'scans': 0, 'age': None})
+            index.lookup('eth0', 4)
+            clock.now += 10
+            index.lookup('eth0', 4)
+            self.assertEqual(index.stats(),
+                             {'lookups': 2, 'scans': 1, 'age': 10})
+
+    def test_dhcp_info(self):
+        procs = FakeProcesses({
+            100: dhclient_args('eth0'),
+            101: dhclient_args('eth0', family=6),
+            102: dhclient_args('eth1', family=6),
+            103: dhclient_args('eth2'),
+        })
+        with fake_index(procs) as index:
+            with MonkeyPatchScope([(dhclient, '_index', index)]):
+                info = dhclient.dhcp_info(['eth0', 'eth1', 'eth3'])
+        self.assertEqual(info, {
+            'eth0': {dhclient.DHCP4: True, dhclient.DHCP6: True},
+            'eth1': {dhclient.DHCP4: False, dhclient.DHCP6: True},
+            'eth3': {dhclient.DHCP4: False, dhclient.DHCP6: False},
+        })
+
+    @slowtest
+    def test_time_lookups(self):
+        devices = 100
+        procs = FakeProcesses(
+            (i * 10 + family, dhclient_args('eth%d' % i, family=family))
+            for i in range(devices) for family in (4, 6))
+        for ttl in (0, 60):
+            with fake_index(procs, ttl=ttl) as index:
+                with MonkeyPatchScope([(dhclient, '_index', index)]):
+                    start = time.time()
+                    names = ['eth%d' % i for i in range(devices)]
+                    dhclient.dhcp_info(names)
+                    for name in names:
+                        dhclient.is_active(name, 4)
+                        dhclient.is_active(name, 6)
+                    elapsed = time.time() - start
+            print("ttl=%d: %d devices in %.3f seconds" %
+                  (ttl, devices, elapsed))
+
+
+@contextmanager
+def fake_index(procs, ttl=0, clock=time.time):
+    with MonkeyPatchScope([
+        (dhclient, 'pgrep', procs.pgrep),
+        (dhclient, '_read_cmdline', procs.read_cmdline),
+    ]):
+        yield dhclient.ClientIndex(ttl=ttl, clock=clock)
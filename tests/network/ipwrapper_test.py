@@ -113,6 +113,14 @@ class TestLinks(TestCaseBase):
         self.assertEqual(link.master, None)
         self.assertEqual(link.name, self._bridge.devName)
 
+    def testGetLinksStats(self):
+        links = {link.name: link for link in ipwrapper.getLinks(stats=True)}
+        stats = links[self._bridge.devName].stats
+        for name, value in stats.items():
+            with open('/sys/class/net/%s/statistics/%s' %
+                      (self._bridge.devName, name)) as f:
+                self.assertEqual(value, int(f.read()))
+
 
 class TestDrvinfo(TestCaseBase):
 
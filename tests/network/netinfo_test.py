@@ -19,8 +19,12 @@
 # Refer to the README and COPYING files for full details of the license
 #
 from __future__ import absolute_import
+from __future__ import print_function
+from contextlib import contextmanager
+import errno
 import os
 import io
+import time
 
 import six
 
@@ -34,14 +38,18 @@ from vdsm.network.link.bond import sysfs_options
 from vdsm.network.link.bond.sysfs_driver import BONDING_MASTERS
 from vdsm.network.link.iface import random_iface_name
 from vdsm.network.netinfo import addresses, bonding, dns, misc, nics, routes
+from vdsm.network.netinfo import cache
+from vdsm.network.netinfo import vlans
 from vdsm.network.netinfo.cache import get
 from vdsm.network.netlink import waitfor
 
 from modprobe import RequireBondingMod
+from monkeypatch import MonkeyPatchScope
 from testlib import mock
 from testlib import VdsmTestCase as TestCaseBase
 from testValidation import ValidateRunningAsRoot
 from testValidation import broken_on_ci
+from testValidation import slowtest
 
 from .nettestlib import bonding_default_fpath
 from .nettestlib import dnsmasq_run, dummy_device, veth_pair, wait_for_ipv6
@@ -401,6 +409,180 @@ class TestNetinfo(TestCaseBase):
                          {'custom': {'foo': 'bar'}, 'mode': '4'})
 
 
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeHost(object):
+    """
+    Emulate the links of a host, counting device reads. Reading a device takes
+    delay seconds, like reading its info from netlink and sysfs.
+    """
+
+    def __init__(self, vlans=0, delay=0):
+        self.delay = delay
+        self.reads = 0
+        self.links = {}
+        for i in range(vlans):
+            self.add_vlan('eth0.%d' % i, 'eth0', i)
+
+    def add_vlan(self, name, device, vlanid):
+        self.links[name] = ipwrapper.Link(
+            address='00:11:22:33:44:55', index=len(self.links) + 1,
+            linkType=ipwrapper.LinkType.VLAN, mtu=1500, name=name,
+            qdisc='noqueue', state='up', vlanid=vlanid, device=device)
+
+    def get_links(self):
+        return [self.get_link(name) for name in sorted(self.links)]
+
+    def get_link(self, name):
+        if name not in self.links:
+            raise IOError(errno.ENODEV, '%s is not present in the system' %
+                          name)
+        return self.links[name]
+
+    def vlan_info(self, link):
+        self.reads += 1
+        time.sleep(self.delay)
+        return {'iface': link.device, 'vlanid': link.vlanid}
+
+
+@attr(type='unit')
+class TestDevicesCache(TestCaseBase):
+
+    def test_same_as_full_report(self):
+        host = FakeHost(vlans=3)
+        with fake_devices_cache(host) as devices_cache:
+            self.assertEqual(devices_cache.report({}, {}),
+                             cache._read_devices_report({}, {}))
+
+    def test_read_once(self):
+        host = FakeHost(vlans=3)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})
+            devices_cache.report({}, {})
+            self.assertEqual(host.reads, 3)
+
+    def test_copy(self):
+        host = FakeHost(vlans=1)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})['vlans']['eth0.0']['vlanid'] = 42
+            report = devices_cache.report({}, {})
+            self.assertEqual(report['vlans']['eth0.0']['vlanid'], 0)
+
+    def test_read_modified(self):
+        host = FakeHost(vlans=3)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})
+            host.add_vlan('eth0.1', 'eth1', 1)
+            devices_cache.invalidate({'event': 'new_link', 'name': 'eth0.1'})
+            report = devices_cache.report({}, {})
+            self.assertEqual(report['vlans']['eth0.1']['iface'], 'eth1')
+            self.assertEqual(host.reads, 4)
+
+    def test_added(self):
+        host = FakeHost(vlans=1)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})
+            host.add_vlan('eth1.1', 'eth1', 1)
+            devices_cache.invalidate({'event': 'new_link', 'name': 'eth1.1'})
+            report = devices_cache.report({}, {})
+            self.assertEqual(sorted(report['vlans']), ['eth0.0', 'eth1.1'])
+
+    def test_removed(self):
+        host = FakeHost(vlans=2)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})
+            del host.links['eth0.1']
+            devices_cache.invalidate({'event': 'del_link', 'name': 'eth0.1'})
+            report = devices_cache.report({}, {})
+            self.assertEqual(sorted(report['vlans']), ['eth0.0'])
+
+    def test_invalidate_master(self):
+        host = FakeHost(vlans=1)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache.report({}, {})
+            host.links['eth0.0'].master = 'br0'
+            devices_cache.invalidate({'event': 'new_link', 'name': 'eth0.0',
+                                      'master': 'br0'})
+            self.assertEqual(devices_cache._dirty, {'eth0.0', 'br0'})
+            devices_cache.report({}, {})
+            # The previous master is modified when the port is removed.
+            devices_cache.invalidate({'event': 'new_link', 'name': 'eth0.0'})
+            self.assertEqual(devices_cache._dirty, {'eth0.0', 'br0'})
+
+    def test_max_age(self):
+        host = FakeHost(vlans=3)
+        clock = FakeClock()
+        with fake_devices_cache(host, max_age=60, clock=clock) as \
+                devices_cache:
+            devices_cache.report({}, {})
+            clock.now += 59
+            devices_cache.report({}, {})
+            self.assertEqual(host.reads, 3)
+            clock.now += 1
+            devices_cache.report({}, {})
+            self.assertEqual(host.reads, 6)
+
+    def test_check(self):
+        host = FakeHost(vlans=2)
+        with fake_devices_cache(host, check=True) as devices_cache:
+            devices_cache.report({}, {})
+            # Modified without an event.
+            host.add_vlan('eth0.1', 'eth1', 1)
+            report = devices_cache.report({}, {})
+            self.assertEqual(report['vlans']['eth0.1']['iface'], 'eth1')
+            self.assertIsNone(devices_cache._devices)
+
+    def test_not_monitoring(self):
+        host = FakeHost(vlans=3)
+        with fake_devices_cache(host) as devices_cache:
+            devices_cache._monitoring = False
+            devices_cache.report({}, {})
+            devices_cache.report({}, {})
+            self.assertEqual(host.reads, 6)
+
+    @slowtest
+    def test_time_report(self):
+        links = 1000
+        host = FakeHost(vlans=links, delay=0.0001)
+        with fake_devices_cache(host) as devices_cache:
+            start = time.time()
+            cache._read_devices_report({}, {})
+            full_time = time.time() - start
+
+            devices_cache.report({}, {})
+            devices_cache.invalidate({'event': 'new_link', 'name': 'eth0.0'})
+            start = time.time()
+            devices_cache.report({}, {})
+            cached_time = time.time() - start
+
+        print("%d links: full report %.3f seconds, cached report %.3f "
+              "seconds" % (links, full_time, cached_time))
+
+
+@contextmanager
+def fake_devices_cache(host, check=False, max_age=300, clock=time.time):
+    with MonkeyPatchScope([
+        (cache, 'getLinks', host.get_links),
+        (cache, 'getLink', host.get_link),
+        (cache, '_netlink_links', host.get_links),
+        (cache, '_dpdk_links', lambda: []),
+        (cache, '_devinfo', lambda dev, routes, ipaddrs: {'mtu': dev.mtu}),
+        (vlans, 'info', host.vlan_info),
+    ]):
+        devices_cache = cache.DevicesCache(check=check, max_age=max_age,
+                                           clock=clock)
+        # Emulate a running netlink events monitor.
+        devices_cache._monitoring = True
+        yield devices_cache
+
+
 @attr(type='integration')
 class TestIPv6Addresses(TestCaseBase):
     @ValidateRunningAsRoot
@@ -21,6 +21,7 @@ from __future__ import absolute_import
 from nose.plugins.attrib import attr
 
 from testlib import VdsmTestCase as TestCaseBase
+from testlib import mock
 
 from vdsm.network.netinfo import qos
 from vdsm.network.tc import cls
@@ -53,3 +54,27 @@ class TestConversions(TestCaseBase):
                {'kind': 'sfq', 'handle': '20:', 'parent': '1:20',
                 'sfq': {'limit': 127, 'quantum': 1514}})
         self.assertEqual(qos.get_root_qdisc(inp), root)
+
+    @mock.patch.object(qos, 'tc')
+    def test_report_network_qos(self, tc):
+        tc.qdiscs.return_value = [
+            {'kind': 'hfsc', 'root': True, 'handle': '1:', 'dev': 'eth0',
+             'hfsc': {'default': 0x5000}}]
+        curve = {'ls': {'m1': 0, 'd': 0, 'm2': 1000}}
+        tc.classes.return_value = [
+            {'kind': 'hfsc', 'handle': '1:a', 'parent': '1:', 'hfsc': curve},
+            {'kind': 'hfsc', 'handle': '1:14', 'parent': '1:',
+             'hfsc': curve}]
+        nets_info = {'net10': {'iface': 'eth0.10'},
+                     'net20': {'iface': 'eth0.20'},
+                     'net30': {'iface': 'eth0.30'}}
+        devs_info = {'bridges': {}, 'vlans': {
+            'eth0.10': {'iface': 'eth0', 'vlanid': 10},
+            'eth0.20': {'iface': 'eth0', 'vlanid': 20},
+            'eth0.30': {'iface': 'eth0', 'vlanid': 30}}}
+        qos.report_network_qos(nets_info, devs_info)
+        self.assertEqual(nets_info['net10']['hostQos'], {'out': curve})
+        self.assertEqual(nets_info['net20']['hostQos'], {'out': curve})
+        self.assertNotIn('hostQos', nets_info['net30'])
+        # The classes of the vlans device are read once.
+        tc.classes.assert_called_once_with('eth0')
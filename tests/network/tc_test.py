@@ -20,7 +20,9 @@
 #
 
 from __future__ import absolute_import
+from __future__ import print_function
 from collections import namedtuple
+import struct
 import time
 import os
 import sys
@@ -36,7 +38,7 @@ from vmfakecon import Connection
 from testlib import (VdsmTestCase as TestCaseBase, permutations,
                      expandPermutations)
 from testlib import mock
-from testValidation import ValidateRunningAsRoot, stresstest
+from testValidation import ValidateRunningAsRoot, slowtest, stresstest
 from monkeypatch import MonkeyClass
 from .nettestlib import (Bridge, Dummy, IperfClient, IperfServer, Tap,
                          bridge_device, network_namespace, requires_iperf3,
@@ -46,6 +48,7 @@ from .nettestlib import running
 from vdsm import libvirtconnection
 from vdsm.constants import EXT_TC
 from vdsm.network import tc
+from vdsm.network.tc import _netlink
 from vdsm.network.configurators import qos
 from vdsm.network.ipwrapper import addrAdd, linkSet, netns_exec, link_set_netns
 from vdsm.network.netinfo.qos import DEFAULT_CLASSID
@@ -271,6 +274,173 @@ class TestFilters(TestCaseBase):
             self.assertEqual(parsed, correct)
 
 
+@attr(type='unit')
+class TestNetlink(TestCaseBase):
+
+    def test_qdiscs(self):
+        data = '\n'.join((
+            'qdisc hfsc 1: root refcnt 2 default 5000',
+            'qdisc sfq 10: parent 1:10 limit 127p quantum 1514b',
+            'qdisc sfq 30: parent 1:30 limit 127p quantum 30Kb perturb 3sec',
+            'qdisc ingress ffff: parent ffff:fff1 ----------------',
+            'qdisc pfifo_fast 0: parent :1 bands 3 priomap  '
+            '1 2 2 2 1 2 0 0 1 1 1 1 1 1 1 1',  # end of previous line
+            'qdisc fq_codel 801e: root refcnt 2 limit 132p flows 15 quantum '
+            '400 target 5.0ms interval 150.0ms ecn',  # end of previous line
+        ))
+        dump = b''.join((
+            _qdisc_msg('hfsc', 0x10000, _netlink.TC_H_ROOT, info=2,
+                       options=struct.pack('=H', 0x5000)),
+            _qdisc_msg('sfq', 0x100000, 0x10010,
+                       options=struct.pack('=IiIII', 1514, 0, 127, 1024,
+                                           127)),
+            _qdisc_msg('sfq', 0x300000, 0x10030,
+                       options=struct.pack('=IiIII', 30 * 1024, 3, 127, 1024,
+                                           127)),
+            _qdisc_msg('ingress', 0xffff0000, 0xfffffff1),
+            _qdisc_msg('pfifo_fast', 0, 0x1,
+                       options=struct.pack('=i16B', 3, 1, 2, 2, 2, 1, 2, 0, 0,
+                                           1, 1, 1, 1, 1, 1, 1, 1)),
+            _qdisc_msg('fq_codel', 0x801e0000, _netlink.TC_H_ROOT, info=2,
+                       options=b''.join((
+                           _rtattr(_netlink.TCA_FQ_CODEL_TARGET, _u32(5000)),
+                           _rtattr(_netlink.TCA_FQ_CODEL_LIMIT, _u32(132)),
+                           _rtattr(_netlink.TCA_FQ_CODEL_INTERVAL,
+                                   _u32(150000)),
+                           _rtattr(_netlink.TCA_FQ_CODEL_ECN, _u32(1)),
+                           _rtattr(_netlink.TCA_FQ_CODEL_FLOWS, _u32(15)),
+                           _rtattr(_netlink.TCA_FQ_CODEL_QUANTUM, _u32(400)),
+                       ))),
+            _qdisc_msg('noqueue', 0, _netlink.TC_H_ROOT, info=2),
+            _done_msg(),
+        ))
+        self.assertEqual(list(_netlink.parse_qdiscs(dump)),
+                         list(tc.qdiscs(None, out=data)))
+
+    def test_qdiscs_of_device(self):
+        dump = b''.join((
+            _qdisc_msg('hfsc', 0x10000, _netlink.TC_H_ROOT, ifindex=1,
+                       options=struct.pack('=H', 0x5000)),
+            _qdisc_msg('ingress', 0xffff0000, 0xfffffff1, ifindex=2),
+        ))
+        self.assertEqual(
+            list(_netlink.parse_qdiscs(dump, ifindex=2)),
+            [{'kind': 'ingress', 'handle': 'ffff:', 'parent': 'ffff:fff1'}])
+        self.assertEqual(
+            [qdisc['dev'] for qdisc in _netlink.parse_qdiscs(
+                dump, names={1: 'eth0', 2: 'eth1'})],
+            ['eth0', 'eth1'])
+
+    def test_classes(self):
+        data = '\n'.join((
+            'class hfsc 1: root',
+            'class hfsc 1:10 parent 1: leaf 10: sc m1 0bit d 0us m2 3200Kbit',
+            'class hfsc 1:20 parent 1: leaf 20: ls m1 6400Kibit d 152us '
+            'm2 3200Kbit ul m1 0bit d 0us m2 30000Kbit',
+            'class hfsc 1:30 parent 1: leaf 40: rt m1 0bit d 0us m2 3504bit '
+            'ls m1 0bit d 0us m2 8Kbit',  # end of previous line
+            'class hfsc 1:5000 parent 1: leaf 5000: ls m1 0bit d 0us '
+            'm2 40000Kbit',  # end of previous line
+        ))
+        dump = b''.join((
+            _class_msg(0x10000, _netlink.TC_H_ROOT),
+            _class_msg(0x10010, 0x10000, leaf=0x10, rt=(0, 0, 400000),
+                       ls=(0, 0, 400000)),
+            _class_msg(0x10020, 0x10000, leaf=0x20,
+                       ls=(6400 * 1024 // 8, 152, 400000),
+                       ul=(0, 0, 3750000)),
+            _class_msg(0x10030, 0x10000, leaf=0x40, rt=(0, 0, 438),
+                       ls=(0, 0, 1000)),
+            _class_msg(0x15000, 0x10000, leaf=0x5000, ls=(0, 0, 5000000)),
+            _done_msg(),
+        ))
+        self.assertEqual(list(_netlink.parse_classes(dump)),
+                         list(tc.classes(None, out=data)))
+
+    def test_handles(self):
+        for handle, text in ((_netlink.TC_H_ROOT, 'root'),
+                             (0, 'none'),
+                             (0x10000, '1:'),
+                             (0x11388, '1:1388'),
+                             (0xfffffff1, 'ffff:fff1'),
+                             (0x1, ':1')):
+            self.assertEqual(_netlink._format_handle(handle), text)
+            self.assertEqual(_netlink._parse_handle(text), handle)
+
+    @slowtest
+    def test_time_parse_classes(self):
+        vlans = 200
+        lines = ['class hfsc 1: root']
+        msgs = [_class_msg(0x10000, _netlink.TC_H_ROOT)]
+        for vlan in range(1, vlans + 1):
+            lines.append('class hfsc 1:%x parent 1: leaf %x: ls m1 0bit d 0us '
+                         'm2 %dKbit ul m1 0bit d 0us m2 30000Kbit' %
+                         (vlan, vlan, vlan * 8))
+            msgs.append(_class_msg(0x10000 + vlan, 0x10000, leaf=vlan,
+                                   ls=(0, 0, vlan * 1000),
+                                   ul=(0, 0, 3750000)))
+        data = '\n'.join(lines)
+        dump = b''.join(msgs)
+
+        start = time.time()
+        parsed_text = list(tc.classes(None, out=data))
+        text_time = time.time() - start
+
+        start = time.time()
+        parsed_dump = list(_netlink.parse_classes(dump))
+        dump_time = time.time() - start
+
+        self.assertEqual(parsed_dump, parsed_text)
+        print("%d classes: tc output %.3f seconds, netlink dump %.3f seconds"
+              % (vlans + 1, text_time, dump_time))
+
+
+def _qdisc_msg(kind, handle, parent, ifindex=1, info=1, options=None):
+    return _tc_msg(_netlink.RTM_NEWQDISC, kind, handle, parent, ifindex, info,
+                   options)
+
+
+def _class_msg(handle, parent, ifindex=1, leaf=0, rt=None, ls=None, ul=None):
+    options = b''
+    for attr_type, curve in ((_netlink.TCA_HFSC_RSC, rt),
+                             (_netlink.TCA_HFSC_FSC, ls),
+                             (_netlink.TCA_HFSC_USC, ul)):
+        if curve is not None:
+            options += _rtattr(attr_type, struct.pack('=III', *curve))
+    return _tc_msg(_netlink.RTM_NEWTCLASS, 'hfsc', handle, parent, ifindex,
+                   leaf << 16, options or None)
+
+
+def _tc_msg(msg_type, kind, handle, parent, ifindex, info, options):
+    payload = struct.pack('=BxxxiIII', 0, ifindex, handle, parent, info)
+    payload += _rtattr(_netlink.TCA_KIND, kind.encode('ascii') + b'\0')
+    if options is not None:
+        payload += _rtattr(_netlink.TCA_OPTIONS, options)
+    return _nl_msg(msg_type, payload)
+
+
+def _done_msg():
+    return _nl_msg(_netlink.NLMSG_DONE, struct.pack('=i', 0))
+
+
+def _nl_msg(msg_type, payload):
+    # NLM_F_MULTI, like a dump reply
+    header = struct.pack('=IHHII', 16 + len(payload), msg_type, 0x2, 1, 0)
+    return _pad(header + payload)
+
+
+def _rtattr(attr_type, payload):
+    return _pad(struct.pack('=HH', 4 + len(payload), attr_type) + payload)
+
+
+def _u32(value):
+    return struct.pack('=I', value)
+
+
+def _pad(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
 class TestPortMirror(TestCaseBase):
 
     """
@@ -331,6 +331,83 @@ class VmDispatcherTests(TestCaseBase):
                     vm_id, vm_id)
 
 
+class SpreadVmDispatcherTests(TestCaseBase):
+
+    def setUp(self):
+        self.cif = fake.ClientIF()
+        for i in range(VM_NUM):
+            vm_id = _fake_vm_id(i)
+            with self.cif.vmContainerLock:
+                self.cif.vmContainer[vm_id] = _FakeVM(vm_id, vm_id)
+        self.sched = _FakeScheduler()
+        self.clock = _FakeClock()
+        _Visitor.VMS.clear()
+
+    def test_spread(self):
+        exc = _FakeExecutor()
+        op = self.make_dispatcher(exc, _Visitor, slots=4)
+        op()
+        slots = set(op.slot(vm_id) for vm_id in self.cif.getVMs())
+        # Slot 0 is dispatched immediately, the rest are scheduled.
+        self.assertEqual(sorted(delay for delay, _ in self.sched.calls),
+                         sorted(slot * 0.5 for slot in slots if slot))
+        self.sched.run_all()
+        for vm_id in self.cif.getVMs():
+            self.assertEqual(_Visitor.VMS[vm_id], 1)
+
+    def test_stable_slot(self):
+        op = self.make_dispatcher(_FakeExecutor(), _Visitor, slots=4)
+        other = self.make_dispatcher(_FakeExecutor(), _Nop, slots=4)
+        for vm_id in self.cif.getVMs():
+            self.assertEqual(op.slot(vm_id), other.slot(vm_id))
+
+    def test_batch(self):
+        exc = _FakeExecutor()
+        op = self.make_dispatcher(exc, _BatchableVisitor, slots=1,
+                                  batch_size=4)
+        op()
+        self.assertEqual(exc.attempts, (VM_NUM + 3) // 4)
+        for vm_id in self.cif.getVMs():
+            self.assertEqual(_Visitor.VMS[vm_id], 1)
+
+    def test_batch_not_batchable(self):
+        exc = _FakeExecutor()
+        op = self.make_dispatcher(exc, _Visitor, slots=1, batch_size=4)
+        op()
+        self.assertEqual(exc.attempts, VM_NUM)
+
+    def test_batch_failure(self):
+        vm_id = _fake_vm_id(0)
+        self.cif.vmContainer[vm_id].fail_execute = True
+        op = self.make_dispatcher(_FakeExecutor(), _BatchableVisitor,
+                                  slots=1, batch_size=VM_NUM)
+        op()
+        self.assertNotIn(vm_id, _Visitor.VMS)
+        self.assertEqual(len(_Visitor.VMS), VM_NUM - 1)
+
+    def test_skipped(self):
+        op = self.make_dispatcher(_FakeExecutor(fail=True), _Nop, slots=2)
+        op()
+        self.sched.run_all()
+        self.assertEqual(set(op._skipped), set(self.cif.getVMs()))
+        # Reported and cleared in the next period.
+        op._report()
+        self.assertEqual(op._skipped, [])
+
+    def test_lag(self):
+        op = self.make_dispatcher(_FakeExecutor(), _Nop, slots=2)
+        op()
+        self.clock.now += 1.5
+        self.sched.run_all()
+        # Slot 1 was planned 1 second after the start of the period.
+        self.assertEqual(op._lag, 0.5)
+
+    def make_dispatcher(self, exc, create, slots, batch_size=1):
+        return periodic.SpreadVmDispatcher(
+            self.cif.getVMs, exc, create, 0, self.sched, 2, slots,
+            batch_size=batch_size, clock=self.clock)
+
+
 def _fake_vm_id(i):
     return 'VM-%03i' % i
 
@@ -352,9 +429,16 @@ class _Visitor(periodic._RunnableOnVm):
         return super(_Visitor, self).runnable
 
     def _execute(self):
+        if getattr(self._vm, 'fail_execute', False):
+            raise ValueError('execute failed')
         _Visitor.VMS[self._vm.id] += 1
 
 
+class _BatchableVisitor(_Visitor):
+
+    batchable = True
+
+
 class _Nop(periodic._RunnableOnVm):
 
     @property
@@ -390,6 +474,29 @@ class _FakeExecutor(object):
             func()
 
 
+class _FakeScheduler(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def schedule(self, delay, callable):
+        self.calls.append((delay, callable))
+
+    def run_all(self):
+        calls, self.calls = self.calls, []
+        for _, callable in calls:
+            callable()
+
+
+class _FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
 # fake.VM is a quite complex beast. We need only the bare minimum here,
 # literally only `id' and `name', so it seems sensible to create this
 # new tiny fake locally.
@@ -72,8 +72,8 @@ class InterfaceSampleTests(TestCaseBase):
     def testHostSampleHandlesDisappearingVlanInterfaces(self):
         original_getLinks = ipwrapper.getLinks
 
-        def faultyGetLinks():
-            all_links = list(original_getLinks())
+        def faultyGetLinks(stats=False):
+            all_links = list(original_getLinks(stats=stats))
             ipwrapper.linkDel(self.NEW_VLAN)
             return iter(all_links)
 
@@ -83,6 +83,70 @@ class InterfaceSampleTests(TestCaseBase):
                 interfaces_and_samples = sampling._get_interfaces_and_samples()
                 self.assertNotIn(self.NEW_VLAN, interfaces_and_samples)
 
+    def testNetlinkStats(self):
+        link = FakeLink('fake0', stats={
+            'rx_bytes': 1, 'tx_bytes': 2, 'rx_dropped': 3, 'tx_dropped': 4,
+            'rx_errors': 5, 'tx_errors': 6})
+        sample = sampling.InterfaceSample(link)
+        self.assertEqual(
+            (sample.rx, sample.tx, sample.rxDropped, sample.txDropped,
+             sample.rxErrors, sample.txErrors),
+            (1, 2, 3, 4, 5, 6))
+        self.assertEqual(sample.operstate, 'up')
+
+    def testMissingSysfsStats(self):
+        # Links without netlink stats are read from sysfs; missing files are
+        # reported as 0.
+        sample = sampling.InterfaceSample(FakeLink('no-such-link'))
+        self.assertEqual((sample.rx, sample.tx), (0, 0))
+
+
+class FakeLink(object):
+
+    oper_up = True
+
+    def __init__(self, name, stats=None):
+        self.name = name
+        if stats is not None:
+            self.stats = stats
+
+    def isNIC(self):
+        return False
+
+    def isBOND(self):
+        return False
+
+    def isVLAN(self):
+        return False
+
+
+_PROC_STAT = [
+    'cpu  1000 10 200 5000 30 0 4 0 0 0\n',
+    'cpu0 500 5 100 2500 15 0 2 0 0 0\n',
+    'cpu1 500 5 100 2500 15 0 2 0 0 0\n',
+    'intr 2000 0 9 0 0 0 0 0 0 1 0\n',
+    'ctxt 3000\n',
+]
+
+
+class CpuSampleTests(TestCaseBase):
+
+    def test_total(self):
+        sample = sampling.TotalCpuSample(_PROC_STAT)
+        self.assertEqual((sample.user, sample.sys, sample.idle),
+                         (1010, 200, 5000))
+
+    def test_cores(self):
+        sample = sampling.CpuCoreSample(_PROC_STAT)
+        self.assertEqual(sample.getCoreSample(1),
+                         {'user': 500, 'userNice': 5, 'sys': 100,
+                          'idle': 2500})
+        self.assertIsNone(sample.getCoreSample(2))
+
+    def test_read_proc_stat(self):
+        sample = sampling.CpuCoreSample()
+        self.assertIsNotNone(sample.getCoreSample(0))
+
 
 @expandPermutations
 class SampleWindowTests(TestCaseBase):
@@ -149,6 +213,7 @@ class HostStatsMonitorTests(TestCaseBase):
         class FakeHostSample(object):
 
             counter = 0
+            timings = {}
 
             def __repr__(self):
                 return "FakeHostSample(id=%i)" % self.id
@@ -0,0 +1,158 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+import timeit
+
+from testlib import VdsmTestCase
+from testlib import expandPermutations, permutations
+from testValidation import slowtest
+
+from vdsm import constants
+from yajsonrpc import stomp
+
+PARSERS = [[stomp.Parser], [stomp.BufferParser]]
+
+
+def chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@expandPermutations
+class ParserTests(VdsmTestCase):
+
+    @permutations(PARSERS)
+    def test_content_length(self, parser_class):
+        frame = stomp.Frame(stomp.Command.SEND,
+                            {stomp.Headers.DESTINATION: "dest"},
+                            "body\0with\nnull")
+        parser = parser_class()
+        parser.parse(frame.encode())
+        self.assertEqual(parser.pending, 1)
+        parsed = parser.popFrame()
+        self.assertEqual(parsed.command, stomp.Command.SEND)
+        self.assertEqual(parsed.headers[stomp.Headers.DESTINATION], "dest")
+        self.assertEqual(parsed.body, "body\0with\nnull")
+        self.assertIsNone(parser.popFrame())
+
+    @permutations(PARSERS)
+    def test_null_terminated(self, parser_class):
+        parser = parser_class()
+        parser.parse("SEND\r\ndestination:dest\r\n\r\nbody\0")
+        parsed = parser.popFrame()
+        self.assertEqual(parsed.command, stomp.Command.SEND)
+        self.assertEqual(parsed.headers, {"destination": "dest"})
+        self.assertEqual(parsed.body, "body")
+
+    @permutations(PARSERS)
+    def test_heartbeats(self, parser_class):
+        parser = parser_class()
+        parser.parse("\n\nCONNECT\n\n\0\n")
+        self.assertEqual(parser.pending, 1)
+        self.assertEqual(parser.popFrame().command, stomp.Command.CONNECT)
+
+    @permutations(PARSERS)
+    def test_repeated_header(self, parser_class):
+        parser = parser_class()
+        parser.parse("SEND\nkey:first\nkey:second\n\n\0")
+        self.assertEqual(parser.popFrame().headers, {"key": "first"})
+
+    @permutations(PARSERS)
+    def test_escaped_header(self, parser_class):
+        parser = parser_class()
+        parser.parse("SEND\nkey:a\\cb\\nc\n\n\0")
+        self.assertEqual(parser.popFrame().headers, {"key": "a:b\nc"})
+
+    @permutations([
+        # parser_class, chunk_size
+        (stomp.Parser, 1),
+        (stomp.Parser, 7),
+        (stomp.BufferParser, 1),
+        (stomp.BufferParser, 7),
+    ])
+    def test_chunked(self, parser_class, chunk_size):
+        frames = [
+            stomp.Frame(stomp.Command.SEND, {"id": str(i)}, "x" * i * 13)
+            for i in range(10)
+        ]
+        data = "".join(f.encode() for f in frames)
+        parser = parser_class()
+        for chunk in chunks(data, chunk_size):
+            parser.parse(chunk)
+        self.assertEqual(parser.pending, len(frames))
+        for expected in frames:
+            parsed = parser.popFrame()
+            self.assertEqual(parsed.headers["id"], expected.headers["id"])
+            self.assertEqual(parsed.body, expected.body)
+
+    @permutations(PARSERS)
+    def test_missing_terminator(self, parser_class):
+        parser = parser_class()
+        self.assertRaises(RuntimeError, parser.parse,
+                          "SEND\ncontent-length:4\n\nbodyX")
+
+    def test_compact(self):
+        parser = stomp.BufferParser()
+        body = "x" * stomp.BufferParser._COMPACT_THRESHOLD
+        frame = stomp.Frame(stomp.Command.SEND, {}, body).encode()
+        # Leave an incomplete frame in the buffer to force compacting.
+        parser.parse(frame * 3 + frame[:10])
+        for chunk in chunks(frame[10:] + frame, 4096):
+            parser.parse(chunk)
+        self.assertEqual(parser.pending, 5)
+        for i in range(5):
+            self.assertEqual(parser.popFrame().body, body)
+
+    @permutations(PARSERS)
+    def test_parser_factory(self, parser_class):
+        names = {v: k for k, v in stomp._PARSERS.items()}
+        self.assertIs(stomp.parser_factory(names[parser_class]),
+                      parser_class)
+
+    def test_parser_factory_unknown(self):
+        self.assertRaises(ValueError, stomp.parser_factory, "no-such-parser")
+
+    @slowtest
+    @permutations([
+        # size_mib
+        (1,),
+        (10,),
+        (50,),
+    ])
+    def test_time_parse(self, size_mib):
+        setup = """
+from yajsonrpc import stomp
+frame = stomp.Frame(stomp.Command.SEND, {}, "x" * %d).encode()
+chunks = [frame[i:i + 4096] for i in range(0, len(frame), 4096)]
+
+def bench(parser_class):
+    parser = parser_class()
+    for chunk in chunks:
+        parser.parse(chunk)
+    assert parser.pending == 1
+"""
+        setup %= size_mib * constants.MEGAB
+        for parser_class in ("Parser", "BufferParser"):
+            elapsed = timeit.timeit("bench(stomp.%s)" % parser_class,
+                                    setup=setup, number=1)
+            print("%s: %d MiB frame in 4 KiB chunks parsed in %.6f seconds"
+                  % (parser_class, size_mib, elapsed))
@@ -528,6 +528,59 @@ class TestBufferedReader(VdsmTestCase):
             self.assertEqual(self.received, data)
 
 
+@expandPermutations
+class TestLineReader(VdsmTestCase):
+
+    def setUp(self):
+        self.loop = asyncevent.EventLoop()
+        self.lines = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def receive(self, line):
+        self.lines.append(line)
+
+    def closed(self):
+        self.loop.stop()
+
+    @permutations([
+        # data, bufsize, lines
+        (b"", 1, []),
+        (b"a\nbb\nccc\n", 1, [b"a", b"bb", b"ccc"]),
+        (b"a\nbb\nccc\n", 32, [b"a", b"bb", b"ccc"]),
+        (b"a\n\nb\n", 2, [b"a", b"", b"b"]),
+        # Incomplete last line is dropped.
+        (b"a\nb", 32, [b"a"]),
+        (b"x" * 10000 + b"\n", 1024, [b"x" * 10000]),
+    ])
+    def test_read(self, data, bufsize, lines):
+        r, w = os.pipe()
+        reader = self.loop.create_dispatcher(
+            asyncevent.LineReader, r, self.receive, self.closed,
+            bufsize=bufsize)
+        with closing(reader):
+            os.close(r)  # Dupped by LineReader
+            Sender(self.loop, w, data, bufsize)
+            self.loop.run_forever()
+            self.assertEqual(self.lines, lines)
+
+    def test_close_while_receiving(self):
+        r, w = os.pipe()
+        reader = self.loop.create_dispatcher(
+            asyncevent.LineReader, r, self.receive_and_close, self.closed)
+        self.reader = reader
+        os.close(r)
+        Sender(self.loop, w, b"a\nb\n", 32)
+        self.loop.call_later(0.2, self.loop.stop)
+        self.loop.run_forever()
+        self.assertEqual(self.lines, [b"a"])
+
+    def receive_and_close(self, line):
+        self.lines.append(line)
+        self.reader.close()
+
+
 class Sender(object):
 
     def __init__(self, loop, fd, data, bufsize):
@@ -18,15 +18,21 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from __future__ import print_function
+
 import io
 import os
+import time
 
 from contextlib import contextmanager
 
+from monkeypatch import MonkeyPatch
+from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase
 from testlib import expandPermutations, permutations
 from testlib import namedTemporaryDir
 from testValidation import ValidateRunningAsRoot
+from testValidation import slowtest
 import loopback
 
 from vdsm.common import exception
@@ -109,6 +115,167 @@ class TestZero(VdsmTestCase):
             blockdev.zero("/no/such/path", size=size)
 
 
+@expandPermutations
+class TestZeroInProcess(VdsmTestCase):
+
+    @MonkeyPatch(blockdev, "_ZERO_IN_PROCESS", True)
+    def test_entire_device(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, SIZE)
+            blockdev.zero(path)
+            with io.open(path, "rb") as f:
+                data = f.read()
+                self.assertEqual(data, b"\0" * SIZE, "data was not zeroed")
+
+    @MonkeyPatch(blockdev, "_ZERO_IN_PROCESS", True)
+    @permutations([
+        (sc.BLOCK_SIZE,),
+        (blockdev.OPTIMAL_BLOCK_SIZE - sc.BLOCK_SIZE,),
+        (blockdev.OPTIMAL_BLOCK_SIZE + sc.BLOCK_SIZE,),
+    ])
+    def test_special_volumes(self, size):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, size + SIZE)
+            blockdev.zero(path, size=size)
+            with io.open(path, "rb") as f:
+                data = f.read(size)
+                self.assertEqual(data, b"\0" * size, "data was not zeroed")
+                data = f.read()
+                self.assertEqual(data, b"x" * SIZE, "data was modified")
+
+    @MonkeyPatch(blockdev, "_ZERO_IN_PROCESS", True)
+    def test_abort(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, SIZE)
+            task = AbortingTask()
+            with self.assertRaises(exception.ActionStopped):
+                blockdev.zero(path, size=SIZE, task=task)
+            with io.open(path, "rb") as f:
+                data = f.read(SIZE)
+                self.assertEqual(data, b"x" * SIZE, "data was modified")
+
+    @MonkeyPatch(blockdev, "_ZERO_IN_PROCESS", True)
+    def test_error(self):
+        with self.assertRaises(se.VolumesZeroingError):
+            blockdev.zero("/no/such/path", size=SIZE)
+
+    @permutations([
+        # workers, size
+        (1, 10 * SIZE),
+        (4, 10 * SIZE),
+        (4, 10 * SIZE + sc.BLOCK_SIZE),
+        (16, 2 * SIZE),
+    ])
+    def test_ranges(self, workers, size):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, size + SIZE)
+            zeroer = blockdev.Zeroer(path, size, workers=workers,
+                                     range_size=2 * SIZE,
+                                     buffer_size=SIZE // 2)
+            zeroer.run()
+            with io.open(path, "rb") as f:
+                data = f.read(size)
+                self.assertEqual(data, b"\0" * size, "data was not zeroed")
+                data = f.read()
+                self.assertEqual(data, b"x" * SIZE, "data was modified")
+
+    def test_fallback_to_write(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, 4 * SIZE)
+            # Regular files do not support block device ioctls.
+            zeroer = blockdev.Zeroer(path, 4 * SIZE, range_size=SIZE,
+                                     method=blockdev.ZERO_ZEROOUT)
+            zeroer.run()
+            self.assertEqual(zeroer.method, blockdev.ZERO_WRITE)
+            with io.open(path, "rb") as f:
+                data = f.read()
+                self.assertEqual(data, b"\0" * 4 * SIZE,
+                                 "data was not zeroed")
+
+    def test_unexpected_error(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, 4 * SIZE)
+            zeroer = blockdev.Zeroer(path, 4 * SIZE, range_size=SIZE)
+
+            def fail(*args):
+                raise RuntimeError("unexpected error")
+
+            zeroer._zero_range = fail
+            self.assertRaises(RuntimeError, zeroer.run)
+
+    def test_incomplete(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, 4 * SIZE)
+            zeroer = blockdev.Zeroer(path, 4 * SIZE, range_size=SIZE)
+            # Emulate a worker that stopped without zeroing its range.
+            zeroer._zero_range = lambda *args: None
+            self.assertRaises(se.VolumesZeroingError, zeroer.run)
+
+    def test_progress(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, 4 * SIZE)
+            # Report progress after every chunk.
+            zeroer = blockdev.Zeroer(path, 4 * SIZE, range_size=SIZE,
+                                     workers=1, progress_interval=0)
+            messages = []
+
+            def info(msg, *args):
+                messages.append(msg % args)
+
+            with MonkeyPatchScope([(blockdev.log, "info", info)]):
+                zeroer.run()
+            progress = [m for m in messages if "% done" in m]
+            self.assertEqual(len(progress), 4)
+            self.assertIn("100% done", progress[-1])
+            with io.open(path, "rb") as f:
+                self.assertEqual(f.read(), b"\0" * 4 * SIZE,
+                                 "data was not zeroed")
+
+    def test_zero_method_file(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, SIZE)
+            self.assertEqual(blockdev.zero_method(path), blockdev.ZERO_WRITE)
+
+    @ValidateRunningAsRoot
+    def test_loop_device(self):
+        with namedTemporaryDir() as tmpdir:
+            backing_file = os.path.join(tmpdir, "backing_file")
+            poison(backing_file, 4 * SIZE)
+            with loopback.Device(backing_file) as loop_device:
+                zeroer = blockdev.Zeroer(loop_device.path, 4 * SIZE,
+                                         range_size=SIZE)
+                zeroer.run()
+            with io.open(backing_file, "rb") as f:
+                data = f.read()
+                self.assertEqual(data, b"\0" * 4 * SIZE,
+                                 "data was not zeroed")
+
+    @slowtest
+    def test_time_zero(self):
+        size = 1024 * SIZE
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "file")
+            poison(path, size)
+            for in_process in (False, True):
+                with MonkeyPatchScope([
+                    (blockdev, "_ZERO_IN_PROCESS", in_process),
+                ]):
+                    start = time.time()
+                    blockdev.zero(path)
+                    elapsed = time.time() - start
+                print("in_process=%s: zeroed %d MiB in %.3f seconds" %
+                      (in_process, size // SIZE, elapsed))
+
+
 class TestDiscard(VdsmTestCase):
 
     def test_not_supported(self):
@@ -147,3 +314,8 @@ class AbortingTask(object):
         # it was started.
         cb()
         yield
+
+
+def poison(path, size):
+    with io.open(path, "wb") as f:
+        f.write(b"x" * size)
@@ -0,0 +1,147 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+
+import os
+from contextlib import contextmanager
+
+from testlib import VdsmTestCase
+from testlib import namedTemporaryDir
+from testlib import temporaryPath
+
+from vdsm.storage import blockreader
+
+BLOCK_SIZE = 512
+
+HELPER = "../helpers/blockreader"
+
+# Never replies, like a helper blocked on a dead device.
+HUNG_HELPER = """#!/bin/sh
+exec sleep 60
+"""
+
+# Exits before replying.
+DEAD_HELPER = """#!/bin/sh
+exit 1
+"""
+
+
+class TestBlockReader(VdsmTestCase):
+
+    DATA = b"".join(c.encode('ascii') * (BLOCK_SIZE - 1) + b"\n"
+                    for c in "abcdefgh")
+
+    def test_read(self):
+        ranges = [(4 * BLOCK_SIZE, BLOCK_SIZE), (0, 2 * BLOCK_SIZE)]
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            # Reuse the same helper for several reads.
+            for i in range(2):
+                self.assertEqual(r.read(path, ranges),
+                                 [self.DATA[offset:offset + size]
+                                  for offset, size in ranges])
+
+    def test_read_after_eof(self):
+        end = len(self.DATA)
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            self.assertEqual(r.read(path, [(end, BLOCK_SIZE)]), [b""])
+
+    def test_read_missing(self):
+        with reader() as r:
+            self.assertRaises(OSError, r.read, "/no/such/path",
+                              [(0, BLOCK_SIZE)])
+            # The helper is still usable.
+            with temporaryPath(data=self.DATA) as path:
+                self.assertEqual(r.read(path, [(0, BLOCK_SIZE)]),
+                                 [self.DATA[:BLOCK_SIZE]])
+
+    def test_read_unaligned(self):
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            self.assertRaises(ValueError, r.read, path, [(1, BLOCK_SIZE)])
+
+    def test_write(self):
+        data = b"x" * 2 * BLOCK_SIZE
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            r.write(path, BLOCK_SIZE, data)
+            # The helper reads the next request after the written data.
+            self.assertEqual(r.read(path, [(0, 4 * BLOCK_SIZE)]),
+                             [self.DATA[:BLOCK_SIZE] + data +
+                              self.DATA[3 * BLOCK_SIZE:4 * BLOCK_SIZE]])
+
+    def test_write_missing(self):
+        with reader() as r:
+            self.assertRaises(OSError, r.write, "/no/such/path", 0,
+                              b"x" * BLOCK_SIZE)
+
+    def test_write_unaligned(self):
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            self.assertRaises(ValueError, r.write, path, 0, b"x" * 100)
+            # The unaligned data was consumed by the helper.
+            self.assertEqual(r.read(path, [(0, BLOCK_SIZE)]),
+                             [self.DATA[:BLOCK_SIZE]])
+
+    def test_latency(self):
+        with temporaryPath(data=self.DATA) as path, reader() as r:
+            r.read(path, [(0, BLOCK_SIZE)])
+            r.write(path, 0, self.DATA[:BLOCK_SIZE])
+            self.assertRaises(OSError, r.read, "/no/such/path",
+                              [(0, BLOCK_SIZE)])
+            latency = r.latency()
+        self.assertEqual(latency["read"]["count"], 2)
+        self.assertEqual(latency["write"]["count"], 1)
+
+    def test_timeout(self):
+        with fake_helper(HUNG_HELPER) as helper, \
+                reader(helper=helper, timeout=0.2) as r:
+            self.assertRaises(blockreader.Timeout, r.read, "/path",
+                              [(0, BLOCK_SIZE)])
+            # The hung helper was replaced.
+            self.assertRaises(blockreader.Timeout, r.read, "/path",
+                              [(0, BLOCK_SIZE)])
+
+    def test_write_timeout(self):
+        with fake_helper(HUNG_HELPER) as helper, \
+                reader(helper=helper, timeout=0.2) as r:
+            self.assertRaises(blockreader.Timeout, r.write, "/path", 0,
+                              b"x" * BLOCK_SIZE)
+
+    def test_helper_terminated(self):
+        with fake_helper(DEAD_HELPER) as helper, reader(helper=helper) as r:
+            self.assertRaises(blockreader.Error, r.read, "/path",
+                              [(0, BLOCK_SIZE)])
+
+
+@contextmanager
+def reader(helper=HELPER, timeout=10):
+    r = blockreader.BlockReader(2, timeout, helper=helper)
+    try:
+        yield r
+    finally:
+        r.close()
+
+
+@contextmanager
+def fake_helper(script):
+    with namedTemporaryDir() as tmpdir:
+        path = os.path.join(tmpdir, "blockreader")
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+        yield path
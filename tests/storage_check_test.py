@@ -312,6 +312,154 @@ class TestDirectioCheckerTimings(VdsmTestCase):
             self.assertRaises(exception.MiscFileReadException, res.delay)
 
 
+@expandPermutations
+class TestHelperChecker(VdsmTestCase):
+
+    def setUp(self):
+        self.loop = asyncevent.EventLoop()
+        self.helper = check.CheckHelper(self.loop)
+        self.results = []
+        self.checks = 1
+
+    def tearDown(self):
+        self.helper.close()
+        self.loop.close()
+
+    def complete(self, result):
+        self.results.append(result)
+        if len(self.results) == self.checks:
+            self.loop.stop()
+
+    def start_checker(self, path, **kwargs):
+        checker = check.HelperChecker(self.loop, self.helper, path,
+                                      self.complete, **kwargs)
+        checker.start()
+        return checker
+
+    @MonkeyPatch(check, "_DIOCHECK", "../helpers/diocheck")
+    def test_path_missing(self):
+        self.start_checker("/no/such/path")
+        self.loop.run_forever()
+        pprint.pprint(self.results)
+        self.assertRaises(exception.MiscFileReadException,
+                          self.results[0].delay)
+
+    @MonkeyPatch(check, "_DIOCHECK", "../helpers/diocheck")
+    def test_path_ok(self):
+        self.checks = 2
+        with temporaryPath(data=b"blah") as path:
+            self.start_checker(path)
+            self.start_checker(path)
+            self.loop.run_forever()
+        pprint.pprint(self.results)
+        for result in self.results:
+            delay = result.delay()
+            print("delay:", delay)
+            self.assertEqual(type(delay), float)
+
+    @MonkeyPatch(check, "_DIOCHECK", "/no/such/executable")
+    def test_executable_missing(self):
+        self.start_checker("/path")
+        self.loop.run_forever()
+        pprint.pprint(self.results)
+        self.assertRaises(exception.MiscFileReadException,
+                          self.results[0].delay)
+
+    def test_helper_terminated(self):
+        with fake_helper("exit 0"):
+            self.start_checker("/path")
+            self.loop.run_forever()
+        pprint.pprint(self.results)
+        self.assertRaises(exception.MiscFileReadException,
+                          self.results[0].delay)
+
+    def test_helper_restarted(self):
+        self.checks = 2
+        with fake_helper("exit 0"):
+            self.start_checker("/path", interval=0.1)
+            self.loop.run_forever()
+        for result in self.results:
+            self.assertRaises(exception.MiscFileReadException, result.delay)
+
+    @slowtest
+    def test_timeout(self):
+        with fake_helper("exec cat >/dev/null"):
+            checker = self.start_checker("/path", timeout=0.1)
+            self.loop.run_forever()
+        pprint.pprint(self.results)
+        result = self.results[0]
+        self.assertRaises(exception.MiscFileReadException, result.delay)
+        self.assertTrue(checker.is_running())
+
+    def test_stop_during_check(self):
+        with fake_helper("exec cat >/dev/null"):
+            checker = self.start_checker("/path")
+            checker.stop()
+            self.assertFalse(checker.wait(0))
+            # Terminating the helper completes the check.
+            self.helper.close()
+            self.assertTrue(checker.wait(0))
+        self.assertEqual(self.results, [])
+
+    def test_repr(self):
+        checker = check.HelperChecker(self.loop, self.helper, "/path",
+                                      self.complete)
+        self.assertIn("HelperChecker", str(checker))
+        self.assertIn(check.IDLE, str(checker))
+
+
+@expandPermutations
+class TestCheckerCPUTime(VdsmTestCase):
+
+    def setUp(self):
+        self.loop = asyncevent.EventLoop()
+        self.helper = check.CheckHelper(self.loop)
+        self.results = []
+
+    def tearDown(self):
+        self.helper.close()
+        self.loop.close()
+
+    def complete(self, result):
+        self.results.append(result)
+        if len(self.results) == self.checks:
+            self.loop.stop()
+
+    @slowtest
+    @MonkeyPatch(check, "_DIOCHECK", "../helpers/diocheck")
+    @permutations([["dd"], ["helper"]])
+    def test_path_ok(self, checker_type):
+        paths = 200
+        rounds = 5
+        self.checks = paths * rounds
+        with temporaryPath(data=b"blah") as path:
+            before = os.times()
+            start = time.time()
+            for i in range(paths):
+                if checker_type == "dd":
+                    checker = check.DirectioChecker(
+                        self.loop, path, self.complete, interval=0.2)
+                else:
+                    checker = check.HelperChecker(
+                        self.loop, self.helper, path, self.complete,
+                        interval=0.2)
+                checker.start()
+            self.loop.run_forever()
+            elapsed = time.time() - start
+            if checker_type == "helper":
+                # Include the helper in the children times.
+                proc = self.helper._proc
+                self.helper.close()
+                proc.wait()
+            after = os.times()
+        # Make sure all succeeded
+        for res in self.results:
+            res.delay()
+        cpu = sum(after[:4]) - sum(before[:4])
+        print("%s: %d checks in %.3f seconds, cpu time %.3f seconds" %
+              (checker_type, self.checks, elapsed, cpu))
+
+
 @expandPermutations
 class TestCheckResult(VdsmTestCase):
 
@@ -409,6 +557,17 @@ class TestCheckService(VdsmTestCase):
             self.assertTrue(self.service.stop_checking("/path", timeout=1.0))
             self.assertFalse(self.service.is_checking("/path"))
 
+    @MonkeyPatch(check, "_DIOCHECK", "../helpers/diocheck")
+    def test_start_checking_helper(self):
+        self.service.stop()
+        self.service = check.CheckService(use_helper=True)
+        self.service.start()
+        with temporaryPath(data=b"blah") as path:
+            self.service.start_checking(path, self.complete)
+            self.assertTrue(self.completed.wait(1.0))
+            self.assertEqual(type(self.result.delay()), float)
+            self.assertTrue(self.service.stop_checking(path, timeout=1.0))
+
     @slowtest
     def test_stop_checking_timeout(self):
         with fake_dd(0.2):
@@ -425,3 +584,13 @@ def fake_dd(delay):
         os.chmod(fake_dd, 0o700)
         with MonkeyPatchScope([(constants, "EXT_DD", fake_dd)]):
             yield
+
+
+@contextmanager
+def fake_helper(command):
+    script = "#!/bin/sh\n%s\n" % command
+    script = script.encode('ascii')
+    with temporaryPath(data=script) as helper:
+        os.chmod(helper, 0o700)
+        with MonkeyPatchScope([(check, "_DIOCHECK", helper)]):
+            yield
@@ -94,3 +94,83 @@ class TestDirectFile(TestCaseBase):
                 directio.DirectFile(srcPath, "r") as direct_file, \
                 io.open(srcPath, "rb") as buffered_file:
             self.assertEqual(direct_file.read(), buffered_file.read())
+
+
+@expandPermutations
+class TestBlockIO(TestCaseBase):
+
+    DATA = b"".join(c.encode('ascii') * (BLOCK_SIZE - 1) + b"\n"
+                    for c in "abcdefgh")
+
+    @permutations([
+        # ranges
+        [[(0, BLOCK_SIZE)]],
+        [[(BLOCK_SIZE, 3 * BLOCK_SIZE)]],
+        # Adjacent ranges, read in one call.
+        [[(0, BLOCK_SIZE), (BLOCK_SIZE, 2 * BLOCK_SIZE)]],
+        # Unordered ranges.
+        [[(4 * BLOCK_SIZE, BLOCK_SIZE), (0, BLOCK_SIZE),
+          (BLOCK_SIZE, BLOCK_SIZE)]],
+        # Overlapping ranges.
+        [[(0, 2 * BLOCK_SIZE), (BLOCK_SIZE, 2 * BLOCK_SIZE)]],
+        [[(0, BLOCK_SIZE), (0, BLOCK_SIZE)]],
+        [[(2 * BLOCK_SIZE, 0)]],
+    ])
+    def test_readblocks(self, ranges):
+        with temporaryPath(data=self.DATA) as path:
+            blocks = directio.readblocks(path, ranges)
+        self.assertEqual(blocks, [self.DATA[offset:offset + size]
+                                  for offset, size in ranges])
+
+    def test_readblocks_after_eof(self):
+        end = len(self.DATA)
+        ranges = [(end - BLOCK_SIZE, 2 * BLOCK_SIZE), (end, BLOCK_SIZE)]
+        with temporaryPath(data=self.DATA) as path:
+            blocks = directio.readblocks(path, ranges)
+        self.assertEqual(blocks, [self.DATA[-BLOCK_SIZE:], b""])
+
+    @permutations([[(1, BLOCK_SIZE)], [(BLOCK_SIZE, 1)]])
+    def test_readblocks_unaligned(self, block):
+        with temporaryPath(data=self.DATA) as path:
+            self.assertRaises(ValueError, directio.readblocks, path, [block])
+
+    def test_readblocks_missing(self):
+        self.assertRaises(OSError, directio.readblocks, "/no/such/path",
+                          [(0, BLOCK_SIZE)])
+
+    def test_writeblock(self):
+        data = b"x" * 2 * BLOCK_SIZE
+        with temporaryPath(data=self.DATA) as path:
+            directio.writeblock(path, BLOCK_SIZE, data)
+            with io.open(path, "rb") as f:
+                self.assertEqual(f.read(), self.DATA[:BLOCK_SIZE] + data +
+                                 self.DATA[3 * BLOCK_SIZE:])
+
+    def test_writeblock_unaligned(self):
+        with temporaryPath(data=self.DATA) as path:
+            self.assertRaises(ValueError, directio.writeblock, path, 0,
+                              b"x" * (BLOCK_SIZE - 1))
+            with io.open(path, "rb") as f:
+                self.assertEqual(f.read(), self.DATA)
+
+    def test_latency(self):
+        before = directio.latency()
+        with temporaryPath(data=self.DATA) as path:
+            directio.readblocks(path, [(0, BLOCK_SIZE)])
+            directio.writeblock(path, 0, self.DATA[:BLOCK_SIZE])
+        after = directio.latency()
+        for op in ("read", "write"):
+            self.assertEqual(after[op]["count"], before[op]["count"] + 1)
+
+
+class TestLatencyHistogram(TestCaseBase):
+
+    def test_buckets(self):
+        histogram = directio.LatencyHistogram(buckets=(0.1, 1))
+        for latency in (0.05, 0.1, 0.5, 2, 3):
+            histogram.add(latency)
+        info = histogram.info()
+        self.assertEqual(info["count"], 5)
+        self.assertEqual(info["total"], 5.65)
+        self.assertEqual(info["max"], 3)
+        self.assertEqual(info["buckets"], [(0.1, 2), (1, 1), (None, 2)])
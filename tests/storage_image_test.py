@@ -17,13 +17,30 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+from __future__ import print_function
+
+from contextlib import contextmanager
+import os
+import time
 
 from monkeypatch import MonkeyPatch
+from monkeypatch import MonkeyPatchScope
+from storagetestlib import fake_env
 from testlib import expandPermutations, permutations
+from testlib import make_uuid
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import slowtest
 
+from vdsm.storage import blockreader
 from vdsm.storage import constants as sc
+from vdsm.storage import exception as se
+from vdsm.storage import misc
+from storage import blockVolume
+from storage import fileVolume
 from storage import image
+from storage import sd
+
+MB = 1024**2
 
 GB_IN_BLK = 1024**3 // 512
 
@@ -96,3 +113,206 @@ class TestCalculateVolAlloc(TestCaseBase):
         alloc_blk = img.calculate_vol_alloc("src_sd_id", src_params,
                                             "dst_sd_id", dest_format)
         self.assertEqual(alloc_blk, expected_blk)
+
+
+class FakeDomain(object):
+
+    def __init__(self, sd_manifest, volclass):
+        self.sd_manifest = sd_manifest
+        self.volclass = volclass
+
+    def getVolumeClass(self):
+        return self.volclass
+
+    def produceVolume(self, imgUUID, volUUID):
+        return self.volclass(self.sd_manifest.getRepoPath(),
+                             self.sd_manifest.sdUUID, imgUUID, volUUID)
+
+
+@contextmanager
+def chain_env(storage_type, bulk):
+    volclass = {"file": fileVolume.FileVolume,
+                "block": blockVolume.BlockVolume}[storage_type]
+    with fake_env(storage_type) as env:
+        dom = FakeDomain(env.sd_manifest, volclass)
+        env.sdcache.domains[env.sd_manifest.sdUUID] = dom
+        with MonkeyPatchScope([
+            (image, "sdCache", env.sdcache),
+            (fileVolume, "sdCache", env.sdcache),
+            (image, "_BULK_IMAGE_CHAIN", bulk),
+        ]):
+            yield env
+
+
+def make_chain(env, length, imgUUID=None, parent=sc.BLANK_UUID):
+    imgUUID = imgUUID or make_uuid()
+    chain = []
+    for i in range(length):
+        volUUID = make_uuid()
+        voltype = sc.LEAF_VOL if i == length - 1 else sc.INTERNAL_VOL
+        env.make_volume(MB, imgUUID, volUUID, parent_vol_id=parent,
+                        vol_type=voltype)
+        chain.append(volUUID)
+        parent = volUUID
+    return imgUUID, chain
+
+
+def make_template(env):
+    imgUUID = make_uuid()
+    volUUID = make_uuid()
+    env.make_volume(MB, imgUUID, volUUID, vol_type=sc.SHARED_VOL)
+    return imgUUID, volUUID
+
+
+def share_template(env, storage_type, tmplImgUUID, tmplUUID, imgUUID):
+    # File domains link the template into the image directory.
+    if storage_type == "file":
+        images = os.path.join(env.sd_manifest.domaindir, sd.DOMAIN_IMAGES)
+        os.mkdir(os.path.join(images, imgUUID))
+        for ext in ("", ".meta", ".lease"):
+            os.link(os.path.join(images, tmplImgUUID, tmplUUID + ext),
+                    os.path.join(images, imgUUID, tmplUUID + ext))
+
+
+@expandPermutations
+class TestGetChain(TestCaseBase):
+
+    @permutations([
+        ("file", False), ("file", True), ("block", False), ("block", True),
+    ])
+    def test_chain(self, storage_type, bulk):
+        with chain_env(storage_type, bulk) as env:
+            imgUUID, expected = make_chain(env, 5)
+            img = image.Image(env.sd_manifest.getRepoPath())
+            chain = img.getChain(env.sd_manifest.sdUUID, imgUUID)
+            self.assertEqual([vol.volUUID for vol in chain], expected)
+
+    @permutations([
+        ("file", False), ("file", True), ("block", False), ("block", True),
+    ])
+    def test_chain_from_volume(self, storage_type, bulk):
+        with chain_env(storage_type, bulk) as env:
+            imgUUID, expected = make_chain(env, 5)
+            img = image.Image(env.sd_manifest.getRepoPath())
+            chain = img.getChain(env.sd_manifest.sdUUID, imgUUID,
+                                 volUUID=expected[2])
+            self.assertEqual([vol.volUUID for vol in chain], expected[:3])
+
+    @permutations([
+        ("file", False), ("file", True), ("block", False), ("block", True),
+    ])
+    def test_template(self, storage_type, bulk):
+        with chain_env(storage_type, bulk) as env:
+            sdUUID = env.sd_manifest.sdUUID
+            tmplImgUUID, tmplUUID = make_template(env)
+            imgUUID = make_uuid()
+            share_template(env, storage_type, tmplImgUUID, tmplUUID, imgUUID)
+            imgUUID, expected = make_chain(env, 3, imgUUID=imgUUID,
+                                           parent=tmplUUID)
+            img = image.Image(env.sd_manifest.getRepoPath())
+            chain = img.getChain(sdUUID, imgUUID)
+            self.assertEqual([vol.volUUID for vol in chain], expected)
+            chain = img.getChain(sdUUID, tmplImgUUID)
+            self.assertEqual([vol.volUUID for vol in chain], [tmplUUID])
+
+    @permutations([
+        ("file", False), ("file", True), ("block", False), ("block", True),
+    ])
+    def test_missing_image(self, storage_type, bulk):
+        with chain_env(storage_type, bulk) as env:
+            img = image.Image(env.sd_manifest.getRepoPath())
+            self.assertRaises(se.ImageDoesNotExistInSD, img.getChain,
+                              env.sd_manifest.sdUUID, make_uuid())
+
+    @permutations([("file",), ("block",)])
+    def test_bulk_no_volume_metadata(self, storage_type):
+        with chain_env(storage_type, True) as env:
+            imgUUID, expected = make_chain(env, 3)
+            volclass = env.sdcache.produce(
+                env.sd_manifest.sdUUID).getVolumeClass()
+            img = image.Image(env.sd_manifest.getRepoPath())
+            with MonkeyPatchScope([
+                (volclass.manifestClass, "getMetadata", fail),
+            ]):
+                chain = img.getChain(env.sd_manifest.sdUUID, imgUUID)
+            self.assertEqual([vol.volUUID for vol in chain], expected)
+
+    def test_bulk_volume_being_created(self):
+        with chain_env("block", True) as env:
+            sdUUID = env.sd_manifest.sdUUID
+            imgUUID, expected = make_chain(env, 3)
+            # A new leaf is being created.
+            volUUID = make_uuid()
+            env.make_volume(MB, imgUUID, volUUID, parent_vol_id=expected[-1])
+            env.lvm.addtag(sdUUID, volUUID, sc.TAG_VOL_UNINIT)
+            img = image.Image(env.sd_manifest.getRepoPath())
+            self.assertIsNone(img._resolveChain(
+                blockVolume.BlockVolume, sdUUID, imgUUID))
+
+    @permutations([("file",), ("block",)])
+    def test_bulk_parent_not_shared(self, storage_type):
+        with chain_env(storage_type, True) as env:
+            sdUUID = env.sd_manifest.sdUUID
+            otherImgUUID, other = make_chain(env, 1)
+            imgUUID, chain = make_chain(env, 3, parent=other[0])
+            img = image.Image(env.sd_manifest.getRepoPath())
+            self.assertIsNone(img._resolveChain(
+                env.sdcache.produce(sdUUID).getVolumeClass(), sdUUID,
+                imgUUID))
+
+    @permutations([("file",), ("block",)])
+    def test_bulk_missing_parent(self, storage_type):
+        with chain_env(storage_type, True) as env:
+            sdUUID = env.sd_manifest.sdUUID
+            imgUUID, chain = make_chain(env, 3, parent=make_uuid())
+            img = image.Image(env.sd_manifest.getRepoPath())
+            self.assertIsNone(img._resolveChain(
+                env.sdcache.produce(sdUUID).getVolumeClass(), sdUUID,
+                imgUUID))
+
+    def test_bulk_invalid_parent(self):
+        with chain_env("block", True) as env:
+            sdUUID = env.sd_manifest.sdUUID
+            imgUUID, chain = make_chain(env, 3)
+            # Base volume parent is the leaf.
+            env.lvm.changeLVTags(
+                sdUUID, chain[0],
+                delTags=["%s%s" % (sc.TAG_PREFIX_PARENT, sc.BLANK_UUID)],
+                addTags=["%s%s" % (sc.TAG_PREFIX_PARENT, chain[-1])])
+            img = image.Image(env.sd_manifest.getRepoPath())
+            self.assertRaises(se.ImageIsNotLegalChain, img.getChain,
+                              sdUUID, imgUUID, volUUID=chain[-1])
+
+    def test_chain_readblock_helper(self):
+        reader = blockreader.BlockReader(2, 10,
+                                         helper="../helpers/blockreader")
+        try:
+            with MonkeyPatchScope([(misc, "_READBLOCK_HELPER", True),
+                                   (misc, "_block_reader", reader)]), \
+                    chain_env("block", False) as env:
+                imgUUID, expected = make_chain(env, 5)
+                img = image.Image(env.sd_manifest.getRepoPath())
+                chain = img.getChain(env.sd_manifest.sdUUID, imgUUID)
+                self.assertEqual([vol.volUUID for vol in chain], expected)
+            self.assertGreater(reader.latency()["read"]["count"], 0)
+        finally:
+            reader.close()
+
+    @slowtest
+    def test_time_deep_chain(self):
+        length = 50
+        for storage_type in ("file", "block"):
+            for bulk in (False, True):
+                with chain_env(storage_type, bulk) as env:
+                    imgUUID, expected = make_chain(env, length)
+                    img = image.Image(env.sd_manifest.getRepoPath())
+                    start = time.time()
+                    chain = img.getChain(env.sd_manifest.sdUUID, imgUUID)
+                    elapsed = time.time() - start
+                    self.assertEqual(len(chain), length)
+                print("%s, bulk=%s: chain of %d volumes in %.3f seconds" %
+                      (storage_type, bulk, length, elapsed))
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("Unexpected call")
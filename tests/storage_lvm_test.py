@@ -37,3 +37,127 @@ class LvmTests(TestCaseBase):
                           "\\\\x22\\\\x28|\', \'r|.*|\' ]"
                           )
         self.assertEqual(expectedFilter, filter)
+
+
+class FakeLVMCache(lvm.LVMCache):
+    """
+    LVMCache running fake lvs and vgs commands.
+
+    vgs maps vg name to vg_seqno, lvs maps vg name to list of lv names.
+    """
+
+    def __init__(self, vgs, lvs):
+        super(FakeLVMCache, self).__init__()
+        self.fake_vgs = vgs
+        self.fake_lvs = lvs
+        self.commands = []
+
+    def cmd(self, cmd, devices=tuple()):
+        self.commands.append(cmd[0])
+        args = cmd[len(lvm.LVS_CMD):]
+        if cmd[0] == "lvs":
+            return 0, self._lvs_output(args), []
+        elif cmd[0] == "vgs":
+            return 0, self._vgs_output(args), []
+        elif cmd[0] == "pvs":
+            return 0, [], []
+        raise AssertionError("Unexpected command: %s" % cmd)
+
+    def _lvs_output(self, args):
+        out = []
+        for vg_name, lv_names in self.fake_lvs.items():
+            for lv_name in lv_names:
+                if (args and vg_name not in args and
+                        "%s/%s" % (vg_name, lv_name) not in args):
+                    continue
+                out.append(lvm.SEPARATOR.join((
+                    "uuid-" + lv_name, lv_name, vg_name, "-wi-a-----",
+                    "134217728", "0", "/dev/mapper/pv(0)", "")))
+        return out
+
+    def _vgs_output(self, args):
+        return [lvm.SEPARATOR.join((
+            "uuid-" + vg_name, vg_name, "wz--n-", "1073741824", "536870912",
+            "134217728", "8", "4", "", "134217728", "67108864",
+            str(len(self.fake_lvs.get(vg_name, ()))), "1", str(seqno),
+            "/dev/mapper/pv"))
+            for vg_name, seqno in self.fake_vgs.items()
+            if not args or vg_name in args]
+
+
+class LVMCacheTests(TestCaseBase):
+
+    def setUp(self):
+        self.cache = FakeLVMCache(
+            vgs={"vg1": 1, "vg2": 1},
+            lvs={"vg1": ["lv1", "lv2"], "vg2": ["lv3"]})
+        self.cache.bootstrap()
+        self.cache.commands = []
+
+    def test_get_lv_cached(self):
+        self.assertEqual(self.cache.getLv("vg1", "lv1").name, "lv1")
+        self.assertEqual(sorted(lv.name for lv in self.cache.getLv("vg1")),
+                         ["lv1", "lv2"])
+        self.assertEqual(self.cache.commands, [])
+        stats = self.cache.stats()
+        self.assertEqual(stats["lv_hits"], 2)
+        self.assertEqual(stats["lv_hit_rate"], 1.0)
+
+    def test_reload_removes_stale(self):
+        self.cache.fake_lvs["vg1"].remove("lv2")
+        self.cache._invalidatelvs("vg1", "lv1")
+        self.assertEqual([lv.name for lv in self.cache.getLv("vg1")], ["lv1"])
+        self.assertEqual(self.cache.commands, ["lvs"])
+        # Including the lvs run by bootstrap.
+        self.assertEqual(self.cache.stats()["lvs_commands"], 2)
+        # Other vgs are not affected.
+        self.assertEqual(self.cache.getLv("vg2", "lv3").name, "lv3")
+        self.assertEqual(self.cache.commands, ["lvs"])
+
+    def test_invalidate_vg_lvs(self):
+        self.cache._invalidatelvs("vg1")
+        self.assertEqual(self.cache.getLv("vg1", "lv2").name, "lv2")
+        self.assertEqual(self.cache.commands, ["lvs"])
+        stats = self.cache.stats()
+        self.assertEqual((stats["lv_hits"], stats["lv_misses"]), (0, 1))
+
+    def test_invalidate_vg_unchanged(self):
+        lvm._lvminfo, saved = self.cache, lvm._lvminfo
+        try:
+            lvm.invalidateVG("vg1")
+        finally:
+            lvm._lvminfo = saved
+        self.assertEqual(self.cache.getLv("vg1", "lv1").name, "lv1")
+        # The vg was reloaded, but the lvs were not.
+        self.assertEqual(self.cache.commands, ["vgs"])
+
+    def test_invalidate_vg_changed(self):
+        self.cache.fake_vgs["vg1"] = 2
+        self.cache.fake_lvs["vg1"].append("lv4")
+        self.cache._invalidatevgs("vg1")
+        self.cache._invalidatelvsmetadata("vg1")
+        self.assertEqual(self.cache.getLv("vg1", "lv4").name, "lv4")
+        self.assertEqual(self.cache.commands, ["vgs", "lvs"])
+        # The lvs are valid now.
+        self.assertEqual(self.cache.getLv("vg1", "lv1").name, "lv1")
+        self.assertEqual(self.cache.commands, ["vgs", "lvs"])
+
+    def test_get_all_lvs_reloads_only_stale_vgs(self):
+        self.cache._invalidatelvs("vg2", "lv3")
+        self.assertEqual(sorted(lv.name for lv in self.cache.getAllLvs()),
+                         ["lv1", "lv2", "lv3"])
+        self.assertEqual(self.cache.commands, ["lvs"])
+
+    def test_remove_lv(self):
+        self.cache._removelvs("vg1", "lv1")
+        self.assertEqual([lv.name for lv in self.cache.getLv("vg1")], ["lv2"])
+        self.assertEqual(self.cache.commands, [])
+
+    def test_flush(self):
+        self.cache.flush()
+        self.assertEqual(sorted(lv.name for lv in self.cache.getLv("vg2")),
+                         ["lv3"])
+        self.assertEqual(self.cache.commands, ["lvs"])
+        # vg2 lvs are loaded now.
+        self.cache.getLv("vg2")
+        self.assertEqual(self.cache.commands, ["lvs"])
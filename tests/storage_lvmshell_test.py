@@ -0,0 +1,172 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+from contextlib import contextmanager
+import sys
+import time
+
+from testlib import VdsmTestCase
+from testlib import temporaryPath
+from testValidation import slowtest
+
+from vdsm import commands
+from vdsm.storage import lvmshell
+
+# Emulates "lvm" with JSON reports, both as a shell (without arguments), and
+# running a single command.
+FAKE_LVM = """#!%(python)s
+import json
+import shlex
+import sys
+
+LVS = [("uuid-1", "lv1", "vg1"), ("uuid-2", "lv2", "vg1")]
+
+
+def lvs(args):
+    if "missing" in args:
+        sys.stderr.write('  Volume group "missing" not found\\n')
+        return 5, []
+    return 1, LVS
+
+
+def run_shell():
+    while True:
+        sys.stdout.write("lvm> ")
+        sys.stdout.flush()
+        line = sys.stdin.readline()
+        if not line:
+            break
+        args = shlex.split(line)
+        if "crash" in args:
+            sys.exit(1)
+        config = args[args.index("--config") + 1]
+        if ('"' in config or "report_command_log=1" not in config or
+                args[-2:] != ["--reportformat", "json"]):
+            sys.stdout.write("unexpected command: %%r\\n" %% line)
+            continue
+        ret_code, rows = lvs(args)
+        report = '{"report": [{"lv": [%%s]}], "log": [%%s]}' %% (
+            ", ".join('{"lv_uuid":"%%s", "lv_name":"%%s", "vg_name":"%%s"}'
+                      %% row for row in rows),
+            '{"log_type":"status", "log_object_type":"cmd", '
+            '"log_ret_code":"%%d"}' %% ret_code)
+        sys.stdout.write("  " + report + "\\n")
+
+
+def run_command(args):
+    ret_code, rows = lvs(args)
+    for row in rows:
+        sys.stdout.write("  %%s\\n" %% "|".join(row))
+    return 0 if ret_code == 1 else ret_code
+
+
+if len(sys.argv) == 1:
+    run_shell()
+else:
+    sys.exit(run_command(sys.argv[1:]))
+""" % {"python": sys.executable}
+
+LVS_ARGS = ["lvs", "--config", 'devices { filter = [ "a|.*|" ] }',
+            "--noheadings", "--separator", "|", "-o", "uuid,name,vg_name"]
+
+
+class LVMShellTests(VdsmTestCase):
+
+    def test_report(self):
+        with fake_shell() as shell:
+            rc, out, err = shell.run(LVS_ARGS + ["vg1"])
+            self.assertEqual(rc, 0)
+            self.assertEqual(out, ["uuid-1|lv1|vg1", "uuid-2|lv2|vg1"])
+            self.assertEqual(err, [])
+
+    def test_same_output_as_lvm(self):
+        with fake_shell() as shell:
+            rc, out, err = commands.execCmd([shell._lvm] + LVS_ARGS)
+            self.assertEqual((rc, [line.strip() for line in out], err),
+                             shell.run(LVS_ARGS))
+
+    def test_failure(self):
+        with fake_shell() as shell:
+            rc, out, err = shell.run(LVS_ARGS + ["missing"])
+            self.assertEqual(rc, 5)
+            self.assertEqual(out, [])
+            self.assertEqual(err, ['  Volume group "missing" not found'])
+            # The shell is usable after a failed command.
+            rc, out, err = shell.run(LVS_ARGS)
+            self.assertEqual(rc, 0)
+
+    def test_restart(self):
+        with fake_shell() as shell:
+            self.assertRaises(lvmshell.Error, shell.run, LVS_ARGS + ["crash"])
+            rc, out, err = shell.run(LVS_ARGS)
+            self.assertEqual(rc, 0)
+
+    def test_not_report_command(self):
+        shell = lvmshell.LVMShell()
+        self.assertRaises(ValueError, shell.run, ["lvcreate", "vg/lv"])
+
+    def test_shell_line(self):
+        line = lvmshell._shell_line(["vgs", "--config", 'a { b = "c" }',
+                                     "-o", "name"])
+        self.assertEqual(
+            line,
+            "vgs --config \"a { b = 'c' } %s\" -o name --reportformat json"
+            % lvmshell._LOG_CONFIG)
+
+    def test_parse_echo(self):
+        out = 'lvs -o name\n  {"report": [{"lv": [{"lv_name": "lv1"}]}]}'
+        rc, out, err = lvmshell._parse_report(out, "", "|")
+        # No command status in the log report.
+        self.assertEqual(rc, 5)
+        self.assertEqual(out, ["lv1"])
+
+    def test_invalid_report(self):
+        self.assertRaises(lvmshell.Error, lvmshell._parse_report,
+                          "{invalid", "", "|")
+
+    @slowtest
+    def test_time_vms_start(self):
+        # Starting a VM on block storage looks up its LVs once.
+        vms = 500
+        with fake_shell() as shell:
+            start = time.time()
+            for i in range(vms):
+                commands.execCmd([shell._lvm] + LVS_ARGS)
+            exec_time = time.time() - start
+
+            start = time.time()
+            for i in range(vms):
+                shell.run(LVS_ARGS)
+            shell_time = time.time() - start
+
+        print("%d VMs: exec %.3f seconds, lvm shell %.3f seconds"
+              % (vms, exec_time, shell_time))
+
+
+@contextmanager
+def fake_shell():
+    with temporaryPath(perms=0o755, data=FAKE_LVM) as fake_lvm:
+        shell = lvmshell.LVMShell(lvm=fake_lvm, timeout=5)
+        try:
+            yield shell
+        finally:
+            shell.close()
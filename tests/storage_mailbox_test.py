@@ -20,13 +20,17 @@
 
 import collections
 import contextlib
+import errno
 import io
 import os
 import threading
+import time
 import struct
 
 from testlib import VdsmTestCase as TestCaseBase
+from testlib import expandPermutations, permutations
 from testlib import namedTemporaryDir
+from testValidation import slowtest
 
 import vdsm.storage.mailbox as sm
 from vdsm.storage import misc
@@ -54,13 +58,14 @@ def make_env():
 
 
 @contextlib.contextmanager
-def make_hsm_mailbox(env, host_id):
+def make_hsm_mailbox(env, host_id, directIO=False):
     mailbox = sm.HSM_Mailbox(
         hostID=host_id,
         poolID=SPUUID,
         inbox=env.outbox,
         outbox=env.inbox,
-        monitorInterval=MONITOR_INTERVAL)
+        monitorInterval=MONITOR_INTERVAL,
+        directIO=directIO)
     try:
         yield mailbox
     finally:
@@ -70,13 +75,14 @@ def make_hsm_mailbox(env, host_id):
 
 
 @contextlib.contextmanager
-def make_spm_mailbox(env):
+def make_spm_mailbox(env, directIO=False):
     mailbox = sm.SPM_MailMonitor(
         SPUUID,
         MAX_HOSTS,
         inbox=env.inbox,
         outbox=env.outbox,
-        monitorInterval=MONITOR_INTERVAL)
+        monitorInterval=MONITOR_INTERVAL,
+        directIO=directIO)
     try:
         yield mailbox
     finally:
@@ -108,27 +114,31 @@ class SPM_MailMonitorTests(TestCaseBase):
                     msg='mailer.wait: Timeout expired')
 
 
+@expandPermutations
 class TestSPMMailbox(TestCaseBase):
 
-    def test_clear_outbox(self):
+    @permutations([[False], [True]])
+    def test_clear_outbox(self, directIO):
         with make_env() as env:
             with io.open(env.outbox, "wb") as f:
                 f.write(b"x" * sm.MAILBOX_SIZE * MAX_HOSTS)
-            with make_spm_mailbox(env):
+            with make_spm_mailbox(env, directIO=directIO):
                 with io.open(env.outbox, "rb") as f:
                     data = f.read()
                 self.assertEqual(data, sm.EMPTYMAILBOX * MAX_HOSTS)
 
 
+@expandPermutations
 class TestHSMMailbox(TestCaseBase):
 
-    def test_clear_host_outbox(self):
+    @permutations([[False], [True]])
+    def test_clear_host_outbox(self, directIO):
         host_id = 7
         with make_env() as env:
             # Dirty the inbox
             with io.open(env.inbox, "wb") as f:
                 f.write(b"x" * sm.MAILBOX_SIZE * MAX_HOSTS)
-            with make_hsm_mailbox(env, host_id):
+            with make_hsm_mailbox(env, host_id, directIO=directIO):
                 with io.open(env.inbox, "rb") as f:
                     data = f.read()
                 start = host_id * sm.MAILBOX_SIZE
@@ -152,9 +162,11 @@ class TestHSMMailbox(TestCaseBase):
                 self.assertEqual(data, dirty_outbox)
 
 
+@expandPermutations
 class TestCommunicate(TestCaseBase):
 
-    def test_send_receive(self):
+    @permutations([[False], [True]])
+    def test_send_receive(self, directIO):
         msg_processed = threading.Event()
         expired = False
         received_messages = []
@@ -164,8 +176,8 @@ class TestCommunicate(TestCaseBase):
             msg_processed.set()
 
         with make_env() as env:
-            with make_hsm_mailbox(env, 7) as hsm_mb:
-                with make_spm_mailbox(env) as spm_mm:
+            with make_hsm_mailbox(env, 7, directIO=directIO) as hsm_mb:
+                with make_spm_mailbox(env, directIO=directIO) as spm_mm:
                     spm_mm.registerMessageType("xtnd", spm_callback)
 
                     VOL_DATA = dict(
@@ -207,3 +219,82 @@ class TestValidation(TestCaseBase):
         data = msg + padding * "\0"
         mailbox = data + "bad!"
         self.assertFalse(sm.SPM_MailMonitor.validateMailbox(mailbox, 7))
+
+
+@expandPermutations
+class TestMailboxFile(TestCaseBase):
+
+    @permutations([[sm.DDMailboxFile], [sm.DirectMailboxFile]])
+    def test_read_write(self, mailbox_file):
+        with make_env() as env:
+            f = mailbox_file(env.inbox)
+            try:
+                data = b"x" * sm.MAILBOX_SIZE
+                f.write(3 * sm.MAILBOX_SIZE, data)
+                self.assertEqual(f.read(3 * sm.MAILBOX_SIZE, sm.MAILBOX_SIZE),
+                                 data)
+                self.assertEqual(f.read(0, sm.MAILBOX_SIZE * MAX_HOSTS),
+                                 sm.EMPTYMAILBOX * 3 + data +
+                                 sm.EMPTYMAILBOX * (MAX_HOSTS - 4))
+            finally:
+                f.close()
+
+    @permutations([[sm.DDMailboxFile], [sm.DirectMailboxFile]])
+    def test_read_missing(self, mailbox_file):
+        with namedTemporaryDir() as tmpdir:
+            f = mailbox_file(os.path.join(tmpdir, "missing"))
+            try:
+                self.assertRaises(EnvironmentError, f.read, 0,
+                                  sm.MAILBOX_SIZE)
+            finally:
+                f.close()
+
+    @permutations([[sm.DDMailboxFile], [sm.DirectMailboxFile]])
+    def test_io_after_close(self, mailbox_file):
+        with make_env() as env:
+            f = mailbox_file(env.inbox)
+            f.read(0, sm.MAILBOX_SIZE)
+            f.close()
+            for call, args in ((f.read, (0, sm.MAILBOX_SIZE)),
+                               (f.write, (0, sm.EMPTYMAILBOX))):
+                with self.assertRaises(IOError) as ctx:
+                    call(*args)
+                self.assertEqual(ctx.exception.errno, errno.EBADF)
+
+    @slowtest
+    def test_time_spm_poll(self):
+        hosts = 250
+        polls = 100
+        with namedTemporaryDir() as tmpdir:
+            inbox = os.path.join(tmpdir, "inbox")
+            with io.open(inbox, "wb") as f:
+                f.write(sm.EMPTYMAILBOX * hosts)
+            for mailbox_file in (sm.DDMailboxFile, sm.DirectMailboxFile):
+                f = mailbox_file(inbox)
+                try:
+                    start = time.time()
+                    for i in range(polls):
+                        f.read(0, sm.MAILBOX_SIZE * hosts)
+                    elapsed = time.time() - start
+                finally:
+                    f.close()
+                print("%s: %d polls of %d hosts in %.3f seconds"
+                      % (mailbox_file.__name__, polls, hosts, elapsed))
+
+
+class TestPollInterval(TestCaseBase):
+
+    def test_default(self):
+        interval = sm.PollInterval(0.25, 2)
+        self.assertEqual([interval.next() for i in range(2)], [2, 2])
+
+    def test_reset(self):
+        interval = sm.PollInterval(0.25, 2)
+        interval.reset()
+        self.assertEqual([interval.next() for i in range(5)],
+                         [0.25, 0.5, 1, 2, 2])
+
+    def test_min_larger_than_max(self):
+        interval = sm.PollInterval(4, 2)
+        interval.reset()
+        self.assertEqual(interval.next(), 2)
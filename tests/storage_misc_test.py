@@ -25,6 +25,7 @@ import time
 import threading
 import weakref
 
+from contextlib import contextmanager
 from functools import partial
 
 from testlib import AssertingLock
@@ -32,18 +33,22 @@ from testlib import VdsmTestCase as TestCaseBase
 from testlib import namedTemporaryDir
 from testlib import permutations, expandPermutations
 from testlib import TEMPDIR
+from testlib import temporaryPath
 
 from vdsm import cmdutils
 from vdsm import commands
 from vdsm import utils
 from vdsm.common import exception
 from vdsm.common.proc import pidstat
+from vdsm.storage import blockreader
 from vdsm.storage import fileUtils
 from vdsm.storage import misc
 from vdsm.storage import outOfProcess as oop
 
 from monkeypatch import MonkeyPatch
+from monkeypatch import MonkeyPatchScope
 from testValidation import checkSudo
+from testValidation import slowtest
 
 EXT_DD = "/bin/dd"
 
@@ -635,6 +640,76 @@ class ReadBlock(TestCaseBase):
         os.unlink(path)
 
 
+@contextmanager
+def block_reader(enabled):
+    reader = blockreader.BlockReader(2, 10, helper="../helpers/blockreader")
+    try:
+        with MonkeyPatchScope([(misc, "_READBLOCK_HELPER", enabled),
+                               (misc, "_block_reader", reader)]):
+            yield
+    finally:
+        reader.close()
+
+
+class ReadBlockHelper(ReadBlock):
+
+    def setUp(self):
+        patch = block_reader(True)
+        patch.__enter__()
+        self.addCleanup(patch.__exit__, None, None, None)
+
+
+@expandPermutations
+class ReadBlocks(TestCaseBase):
+
+    @permutations([[True], [False]])
+    def test_ranges(self, enabled):
+        data = b"".join(c.encode("ascii") * 511 + b"\n" for c in "abcd")
+        with block_reader(enabled), temporaryPath(data=data) as path:
+            blocks = misc.readblocks(path, [(1024, 512), (0, 1024)])
+        self.assertEqual(blocks, [[b"c" * 511], [b"a" * 511, b"b" * 511]])
+
+    @permutations([[True], [False]])
+    def test_incomplete(self, enabled):
+        with block_reader(enabled), temporaryPath(data=b"x" * 1024) as path:
+            self.assertRaises(misc.se.MiscBlockReadIncomplete,
+                              misc.readblocks, path, [(0, 512), (512, 1024)])
+
+
+@expandPermutations
+class WriteBlock(TestCaseBase):
+
+    @permutations([[True], [False]])
+    def test_write(self, enabled):
+        data = b"".join(c.encode("ascii") * 511 + b"\n" for c in "abcd")
+        with block_reader(enabled), temporaryPath(data=data) as path:
+            misc.writeblock(path, 512, b"x" * 1024)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(),
+                                 data[:512] + b"x" * 1024 + data[1536:])
+
+    def test_write_missing(self):
+        with block_reader(True):
+            self.assertRaises(misc.se.MiscBlockWriteException,
+                              misc.writeblock, "/no/such/path", 0, b"x" * 512)
+
+
+class ReadBlockTiming(TestCaseBase):
+
+    @slowtest
+    def test_time_read_metadata(self):
+        count = 100
+        with temporaryPath(data=b"\0" * 1024**2) as path:
+            for enabled in (False, True):
+                with block_reader(enabled):
+                    start = time.time()
+                    for i in range(count):
+                        misc.readblock(path, i * 512, 512)
+                    elapsed = time.time() - start
+                print("readblock_helper=%s: %d reads in %.3f seconds" %
+                      (enabled, count, elapsed))
+
+
 class CleanUpDir(TestCaseBase):
 
     def testFullDir(self):
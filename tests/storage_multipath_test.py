@@ -0,0 +1,251 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+from contextlib import contextmanager
+import os
+import time
+
+from vdsm.storage import devicemapper
+from vdsm.storage import iscsi
+from vdsm.storage import multipath
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testlib import namedTemporaryDir
+from testValidation import slowtest
+
+GUID = "360014057ce9b4d9b3bd4e5c9ea0d6b%02d"
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCollect(object):
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.devices
+
+
+class DeviceInventoryTests(VdsmTestCase):
+
+    def test_shared(self):
+        collect = FakeCollect([{"guid": "a"}, {"guid": "b"}])
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        self.assertEqual(inventory.devices(), collect.devices)
+        self.assertEqual(inventory.devices(), collect.devices)
+        self.assertEqual(collect.calls, 1)
+
+    def test_filter(self):
+        collect = FakeCollect([{"guid": "a"}, {"guid": "b"}])
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        self.assertEqual(inventory.devices(["b"]), [{"guid": "b"}])
+
+    def test_copy(self):
+        collect = FakeCollect([{"guid": "a", "paths": []}])
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        inventory.devices()[0]["paths"].append({"physdev": "sda"})
+        self.assertEqual(inventory.devices(), [{"guid": "a", "paths": []}])
+
+    def test_invalidate(self):
+        collect = FakeCollect([{"guid": "a"}])
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        inventory.devices()
+        inventory.invalidate()
+        collect.devices = [{"guid": "b"}]
+        self.assertEqual(inventory.devices(), [{"guid": "b"}])
+        self.assertEqual(collect.calls, 2)
+
+    def test_invalidate_while_collecting(self):
+        inventory = None
+
+        def collect():
+            # Devices rescanned while collecting.
+            inventory.invalidate()
+            return [{"guid": "a"}]
+
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        inventory.devices()
+        self.assertIsNone(inventory._devices)
+
+    def test_max_age(self):
+        collect = FakeCollect([{"guid": "a"}])
+        clock = FakeClock()
+        inventory = multipath.DeviceInventory(collect, max_age=60,
+                                              clock=clock)
+        inventory.devices()
+        clock.now += 59
+        inventory.devices()
+        self.assertEqual(collect.calls, 1)
+        clock.now += 1
+        inventory.devices()
+        self.assertEqual(collect.calls, 2)
+
+    def test_path_list_iter(self):
+        collect = FakeCollect([{"guid": "a"}, {"guid": "b"}])
+        inventory = multipath.DeviceInventory(collect, clock=FakeClock())
+        with MonkeyPatchScope([(multipath, "_DEVICE_INVENTORY", True),
+                               (multipath, "_inventory", inventory)]):
+            self.assertEqual(list(multipath.pathListIter()),
+                             collect.devices)
+
+
+class CollectDevicesTests(VdsmTestCase):
+
+    def test_collect(self):
+        with fake_sysfs(devices=2, paths=2):
+            devices = sorted(multipath.collectDevices(),
+                             key=lambda d: d["guid"])
+        self.assertEqual(len(devices), 2)
+        dev = devices[0]
+        self.assertEqual(dev["guid"], GUID % 0)
+        self.assertEqual(dev["dm"], "dm-0")
+        self.assertEqual(dev["capacity"], str(20 * 1024**3))
+        self.assertEqual(dev["serial"], "serial-dm-0")
+        self.assertEqual(dev["vendor"], "LIO-ORG")
+        self.assertEqual(dev["product"], "lun0")
+        self.assertEqual(dev["logicalblocksize"], "512")
+        self.assertEqual(dev["physicalblocksize"], "4096")
+        self.assertEqual(dev["devtype"], multipath.DEV_FCP)
+        self.assertEqual(
+            sorted(dev["paths"], key=lambda p: p["physdev"]),
+            [{"physdev": "sdx0p0", "state": "active", "type": "FCP",
+              "capacity": str(20 * 1024**3), "lun": "0"},
+             {"physdev": "sdx0p1", "state": "failed", "type": "FCP",
+              "capacity": str(20 * 1024**3), "lun": "0"}])
+
+    def test_same_as_path_list_iter(self):
+        with fake_sysfs(devices=3, paths=2):
+            expected = list(multipath._pathListIter(
+                (), fake_serial, fake_paths_status(), None))
+            self.assertEqual(multipath.collectDevices(), expected)
+
+    @slowtest
+    def test_time_get_device_list(self):
+        devices = 500
+        with fake_sysfs(devices=devices, paths=2):
+            start = time.time()
+            for dev in multipath._pathListIter(
+                    (), fake_serial, fake_paths_status(), None):
+                pass
+            iter_time = time.time() - start
+
+            inventory = multipath.DeviceInventory(multipath.collectDevices)
+            start = time.time()
+            inventory.devices()
+            collect_time = time.time() - start
+
+            start = time.time()
+            inventory.devices()
+            cached_time = time.time() - start
+
+        print("%d devices: pathListIter %.3f seconds, collect %.3f seconds, "
+              "cached %.3f seconds"
+              % (devices, iter_time, collect_time, cached_time))
+
+
+def fake_serial(dmId):
+    return "serial-" + dmId
+
+
+def fake_paths_status():
+    # First path of every device is active, second failed.
+    statuses = {}
+    for dev in os.listdir(multipath.SYS_BLOCK):
+        if dev.startswith("sdx"):
+            statuses[dev] = "active" if dev.endswith("p0") else "failed"
+    return statuses
+
+
+@contextmanager
+def fake_sysfs(devices, paths):
+    """
+    Create a sysfs tree with devices multipath devices, each with paths
+    slaves.
+    """
+    with namedTemporaryDir() as tmpdir:
+        sys_block = os.path.join(tmpdir, "block")
+        for i in range(devices):
+            dm = os.path.join(sys_block, "dm-%d" % i)
+            write_attrs(dm, {
+                "dm/uuid": "mpath-" + GUID % i,
+                "dm/name": GUID % i,
+            })
+            write_device_attrs(dm)
+            os.mkdir(os.path.join(dm, "slaves"))
+            for j in range(paths):
+                slave = "sdx%dp%d" % (i, j)
+                open(os.path.join(dm, "slaves", slave), "w").close()
+                sd = os.path.join(sys_block, slave)
+                write_attrs(sd, {
+                    "device/vendor": "LIO-ORG",
+                    "device/model": "lun%d" % i,
+                    "device/rev": "4.0",
+                })
+                write_device_attrs(sd)
+                os.makedirs(os.path.join(sd, "device/scsi_disk/%d:0:0:0" % j))
+
+        def getSlaves(dmId):
+            return os.listdir(os.path.join(sys_block, dmId, "slaves"))
+
+        def isBlockDevice(dev):
+            return os.path.exists(os.path.join(sys_block, dev))
+
+        with MonkeyPatchScope([
+            (multipath, "SYS_BLOCK", sys_block),
+            (multipath, "getScsiSerial", fake_serial),
+            (devicemapper, "getSlaves", getSlaves),
+            (devicemapper, "isBlockDevice", isBlockDevice),
+            (devicemapper, "_getPathsStatus", fake_paths_status),
+            (iscsi, "devIsiSCSI", lambda dev: False),
+        ]):
+            yield
+
+
+def write_device_attrs(path):
+    write_attrs(path, {
+        "size": str(20 * 1024**3 // 512),
+        "queue/logical_block_size": "512",
+        "queue/physical_block_size": "4096",
+        "queue/discard_max_bytes": "0",
+        "queue/discard_zeroes_data": "0",
+    })
+
+
+def write_attrs(path, attrs):
+    for name, value in attrs.items():
+        filename = os.path.join(path, name)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(filename, "w") as f:
+            f.write(value + "\n")
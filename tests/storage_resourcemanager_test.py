@@ -29,6 +29,7 @@ from resource import getrlimit, RLIMIT_NPROC
 from vdsm.storage import resourceManager as rm
 
 from monkeypatch import MonkeyPatch
+from monkeypatch import MonkeyPatchScope
 from storagefakelib import FakeResourceManager
 from testlib import expandPermutations, permutations
 from testlib import VdsmTestCase as TestCaseBase
@@ -653,6 +654,191 @@ class ResourceManagerTests(TestCaseBase):
             t.join()
 
 
+class BlockingResourceFactory(rm.SimpleResourceFactory):
+    """
+    A resource factory blocking in createResource until resumed, failing the
+    next failures calls. Used for testing.
+    """
+    def __init__(self):
+        self.creating = threading.Event()
+        self.resume = threading.Event()
+        self.failures = 0
+        self.created = 0
+
+    def createResource(self, name, lockType):
+        self.creating.set()
+        self.resume.wait()
+        if self.failures:
+            self.failures -= 1
+            raise Exception("Cannot create resource")
+        self.created += 1
+        return StringIO("%s:%s" % (name, lockType))
+
+
+class SlowResourceFactory(rm.SimpleResourceFactory):
+    """
+    A resource factory taking some time to create resources, like a factory
+    activating logical volumes. Used for testing.
+    """
+    def createResource(self, name, lockType):
+        time.sleep(0.001)
+
+
+class ResourceCreationTests(TestCaseBase):
+
+    def setUp(self):
+        self.factory = BlockingResourceFactory()
+        self.manager = rm._ResourceManager()
+        self.manager.registerNamespace("blocking", self.factory)
+        self.manager.registerNamespace("storage", rm.SimpleResourceFactory())
+        self.manager.registerNamespace("slow", SlowResourceFactory())
+        self.granted = []
+        patch = MonkeyPatchScope([(rm, "_manager", self.manager)])
+        patch.__enter__()
+        self.addCleanup(patch.__exit__, None, None, None)
+
+    def callback(self, req, res):
+        self.granted.append((req, res))
+
+    def register(self, name, lockType, namespace="blocking"):
+        return self.manager.registerResource(namespace, name, lockType,
+                                             self.callback)
+
+    def start_creation(self, name, lockType):
+        """
+        Register a request in another thread, and return when the thread is
+        creating the resource.
+        """
+        t = threading.Thread(target=self.register, args=(name, lockType))
+        t.daemon = True
+        t.start()
+        self.factory.creating.wait(1)
+        self.assertTrue(self.factory.creating.is_set())
+        return t
+
+    def test_queued_while_creating(self):
+        t = self.start_creation("resource", rm.SHARED)
+        try:
+            # Resource is being created, even shared requests must wait.
+            req = self.register("resource", rm.SHARED)
+            self.assertFalse(req.granted())
+            self.assertEqual(
+                self.manager.getResourceStatus("blocking", "resource"),
+                rm.LockState.shared)
+        finally:
+            self.factory.resume.set()
+            t.join()
+        self.assertTrue(req.granted())
+        self.assertEqual(self.factory.created, 1)
+        self.assertEqual(len(self.granted), 2)
+        for _, res in self.granted:
+            res.release()
+        self.assertEqual(
+            self.manager.getResourceStatus("blocking", "resource"),
+            rm.LockState.free)
+
+    def test_exclusive_waits_for_creation(self):
+        t = self.start_creation("resource", rm.EXCLUSIVE)
+        try:
+            req = self.register("resource", rm.EXCLUSIVE)
+            self.assertFalse(req.granted())
+        finally:
+            self.factory.resume.set()
+            t.join()
+        self.assertFalse(req.granted())
+        self.granted.pop(0)[1].release()
+        self.assertTrue(req.granted())
+        self.granted.pop(0)[1].release()
+        self.assertEqual(self.manager.getLockStats()["blocking"]["waited"], 1)
+
+    def test_creation_failed_with_waiters(self):
+        self.factory.failures = 1
+        t = self.start_creation("resource", rm.EXCLUSIVE)
+        try:
+            req = self.register("resource", rm.SHARED)
+        finally:
+            self.factory.resume.set()
+            t.join()
+        # The first request was canceled, the waiting request created the
+        # resource.
+        self.assertEqual(len(self.granted), 2)
+        canceled, res = self.granted[0]
+        self.assertTrue(canceled.canceled())
+        self.assertIsNone(res)
+        self.assertTrue(req.granted())
+        self.assertEqual(self.factory.created, 1)
+        self.assertEqual(
+            self.manager.getResourceStatus("blocking", "resource"),
+            rm.LockState.shared)
+        self.granted[1][1].release()
+        self.assertEqual(
+            self.manager.getResourceStatus("blocking", "resource"),
+            rm.LockState.free)
+
+    def test_other_resources_not_blocked(self):
+        t = self.start_creation("resource", rm.EXCLUSIVE)
+        try:
+            req = self.register("other", rm.EXCLUSIVE, namespace="storage")
+            self.assertTrue(req.granted())
+            self.granted.pop()[1].release()
+        finally:
+            self.factory.resume.set()
+            t.join()
+
+    def test_fifo(self):
+        self.factory.resume.set()
+        self.register("resource", rm.EXCLUSIVE)
+        waiting = [self.register("resource", lockType)
+                   for lockType in (rm.EXCLUSIVE, rm.SHARED, rm.EXCLUSIVE)]
+        for req in waiting:
+            self.granted.pop(0)[1].release()
+            self.assertTrue(req.granted())
+        self.granted.pop(0)[1].release()
+
+    def test_stats(self):
+        self.factory.resume.set()
+        self.register("resource", rm.SHARED)
+        self.register("resource", rm.SHARED)
+        self.register("resource", rm.EXCLUSIVE)
+        for _, res in self.granted[:]:
+            res.release()
+        self.granted.pop(0)
+        self.granted.pop(0)
+        self.granted.pop(0)[1].release()
+        stats = self.manager.getLockStats()
+        self.assertEqual(stats["storage"]["requests"], 0)
+        self.assertEqual(stats["blocking"]["requests"], 3)
+        self.assertEqual(stats["blocking"]["waited"], 1)
+        self.assertGreaterEqual(stats["blocking"]["max_wait"], 0)
+        self.assertEqual(stats["blocking"]["wait_time"],
+                         stats["blocking"]["max_wait"])
+
+    @slowtest
+    def test_time_concurrent_acquire(self):
+        threads = 20
+        count = 100
+
+        def worker(n):
+            for i in range(count):
+                name = "resource-%d" % ((n + i) % threads)
+                res = rm.acquireResource("slow", name, rm.EXCLUSIVE)
+                res.release()
+
+        workers = [threading.Thread(target=worker, args=(n,))
+                   for n in range(threads)]
+        start = time.time()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.time() - start
+        stats = rm.getLockStats()["slow"]
+        print("%d threads, %d requests in %.3f seconds, %d waited "
+              "(max wait %.6f seconds)" % (
+                  threads, stats["requests"], elapsed, stats["waited"],
+                  stats["max_wait"]))
+
+
 @expandPermutations
 class ResourceManagerLockTest(TestCaseBase):
 
@@ -16,8 +16,12 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+from __future__ import print_function
 
+import logging
 import os
+import random
+import time
 import uuid
 
 from vdsm.storage import constants as sc
@@ -27,6 +31,7 @@ from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase, recorded
 from testlib import make_uuid
 from testlib import expandPermutations, permutations
+from testValidation import slowtest
 
 from storagetestlib import (
     make_file_volume,
@@ -192,6 +197,170 @@ class BlockDomainMetadataSlotTests(VdsmTestCase):
                 acquired = env.sd_manifest._lvTagMetaSlotLock.acquire(False)
                 self.assertFalse(acquired)
 
+    def test_metaslot_allocated(self):
+        with fake_block_env() as env:
+            self.assertEqual(create_volume(env), 4)
+            self.assertEqual(create_volume(env), 5)
+
+    def test_metaslot_allocation_failed(self):
+        with fake_block_env() as env:
+            with self.assertRaises(RuntimeError):
+                with env.sd_manifest.acquireVolumeMetadataSlot(
+                        make_uuid(), 1):
+                    raise RuntimeError("injected failure")
+            self.assertEqual(create_volume(env), 4)
+
+    def test_metaslot_removed_volume(self):
+        with fake_block_env() as env:
+            sduuid = env.sd_manifest.sdUUID
+            lvs = [make_uuid() for i in range(3)]
+            for lv in lvs:
+                create_volume(env, lv)
+            del env.lvm.lvmd[(sduuid, lvs[1])]
+            self.assertEqual(create_volume(env), 5)
+            self.assertEqual(create_volume(env), 7)
+
+    def test_metaslot_other_host(self):
+        with fake_block_env() as env:
+            self.assertEqual(create_volume(env), 4)
+            # Volume created by another host.
+            add_lv(env, 5)
+            self.assertEqual(create_volume(env), 6)
+
+    @permutations([
+        # used_slots, size, free_slot
+        ([5], 2, 6),
+        ([6], 2, 4),
+        ([4, 7], 2, 5),
+        ([4, 6, 9], 2, 7),
+    ])
+    def test_metaslot_size(self, used_slots, size, free_slot):
+        with fake_block_env() as env:
+            for offset in used_slots:
+                add_lv(env, offset)
+            with env.sd_manifest.acquireVolumeMetadataSlot(None, size) as slot:
+                self.assertEqual(slot, free_slot)
+
+
+class MetadataSlotMapTests(VdsmTestCase):
+
+    def test_first_fit(self):
+        for i in range(100):
+            slots = random_slots()
+            slot_map = blockSD.MetadataSlotMap("sd", 4, logging.getLogger())
+            for lv, (offset, size) in slots.items():
+                slot_map.add(lv, offset, size)
+            for size in (1, 2, 3):
+                self.assertEqual(slot_map.find(size),
+                                 first_fit(slots.values(), 4, size))
+
+    def test_sync(self):
+        lvs = [FakeLV(make_uuid(), offset) for offset in (4, 5, 7)]
+        slot_map = blockSD.MetadataSlotMap("sd", 4, logging.getLogger())
+        slot_map.sync(lvs)
+        self.assertEqual(slot_map.find(1), 6)
+        del lvs[0]
+        lvs.append(FakeLV(make_uuid(), 6))
+        slot_map.sync(lvs)
+        self.assertEqual(slot_map.find(1), 4)
+        self.assertEqual(slot_map.find(2), 8)
+
+    def test_sync_lv_without_slot(self):
+        lvs = [FakeLV(make_uuid(), 4), FakeLV(make_uuid(), None)]
+        slot_map = blockSD.MetadataSlotMap("sd", 4, logging.getLogger())
+        slot_map.sync(lvs)
+        self.assertEqual(slot_map.find(1), 5)
+        # The volume was tagged.
+        lvs[1] = FakeLV(lvs[1].name, 5)
+        slot_map.sync(lvs)
+        self.assertEqual(slot_map.find(1), 6)
+
+    @slowtest
+    def test_time_allocate(self):
+        volumes = 5000
+        lvs = [FakeLV(make_uuid(), offset)
+               for offset in range(4, 4 + volumes)]
+        random.shuffle(lvs)
+
+        start = time.time()
+        for i in range(100):
+            slots = [blockSD._metadataSlot(lv) for lv in lvs]
+            first_fit(slots, 4, 1)
+        scan_time = (time.time() - start) / 100
+
+        slot_map = blockSD.MetadataSlotMap("sd", 4, logging.getLogger())
+        start = time.time()
+        slot_map.sync(lvs)
+        build_time = time.time() - start
+
+        start = time.time()
+        for i in range(100):
+            slot_map.sync(lvs)
+            lvs.append(FakeLV(make_uuid(), slot_map.find(1)))
+        map_time = (time.time() - start) / 100
+
+        print("%d volumes: scanning %.6f seconds, building map %.6f seconds, "
+              "allocating using map %.6f seconds"
+              % (volumes, scan_time, build_time, map_time))
+
+    def test_remove(self):
+        slots = random_slots()
+        slot_map = blockSD.MetadataSlotMap("sd", 4, logging.getLogger())
+        for lv, (offset, size) in slots.items():
+            slot_map.add(lv, offset, size)
+        for lv in list(slots):
+            slot_map.remove(lv)
+            del slots[lv]
+            self.assertEqual(slot_map.find(1),
+                             first_fit(slots.values(), 4, 1))
+
+
+class FakeLV(object):
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.tags = ("%s%s" % (sc.TAG_PREFIX_IMAGE, make_uuid()),
+                     "%s%s" % (sc.TAG_PREFIX_PARENT, sc.BLANK_UUID))
+        if offset is not None:
+            self.tags += ("%s%s" % (sc.TAG_PREFIX_MD, offset),)
+
+
+def random_slots():
+    slots = {}
+    offset = 4
+    while offset < 64:
+        offset += random.randint(0, 3)
+        size = random.choice((1, 1, 1, 2))
+        slots[make_uuid()] = (offset, size)
+        offset += size
+    return slots
+
+
+def first_fit(slots, first, size):
+    free = first
+    for offset, slot_size in sorted(slots):
+        if offset >= free + size:
+            break
+        free = max(free, offset + slot_size)
+    return free
+
+
+def add_lv(env, offset):
+    sduuid = env.sd_manifest.sdUUID
+    lv = make_uuid()
+    env.lvm.createLV(sduuid, lv, VOLSIZE / MB)
+    env.lvm.addtag(sduuid, lv, sc.TAG_PREFIX_MD + str(offset))
+    return lv
+
+
+def create_volume(env, lv=None):
+    sduuid = env.sd_manifest.sdUUID
+    lv = lv or make_uuid()
+    env.lvm.createLV(sduuid, lv, VOLSIZE / MB)
+    with env.sd_manifest.acquireVolumeMetadataSlot(lv, 1) as slot:
+        env.lvm.addtag(sduuid, lv, sc.TAG_PREFIX_MD + str(slot))
+    return slot
+
 
 class TestingStorageDomainManifest(sd.StorageDomainManifest):
     def __init__(self):
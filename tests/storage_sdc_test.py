@@ -0,0 +1,258 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+from contextlib import contextmanager
+import threading
+import time
+
+from vdsm.storage import exception as se
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testlib import expandPermutations, permutations
+from testlib import make_uuid
+from testValidation import slowtest
+
+from storage import sdc
+
+
+class FakeBackend(object):
+    """
+    Emulate a storage type module (e.g. blockSD), with list and find
+    functions taking delay seconds, like a slow storage.
+    """
+
+    def __init__(self, name, domains, delay=0, error=None, find_error=None):
+        self.__name__ = name
+        self.domains = set(domains)
+        self.delay = delay
+        self.error = error
+        self.find_error = find_error
+        self.listed = threading.Event()
+        self.listed.set()
+        self.list_calls = 0
+        self.find_calls = 0
+
+    def getStorageDomainsList(self):
+        self.list_calls += 1
+        self.listed.wait()
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return list(self.domains)
+
+    def findDomain(self, sdUUID):
+        self.find_calls += 1
+        time.sleep(self.delay)
+        if self.find_error:
+            raise self.find_error
+        if sdUUID not in self.domains:
+            raise se.StorageDomainDoesNotExist(sdUUID)
+        return FakeDomain(sdUUID, self.__name__)
+
+
+class FakeDomain(object):
+
+    def __init__(self, sdUUID, backend):
+        self.sdUUID = sdUUID
+        self.backend = backend
+
+
+@expandPermutations
+class StorageDomainCacheTests(VdsmTestCase):
+
+    @permutations([[True], [False]])
+    def test_produce(self, discovery):
+        block = FakeBackend("blockSD", [make_uuid()])
+        nfs = FakeBackend("nfsSD", [make_uuid()])
+        with fake_cache([block, nfs], discovery) as cache:
+            for backend in (block, nfs):
+                sdUUID = next(iter(backend.domains))
+                dom = cache.produce(sdUUID)
+                self.assertEqual(dom.sdUUID, sdUUID)
+                self.assertEqual(dom.backend, backend.__name__)
+
+    @permutations([[True], [False]])
+    def test_missing(self, discovery):
+        block = FakeBackend("blockSD", [make_uuid()])
+        with fake_cache([block], discovery) as cache:
+            self.assertRaises(se.StorageDomainDoesNotExist,
+                              cache.produce, make_uuid())
+
+    def test_discover_once(self):
+        block = FakeBackend("blockSD", [make_uuid() for i in range(5)])
+        nfs = FakeBackend("nfsSD", [make_uuid() for i in range(5)])
+        with fake_cache([block, nfs]) as cache:
+            for sdUUID in block.domains | nfs.domains:
+                cache.produce(sdUUID)
+            self.assertEqual(block.list_calls, 1)
+            self.assertEqual(nfs.list_calls, 1)
+            # Domains are looked up only using their storage type.
+            self.assertEqual(block.find_calls, 5)
+            self.assertEqual(nfs.find_calls, 5)
+
+    def test_same_order(self):
+        sdUUID = make_uuid()
+        gluster = FakeBackend("glusterSD", [sdUUID])
+        nfs = FakeBackend("nfsSD", [sdUUID])
+        with fake_cache([gluster, nfs]) as cache:
+            self.assertEqual(cache.produce(sdUUID).backend, "glusterSD")
+
+    def test_failed_backend(self):
+        sdUUID = make_uuid()
+        gluster = FakeBackend("glusterSD", [sdUUID], error=RuntimeError())
+        nfs = FakeBackend("nfsSD", [sdUUID])
+        with fake_cache([gluster, nfs]) as cache:
+            # Indexing the domain as nfs domain would be wrong; fall back to
+            # probing all storage types.
+            self.assertEqual(cache.produce(sdUUID).backend, "glusterSD")
+
+    def test_hung_backend(self):
+        sdUUID = make_uuid()
+        block = FakeBackend("blockSD", [sdUUID])
+        nfs = FakeBackend("nfsSD", [])
+        nfs.listed.clear()
+        try:
+            with fake_cache([block, nfs]) as cache:
+                # Finding a block domain does not wait for listing nfs
+                # domains.
+                self.assertEqual(cache.produce(sdUUID).backend, "blockSD")
+        finally:
+            nfs.listed.set()
+
+    def test_failed_find(self):
+        sdUUID = make_uuid()
+        block = FakeBackend("blockSD", [sdUUID], find_error=RuntimeError())
+        nfs = FakeBackend("nfsSD", [sdUUID])
+        with fake_cache([block, nfs]) as cache:
+            self.assertEqual(cache.produce(sdUUID).backend, "nfsSD")
+            self.assertEqual(block.find_calls, 2)
+
+    def test_refresh_storage(self):
+        block = FakeBackend("blockSD", [])
+        with fake_cache([block]) as cache:
+            sdUUID = make_uuid()
+            self.assertRaises(se.StorageDomainDoesNotExist,
+                              cache.produce, sdUUID)
+            block.domains.add(sdUUID)
+            cache.invalidateStorage()
+            # The domain is found by probing, without listing again.
+            self.assertEqual(cache.produce(sdUUID).backend, "blockSD")
+            self.assertEqual(block.list_calls, 1)
+
+    def test_probed_domain_indexed(self):
+        sdUUID = make_uuid()
+        block = FakeBackend("blockSD", [])
+        nfs = FakeBackend("nfsSD", [])
+        with fake_cache([block, nfs]) as cache:
+            self.assertRaises(se.StorageDomainDoesNotExist,
+                              cache.produce, sdUUID)
+            nfs.domains.add(sdUUID)
+            cache.invalidateStorage()
+            cache.produce(sdUUID)
+            find_calls = block.find_calls
+            cache.manuallyRemoveDomain(sdUUID)
+            # The domain is looked up only using its storage type.
+            self.assertEqual(cache.produce(sdUUID).backend, "nfsSD")
+            self.assertEqual(block.find_calls, find_calls)
+
+    def test_refresh_failed_backend(self):
+        block = FakeBackend("blockSD", [make_uuid(), make_uuid()],
+                            error=RuntimeError())
+        with fake_cache([block]) as cache:
+            first, second = block.domains
+            cache.produce(first)
+            block.error = None
+            cache.invalidateStorage()
+            cache.produce(second)
+            self.assertEqual(block.list_calls, 2)
+
+    def test_refresh_hung_backend(self):
+        block = FakeBackend("blockSD", [make_uuid(), make_uuid()])
+        nfsUUID = make_uuid()
+        nfs = FakeBackend("nfsSD", [nfsUUID])
+        nfs.listed.clear()
+        try:
+            with fake_cache([block, nfs]) as cache:
+                for sdUUID in block.domains:
+                    cache.produce(sdUUID)
+                    cache.invalidateStorage()
+                nfs.listed.set()
+                cache.produce(nfsUUID)
+                # The unfinished nfs listing was not started again.
+                self.assertEqual(nfs.list_calls, 1)
+        finally:
+            nfs.listed.set()
+
+    def test_discovered_domain_removed(self):
+        sdUUID = make_uuid()
+        block = FakeBackend("blockSD", [sdUUID])
+        nfs = FakeBackend("nfsSD", [])
+        with fake_cache([block, nfs]) as cache:
+            cache.produce(sdUUID)
+            cache.manuallyRemoveDomain(sdUUID)
+            block.domains.remove(sdUUID)
+            nfs.domains.add(sdUUID)
+            self.assertEqual(cache.produce(sdUUID).backend, "nfsSD")
+            self.assertEqual(block.list_calls, 1)
+
+    def test_stats(self):
+        sdUUID = make_uuid()
+        block = FakeBackend("blockSD", [sdUUID])
+        with fake_cache([block]) as cache:
+            cache.produce(sdUUID)
+            cache.produce(sdUUID)
+            cache.produce(sdUUID)
+            self.assertEqual(cache.stats(),
+                             {"hits": 2, "misses": 1, "discoveries": 1})
+
+    @slowtest
+    def test_time_connect_pool(self):
+        domains = 30
+        delay = 0.01
+        for discovery in (False, True):
+            backends = [FakeBackend(name, [], delay=delay)
+                        for name in ("blockSD", "glusterSD", "localFsSD",
+                                     "nfsSD")]
+            for i in range(domains):
+                backends[i % len(backends)].domains.add(make_uuid())
+            with fake_cache(backends, discovery) as cache:
+                start = time.time()
+                for backend in backends:
+                    for sdUUID in backend.domains:
+                        cache.produce(sdUUID)
+                elapsed = time.time() - start
+            print("discovery=%s: %d domains in %.3f seconds" %
+                  (discovery, domains, elapsed))
+
+
+@contextmanager
+def fake_cache(backends, discovery=True):
+    with MonkeyPatchScope([
+        (sdc.multipath, "rescan", lambda: None),
+        (sdc.multipath, "resize_devices", lambda: None),
+        (sdc.lvm, "invalidateCache", lambda: None),
+    ]):
+        cache = sdc.StorageDomainCache("/rhev/data-center",
+                                       discovery=discovery)
+        cache._backends = lambda: backends
+        yield cache
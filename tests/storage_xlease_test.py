@@ -296,6 +296,74 @@ class TestIndex(VdsmTestCase):
             self.assertEqual(leases[uuids[2]]["offset"],
                              xlease.USER_RESOURCE_BASE + xlease.SLOT_SIZE * 2)
 
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_add_no_space(self):
+        with make_full_volume() as vol:
+            self.assertRaises(xlease.NoSpace, vol.add, make_uuid())
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_full_volume_remove_add(self):
+        with make_full_volume() as vol:
+            leases = vol.leases()
+            self.assertEqual(len(leases), xlease.MAX_RECORDS)
+            lease_id = next(iter(leases))
+            vol.remove(lease_id)
+            self.assertRaises(xlease.NoSuchLease, vol.lookup, lease_id)
+            new_id = make_uuid()
+            lease = vol.add(new_id)
+            self.assertEqual(lease.offset, leases[lease_id]["offset"])
+            self.assertEqual(vol.lookup(new_id), lease)
+
+    def test_index_loaded_from_storage(self):
+        lease_id = make_uuid()
+        recnum = 42
+        record = xlease.Record(lease_id, xlease.lease_offset(recnum))
+        with make_volume((recnum, record)) as vol:
+            lease = vol.lookup(lease_id)
+            self.assertEqual(lease.offset, xlease.lease_offset(recnum))
+            self.assertEqual(list(vol.leases()), [lease_id])
+
+    def test_index_duplicate_lease(self):
+        lease_id = make_uuid()
+        records = [(recnum, xlease.Record(lease_id,
+                                          xlease.lease_offset(recnum)))
+                   for recnum in (7, 3)]
+        with make_volume(*records) as vol:
+            # Like a search in the index, the first record wins.
+            lease = vol.lookup(lease_id)
+            self.assertEqual(lease.offset, xlease.lease_offset(3))
+
+    @slowtest
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_time_full_index(self):
+        with make_full_volume() as vol:
+            lease_ids = list(vol.leases())
+            count = 1000
+            start = time.time()
+            for i in range(count):
+                vol.lookup(lease_ids[i % len(lease_ids)])
+            lookup_time = time.time() - start
+
+            # Note: this does not include the time to write to storage.
+            start = time.time()
+            for i in range(count):
+                index = vol._index
+                recnum = index.find_record(lease_ids[-1])
+                index.write_record(recnum, xlease.EMPTY_RECORD)
+                recnum = index.find_free_record()
+                index.write_record(recnum, xlease.Record(
+                    lease_ids[-1], xlease.lease_offset(recnum)))
+            update_time = time.time() - start
+
+            start = time.time()
+            vol.leases()
+            leases_time = time.time() - start
+
+            print("%d leases: %d lookups in %.6f seconds, %d remove+add in "
+                  "%.6f seconds, all leases in %.6f seconds"
+                  % (len(lease_ids), count, lookup_time, count, update_time,
+                     leases_time))
+
     @slowtest
     def test_time_lookup(self):
         setup = """
@@ -380,6 +448,26 @@ def make_volume(*records):
                 yield vol
 
 
+@contextmanager
+def make_full_volume():
+    with make_leases() as path:
+        lockspace = os.path.basename(os.path.dirname(path))
+        file = xlease.DirectFile(path)
+        with utils.closing(file):
+            xlease.format_index(lockspace, file)
+            index = xlease.VolumeIndex()
+            with utils.closing(index):
+                index.load(file)
+                for recnum in range(xlease.MAX_RECORDS):
+                    record = xlease.Record(make_uuid(),
+                                           xlease.lease_offset(recnum))
+                    index.write_record(recnum, record)
+                index.dump(file)
+            vol = xlease.LeasesVolume(file)
+            with utils.closing(vol):
+                yield vol
+
+
 @contextmanager
 def make_leases():
     with namedTemporaryDir() as tmpdir:
@@ -84,6 +84,7 @@ class FakeLVM(object):
                      vg_mda_free=None,
                      lv_count='0',
                      pv_count=str(len(devices)),
+                     vg_seqno='1',
                      pv_name=pv_name,
                      writeable=True,
                      partial='OK')
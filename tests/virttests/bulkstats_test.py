@@ -0,0 +1,200 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+import copy
+import timeit
+
+from vdsm.virt import bulkstats
+from vdsm.virt import sampling
+from vdsm.virt import vmstats
+
+from testlib import VdsmTestCase
+from testlib import permutations, expandPermutations
+from testValidation import slowtest
+
+from .vmstats_test import _FAKE_BULK_STATS
+from .vmstats_test import FakeDrive, FakeNic, FakeVM
+
+
+VM_ID = 'f3243a90-2e9e-4061-b7b3-a6c585e14857'
+
+
+def make_vm(sample):
+    nics = [FakeNic(sample['net.%d.name' % i], 'virtio', '00:1a:4a:16:01:51')
+            for i in range(sample['net.count'])]
+    drives = [FakeDrive(sample['block.%d.name' % i], 1024)
+              for i in range(sample['block.count'])]
+    return FakeVM(nics=nics, drives=drives)
+
+
+def without_sample_time(stats):
+    for nic_stats in stats['network'].values():
+        del nic_stats['sampleTime']
+    return stats
+
+
+@expandPermutations
+class ComputeTests(VdsmTestCase):
+
+    def setUp(self):
+        self.first, self.last = _FAKE_BULK_STATS[VM_ID][:2]
+        self.vm = make_vm(self.last)
+
+    @permutations([[10], [0]])
+    def test_same_as_vmstats(self, interval):
+        self.check(self.first, self.last, interval)
+
+    @permutations([
+        ['block.0.rd.bytes'], ['block.1.wr.times'], ['block.2.fl.reqs'],
+        ['net.0.rx.errs'], ['net.1.tx.bytes'], ['cpu.time'], ['cpu.user'],
+    ])
+    def test_missing_counter(self, key):
+        # vmstats tolerates missing counters only if the vm is not
+        # monitorable; compute() always tolerates them.
+        self.vm.migrationPending = True
+        last = copy.deepcopy(self.last)
+        del last[key]
+        self.check(self.first, last, 10)
+
+    @permutations([['net.1.rx.errs'], ['net.1.tx.bytes']])
+    def test_missing_nic_counter_monitorable(self, key):
+        last = copy.deepcopy(self.last)
+        del last[key]
+        computed = bulkstats.compute(bulkstats.Sample({VM_ID: self.first}),
+                                     bulkstats.Sample({VM_ID: last}),
+                                     10)[VM_ID]
+        self.assertRaises(KeyError, vmstats.networks, self.vm, {},
+                          self.first, last, 10)
+        self.assertRaises(KeyError, vmstats.networks, self.vm, {},
+                          self.first, last, 10, computed)
+
+    def test_new_device(self):
+        first = copy.deepcopy(self.first)
+        first['block.count'] -= 1
+        first['net.count'] -= 1
+        self.check(first, self.last, 10)
+
+    def test_missing_vm(self):
+        computed = bulkstats.compute(bulkstats.Sample({}),
+                                     bulkstats.Sample({VM_ID: self.last}),
+                                     10)
+        self.assertEqual(computed, {})
+
+    def check(self, first, last, interval):
+        computed = bulkstats.compute(bulkstats.Sample({VM_ID: first}),
+                                     bulkstats.Sample({VM_ID: last}),
+                                     interval)[VM_ID]
+
+        expected = {}
+        vmstats.cpu(expected, first, last, interval)
+        vmstats.networks(self.vm, expected, first, last, interval)
+        vmstats.disks(self.vm, expected, first, last, interval)
+
+        stats = {}
+        stats.update(computed.cpu)
+        vmstats.networks(self.vm, stats, first, last, interval, computed)
+        vmstats.disks(self.vm, stats, first, last, interval, computed)
+
+        if interval > 0:
+            expected = without_sample_time(expected)
+            stats = without_sample_time(stats)
+        self.assertEqual(stats, expected)
+
+
+class StatsCacheTests(VdsmTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = sampling.StatsCache(clock=self.clock, columnar=True)
+
+    def test_not_columnar(self):
+        cache = sampling.StatsCache(clock=self.clock)
+        cache.put({VM_ID: {}}, self.clock.tick())
+        cache.put({VM_ID: {}}, self.clock.tick())
+        self.assertIsNone(cache.get_with_computed(VM_ID)[1])
+
+    def test_one_sample(self):
+        self.cache.put({VM_ID: {}}, self.clock.tick())
+        self.assertIsNone(self.cache.get_with_computed(VM_ID)[1])
+
+    def test_cached_until_next_sample(self):
+        first, last = _FAKE_BULK_STATS[VM_ID][:2]
+        self.cache.put({VM_ID: first}, self.clock.tick())
+        self.cache.put({VM_ID: last}, self.clock.tick())
+        computed = self.cache.get_with_computed(VM_ID)[1]
+        self.assertIs(self.cache.get_with_computed(VM_ID)[1], computed)
+
+        self.cache.put({VM_ID: last}, self.clock.tick())
+        self.assertIsNot(self.cache.get_with_computed(VM_ID)[1], computed)
+
+    def test_batch(self):
+        first, last = _FAKE_BULK_STATS[VM_ID][:2]
+        self.cache.put({VM_ID: first}, self.clock.tick())
+        self.cache.put({VM_ID: last}, self.clock.tick())
+        self.cache.add(VM_ID)
+        samples, computed = self.cache.get_batch_with_computed()
+        self.assertEqual(samples, self.cache.get_batch())
+        self.assertIsNotNone(computed[VM_ID])
+        self.assertIs(self.cache.get_with_computed(VM_ID)[1],
+                      computed[VM_ID])
+
+    def test_stale_sample(self):
+        first, last = _FAKE_BULK_STATS[VM_ID][:2]
+        self.cache.put({VM_ID: first}, self.clock.tick())
+        stale = self.clock.now
+        self.cache.put({VM_ID: last}, self.clock.tick())
+        computed = self.cache.get_with_computed(VM_ID)[1]
+        self.cache.put({VM_ID: first}, stale - 1)
+        self.assertIs(self.cache.get_with_computed(VM_ID)[1], computed)
+
+    @slowtest
+    def test_time_compute(self):
+        setup = """
+from vdsm.virt import bulkstats
+from virttests.vmstats_test import _FAKE_BULK_STATS
+
+first, last = _FAKE_BULK_STATS[%r][:2]
+first = {'vm-%%d' %% i: first for i in range(%d)}
+last = {'vm-%%d' %% i: last for i in range(%d)}
+
+def bench():
+    bulkstats.compute(bulkstats.Sample(first), bulkstats.Sample(last), 15)
+"""
+        count = 10
+        vms = 300
+        elapsed = timeit.timeit("bench()", setup=setup % (VM_ID, vms, vms),
+                                number=count)
+        print("%d VMs flattened and computed in %.6f seconds"
+              % (vms, elapsed / count))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def tick(self):
+        self.now += 15
+        return self.now
@@ -0,0 +1,228 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import logging
+
+import libvirt
+
+from vdsm import constants
+from vdsm.virt import drivemonitor
+from vdsm.virt import periodic
+from vdsm.virt.vmdevices import hwclass
+from vdsm.virt.vmdevices.storage import BLOCK_THRESHOLD
+from vdsm.virt.vmdevices.storage import DISK_TYPE
+from vdsm.virt.vmdevices.storage import Drive
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testlib import make_uuid
+import vmfakelib as fake
+
+GiB = constants.GIB
+
+
+class FakeDomain(object):
+    """
+    Emulate libvirt block threshold events: when the guest writes above the
+    threshold of a drive, the threshold is removed and an event is emitted.
+    """
+
+    def __init__(self, on_event):
+        self._on_event = on_event
+        self.devices = {}
+        self.block_info = {}
+        self.thresholds = {}
+        self.block_info_calls = 0
+
+    def add_drive(self, drive, capacity, physical):
+        self.devices[drive.name] = drive.path
+        self.block_info[drive.path] = (capacity, 0, physical)
+
+    def controlInfo(self):
+        return (libvirt.VIR_DOMAIN_CONTROL_OK, 0, 0)
+
+    def blockInfo(self, path, flags=0):
+        self.block_info_calls += 1
+        return self.block_info[path]
+
+    def setBlockThreshold(self, dev, threshold, flags=0):
+        self.thresholds[dev] = threshold
+        # Like libvirt, emit the event if the threshold was already exceeded.
+        self._check_threshold(dev)
+
+    def write(self, drive, alloc):
+        capacity, _, physical = self.block_info[drive.path]
+        self.block_info[drive.path] = (capacity, alloc, physical)
+        self._check_threshold(drive.name)
+
+    def extend(self, drive, physical):
+        capacity, alloc, _ = self.block_info[drive.path]
+        self.block_info[drive.path] = (capacity, alloc, physical)
+
+    def _check_threshold(self, dev):
+        threshold = self.thresholds.get(dev)
+        if threshold is None:
+            return
+        path = self.devices[dev]
+        capacity, alloc, physical = self.block_info[path]
+        if alloc > threshold:
+            del self.thresholds[dev]
+            self._on_event(dev + "[1]", path, threshold, alloc - threshold)
+
+
+class FakeExecutor(object):
+    """
+    Run dispatched operations immediately.
+    """
+
+    def dispatch(self, callable, timeout=None, discard=True):
+        callable()
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class DriveMonitorTests(VdsmTestCase):
+
+    def test_polling(self):
+        with fake_vm(events=False) as (vm, dom, drive, extended):
+            self.assertTrue(vm.needsDriveMonitoring())
+            vm.extendDrivesIfNeeded()
+            self.assertEqual(dom.thresholds, {})
+            self.assertEqual(dom.block_info_calls, 1)
+            self.assertTrue(vm.needsDriveMonitoring())
+
+    def test_set_threshold(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            self.assertTrue(vm.needsDriveMonitoring())
+            vm.extendDrivesIfNeeded()
+            self.assertEqual(dom.thresholds,
+                             {"vda": GiB - drive.watermarkLimit})
+            self.assertEqual(drive.threshold_state, BLOCK_THRESHOLD.SET)
+            self.assertEqual(extended, [])
+
+    def test_no_polling_below_threshold(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            dom.write(drive, GiB // 2)
+            self.assertFalse(vm.needsDriveMonitoring())
+            vm.extendDrivesIfNeeded()
+            self.assertEqual(dom.block_info_calls, 1)
+
+    def test_extend_on_event(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            dom.write(drive, GiB - drive.watermarkLimit // 2)
+            # The event is handled immediately, not in the next cycle.
+            self.assertEqual(len(extended), 1)
+            self.assertEqual(drive.threshold_state, BLOCK_THRESHOLD.EXCEEDED)
+            self.assertTrue(vm.needsDriveMonitoring())
+
+    def test_set_threshold_after_extend(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            dom.write(drive, GiB - drive.watermarkLimit // 2)
+            dom.extend(drive, extended[0]["newSize"])
+            vm.extendDrivesIfNeeded()
+            self.assertEqual(len(extended), 1)
+            self.assertEqual(
+                dom.thresholds,
+                {"vda": extended[0]["newSize"] - drive.watermarkLimit})
+            self.assertFalse(vm.needsDriveMonitoring())
+
+    def test_threshold_exceeded_when_set(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            with MonkeyPatchScope([(periodic, "_executor", None)]):
+                vm.extendDrivesIfNeeded()
+                # Guest wrote before the threshold was set again.
+                drive.threshold_state = BLOCK_THRESHOLD.UNSET
+                dom.block_info[drive.path] = (
+                    20 * GiB, GiB - drive.watermarkLimit // 2, GiB)
+                vm._driveMonitor.set_threshold(drive, GiB)
+            self.assertEqual(drive.threshold_state, BLOCK_THRESHOLD.EXCEEDED)
+            self.assertTrue(vm.needsDriveMonitoring())
+
+    def test_path_changed(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            drive.path = "/dev/vg/new-volume"
+            drive._blockDev = True
+            self.assertEqual(drive.threshold_state, BLOCK_THRESHOLD.UNSET)
+            self.assertTrue(vm.needsDriveMonitoring())
+
+    def test_safety_interval(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            vm._driveMonitor._clock.now += 60
+            self.assertTrue(vm.needsDriveMonitoring())
+            vm.extendDrivesIfNeeded()
+            self.assertEqual(dom.block_info_calls, 2)
+            self.assertFalse(vm.needsDriveMonitoring())
+
+    def test_replicating(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.extendDrivesIfNeeded()
+            drive.diskReplicate = {"diskType": DISK_TYPE.FILE,
+                                   "format": "cow"}
+            self.assertTrue(vm.needsDriveMonitoring())
+
+    def test_unknown_drive(self):
+        with fake_vm() as (vm, dom, drive, extended):
+            vm.onBlockThreshold("vdb", "/dev/vg/lv", GiB, 1)
+            self.assertEqual(drive.threshold_state, BLOCK_THRESHOLD.UNSET)
+
+    def test_drive_name(self):
+        self.assertEqual(drivemonitor.drive_name("vda"), "vda")
+        self.assertEqual(drivemonitor.drive_name("sdb[3]"), "sdb")
+
+
+@contextmanager
+def fake_vm(events=True):
+    extended = []
+
+    def sendExtendMsg(poolID, volInfo, newSize, func):
+        extended.append(volInfo)
+
+    with MonkeyPatchScope([(periodic, "_executor", FakeExecutor())]):
+        with fake.VM() as vm:
+            vm.cif.irs.sendExtendMsg = sendExtendMsg
+            vm._monitorable = True
+            vm._driveMonitorEnabled = True
+            vm._driveMonitor = drivemonitor.DriveMonitor(
+                vm, logging.getLogger("test"), events=events,
+                safety_interval=60, clock=FakeClock())
+            dom = FakeDomain(vm.onBlockThreshold)
+            vm._dom = dom
+            drive = Drive(vm.log, iface="virtio", index=0, device="disk",
+                          path="/dev/vg/volume", format="cow",
+                          domainID=make_uuid(), poolID=make_uuid(),
+                          imageID=make_uuid(), volumeID=make_uuid())
+            drive._blockDev = True
+            vm._devices[hwclass.DISK] = [drive]
+            dom.add_drive(drive, 20 * GiB, GiB)
+            yield vm, dom, drive, extended
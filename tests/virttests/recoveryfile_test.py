@@ -0,0 +1,269 @@
+#
+# Copyright 2017 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+from __future__ import absolute_import
+from __future__ import print_function
+
+import copy
+import errno
+import os
+import tempfile
+import time
+
+from vdsm.common.compat import pickle
+from vdsm.virt import recoveryfile
+
+from monkeypatch import MonkeyPatchScope
+from testlib import VdsmTestCase
+from testlib import expandPermutations, permutations
+from testlib import make_uuid
+from testlib import namedTemporaryDir
+from testValidation import slowtest
+
+
+def make_state():
+    drives = [{'device': 'disk', 'type': 'disk', 'format': 'cow',
+               'iface': 'virtio', 'index': i, 'propagateErrors': 'off',
+               'poolID': make_uuid(), 'domainID': make_uuid(),
+               'imageID': make_uuid(), 'volumeID': make_uuid(),
+               'path': '/rhev/data-center/mnt/blockSD/%s' % make_uuid(),
+               'truesize': '1073741824', 'apparentsize': '1073741824'}
+              for i in range(4)]
+    nics = [{'device': 'bridge', 'type': 'interface', 'nicModel': 'virtio',
+             'macAddr': '00:1a:4a:16:01:%02x' % i, 'network': 'ovirtmgmt',
+             'linkActive': True}
+            for i in range(2)]
+    return {
+        'vmId': make_uuid(),
+        'vmName': 'vm',
+        'status': 'Up',
+        'statusTime': '4296227440',
+        'memSize': 1024,
+        'smp': '2',
+        'display': 'vnc',
+        'devices': drives + nics,
+        'drives': copy.deepcopy(drives),
+        'custom': {},
+        'guestDiskMapping': {},
+        'startTime': time.time(),
+        'username': '',
+        'guestIPs': '',
+        'guestFQDN': '',
+        '_blockJobs': {},
+    }
+
+
+@expandPermutations
+class RecoveryFileTests(VdsmTestCase):
+
+    def test_write_load(self):
+        state = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            recoveryfile.Writer(path).write(state)
+            self.assertEqual(recoveryfile.load(path), state)
+
+    def test_append_changes(self):
+        first = make_state()
+        second = dict(first, status='Paused', statusTime='4296228440')
+        del second['username']
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(first)
+            size = os.path.getsize(path)
+            writer.write(second)
+            with open(path, "rb") as f:
+                f.seek(size)
+                record = f.read()
+            self.assertNotIn(b'devices', record)
+            self.assertEqual(recoveryfile.load(path), second)
+
+    def test_unchanged(self):
+        state = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(state)
+            size = os.path.getsize(path)
+            writer.write(copy.deepcopy(state))
+            self.assertEqual(os.path.getsize(path), size)
+
+    def test_rewrite(self):
+        state = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path, max_records=2)
+            for i in range(3):
+                state = dict(state, statusTime=str(i))
+                writer.write(state)
+            with open(path, "rb") as f:
+                lines = f.readlines()
+            self.assertEqual(lines[0], recoveryfile.HEADER)
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(recoveryfile.load(path), state)
+
+    def test_rewrite_removed_file(self):
+        state = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(state)
+            os.unlink(path)
+            state = dict(state, status='Paused')
+            writer.write(state)
+            self.assertEqual(recoveryfile.load(path), state)
+
+    def test_incomplete_last_record(self):
+        first = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(first)
+            with open(path, "ab") as f:
+                f.write(b'{"set":{"status":"Pau')
+            self.assertEqual(recoveryfile.load(path), first)
+
+    def test_short_write(self):
+        first = make_state()
+        second = dict(first, status='Paused')
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(first)
+
+            real_write = os.write
+
+            def short_write(fd, data):
+                return real_write(fd, data[:10])
+
+            with MonkeyPatchScope([(recoveryfile.os, "write", short_write)]):
+                writer.write(second)
+            self.assertEqual(recoveryfile.load(path), second)
+            with open(path, "rb") as f:
+                self.assertEqual(len(f.readlines()), 2)
+
+    def test_failed_write(self):
+        first = make_state()
+        second = dict(first, status='Paused')
+        third = dict(second, statusTime='4296228440')
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            writer.write(first)
+
+            real_write = os.write
+
+            def failed_write(fd, data):
+                real_write(fd, data[:10])
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+            with MonkeyPatchScope([(recoveryfile.os, "write", failed_write)]):
+                self.assertRaises(OSError, writer.write, second)
+            writer.write(third)
+            self.assertEqual(recoveryfile.load(path), third)
+
+    @permutations([
+        [{'watchdog': ('i6300esb', 'none')}],
+        [{'numaTune': {0: 'strict'}}],
+    ])
+    def test_not_json_compatible(self, custom):
+        state = make_state()
+        state['custom'] = custom
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            self.assertRaises(TypeError, writer.write, state)
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_invalid_record(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            with open(path, "wb") as f:
+                f.write(recoveryfile.HEADER)
+                f.write(b'{"set":{"status":"Pau\n')
+                f.write(b'{"set":{"status":"Up"},"del":[]}\n')
+            self.assertRaises(recoveryfile.Error, recoveryfile.load, path)
+
+    def test_no_state(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            with open(path, "wb") as f:
+                f.write(recoveryfile.HEADER)
+            self.assertRaises(recoveryfile.Error, recoveryfile.load, path)
+
+    def test_load_pickle(self):
+        state = make_state()
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            with open(path, "wb") as f:
+                pickle.dump(state, f)
+            self.assertEqual(recoveryfile.load(path), state)
+
+    def test_not_json(self):
+        state = make_state()
+        state['custom'] = {'device': object()}
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "vm.recovery")
+            writer = recoveryfile.Writer(path)
+            self.assertRaises(TypeError, writer.write, state)
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    @slowtest
+    def test_time_save_and_recover(self):
+        vms = 500
+        saves = 10
+        states = [make_state() for i in range(vms)]
+
+        with namedTemporaryDir() as tmpdir:
+
+            def pickle_save(vm_id, state):
+                path = os.path.join(tmpdir, vm_id + ".pickle")
+                with tempfile.NamedTemporaryFile(
+                        dir=tmpdir, delete=False) as f:
+                    pickle.dump(state, f)
+                os.rename(f.name, path)
+
+            writers = {}
+
+            def recovery_save(vm_id, state):
+                if vm_id not in writers:
+                    path = os.path.join(tmpdir, vm_id + ".recovery")
+                    writers[vm_id] = recoveryfile.Writer(path)
+                writers[vm_id].write(state)
+
+            for name, save in (("pickle", pickle_save),
+                               ("recoveryfile", recovery_save)):
+                start = time.time()
+                for i in range(saves):
+                    for state in states:
+                        state = dict(state, statusTime=str(i))
+                        save(state['vmId'], state)
+                elapsed = time.time() - start
+                print("%s: %.6f seconds per save" %
+                      (name, elapsed / (saves * vms)))
+
+            for ext in (".pickle", ".recovery"):
+                start = time.time()
+                for state in states:
+                    path = os.path.join(tmpdir, state['vmId'] + ext)
+                    recoveryfile.load(path)
+                elapsed = time.time() - start
+                print("%s: loaded %d VMs in %.3f seconds" % (ext, vms,
+                                                             elapsed))
@@ -24,8 +24,8 @@ import os
 import threading
 
 from vdsm.common import response
-from vdsm.common.compat import pickle
 from vdsm.virt import recovery
+from vdsm.virt import recoveryfile
 from vdsm.virt import vmstatus
 from vdsm import constants
 from vdsm import containersconnection
@@ -59,8 +59,7 @@ class RecoveryFileTests(TestCaseBase):
             rec = recovery.File(testvm.id)
             rec.save(testvm)
 
-            with open(os.path.join(tmpdir, rec.name), 'rb') as f:
-                self.assertTrue(pickle.load(f))
+            self.assertTrue(recoveryfile.load(os.path.join(tmpdir, rec.name)))
 
     def test_save_after_cleanup(self):
 
@@ -25,6 +25,9 @@ A vm hook expects domain xml in a file named by an environment variable called
 _hook_domxml. The hook may change the xml, but the "china store rule" applies -
 if you break something, you own it.
 
+A hook run by the hookrunner helper receives the xml or json in memory instead
+of a file; hooks must use the read and write functions below to access it.
+
 before_migration_destination hook receives the xml of the domain from the
 source host. The xml of the domain at the destination will differ in various
 details.
@@ -49,25 +52,40 @@ from vdsm.common.conv import tobool
 execCmd
 tobool
 
+# The hook xml or json when the hook is run by the hookrunner helper.
+_payload = None
+
 
 def read_domxml():
-    with open(os.environ['_hook_domxml']) as f:
-        return minidom.parseString(f.read())
+    return minidom.parseString(_read('_hook_domxml'))
 
 
 def write_domxml(domxml):
-    with open(os.environ['_hook_domxml'], 'w') as f:
-        f.write(domxml.toxml(encoding='utf-8'))
+    _write('_hook_domxml', domxml.toxml(encoding='utf-8'))
 
 
 def read_json():
-    with open(os.environ['_hook_json']) as f:
-        return json.loads(f.read())
+    return json.loads(_read('_hook_json'))
 
 
 def write_json(data):
-    with open(os.environ['_hook_json'], 'w') as f:
-        f.write(json.dumps(data))
+    _write('_hook_json', json.dumps(data))
+
+
+def _read(name):
+    if _payload is not None:
+        return _payload
+    with open(os.environ[name]) as f:
+        return f.read()
+
+
+def _write(name, data):
+    global _payload
+    if _payload is not None:
+        _payload = data
+        return
+    with open(os.environ[name], 'w') as f:
+        f.write(data)
 
 
 def log(message):
@@ -30,7 +30,6 @@ import functools
 import sys
 from collections import namedtuple
 from contextlib import contextmanager
-from operator import itemgetter
 
 import six
 
@@ -44,7 +43,6 @@ from vdsm import utils
 from vdsm.storage import blockdev
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
-from vdsm.storage import directio
 from vdsm.storage import exception as se
 from vdsm.storage import fileUtils
 from vdsm.storage import fsutils
@@ -328,9 +326,7 @@ class LvMetadataRW(object):
         metaStr.write('\0' * (self._size - metaStr.pos))
 
         data = metaStr.getvalue()
-        with directio.DirectFile(self.metavol, "r+") as f:
-            f.seek(self._offset)
-            f.write(data)
+        misc.writeblock(self.metavol, self._offset, data)
 
 LvBasedSDMetadata = lambda vg, lv: DictValidator(
     PersistentDict(LvMetadataRW(vg, lv, 0, SD_METADATA_SIZE)),
@@ -365,6 +361,107 @@ def metadataValidity(vg):
     return {'mdathreshold': mda_free_ok, 'mdavalid': mda_size_ok}
 
 
+class MetadataSlotMap(object):
+    """
+    Map of the volume metadata slots used by the LVs of a block domain.
+
+    The map is built from the LV tags, and synchronized with the domain LVs
+    before allocating a slot, adding LVs created and removing LVs deleted
+    since the last allocation, by this host or by another host. Only the
+    tags of new LVs are parsed when synchronizing, and the first free slot
+    is found using an occupancy bitmap.
+
+    Not thread safe; the caller must hold the domain metadata slot lock.
+    """
+
+    def __init__(self, sdUUID, firstSlot, log):
+        self._sdUUID = sdUUID
+        self._firstSlot = firstSlot
+        self._log = log
+        # {lvName: (offset, size)}
+        self._slots = {}
+        # Number of LVs using every slot. Slots before firstSlot are never
+        # allocated.
+        self._used = bytearray(firstSlot)
+        # All slots before this slot are used.
+        self._firstFree = firstSlot
+
+    def sync(self, lvs):
+        """
+        Synchronize the map with lvs, the current domain LVs, not including
+        special LVs.
+        """
+        names = set()
+        for lv in lvs:
+            names.add(lv.name)
+            if lv.name in self._slots:
+                continue
+            slot = _metadataSlot(lv)
+            if slot is None:
+                self._log.warn("Could not find mapping for lv %s/%s",
+                               self._sdUUID, lv.name)
+                continue
+            self.add(lv.name, *slot)
+
+        for name in set(self._slots) - names:
+            self.remove(name)
+
+    def add(self, lvName, offset, size):
+        """
+        Mark size slots starting at offset as used by lvName.
+        """
+        self._slots[lvName] = (offset, size)
+        end = offset + size
+        if end > len(self._used):
+            self._used.extend(bytearray(end - len(self._used)))
+        for i in range(offset, end):
+            if self._used[i] < 255:
+                self._used[i] += 1
+
+    def remove(self, lvName):
+        offset, size = self._slots.pop(lvName)
+        for i in range(offset, offset + size):
+            if self._used[i] > 0:
+                self._used[i] -= 1
+        if self._firstSlot <= offset < self._firstFree:
+            self._firstFree = offset
+
+    def find(self, size):
+        """
+        Return the offset of the first free range of size slots.
+        """
+        while (self._firstFree < len(self._used) and
+               self._used[self._firstFree]):
+            self._firstFree += 1
+
+        offset = self._firstFree
+        while True:
+            end = min(offset + size, len(self._used))
+            for i in range(end - 1, offset - 1, -1):
+                if self._used[i]:
+                    offset = i + 1
+                    break
+            else:
+                return offset
+
+
+def _metadataSlot(lv):
+    """
+    Return the metadata slot (offset, size) of lv, or None if the lv has no
+    metadata slot tag.
+    """
+    offset = None
+    size = sc.VOLUME_MDNUMBLKS
+    for tag in lv.tags:
+        if tag.startswith(sc.TAG_PREFIX_MD):
+            offset = int(tag[len(sc.TAG_PREFIX_MD):])
+        elif tag.startswith(sc.TAG_PREFIX_MDNUMBLKS):
+            size = int(tag[len(sc.TAG_PREFIX_MDNUMBLKS):])
+    if offset is None:
+        return None
+    return offset, size
+
+
 class BlockStorageDomainManifest(sd.StorageDomainManifest):
     mountpoint = os.path.join(sd.StorageDomain.storage_repository,
                               sd.DOMAIN_MNT_POINT, sd.BLOCKSD_DIR)
@@ -380,6 +477,9 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
         # VG extend and LV extend.
         self._extendlock = threading.Lock()
 
+        # Created when allocating the first metadata slot.
+        self._metadataSlotMap = None
+
         try:
             self.logBlkSize = self.getMetaParam(DMDK_LOGBLKSIZE)
             self.phyBlkSize = self.getMetaParam(DMDK_PHYBLKSIZE)
@@ -815,56 +915,25 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
                                       (self.sdUUID, dev, ext))
 
     def _getFreeMetadataSlot(self, slotSize):
-        occupiedSlots = self._getOccupiedMetadataSlots()
+        if self._metadataSlotMap is None:
+            # It might look weird skipping the sd metadata when it has been
+            # moved to tags. But this is here because domain metadata and
+            # volume metadata look the same. The domain might get confused
+            # and think it has lv metadata if it finds something is written
+            # in that area.
+            firstSlot = ((SD_METADATA_SIZE + self.logBlkSize - 1) //
+                         self.logBlkSize)
+            self._metadataSlotMap = MetadataSlotMap(self.sdUUID, firstSlot,
+                                                    self.log)
 
-        # It might look weird skipping the sd metadata when it has been moved
-        # to tags. But this is here because domain metadata and volume metadata
-        # look the same. The domain might get confused and think it has lv
-        # metadata if it finds something is written in that area.
-        freeSlot = (SD_METADATA_SIZE + self.logBlkSize - 1) / self.logBlkSize
-
-        for offset, size in occupiedSlots:
-            if offset >= freeSlot + slotSize:
-                break
-
-            freeSlot = offset + size
+        special_lvs = self.special_volumes(self.getVersion())
+        self._metadataSlotMap.sync(lv for lv in lvm.getLV(self.sdUUID)
+                                   if lv.name not in special_lvs)
+        freeSlot = self._metadataSlotMap.find(slotSize)
 
         self.log.debug("Found freeSlot %s in VG %s", freeSlot, self.sdUUID)
         return freeSlot
 
-    def _getOccupiedMetadataSlots(self):
-        stripPrefix = lambda s, pfx: s[len(pfx):]
-        occupiedSlots = []
-        special_lvs = self.special_volumes(self.getVersion())
-        for lv in lvm.getLV(self.sdUUID):
-            if lv.name in special_lvs:
-                # Special LVs have no mapping
-                continue
-
-            offset = None
-            size = sc.VOLUME_MDNUMBLKS
-            for tag in lv.tags:
-                if tag.startswith(sc.TAG_PREFIX_MD):
-                    offset = int(stripPrefix(tag, sc.TAG_PREFIX_MD))
-
-                if tag.startswith(sc.TAG_PREFIX_MDNUMBLKS):
-                    size = int(stripPrefix(tag,
-                                           sc.TAG_PREFIX_MDNUMBLKS))
-
-                if offset is not None and size != sc.VOLUME_MDNUMBLKS:
-                    # I've found everything I need
-                    break
-
-            if offset is None:
-                self.log.warn("Could not find mapping for lv %s/%s",
-                              self.sdUUID, lv.name)
-                continue
-
-            occupiedSlots.append((offset, size))
-
-        occupiedSlots.sort(key=itemgetter(0))
-        return occupiedSlots
-
     def validateCreateVolumeParams(self, volFormat, srcVolUUID,
                                    preallocate=None):
         super(BlockStorageDomainManifest, self).validateCreateVolumeParams(
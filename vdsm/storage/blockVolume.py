@@ -28,7 +28,6 @@ from vdsm.common.threadlocal import vars
 from vdsm.config import config
 from vdsm.storage import blockdev
 from vdsm.storage import constants as sc
-from vdsm.storage import directio
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
 from vdsm.storage import misc
@@ -244,9 +243,7 @@ class BlockVolumeManifest(volume.VolumeManifest):
         data += "\0" * (sc.METADATA_SIZE - len(data))
 
         metavol = lvm.lvPath(vgname, sd.METADATA)
-        with directio.DirectFile(metavol, "r+") as f:
-            f.seek(offs * sc.METADATA_SIZE)
-            f.write(data)
+        misc.writeblock(metavol, offs * sc.METADATA_SIZE, data)
 
     def changeVolumeTag(self, tagPrefix, uuid):
 
@@ -334,6 +331,50 @@ class BlockVolumeManifest(volume.VolumeManifest):
         lvs = lvm.lvsByTag(sdUUID, "%s%s" % (sc.TAG_PREFIX_IMAGE, imgUUID))
         return [lv.name for lv in lvs]
 
+    @classmethod
+    def getImageParents(cls, repoPath, sdUUID, imgUUID):
+        """
+        Return a dict mapping the UUIDs of the image volumes (not including
+        the shared base) to their parent UUIDs, using the LV tags of all the
+        image volumes, or None if some volumes are being created.
+        """
+        lvs = lvm.lvsByTag(sdUUID, "%s%s" % (sc.TAG_PREFIX_IMAGE, imgUUID))
+        parents = {}
+        for lv in lvs:
+            if sc.TEMP_VOL_LVTAG in lv.tags or sc.TAG_VOL_UNINIT in lv.tags:
+                return None
+            for tag in lv.tags:
+                if tag.startswith(sc.TAG_PREFIX_PARENT):
+                    parents[lv.name] = tag[len(sc.TAG_PREFIX_PARENT):]
+                    break
+            else:
+                return None
+        return parents
+
+    @classmethod
+    def getVolumesMetadata(cls, repoPath, sdUUID, imgUUID, volUUIDs):
+        """
+        Return a dict mapping volUUIDs to the metadata of the volumes, read
+        from the domain metadata volume in one call.
+        """
+        ranges = []
+        for volUUID in volUUIDs:
+            try:
+                offs = int(getVolumeTag(sdUUID, volUUID, sc.TAG_PREFIX_MD))
+            except se.MissingTagOnLogicalVolume:
+                raise se.VolumeMetadataReadError(
+                    "missing offset tag on volume %s/%s" % (sdUUID, volUUID))
+            ranges.append((offs * sc.METADATA_SIZE, sc.METADATA_SIZE))
+
+        try:
+            blocks = misc.readblocks(lvm.lvPath(sdUUID, sd.METADATA), ranges)
+        except Exception as e:
+            cls.log.error(e, exc_info=True)
+            raise se.VolumeMetadataReadError("%s: %s" % (sdUUID, e))
+
+        return {volUUID: VolumeMetadata.from_lines(lines).legacy_info()
+                for volUUID, lines in zip(volUUIDs, blocks)}
+
     @classmethod
     def calculate_volume_alloc_size(cls, preallocate, capacity, initial_size):
         """ Calculate the allocation size in mb of the volume
@@ -338,6 +338,30 @@ class FileVolumeManifest(volume.VolumeManifest):
                 volList.append(volid)
         return volList
 
+    @classmethod
+    def getImageParents(cls, repoPath, sdUUID, imgUUID):
+        """
+        Return a dict mapping the UUIDs of the image volumes (not including
+        the shared base) to their parent UUIDs, reading the metadata of every
+        image volume once.
+        """
+        pattern = os.path.join(repoPath, sdUUID, sd.DOMAIN_IMAGES,
+                               imgUUID, "*.meta")
+        ioproc = oop.getProcessPool(sdUUID)
+        parents = {}
+        for metaPath in ioproc.glob.glob(pattern):
+            volUUID = os.path.splitext(os.path.basename(metaPath))[0]
+            try:
+                lines = ioproc.directReadLines(metaPath)
+            except Exception as e:
+                cls.log.error(e, exc_info=True)
+                raise se.VolumeMetadataReadError("%s: %s" % (metaPath, e))
+            md = VolumeMetadata.from_lines(lines)
+            # The shared base (template) is linked into the image directory.
+            if md.image == imgUUID:
+                parents[volUUID] = md.puuid
+        return parents
+
     def llPrepare(self, rw=False, setrw=False):
         """
         Make volume accessible as readonly (internal) or readwrite (leaf)
@@ -53,3 +53,9 @@ class GlusterStorageDomain(nfsSD.NfsStorageDomain):
 
 def findDomain(sdUUID):
     return GlusterStorageDomain(GlusterStorageDomain.findDomainPath(sdUUID))
+
+
+def getStorageDomainsList():
+    glusterDomPath = os.path.join(sd.GLUSTERSD_DIR, "*")
+    return [sdUUID for sdUUID, domainPath in fileSD.scanDomains(glusterDomPath)
+            if mount.isMounted(os.path.dirname(domainPath))]
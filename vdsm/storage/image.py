@@ -48,6 +48,8 @@ from vdsm.common.exception import ActionStopped
 
 log = logging.getLogger('storage.Image')
 
+_BULK_IMAGE_CHAIN = config.getboolean("irs", "bulk_image_chain")
+
 # Disk type
 UNKNOWN_DISK_TYPE = 0
 SYSTEM_DISK_TYPE = 1
@@ -227,9 +229,16 @@ class Image:
         Return the chain of volumes of image as a sorted list
         (not including a shared base (template) if any)
         """
-        chain = []
         volclass = sdCache.produce(sdUUID).getVolumeClass()
 
+        if _BULK_IMAGE_CHAIN:
+            chain = self._resolveChain(volclass, sdUUID, imgUUID, volUUID)
+            if chain is not None:
+                return [volclass(self.repoPath, sdUUID, imgUUID, volID)
+                        for volID in chain]
+
+        chain = []
+
         # Use volUUID when provided
         if volUUID:
             srcVol = volclass(self.repoPath, sdUUID, imgUUID, volUUID)
@@ -255,10 +264,12 @@ class Image:
                 return [srcVol]
 
             # Searching for the leaf
+            metadata = volclass.getVolumesMetadata(self.repoPath, sdUUID,
+                                                   imgUUID, uuidlist)
             for vol in uuidlist:
                 srcVol = volclass(self.repoPath, sdUUID, imgUUID, vol)
 
-                if srcVol.isLeaf():
+                if metadata[vol][sc.VOLTYPE] == sc.type2name(sc.LEAF_VOL):
                     break
 
                 srcVol = None
@@ -289,6 +300,56 @@ class Image:
 
         return chain
 
+    def _resolveChain(self, volclass, sdUUID, imgUUID, volUUID=None):
+        """
+        Return the UUIDs of the chain of volumes of image, sorted from base to
+        leaf, using the parents of all the image volumes, read in one pass.
+
+        Returns None if the chain cannot be resolved from the parents (e.g.
+        volumes are being created, volUUID is not part of the image, or the
+        base volume parent is not a shared volume), and the metadata of each
+        volume must be checked.
+        """
+        parents = volclass.getImageParents(self.repoPath, sdUUID, imgUUID)
+        if parents is None:
+            return None
+
+        if volUUID is None:
+            if not parents:
+                raise se.ImageDoesNotExistInSD(imgUUID, sdUUID)
+            # The leaf is the only volume which is not a parent of another
+            # volume in the image.
+            children = set(parents.values())
+            leaves = [volID for volID in parents if volID not in children]
+            if len(leaves) != 1:
+                return None
+            volUUID = leaves[0]
+        elif volUUID not in parents:
+            return None
+
+        chain = []
+        while volUUID in parents:
+            if volUUID in chain:
+                self.log.error("Image %s volume %s has invalid parent UUID %s",
+                               imgUUID, chain[0], volUUID)
+                raise se.ImageIsNotLegalChain(imgUUID)
+            chain.insert(0, volUUID)
+            volUUID = parents[volUUID]
+
+        # A parent outside of the image must be the shared base (template).
+        if volUUID != sc.BLANK_UUID:
+            try:
+                parent = volclass(self.repoPath, sdUUID, imgUUID, volUUID)
+                shared = parent.isShared()
+            except se.StorageException as e:
+                self.log.warning("Cannot check image %s volume %s parent %s: "
+                                 "%s", imgUUID, chain[0], volUUID, e)
+                shared = False
+            if not shared:
+                return None
+
+        return chain
+
     def getTemplate(self, sdUUID, imgUUID):
         """
         Return template of the image
@@ -129,3 +129,7 @@ class LocalFsStorageDomain(fileSD.FileStorageDomain):
 
 def findDomain(sdUUID):
     return LocalFsStorageDomain(LocalFsStorageDomain.findDomainPath(sdUUID))
+
+
+def getStorageDomainsList():
+    return [sdUUID for sdUUID, domainPath in fileSD.scanDomains("_*")]
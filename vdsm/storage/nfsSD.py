@@ -124,3 +124,8 @@ class NfsStorageDomain(fileSD.FileStorageDomain):
 
 def findDomain(sdUUID):
     return NfsStorageDomain(NfsStorageDomain.findDomainPath(sdUUID))
+
+
+def getStorageDomainsList():
+    return [sdUUID for sdUUID, domainPath in fileSD.scanDomains("*")
+            if mount.isMounted(os.path.dirname(domainPath))]
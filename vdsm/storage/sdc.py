@@ -24,13 +24,17 @@ for keeping storage related data that is expensive to harvest, but needed often
 """
 import logging
 import threading
+import time
 
+from vdsm import concurrent
 from vdsm.config import config
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
 from vdsm.storage import misc
 from vdsm.storage import multipath
 
+SD_DISCOVERY = config.getboolean('irs', 'sd_discovery')
+
 
 class DomainProxy(object):
     """
@@ -49,6 +53,115 @@ class DomainProxy(object):
         return self._cache._realProduce(self._sdUUID)
 
 
+class _Discovery(object):
+    """
+    Domains listed by all storage types, used to find the storage type of a
+    domain without probing every storage type.
+
+    All storage types are listed concurrently, but the listings are consumed
+    in the order of the storage types, so a domain is found using the same
+    storage type as _findUnfetchedDomain. Looking up a domain waits only for
+    the listings of the storage types preceding its own, so a hung nfs
+    listing does not delay finding block or local domains.
+
+    The listings are kept when the storage is refreshed. Entries are updated
+    one domain at a time: a domain that cannot be found is removed, and a
+    domain found by probing is added.
+    """
+
+    def __init__(self, backends, log):
+        self._backends = backends
+        self._log = log
+        self._cond = threading.Condition(threading.Lock())
+        # Maps backend index to a concurrent.Result with a set of domains.
+        self._results = {}
+        # Backend indexes with a listing in progress.
+        self._listing = set()
+        # Maps sdUUID to the findDomain function of domains found by probing.
+        self._found = {}
+        self._removed = set()
+        self.refresh()
+
+    def refresh(self):
+        """
+        List again storage types whose last listing failed. A storage type
+        which is still being listed is not listed again, so a hung listing
+        does not leave another stuck thread on every refresh.
+        """
+        with self._cond:
+            start = []
+            for i in range(len(self._backends)):
+                if i in self._listing:
+                    continue
+                res = self._results.get(i)
+                if res is not None and res.succeeded:
+                    continue
+                self._results.pop(i, None)
+                self._listing.add(i)
+                start.append(i)
+        for i in start:
+            t = concurrent.thread(self._list, args=(i, self._backends[i]),
+                                  name="discover/%d" % i, log=self._log)
+            t.start()
+
+    def find(self, sdUUID):
+        """
+        Return the findDomain function of the first storage type listing
+        sdUUID, or None if the domain is not listed, or listing a preceding
+        storage type failed.
+        """
+        with self._cond:
+            if sdUUID in self._found:
+                return self._found[sdUUID]
+        for i, mod in enumerate(self._backends):
+            res = self._result(i)
+            if not res.succeeded:
+                return None
+            if sdUUID in res.value:
+                with self._cond:
+                    if sdUUID in self._removed:
+                        return None
+                return mod.findDomain
+        return None
+
+    def add(self, sdUUID, findMethod):
+        """
+        Find sdUUID using findMethod, after probing found the domain.
+        """
+        with self._cond:
+            self._found[sdUUID] = findMethod
+            self._removed.discard(sdUUID)
+
+    def remove(self, sdUUID):
+        """
+        Stop finding sdUUID, after finding it did not find the domain.
+        """
+        with self._cond:
+            self._found.pop(sdUUID, None)
+            self._removed.add(sdUUID)
+
+    def _list(self, i, mod):
+        start = time.time()
+        try:
+            res = concurrent.Result(True, set(mod.getStorageDomainsList()))
+        except Exception as e:
+            self._log.error("Error listing %s domains: %s", mod.__name__, e)
+            res = concurrent.Result(False, e)
+        else:
+            self._log.info("Discovered %d %s domains in %.2f seconds",
+                           len(res.value), mod.__name__, time.time() - start)
+        with self._cond:
+            self._results[i] = res
+            self._listing.discard(i)
+            self._cond.notifyAll()
+
+    def _result(self, i):
+        with self._cond:
+            while i not in self._results:
+                self._cond.wait()
+            return self._results[i]
+
+
 class StorageDomainCache:
     """
     Storage Domain List keeps track of all the storage domains accessible by
@@ -61,13 +174,29 @@ class StorageDomainCache:
     STORAGE_STALE = 1
     STORAGE_REFRESHING = 2
 
-    def __init__(self, storage_repo):
+    def __init__(self, storage_repo, discovery=SD_DISCOVERY):
         self._syncroot = threading.Condition()
         self.__domainCache = {}
         self.__inProgress = set()
         self.__staleStatus = self.STORAGE_STALE
         self.storage_repo = storage_repo
         self.knownSDs = {}  # {sdUUID: mod.findDomain}
+        self._discovery = discovery
+        # _Discovery of visible domains, created on the first lookup.
+        self.__index = None
+        self.__hits = 0
+        self.__misses = 0
+        self.__discoveries = 0
+
+    def stats(self):
+        """
+        Return cache statistics: number of domains found in the cache, not
+        found in the cache, and number of storage discoveries.
+        """
+        with self._syncroot:
+            return {"hits": self.__hits,
+                    "misses": self.__misses,
+                    "discoveries": self.__discoveries}
 
     def invalidateStorage(self):
         with self._syncroot:
@@ -81,6 +210,7 @@ class StorageDomainCache:
         if resize:
             multipath.resize_devices()
         lvm.invalidateCache()
+        self._refreshIndex()
 
         # If a new invalidateStorage request came in after the refresh
         # started then we cannot flag the storages as updated (force a
@@ -114,10 +244,12 @@ class StorageDomainCache:
                 domain = self.__domainCache.get(sdUUID)
 
                 if domain is not None:
+                    self.__hits += 1
                     return domain
 
                 if sdUUID not in self.__inProgress:
                     self.__inProgress.add(sdUUID)
+                    self.__misses += 1
                     break
 
                 self._syncroot.wait()
@@ -144,27 +276,71 @@ class StorageDomainCache:
         try:
             findMethod = self.knownSDs[sdUUID]
         except KeyError:
+            if self._discovery:
+                return self._findIndexedDomain(sdUUID)
             findMethod = self._findUnfetchedDomain
 
         return findMethod(sdUUID)
 
-    def _findUnfetchedDomain(self, sdUUID):
+    def _findIndexedDomain(self, sdUUID):
+        with self._syncroot:
+            index = self.__index
+            if index is None:
+                index = _Discovery(self._backends(), self.log)
+                self.__index = index
+                self.__discoveries += 1
+
+        findMethod = index.find(sdUUID)
+        if findMethod is not None:
+            try:
+                return findMethod(sdUUID)
+            except se.StorageDomainDoesNotExist:
+                self.log.info("Discovered domain %s does not exist",
+                              sdUUID)
+                index.remove(sdUUID)
+            except Exception:
+                self.log.exception("Error looking up discovered domain %s",
+                                   sdUUID)
+
+        # The domain was not visible during discovery, listing its storage
+        # type failed, or looking it up failed; probe all storage types.
+        findMethod, domain = self._probeDomain(sdUUID)
+        index.add(sdUUID, findMethod)
+        return domain
+
+    def _refreshIndex(self):
+        with self._syncroot:
+            index = self.__index
+        if index is not None:
+            index.refresh()
+
+    def _backends(self):
         import blockSD
         import glusterSD
         import localFsSD
         import nfsSD
 
-        self.log.debug("looking for domain %s", sdUUID)
-
         # The order is somewhat important, it's ordered
         # by how quickly get can find the domain. For instance
         # if an nfs mount is unavailable we will get stuck
         # until it times out, this should affect fetching
         # of block\local domains. If for any case in the future
         # this changes, please update the order.
-        for mod in (blockSD, glusterSD, localFsSD, nfsSD):
+        return (blockSD, glusterSD, localFsSD, nfsSD)
+
+    def _findUnfetchedDomain(self, sdUUID):
+        return self._probeDomain(sdUUID)[1]
+
+    def _probeDomain(self, sdUUID):
+        """
+        Return the findDomain function of the first storage type finding
+        sdUUID, and the domain.
+        """
+        self.log.debug("looking for domain %s", sdUUID)
+
+        for mod in self._backends():
             try:
-                return mod.findDomain(sdUUID)
+                return mod.findDomain, mod.findDomain(sdUUID)
             except se.StorageDomainDoesNotExist:
                 pass
             except Exception:
@@ -187,6 +363,7 @@ class StorageDomainCache:
         with self._syncroot:
             lvm.invalidateCache()
             self.__domainCache.clear()
+        self._refreshIndex()
 
     def manuallyAddDomain(self, domain):
         with self._syncroot:
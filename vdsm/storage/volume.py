@@ -693,6 +693,18 @@ class VolumeManifest(object):
     def getImageVolumes(cls, repoPath, sdUUID, imgUUID):
         raise NotImplementedError
 
+    @classmethod
+    def getImageParents(cls, repoPath, sdUUID, imgUUID):
+        raise NotImplementedError
+
+    @classmethod
+    def getVolumesMetadata(cls, repoPath, sdUUID, imgUUID, volUUIDs):
+        """
+        Return a dict mapping volUUIDs to the metadata of the volumes.
+        """
+        return {volUUID: cls(repoPath, sdUUID, imgUUID, volUUID).getMetadata()
+                for volUUID in volUUIDs}
+
     @classmethod
     def newVolumeLease(cls, metaId, sdUUID, volUUID):
         raise NotImplementedError
@@ -1483,6 +1495,15 @@ class Volume(object):
     def getImageVolumes(cls, repoPath, sdUUID, imgUUID):
         return cls.manifestClass.getImageVolumes(repoPath, sdUUID, imgUUID)
 
+    @classmethod
+    def getImageParents(cls, repoPath, sdUUID, imgUUID):
+        return cls.manifestClass.getImageParents(repoPath, sdUUID, imgUUID)
+
+    @classmethod
+    def getVolumesMetadata(cls, repoPath, sdUUID, imgUUID, volUUIDs):
+        return cls.manifestClass.getVolumesMetadata(repoPath, sdUUID, imgUUID,
+                                                    volUUIDs)
+
     def _extendSizeRaw(self, newSize):
         raise NotImplementedError
 
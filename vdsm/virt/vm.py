@@ -46,6 +46,7 @@ from vdsm import concurrent
 from vdsm import constants
 from vdsm import containersconnection
 from vdsm import cpuarch
+from vdsm import executor
 from vdsm import hooks
 from vdsm import host
 from vdsm import hugepages
@@ -63,10 +64,12 @@ from vdsm.host import caps
 from vdsm.network import api as net_api
 from vdsm.storage import fileUtils
 from vdsm.storage import outOfProcess as oop
+from vdsm.virt import drivemonitor
 from vdsm.virt import guestagent
 from vdsm.virt import libvirtxml
 from vdsm.virt import metadata
 from vdsm.virt import migration
+from vdsm.virt import periodic
 from vdsm.virt import recovery
 from vdsm.virt import sampling
 from vdsm.virt import vmchannels
@@ -334,6 +337,7 @@ class Vm(object):
 
         self._usedIndices = defaultdict(list)  # {'ide': [], 'virtio' = []}
         self.disableDriveMonitor()
+        self._driveMonitor = drivemonitor.DriveMonitor(self, self.log)
         self._vmStartEvent = threading.Event()
         self._vmAsyncStartError = None
         self._vmCreationEvent = threading.Event()
@@ -977,10 +981,10 @@ class Vm(object):
         with self._confLock:
             self.conf['timeOffset'] = newTimeOffset
 
-    def _getExtendCandidates(self):
+    def _getExtendCandidates(self, drives):
         ret = []
 
-        for drive in self._chunkedDrives():
+        for drive in drives:
             try:
                 capacity, alloc, physical = self._getExtendInfo(drive)
             except libvirt.libvirtError as e:
@@ -1065,13 +1069,33 @@ class Vm(object):
         This is called every 2 seconds (configurable) by the periodic system.
         If this returns True, the periodic system will invoke
         extendDrivesIfNeeded during this periodic cycle.
+
+        When using block threshold events, only drives without a threshold
+        or with an exceeded threshold need monitoring.
         """
-        return self._driveMonitorEnabled and bool(self._chunkedDrives())
+        return (self._driveMonitorEnabled and
+                self._driveMonitor.needs_check(self._chunkedDrives()))
+
+    def extendDrivesIfNeeded(self, all_drives=False):
+        """
+        Extend chunked drives if needed, checking only the drives that need
+        monitoring, or all chunked drives if all_drives is True.
+
+        When using block threshold events, set a new threshold on the drives
+        that do not need extension.
+        """
+        drives = self._chunkedDrives()
+        if not all_drives:
+            drives = self._driveMonitor.drives_to_check(drives)
 
-    def extendDrivesIfNeeded(self):
         try:
-            extend = [x for x in self._getExtendCandidates()
-                      if self._shouldExtendVolume(*x)]
+            extend = []
+            for candidate in self._getExtendCandidates(drives):
+                if self._shouldExtendVolume(*candidate):
+                    extend.append(candidate)
+                else:
+                    drive, volumeID, capacity, alloc, physical = candidate
+                    self._driveMonitor.set_threshold(drive, physical)
         except ImprobableResizeRequestError:
             return False
 
@@ -1183,7 +1207,9 @@ class Vm(object):
             self.cont()
         except libvirt.libvirtError:
             self.log.warn("VM %s can't be resumed", self.id, exc_info=True)
-        self._setWriteWatermarks()
+
+        # When using block threshold events, the drive threshold is still
+        # exceeded, so the next drive monitor cycle will set a new threshold.
 
     def _acquireCpuLockWithTimeout(self):
         timeout = self._loadCorrectedTimeout(
@@ -1506,11 +1532,13 @@ class Vm(object):
             # Here we need to do the reverse: check first if a VM is
             # monitorable, and only if it is, consider the stats_age.
             monitorable = self._monitorable
-            vm_sample = sampling.stats_cache.get(self.id)
+            vm_sample, computed = sampling.stats_cache.get_with_computed(
+                self.id)
             decStats = vmstats.produce(self,
                                        vm_sample.first_value,
                                        vm_sample.last_value,
-                                       vm_sample.interval)
+                                       vm_sample.interval,
+                                       computed)
             if monitorable:
                 self._setUnresponsiveIfTimeout(stats, vm_sample.stats_age)
         except Exception:
@@ -4387,7 +4415,7 @@ class Vm(object):
             self._setGuestCpuRunning(False)
             self._logGuestCpuStatus('onIOError')
             if reason == 'ENOSPC':
-                if not self.extendDrivesIfNeeded():
+                if not self.extendDrivesIfNeeded(all_drives=True):
                     self.log.info("No VM drives were extended")
 
             self._send_ioerror_status_event(reason, blockDevAlias)
@@ -4672,13 +4700,6 @@ class Vm(object):
         self.log.exception("Operation failed")
         return response.error(key, msg)
 
-    def _setWriteWatermarks(self):
-        """
-        Define when to receive an event about high write to guest image
-        Currently unavailable by libvirt.
-        """
-        pass
-
     def handle_failed_post_copy(self, clean_vm=False):
         # After a failed post-copy migration, the VM remains in a paused state
         # on both the ends of the migration. There is currently no way to
@@ -5290,6 +5311,26 @@ class Vm(object):
                          stats_age)
         stats['monitorResponse'] = '-1'
 
+    def onBlockThreshold(self, dev, path, threshold, excess):
+        try:
+            drive = self._findDriveByName(drivemonitor.drive_name(dev))
+        except LookupError:
+            self.log.warning("Block threshold event for unknown drive %s "
+                             "(%s)", dev, path)
+            return
+
+        self._driveMonitor.on_block_threshold(drive, path, threshold, excess)
+
+        # Checking the drive accesses QEMU monitor and storage, so it must
+        # not run in the libvirt event thread.
+        try:
+            periodic.dispatch_vm_operation(
+                periodic.DriveWatermarkMonitor, self,
+                config.getint('vars', 'vm_watermark_interval'))
+        except (executor.NotRunning, executor.TooManyTasks) as e:
+            self.log.warning("Cannot check drive %s now, will check in the "
+                             "next drive monitor cycle: %s", drive.name, e)
+
     def onDeviceRemoved(self, device_alias):
         self.log.info("Device removal reported: %s", device_alias)
 